@@ -0,0 +1,21 @@
+#include <avr/io.h>
+
+// Fixed SRAM locations, so that the test can find them
+#define RESULT  (*(volatile uint8_t *) 0x100)
+#define COUNT   (*(volatile uint8_t *) 0x101)
+
+// Main function
+int main () {
+    // ADC1 (PB2) against VCC, left adjusted to read 8 bits
+    ADMUX = (1 << ADLAR) | (1 << MUX0);
+    ADCSRA = (1 << ADEN) | (1 << ADPS1) | (1 << ADPS0);
+
+    // Convert forever
+    while (1) {
+        ADCSRA |= 1 << ADSC;
+        loop_until_bit_is_clear (ADCSRA, ADSC);
+
+        RESULT = ADCH;
+        COUNT++;
+    }
+}
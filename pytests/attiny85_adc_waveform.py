@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+from simavr import *
+from simavrtest import *
+import array
+import ctypes
+import unittest
+import sys
+
+class Test (SimavrTest):
+    def init_adc_avr (self):
+        avr = self.init_avr ()
+        avr.vcc = avr.avcc = avr.aref = 5000
+        return avr
+
+    def read_adc (self, avr):
+        """Last 8 bits result of the firmware"""
+
+        return bytearray (avr.sram[0x100:0x101]) [0]
+
+    def test_conversions (self):
+        avr = self.init_adc_avr ()
+        waveform = ADCWaveform (avr, ADC_IRQ_ADC1, rate = 1000)
+        waveform.queue ([1000, 2000, 3000, 4000])
+
+        # mV * 1023 / 5000, left adjusted
+        avr.run_us (500)
+        self.assertEqual (self.read_adc (avr), 204 >> 2)
+
+        avr.run_us (1000)
+        self.assertEqual (self.read_adc (avr), 409 >> 2)
+
+        # The last sample is held
+        avr.run_us (4000)
+        self.assertEqual (self.read_adc (avr), 818 >> 2)
+        self.assertEqual (waveform.buffers (), 1)
+        self.assertEqual (waveform.underruns (), 1)
+
+    def test_stamps_and_loop (self):
+        avr = self.init_adc_avr ()
+        waveform = ADCWaveform (avr, ADC_IRQ_ADC1, interpolate = True, loop = True)
+        waveform.queue ([0, 4000], stamps = [0, 1000], span = 2000)
+        start = avr.cycle
+
+        # Up to the second sample, then back to the first one that starts the next loop
+        for (cycle, mv) in ((500, 2000), (1500, 2000), (2250, 1000), (3000, 4000)):
+            avr.run_cycles (start + cycle - avr.cycle)
+            self.assertAlmostEqual (waveform.value (), mv, delta = 20)
+
+        self.assertEqual (waveform.buffers (), 1)
+        self.assertEqual (waveform.underruns (), 0)
+
+    def test_formats (self):
+        avr = self.init_adc_avr ()
+        waveform = ADCWaveform (avr, ADC_IRQ_ADC1)
+
+        # Big endian samples and float stamps are converted, not taken as raw bits
+        samples = (ctypes.c_int16.__ctype_be__ * 2) (1000, 2000)
+        waveform.queue (samples, stamps = array.array ('d', [0, 100]), span = 10000)
+        start = avr.cycle
+
+        self.assertEqual (waveform.value (), 1000)
+        avr.run_cycles (start + 150 - avr.cycle)
+        self.assertEqual (waveform.value (), 2000)
+
+    def test_refill (self):
+        avr = self.init_adc_avr ()
+        waveform = ADCWaveform (avr, ADC_IRQ_ADC1, rate = 100000, timed = True)
+        refills = []
+
+        def refill (free, arg):
+            refills.append (free)
+            if len (refills) < 8:
+                waveform.queue (array.array ('h', [(len (refills) + 2) * 100] * 100))
+
+        waveform.on_refill (refill)
+        self.assertEqual (waveform.queue ([100] * 100), 1)
+        self.assertEqual (waveform.queue ([200] * 100), 0)
+        self.assertRaises (AVRException, lambda: waveform.queue ([300]))
+
+        # 100 samples at 100kHz last 1ms, 9 buffers are played then the queue runs dry
+        avr.run_us (9500)
+
+        self.assertEqual (refills, [1] * 8 + [2])
+        self.assertEqual (waveform.buffers (), 9)
+        self.assertEqual (waveform.underruns (), 1)
+        self.assertEqual (waveform.value (), 900)
+        self.assertEqual (self.read_adc (avr), (900 * 1023 // 5000) >> 2)
+
+    def test_refill_after_underrun (self):
+        avr = self.init_adc_avr ()
+        waveform = ADCWaveform (avr, ADC_IRQ_ADC1, rate = 100000, timed = True)
+        refills = []
+
+        def refill (free, arg):
+            refills.append (free)
+            if len (refills) < 4:
+                waveform.queue ([(len (refills) + 1) * 100] * 100)
+
+        # Each buffer is queued once the previous one ran dry, and played for 1ms
+        waveform.on_refill (refill)
+        waveform.queue ([100] * 100)
+
+        avr.run_us (1500)
+        self.assertEqual (refills, [2])
+        self.assertEqual (waveform.value (), 200)
+
+        avr.run_us (3000)
+        self.assertEqual (refills, [2] * 4)
+        self.assertEqual (waveform.buffers (), 4)
+        self.assertEqual (waveform.underruns (), 4)
+        self.assertEqual (waveform.value (), 400)
+
+# Run test
+unittest.main ()
@@ -0,0 +1,17 @@
+#include <avr/io.h>
+#include <util/delay_basic.h>
+
+// Main function
+int main () {
+    uint8_t counter = 0;
+
+    // PB0-PB4 show the counter
+    DDRB = 0x1f;
+
+    while (1) {
+        PORTB = counter++ & 0x1f;
+
+        // About 1000 cycles
+        _delay_loop_2 (250);
+    }
+}
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+from simavr import *
+from simavrtest import *
+import unittest
+import sys
+
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+
+@unittest.skipIf (asyncio == None or sys.version_info < (3, 5), "asyncio is not available")
+class Test (SimavrTest):
+    def setUp (self):
+        self.loop = asyncio.new_event_loop ()
+        asyncio.set_event_loop (self.loop)
+
+    def tearDown (self):
+        asyncio.set_event_loop (None)
+        self.loop.close ()
+
+    def run_until_complete (self, *coroutines):
+        return self.loop.run_until_complete (asyncio.gather (*coroutines))
+
+    def cycle_when_done (self, avr, coroutine, cycles):
+        """Task of the coroutine, that appends the cycle of the AVR to cycles when it is done.
+           The done callback runs after the next slice started, so that is up to a quantum late."""
+
+        task = self.loop.create_task (coroutine)
+        task.add_done_callback (lambda task: cycles.append (avr.cycle))
+        return task
+
+    def test_run_async (self):
+        avr = self.init_avr ()
+        ticks = list ()
+
+        def tick ():
+            ticks.append (avr.cycle)
+            if avr.cycle < 100000:
+                self.loop.call_soon (tick)
+
+        self.loop.call_soon (tick)
+        reason, = self.run_until_complete (avr.run_async (quantum_cycles = 1000, cycles = 100000))
+
+        self.assertEqual (reason, stop_Cycle)
+        self.assertTrue (avr.cycle >= 100000)
+
+        # The event loop ran between the slices
+        self.assertTrue (len (ticks) >= 50)
+
+    def test_wait_irq (self):
+        avr = self.init_avr ()
+        cycles = list ()
+
+        waiter = self.cycle_when_done (avr, avr.wait_irq (avr.get_ioport_irq ('B', 3), 1), cycles)
+        results = self.run_until_complete (avr.run_async (quantum_cycles = 1000, cycles = 200000), waiter)
+
+        self.assertEqual (results [1], 1)
+
+        # PB3 goes up after 8 loops of about 1000 cycles
+        self.assertTrue (8000 <= cycles [0] < 12000)
+
+    def test_wait_irq_timeout (self):
+        avr = self.init_avr ()
+        cycles = list ()
+
+        waiter = self.cycle_when_done (avr, avr.wait_irq (avr.get_ioport_irq ('B', 5), timeout_us = 100), cycles)
+        results = self.run_until_complete (avr.run_async (quantum_cycles = 1000, cycles = 200000), waiter)
+
+        self.assertEqual (results [1], None)
+        self.assertTrue (800 <= cycles [0] < 3000)
+
+    def test_sleep_sim_us (self):
+        avr = self.init_avr ()
+        cycles = list ()
+
+        sleeper = self.cycle_when_done (avr, avr.sleep_sim_us (250), cycles)
+        self.run_until_complete (avr.run_async (quantum_cycles = 1000, cycles = 200000), sleeper)
+
+        self.assertTrue (2000 <= cycles [0] < 4000)
+
+    def test_many (self):
+        avrs = [self.init_avr () for i in range (4)]
+
+        reasons = self.run_until_complete (*[avr.run_async (quantum_cycles = 1000, cycles = 20000) for avr in avrs])
+
+        self.assertEqual (reasons, [stop_Cycle] * 4)
+        for avr in avrs:
+            self.assertTrue (avr.cycle >= 20000)
+
+# Run test
+unittest.main ()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+from simavr import *
+from simavrtest import *
+import unittest
+
+class Test (SimavrTest):
+    def run_board (self, latency_us, threads = False):
+        """A at 8MHz drives PB0 of B at 1MHz with its PB1, that follows its own PB0.
+           Returns the cycle of A at the rise of its PB1, and the one of B at the rise of its PB0"""
+
+        a = self.init_avr (freq = 8000000)
+        b = self.init_avr (freq = 1000000)
+
+        board = Board (quantum_us = 10, threads = threads)
+        self.addCleanup (board.close)
+        board.add (a)
+        board.add (b)
+        board.connect (a.get_ioport_irq ('B', 1), b.get_ioport_irq ('B', 0), latency_us)
+
+        recorder_a = IRQRecorder (a)
+        recorder_a.add_ioport_irq ('B', 1)
+        recorder_b = IRQRecorder (b)
+        recorder_b.add_ioport_irq ('B', 0)
+
+        stimulus = IRQStimulus (a)
+        stimulus.append ([(800, stimulus.add_ioport_irq ('B', 0), 1)])
+
+        self.assertEqual (board.run_us (300), dict ())
+        self.assertEqual (board.time_us (), 300)
+        self.assertTrue (a.cycle >= 2400 and b.cycle >= 300)
+
+        rise_a = [when for (when, i, value) in recorder_a.drain () if value == 1]
+        rise_b = [when for (when, i, value) in recorder_b.drain () if value == 1]
+        self.assertEqual ((len (rise_a), len (rise_b)), (1, 1))
+
+        return rise_a [0], rise_b [0], board
+
+    def test_latency (self):
+        a, b, board = self.run_board (latency_us = 20)
+
+        # B is raised at the cycle of the same time plus the latency
+        self.assertTrue (800 < a < 830)
+        expected = (a + 7) // 8 + 20
+        self.assertTrue (0 <= b - expected < 4, (a, b))
+        self.assertEqual (board.late (), 0)
+
+    def test_late (self):
+        a, b, board = self.run_board (latency_us = 0)
+
+        # Without latency, changes are late by a quantum at most
+        self.assertTrue (0 <= b - (a + 7) // 8 <= 10 + 4, (a, b))
+        # The low level set with DDRB is late too
+        self.assertEqual (board.late (), 2)
+
+    def test_threads (self):
+        self.assertEqual (self.run_board (latency_us = 20, threads = True) [:2],
+                          self.run_board (latency_us = 20) [:2])
+
+    def test_done (self):
+        avr = self.init_avr ()
+        board = Board ()
+        board.add (avr)
+        avr.run_cycles (100)
+        avr.state = cpu_Done
+
+        self.assertEqual (board.run_us (100), {avr: stop_Done})
+        self.assertEqual (board.stopped, {avr: stop_Done})
+        self.assertEqual (board.run_us (100), dict ())
+        self.assertEqual (board.time_us (), 200)
+
+# Run test
+unittest.main ()
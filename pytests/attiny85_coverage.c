@@ -0,0 +1,19 @@
+#include <avr/io.h>
+
+// Only called while PB0 is high
+static void __attribute__ ((noinline)) set_high () {
+    PORTB |= 1 << PB1;
+}
+
+// Main function
+int main () {
+    DDRB = 1 << PB1;
+
+    while (1) {
+        if (PINB & (1 << PB0)) {
+            set_high ();
+        } else {
+            PORTB &= ~(1 << PB1);
+        }
+    }
+}
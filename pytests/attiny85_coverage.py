@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+from simavr import *
+from simavrtest import *
+import simavr_coverage
+import unittest
+import os
+import shutil
+import tempfile
+
+class Test (SimavrTest):
+    def run_coverage (self, pb0):
+        avr = self.init_avr ()
+        avr.coverage_enable ()
+        avr.get_ioport_irq ('B', 0).raise_irq (pb0)
+        avr.run_cycles (1000)
+        return avr.get_coverage ()
+
+    def test_bitmap (self):
+        avr = self.init_avr ()
+        self.assertEqual (avr.coverage_bitmap, None)
+        self.assertRaises (AVRException, avr.get_coverage)
+
+        avr.coverage_enable ()
+        bitmap = avr.coverage_bitmap
+        self.assertEqual (len (bitmap) * 16, avr.flashend + 1)
+
+        avr.run_cycles (1000)
+        coverage = avr.get_coverage ()
+        self.assertTrue (coverage.executed (0))
+        self.assertTrue (coverage.count () > 3)
+        self.assertEqual (coverage.count (), len (coverage.addresses ()))
+
+        # The view is the bitmap itself, the reset vector is not executed again
+        avr.coverage_clear ()
+        self.assertEqual (bitmap.tobytes (), b"\0" * len (bitmap))
+        avr.run_cycles (1000)
+        self.assertTrue (bitmap.tobytes () != b"\0" * len (bitmap))
+        self.assertFalse (avr.get_coverage ().executed (0))
+
+        # ... and keeps it once it is dropped by disable
+        executed = bitmap.tobytes ()
+        avr.coverage_disable ()
+        self.assertEqual (bitmap.tobytes (), executed)
+        self.assertEqual (avr.coverage_bitmap, None)
+
+    def test_merge (self):
+        low = self.run_coverage (0)
+        high = self.run_coverage (1)
+        self.assertTrue (set (high.addresses ()) - set (low.addresses ()))
+
+        merged = Coverage (low.bitmap, digest = low.digest).merge (high)
+        self.assertEqual (set (merged.addresses ()), set (low.addresses ()) | set (high.addresses ()))
+
+        self.assertRaises (AVRException, lambda: Coverage (low.bitmap [:-1]).merge (high))
+        self.assertRaises (AVRException, lambda: Coverage (low.bitmap, digest = "other").merge (high))
+
+    def test_files (self):
+        directory = tempfile.mkdtemp ()
+        try:
+            files = []
+            for pb0 in (0, 1):
+                files.append (os.path.join (directory, "run%d.coverage" % pb0))
+                self.run_coverage (pb0).save (files [-1])
+
+            loaded = Coverage.load (files [1])
+            self.assertEqual (loaded.bitmap, self.run_coverage (1).bitmap)
+
+            output = os.path.join (directory, "all.coverage")
+            self.assertEqual (simavr_coverage.main (["merge", "-o", output] + files), 0)
+            self.assertEqual (Coverage.load (output).addresses (),
+                              Coverage.load (files [0]).merge (loaded).addresses ())
+        finally:
+            shutil.rmtree (directory)
+
+# Run test
+unittest.main ()
@@ -0,0 +1,12 @@
+#include <avr/io.h>
+
+// Main function
+int main () {
+    // PB0 as some "PIN"
+    DDRB = 1 << 0;  // out
+
+    // Toggle PIN forever
+    while (1) {
+        PORTB ^= 1 << 0;
+    }
+}
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+from simavr import *
+from simavrtest import *
+import unittest
+import os
+import shutil
+import sys
+import tempfile
+
+def ihex_record (kind, address, data):
+    """One IHEX line."""
+
+    record = [len (data), (address >> 8) & 0xff, address & 0xff, kind] + list (data)
+    return ":" + "".join ("%02X" % b for b in record + [(-sum (record)) & 0xff]) + "\n"
+
+class Test (SimavrTest):
+    def setUp (self):
+        SimavrTest.setUp (self)
+        self.directory = tempfile.mkdtemp ()
+
+    def tearDown (self):
+        shutil.rmtree (self.directory)
+
+    def write_hex (self, name, extra):
+        """Copy the firmware with extra records added before the end of file."""
+
+        lines = open (sys.argv[0].replace (".py", ".hex")).readlines ()
+        filename = os.path.join (self.directory, name)
+
+        f = open (filename, "w")
+        f.writelines ([line for line in lines if not line.startswith (":00000001")])
+        f.writelines (extra)
+        f.write (":00000001FF\n")
+        f.close ()
+
+        return filename
+
+    def test_many_chunks (self):
+        # Six flash chunks after the code, then EEPROM content at 0x810000
+        extra = [ihex_record (0, 0x1000 + i * 0x100, [i] * 4) for i in range (6)]
+        extra.append (ihex_record (4, 0, [0x00, 0x81]))
+        extra.append (ihex_record (0, 0x10, [1, 2, 3, 4]))
+
+        firmware = Firmware (self.write_hex ("chunks.hex", extra), quiet = True)
+        elf = firmware.get_elf_firmware ()
+
+        self.assertEqual (elf.flashbase, 0)
+        self.assertEqual (elf.flashsize, 0x1504)
+        self.assertEqual (elf.eesize, 0x14)
+
+        # The code is still there
+        avr = AVR (firmware = firmware, mcu = 'attiny85', freq = 8000000, quiet = True)
+        values = []
+        avr.get_ioport_irq ('B', 0).register_notify (lambda value, arg: values.append (value))
+        avr.run_cycles (100)
+        self.assertTrue (1 in values)
+
+    def test_cache (self):
+        filename = self.write_hex ("cached.hex", [])
+
+        firmware = Firmware.load (filename, quiet = True)
+        self.assertTrue (Firmware.load (filename, quiet = True) is firmware)
+        self.assertTrue (AVR (filename = filename, mcu = 'attiny85', freq = 8000000, quiet = True).get_firmware () is firmware)
+
+        # Changed file is parsed again
+        self.write_hex ("cached.hex", [ihex_record (0, 0x1000, [0] * 4)])
+        os.utime (filename, (0, 0))
+        self.assertFalse (Firmware.load (filename, quiet = True) is firmware)
+
+# Run test
+unittest.main ()
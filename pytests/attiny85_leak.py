@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+from simavr import *
+from simavrtest import *
+import unittest
+import gc
+import resource
+import sys
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+class Test (SimavrTest):
+    def create_and_terminate (self, firmware, count):
+        for i in range (count):
+            with AVR (firmware = firmware, mcu = 'attiny85', freq = 8000000, quiet = True) as avr:
+                values = []
+
+                avr.add_timer (50, lambda arg: 10)
+                avr.get_ioport_irq ('B', 0).register_notify (lambda value, arg: values.append (value))
+
+                button = PinButton (avr)
+                button.connect_ioport ('B', 1)
+
+                recorder = IRQRecorder (avr, 16)
+                recorder.add_ioport_irq ('B', 0)
+
+                avr.run_cycles (200)
+
+    def test_terminate (self):
+        # Firmware is parsed once, only the instances are created
+        firmware = Firmware (sys.argv[0].replace (".py", ".hex"), quiet = True)
+
+        self.create_and_terminate (firmware, 1000)
+        rss = resource.getrusage (resource.RUSAGE_SELF).ru_maxrss
+
+        self.create_and_terminate (firmware, 10000)
+        self.assertTrue (resource.getrusage (resource.RUSAGE_SELF).ru_maxrss < rss * 1.1)
+
+    def test_pool_irq (self):
+        avr = AVR (filename = sys.argv[0].replace (".py", ".hex"), mcu = 'attiny85', freq = 8000000, quiet = True)
+        irq = IRQ (avr.irq_pool)
+        avr.terminate ()
+
+        # The IRQ outlives the AVR and its pool
+        self.assertEqual (irq.pool, None)
+        del avr
+        gc.collect ()
+        del irq
+
+    def test_own_irq_notify (self):
+        # The SWIG pointer of an IRQ allocated by IRQ is not hashable
+        with AVR (filename = sys.argv[0].replace (".py", ".hex"), mcu = 'attiny85', freq = 8000000, quiet = True) as avr:
+            irq = IRQ (avr.irq_pool, avr = avr)
+            values = []
+            callback = lambda value, arg: values.append (value)
+
+            irq.register_notify (callback)
+            irq.register_notify (callback)
+            irq.raise_irq (1)
+            irq.unregister_notify (callback)
+            irq.raise_irq (0)
+
+            self.assertEqual (values, [1])
+
+    def test_recorder_views (self):
+        # A view keeps its records once the recorder is closed
+        with AVR (filename = sys.argv[0].replace (".py", ".hex"), mcu = 'attiny85', freq = 8000000, quiet = True) as avr:
+            recorder = IRQRecorder (avr, 16)
+            recorder.add_ioport_irq ('B', 0)
+            avr.run_cycles (200)
+
+            view = next (recorder.views ())
+            records = view.tobytes ()
+            recorder.close ()
+
+        self.assertEqual (len (records), 16 * IRQRecorder.RECORD_SIZE)
+        self.assertEqual (view.tobytes (), records)
+
+    def test_failed_init (self):
+        # AVRs whose construction failed are collected silently
+        filename = sys.argv[0].replace (".py", ".hex")
+        stderr = sys.stderr
+        sys.stderr = StringIO ()
+
+        try:
+            self.assertRaises (AVRException, lambda: AVR (mcu = 'attiny85', freq = 8000000))
+            self.assertRaises (EnvironmentError, lambda: AVR (filename = filename + ".missing", mcu = 'attiny85', freq = 8000000, quiet = True))
+            self.assertRaises (AVRException, lambda: AVR (filename = filename, mcu = 'unknown', freq = 8000000, quiet = True))
+            gc.collect ()
+            output = sys.stderr.getvalue ()
+        finally:
+            sys.stderr = stderr
+
+        self.assertEqual (output, "")
+
+# Run test
+unittest.main ()
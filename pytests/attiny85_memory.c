@@ -0,0 +1,13 @@
+#include <avr/io.h>
+
+// Fixed SRAM locations, so that the test can find them
+#define INPUT   (*(volatile uint8_t *) 0x100)
+#define OUTPUT  (*(volatile uint8_t *) 0x101)
+
+// Main function
+int main () {
+    // OUTPUT follows INPUT forever
+    while (1) {
+        OUTPUT = INPUT + 1;
+    }
+}
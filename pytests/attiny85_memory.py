@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+from simavr import *
+from simavrtest import *
+import unittest
+import sys
+import gc
+import weakref
+
+class Test (SimavrTest):
+    def test_sram (self):
+        avr = self.init_avr ()
+        sram = avr.sram
+        self.assertEqual (len (sram), avr.ramend + 1)
+
+        sram[0x100:0x101] = b'\x29'
+        avr.run_cycles (1000)
+        self.assertEqual (sram[0x101:0x102].tobytes (), b'\x2a')
+
+        sram[0x100:0x101] = b'\x7f'
+        avr.run_cycles (1000)
+        self.assertEqual (bytearray (avr.sram[0x100:0x102]), bytearray (b'\x7f\x80'))
+
+    def test_flash_and_eeprom (self):
+        avr = self.init_avr ()
+
+        flash = avr.flash
+        self.assertEqual (len (flash), avr.flashend + 1)
+        self.assertNotEqual (flash[0:2].tobytes (), b'\xff\xff')
+        self.assertEqual (flash[-2:].tobytes (), b'\xff\xff')
+
+        eeprom = avr.eeprom
+        self.assertEqual (len (eeprom), avr.e2end + 1)
+        eeprom[0:4] = b'abcd'
+        self.assertEqual (avr.eeprom[0:4].tobytes (), b'abcd')
+
+        avr.terminate ()
+        self.assertRaises (AVRException, lambda: avr.sram)
+
+    def test_lifetime (self):
+        avr = self.init_avr ()
+        sram, eeprom = avr.sram, avr.eeprom
+        sram[0x100:0x101] = b'\x29'
+        avr.run_cycles (1000)
+        eeprom[0:1] = b'x'
+
+        # The views keep the memory of the terminated AVR
+        avr.terminate ()
+        self.assertEqual (sram[0x101:0x102].tobytes (), b'\x2a')
+        self.assertEqual (eeprom[0:1].tobytes (), b'x')
+        sram[0x100:0x101] = b'\x00'
+
+        # ... and keep alive the AVR they are on
+        avr = AVR (filename = sys.argv[0].replace (".py", ".hex"), mcu = 'attiny85', freq = 8000000, quiet = True)
+        flash = avr.flash
+        avr = weakref.ref (avr)
+        gc.collect ()
+        self.assertNotEqual (avr (), None)
+        self.assertNotEqual (flash[0:2].tobytes (), b'\xff\xff')
+
+        del flash
+        gc.collect ()
+        self.assertEqual (avr (), None)
+
+# Run test
+unittest.main ()
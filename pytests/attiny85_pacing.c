@@ -0,0 +1,30 @@
+#include <avr/interrupt.h>
+#include <avr/io.h>
+#include <avr/sleep.h>
+
+volatile uint8_t ticks;
+
+ISR (TIMER0_COMPA_vect) {
+    ticks++;
+    PORTB = ticks & 0x1f;
+}
+
+// Main function
+int main () {
+    // PB0-PB4 show the ticks
+    DDRB = 0x1f;
+
+    // Timer0 in CTC mode, interrupt every 256 * 1024 cycles
+    OCR0A = 255;
+    TCCR0A = 1 << WGM01;
+    TCCR0B = (1 << CS02) | (1 << CS00);
+    TIMSK = 1 << OCIE0A;
+
+    set_sleep_mode (SLEEP_MODE_IDLE);
+    sei ();
+
+    // Sleep between the ticks
+    while (1) {
+        sleep_mode ();
+    }
+}
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+from simavr import *
+from simavrtest import *
+import unittest
+import sys
+
+class Test (SimavrTest):
+    def test_max_speed (self):
+        avr = self.init_avr ()
+        avr.set_pacing ('max_speed')
+        self.assertEqual (avr.get_pacing (), Pacing.max_speed)
+
+        self.assertEqual (avr.run_us (2000000), stop_Cycle)
+
+        report = avr.last_run
+        self.assertTrue (report.cycles >= avr.usec_to_cycles (2000000))
+        self.assertTrue (report.simulated >= 2.0)
+        self.assertTrue (report.host < 1.0)
+        self.assertEqual (report.slept, 0)
+
+    def test_realtime (self):
+        avr = self.init_avr ()
+        self.assertEqual (avr.get_pacing (), Pacing.realtime)
+
+        avr.run_us (200000)
+
+        self.assertTrue (avr.last_run.host >= 0.15)
+        self.assertTrue (avr.last_run.slept > 0)
+
+    def test_scaled (self):
+        avr = self.init_avr ()
+        avr.set_pacing (Pacing.scaled (10))
+
+        avr.run_us (1000000)
+
+        self.assertTrue (avr.last_run.host >= 0.07)
+        self.assertTrue (avr.last_run.host < 0.9)
+        self.assertTrue (avr.last_run.speed () > 1)
+
+    def test_invalid (self):
+        avr = self.init_avr ()
+
+        self.assertRaises (AVRException, avr.set_pacing, Pacing.scaled (0))
+        self.assertRaises (AVRException, avr.set_pacing, 'fastest')
+        self.assertEqual (avr.get_pacing (), Pacing.realtime)
+
+# Run test
+unittest.main ()
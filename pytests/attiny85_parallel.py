@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+from simavr import *
+from simavrtest import *
+import unittest
+import os
+import signal
+import sys
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+def make_cases ():
+    """Test cases run by the parallel runner."""
+
+    class First (SimavrTest):
+        def test_toggle (self):
+            avr = self.init_avr ()
+            values = []
+
+            avr.get_ioport_irq ('B', 0).register_notify (lambda value, arg: values.append (value))
+            avr.run_cycles (100)
+
+            self.assertTrue (1 in values)
+
+        def test_fail (self):
+            self.fail ("expected failure " + str (os.getpid ()))
+
+    class Second (SimavrTest):
+        def test_run (self):
+            avr = self.init_avr ()
+
+            self.assertEqual (avr.run_cycles (1000), stop_Cycle)
+
+        def test_pid (self):
+            self.assertNotEqual (os.getpid (), parent_pid)
+
+    return [First, Second]
+
+def make_subtest_cases ():
+    """Test case whose only failure is in a subtest."""
+
+    class SubTests (unittest.TestCase):
+        def test_subtest (self):
+            for i in range (3):
+                with self.subTest (i = i):
+                    self.assertNotEqual (i, 1)
+
+    return [SubTests]
+
+def make_crash_cases ():
+    """Test case whose worker dies, like on a crash of the simulator."""
+
+    class Crash (unittest.TestCase):
+        def test_1_before (self):
+            pass
+
+        def test_2_crash (self):
+            os.kill (os.getpid (), signal.SIGKILL)
+
+        def test_3_after (self):
+            pass
+
+    return [Crash]
+
+parent_pid = os.getpid ()
+
+class Test (unittest.TestCase):
+    def run_cases (self, split, cases = None):
+        loader = unittest.TestLoader ()
+        suite = unittest.TestSuite ([loader.loadTestsFromTestCase (case) for case in cases or make_cases ()])
+
+        runner = ParallelTestRunner (processes = 2,
+                                     split = split,
+                                     firmwares = [sys.argv[0].replace (".py", ".hex")],
+                                     stream = StringIO ())
+        return runner.run (suite)
+
+    def test_by_class (self):
+        result = self.run_cases ("class")
+
+        self.assertEqual (result.testsRun, 4)
+        self.assertEqual (len (result.errors), 0)
+        self.assertEqual (len (result.failures), 1)
+        self.assertTrue ("expected failure" in result.failures [0][1])
+
+    def test_by_method (self):
+        result = self.run_cases ("method")
+
+        self.assertEqual (result.testsRun, 4)
+        self.assertEqual (len (result.errors), 0)
+        self.assertEqual (len (result.failures), 1)
+
+    @unittest.skipIf (not hasattr (unittest.TestCase, "subTest"), "subTest is not available")
+    def test_subtest (self):
+        result = self.run_cases ("method", make_subtest_cases ())
+
+        self.assertEqual (result.testsRun, 1)
+        self.assertEqual (len (result.failures), 1)
+        self.assertTrue ("(i=1)" in result.failures [0][1])
+        self.assertFalse (result.wasSuccessful ())
+
+    def test_crash (self):
+        # Only the test running when the worker died is lost, another worker runs the next ones
+        for split in ("class", "method"):
+            result = self.run_cases (split, make_crash_cases ())
+
+            self.assertEqual (result.testsRun, 3)
+            self.assertEqual (len (result.errors), 1)
+            self.assertEqual (len (result.failures), 0)
+            self.assertTrue ("died" in result.errors [0][1])
+            self.assertTrue ("test_2_crash" in str (result.errors [0][0]))
+
+# Run test
+unittest.main ()
@@ -0,0 +1,25 @@
+#include <avr/interrupt.h>
+#include <avr/io.h>
+
+volatile uint8_t ticks;
+
+ISR (TIMER0_COMPA_vect) {
+    ticks++;
+    PORTB = ticks & 0x1f;
+}
+
+// Main function
+int main () {
+    // PB0-PB4 show the ticks
+    DDRB = 0x1f;
+
+    // Timer0 in CTC mode, interrupt every 400 cycles
+    OCR0A = 49;
+    TCCR0A = 1 << WGM01;
+    TCCR0B = 1 << CS01;
+    TIMSK = 1 << OCIE0A;
+
+    sei ();
+
+    while (1) {};
+}
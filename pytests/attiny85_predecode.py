@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+
+from simavr import *
+from simavrtest import *
+import unittest
+import sys
+
+class Test (SimavrTest):
+    def trace (self, avr, cycles):
+        recorder = IRQRecorder (avr, 65536)
+        for i in range (5):
+            recorder.add_ioport_irq ('B', i)
+
+        avr.run_cycles (cycles)
+
+        events = list (recorder.drain ())
+        recorder.close ()
+
+        return events
+
+    def test_same_trace (self):
+        avr = self.init_avr ()
+        predecoded = self.init_avr (predecode = True)
+
+        expected = self.trace (avr, 50000)
+        self.assertTrue (len (expected) > 100)
+
+        self.assertEqual (self.trace (predecoded, 50000), expected)
+        self.assertEqual ((predecoded.cycle, predecoded.pc), (avr.cycle, avr.pc))
+
+    def test_flash_modified (self):
+        avr = self.init_avr (predecode = True)
+        self.assertTrue (len (self.trace (avr, 1000)) > 0)
+
+        # Every word becomes "rjmp .-2", an endless loop
+        flash = avr.flash
+        flash[:] = b'\xff\xcf' * (len (flash) // 2)
+        avr.flash_modified ()
+
+        avr.run_cycles (10)
+        self.assertEqual (self.trace (avr, 1000), [])
+
+# Run test
+unittest.main ()
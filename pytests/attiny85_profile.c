@@ -0,0 +1,21 @@
+#include <avr/io.h>
+
+volatile uint8_t counter;
+
+__attribute__ ((noinline)) void work () {
+    for (uint8_t i = 0; i < 100; i++) {
+        counter += i;
+    }
+}
+
+__attribute__ ((noinline)) void rest () {
+    counter++;
+}
+
+// Main function
+int main () {
+    while (1) {
+        work ();
+        rest ();
+    }
+}
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+from simavr import *
+from simavrtest import *
+import gzip
+import os
+import tempfile
+import unittest
+import sys
+
+class Test (SimavrTest):
+    def test_exact (self):
+        avr = self.init_avr ()
+        avr.profile_enable ()
+        avr.run_cycles (100000)
+
+        profile = avr.get_profile ()
+
+        # Every cycle is accounted for, the firmware neither sleeps nor interrupts
+        self.assertEqual (profile.total_cycles (), avr.cycle)
+
+        functions = profile.functions ()
+        self.assertEqual (functions [0][0], "work")
+        self.assertTrue ("rest" in [name for name, cycles, count in functions])
+
+        # Counters are visible and clearable in place
+        cycles = avr.profile_cycles
+        self.assertEqual (len (cycles), 8 * len (profile.cycles))
+        avr.profile_clear ()
+        self.assertEqual (avr.get_profile ().total_cycles (), 0)
+
+        # Views keep the counters dropped by disable
+        avr.run_cycles (1000)
+        counters = cycles.tobytes ()
+        avr.profile_disable ()
+        self.assertEqual (cycles.tobytes (), counters)
+        self.assertEqual (avr.profile_cycles, None)
+        self.assertRaises (AVRException, avr.get_profile)
+
+        avr.profile_enable ()
+        self.assertEqual (avr.get_profile ().total_cycles (), 0)
+
+    def test_sampled (self):
+        avr = self.init_avr ()
+        avr.profile_enable (100)
+        avr.run_cycles (100000)
+
+        profile = avr.get_profile ()
+        self.assertTrue (abs (sum (profile.counts) - 1000) <= 1)
+        self.assertEqual (profile.total_cycles (), 100 * sum (profile.counts))
+        self.assertEqual (profile.functions () [0][0], "work")
+
+        # A reset (ie by the watchdog) clears the cycle timers, sampling goes on
+        avr.reset ()
+        avr.run_cycles (100000)
+        self.assertTrue (abs (sum (avr.get_profile ().counts) - 2000) <= 2)
+
+    def test_export (self):
+        avr = self.init_avr ()
+        avr.profile_enable ()
+        avr.run_cycles (10000)
+        profile = avr.get_profile ()
+
+        directory = tempfile.mkdtemp ()
+        callgrind = os.path.join (directory, "callgrind.out")
+        pprof = os.path.join (directory, "profile.pb.gz")
+        try:
+            profile.write_callgrind (callgrind)
+            text = open (callgrind).read ()
+            self.assertTrue ("events: Cycles Executions" in text)
+            self.assertTrue ("fn=work" in text)
+
+            profile.write_pprof (pprof)
+            data = gzip.open (pprof).read ()
+            self.assertTrue (b"work" in data)
+        finally:
+            for filename in (callgrind, pprof):
+                if os.path.exists (filename):
+                    os.remove (filename)
+            os.rmdir (directory)
+
+# Run test
+unittest.main ()
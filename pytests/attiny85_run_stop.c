@@ -0,0 +1,20 @@
+#include <avr/interrupt.h>
+#include <avr/io.h>
+#include <avr/sleep.h>
+
+// Main function
+int main () {
+    // PB0 as some "PIN"
+    DDRB = 1 << 0;  // out
+
+    // Toggle PIN for a while
+    for (uint8_t i = 0; i < 100; i++) {
+        PORTB ^= 1 << 0;
+    }
+
+    // Sleeping with interrupts off stops the simulation gracefully
+    cli ();
+    sleep_mode ();
+
+    while (1) {};
+}
@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+
+from simavr import *
+from simavrtest import *
+import unittest
+import sys
+
+class Test (SimavrTest):
+    def test_run_cycles (self):
+        avr = self.init_avr ()
+
+        self.assertEqual (avr.run_cycles (100), stop_Cycle)
+        self.assertTrue (avr.cycle >= 100)
+
+    def test_run (self):
+        avr = self.init_avr ()
+
+        self.assertEqual (avr.run (), stop_Done)
+        self.assertEqual (avr.state, cpu_Done)
+        self.assertEqual (avr.run_cycles (100), stop_Done)
+
+    def test_exception (self):
+        avr = self.init_avr ()
+
+        def callback (value, arg):
+            raise ValueError (value)
+
+        avr.get_ioport_irq ('B', 0).register_notify (callback)
+
+        self.assertRaises (ValueError, avr.run)
+        self.assertNotEqual (avr.state, cpu_Done)
+
+# Run test
+unittest.main ()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+from simavr import *
+from simavrtest import *
+import os
+import shutil
+import tempfile
+import unittest
+import sys
+
+class Test (SimavrTest):
+    def trace (self, avr, cycles):
+        recorder = IRQRecorder (avr, 4096)
+        for i in range (5):
+            recorder.add_ioport_irq ('B', i)
+
+        avr.run_cycles (cycles)
+
+        events = list (recorder.drain ())
+        recorder.close ()
+
+        return (events, avr.cycle, avr.pc)
+
+    def test_restore (self):
+        avr = self.init_avr ()
+        avr.run_cycles (5000)
+
+        snapshot = avr.snapshot ()
+        expected = self.trace (avr, 20000)
+        self.assertTrue (len (expected[0]) > 0)
+
+        avr.restore (snapshot)
+        self.assertEqual (self.trace (avr, 20000), expected)
+
+        other = self.init_avr ()
+        other.restore (Snapshot.from_bytes (snapshot.to_bytes ()))
+        self.assertEqual (self.trace (other, 20000), expected)
+
+    def test_timers (self):
+        avr = self.init_avr ()
+        hits = []
+
+        timer = avr.add_timer (7000, lambda arg: hits.append (avr.cycle))
+        avr.run_cycles (3000)
+
+        snapshot = avr.snapshot ()
+        avr.run_cycles (10000)
+        avr.restore (snapshot)
+        avr.run_cycles (10000)
+
+        self.assertEqual (len (hits), 2)
+        self.assertEqual (hits[0], hits[1])
+
+        self.assertRaises (AVRException, snapshot.to_bytes)
+        self.assertRaises (AVRException, self.init_avr ().restore, snapshot)
+
+    def test_owned_timers (self):
+        # Timers of objects closed since the snapshot are dropped, not the others
+        avr = self.init_avr ()
+        stimuli = list ()
+        for i in range (2):
+            irq = IRQ (avr.irq_pool, avr = avr)
+            stimulus = IRQStimulus (avr)
+            stimulus.add_irq (irq)
+            stimulus.append ([(1000, 0, 1)], avr.cycle)
+            stimuli.append ((stimulus, irq))
+
+        snapshot = avr.snapshot ()
+        stimuli [0][0].close ()
+        avr.restore (snapshot)
+        avr.stats_enable ()
+        avr.run_cycles (2000)
+
+        self.assertEqual ([irq.value for (stimulus, irq) in stimuli], [0, 1])
+        self.assertEqual ([fires for (timer, module, fires) in avr.stats () ["timers"] if module == None], [1])
+
+    def test_checkpoint (self):
+        directory = tempfile.mkdtemp ()
+        prepared = []
+
+        def prepare (avr):
+            avr.run_cycles (5000)
+            prepared.append (avr.cycle)
+
+        try:
+            self.init_avr ().checkpoint (directory, "booted", prepare)
+            avr = self.init_avr ()
+            avr.checkpoint (directory, "booted", prepare)
+
+            # Snapshots are kept per firmware and build of simavr
+            self.assertEqual (prepared, [avr.cycle])
+            self.assertEqual (os.listdir (directory), ["%s-booted-%016x.snapshot" %
+                                                       (avr.firmware_hash (), avr_snapshot_build (avr))])
+        finally:
+            shutil.rmtree (directory)
+
+# Run test
+unittest.main ()
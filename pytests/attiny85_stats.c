@@ -0,0 +1,21 @@
+#include <avr/interrupt.h>
+#include <avr/io.h>
+
+ISR (TIMER0_COMPA_vect) {
+    PORTB ^= 1 << PB0;
+}
+
+// Main function
+int main () {
+    DDRB = 1 << PB0;
+
+    // Timer0 in CTC mode, interrupt every 400 cycles
+    OCR0A = 49;
+    TCCR0A = 1 << WGM01;
+    TCCR0B = 1 << CS01;
+    TIMSK = 1 << OCIE0A;
+
+    sei ();
+
+    while (1) {};
+}
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+from simavr import *
+from simavrtest import *
+import unittest
+import threading
+import time
+
+class Test (SimavrTest):
+    def test_counters (self):
+        avr = self.init_avr ()
+        self.assertEqual (avr.stats (), None)
+
+        avr.stats_enable ()
+        avr.add_timer_us (10, lambda arg: avr.usec_to_cycles (10))
+        avr.run_us (1000)
+
+        # The timer interrupt toggles PB0 every 50us
+        stats = avr.stats ()
+        self.assertEqual (stats ["cycle"], avr.cycle)
+        self.assertTrue (stats ["modules"]["timer"]["timer_fires"] >= 19)
+        self.assertTrue (stats ["modules"]["port"]["writes"] >= 19)
+        self.assertTrue (stats ["modules"]["python"]["timer_fires"] >= 99)
+        self.assertTrue (stats ["irqs"]["avr.portb.pin0"][0] >= 19)
+
+        writes = sum (writes for (reads, writes, kind) in stats ["io"].values () if kind == "port")
+        self.assertEqual (writes, stats ["modules"]["port"]["writes"])
+
+        avr.stats_clear ()
+        stats = avr.stats ()
+        self.assertEqual ((stats ["io"], stats ["irqs"], stats ["timers"]), ({}, {}, []))
+
+        avr.stats_disable ()
+        self.assertEqual (avr.stats (), None)
+
+    def test_polling (self):
+        avr = self.init_avr ()
+        avr.stats_enable ()
+        thread = threading.Thread (target = lambda: avr.run_us (500000))
+        thread.start ()
+
+        # Polled while the AVR runs in another thread
+        snapshots = []
+        while thread.is_alive ():
+            snapshots.append (avr.stats ())
+            time.sleep (0.001)
+        thread.join ()
+
+        cycles = [stats ["cycle"] for stats in snapshots]
+        self.assertTrue (len (cycles) > 10)
+        self.assertEqual (cycles, sorted (cycles))
+        self.assertTrue (avr.stats () ["modules"]["port"]["writes"] >= 9999)
+
+# Run test
+unittest.main ()
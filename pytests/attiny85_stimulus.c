@@ -0,0 +1,15 @@
+#include <avr/io.h>
+
+// Main function
+int main () {
+    // PB1 follows PB0
+    DDRB = 1 << PB1;
+
+    while (1) {
+        if (PINB & (1 << PB0)) {
+            PORTB |= 1 << PB1;
+        } else {
+            PORTB &= ~(1 << PB1);
+        }
+    }
+}
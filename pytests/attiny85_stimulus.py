@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+from simavr import *
+from simavrtest import *
+import unittest
+import tempfile
+import shutil
+import os
+import sys
+
+VCD_INPUT = """$timescale 1us $end
+$scope module logic $end
+$var wire 1 ! iogB_0 $end
+$upscope $end
+$enddefinitions $end
+#0
+0!
+#100
+1!
+#250
+0!
+"""
+
+class Test (SimavrTest):
+    def init_recorded_avr (self):
+        avr = self.init_avr ()
+        self.recorder = IRQRecorder (avr)
+        self.recorder.add_ioport_irq ('B', 0)
+        self.recorder.add_ioport_irq ('B', 1)
+        return avr
+
+    def changes (self, index, start):
+        """Recorded (cycle from start, value) changes of PB0 (index 0) or PB1 (index 1)"""
+
+        return [(when - start, value) for (when, i, value) in self.recorder.drain () if i == index]
+
+    def assertCycles (self, cycles, expected):
+        """Rows are played once the instruction running at their cycle is done"""
+
+        self.assertEqual (len (cycles), len (expected))
+        for (cycle, expected_cycle) in zip (cycles, expected):
+            self.assertTrue (0 <= cycle - expected_cycle < 4, (cycles, expected))
+
+    def test_rows (self):
+        avr = self.init_recorded_avr ()
+        stimulus = IRQStimulus (avr, size = 2)
+        pb0 = stimulus.add_ioport_irq ('B', 0)
+        avr.run_cycles (100)
+
+        start = avr.cycle
+        stimulus.append ([(100, pb0, 1), (250, pb0, 0), (400, pb0, 1), (401, pb0, 0)], base = start)
+        self.assertEqual (len (stimulus), 4)
+        self.assertRaises (AVRException, lambda: stimulus.append ([(10, pb0, 1)], base = start))
+        self.assertRaises (AVRException, lambda: stimulus.append ([(500, pb0 + 1, 1)], base = start))
+
+        avr.run_cycles (1000)
+        self.assertEqual (len (stimulus), 0)
+        self.assertEqual (stimulus.played (), 4)
+
+        changes = self.changes (0, start)
+        self.assertEqual ([value for (when, value) in changes], [1, 0, 1, 0])
+        self.assertCycles ([when for (when, value) in changes], [100, 250, 400, 401])
+
+    def test_firmware_follows (self):
+        avr = self.init_recorded_avr ()
+        stimulus = IRQStimulus (avr)
+        pb0 = stimulus.add_ioport_irq ('B', 0)
+        avr.run_cycles (100)
+        self.recorder.close ()
+
+        recorder = self.recorder = IRQRecorder (avr)
+        recorder.add_ioport_irq ('B', 0)
+        recorder.add_ioport_irq ('B', 1)
+
+        start = avr.cycle
+        stimulus.append ([(100, pb0, 1), (250, pb0, 0)], base = start)
+        avr.run_cycles (1000)
+
+        changes = self.changes (1, start)
+        self.assertEqual ([value for (when, value) in changes], [1, 0])
+        self.assertTrue (100 < changes [0][0] < 120)
+        self.assertTrue (250 < changes [1][0] < 270)
+
+    def test_append_while_running (self):
+        avr = self.init_recorded_avr ()
+        stimulus = IRQStimulus (avr)
+        pb0 = stimulus.add_ioport_irq ('B', 0)
+
+        # Each edge schedules the next one
+        def edge (value, arg):
+            if stimulus.played () < 10:
+                stimulus.append ([(50 * (stimulus.played () + 1), pb0, 1 - value)], base = start)
+
+        avr.get_ioport_irq ('B', 0).register_notify (edge)
+        start = avr.cycle
+        stimulus.append ([(50, pb0, 1)], base = start)
+        avr.run_cycles (2000)
+
+        changes = self.changes (0, start)
+        self.assertCycles ([when for (when, value) in changes], range (50, 550, 50))
+        self.assertEqual (stimulus.played (), 10)
+
+    def test_vcd_input (self):
+        directory = tempfile.mkdtemp ()
+        try:
+            filename = os.path.join (directory, "input.vcd")
+            with open (filename, "w") as f:
+                f.write (VCD_INPUT)
+
+            avr = self.init_recorded_avr ()
+            vcd = VCDInput (avr, filename)
+            self.assertEqual (vcd.signals (), ["iogB_0"])
+
+            start = avr.cycle
+            self.assertEqual (avr.run (), stop_Done)
+            rises = [when for (when, value) in self.changes (0, start) if value == 1]
+            self.assertCycles (rises, [100 * 8])
+        finally:
+            shutil.rmtree (directory)
+
+# Run test
+unittest.main ()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+from simavr import *
+from simavrtest import *
+import unittest
+import threading
+import time
+
+class Test (SimavrTest):
+    def run_threads (self, target, count):
+        """Run target (index) in count threads, returns their results or exceptions"""
+
+        results = [None] * count
+
+        def run (index):
+            try:
+                results [index] = target (index)
+            except Exception as e:
+                results [index] = e
+
+        threads = [threading.Thread (target = run, args = (i,)) for i in range (count)]
+        for thread in threads:
+            thread.start ()
+        for thread in threads:
+            thread.join ()
+
+        return results
+
+    def test_gil_released (self):
+        avr = self.init_avr ()
+        avr.set_pacing ("realtime")
+
+        thread = threading.Thread (target = lambda: avr.run_us (50000))
+        thread.start ()
+
+        # The AVR sleeps for its pacing most of the time, we run meanwhile
+        spins = 0
+        while thread.is_alive ():
+            spins += 1
+            time.sleep (0.001)
+        thread.join ()
+
+        self.assertTrue (spins > 10, spins)
+        self.assertTrue (avr.cycle >= 400000)
+
+    def test_callbacks (self):
+        avrs = [self.init_avr () for i in range (4)]
+
+        def target (index):
+            avr = avrs [index]
+            avr.set_pacing ("max_speed")
+            ticks = []
+            toggles = []
+
+            def tick (arg):
+                ticks.append (avr.cycle)
+                if index == 1 and len (ticks) == 50:
+                    avr.break_run ()
+                if index == 2 and len (ticks) == 70:
+                    raise ValueError ("failed in thread " + str (index))
+                return 100
+
+            avr.get_ioport_irq ('B', 0).register_notify (lambda value, arg: toggles.append (value))
+            Timer (avr, 100, tick)
+            return (avr.run_cycles (100000), len (ticks), len (toggles) > 1000)
+
+        results = self.run_threads (target, len (avrs))
+
+        # Breaks and exceptions stay in the thread they happened in
+        self.assertEqual (results [0], (stop_Cycle, 1000, True))
+        self.assertEqual (results [1][:2], (stop_Break, 50))
+        self.assertTrue (isinstance (results [2], ValueError))
+        self.assertEqual (results [3], results [0])
+
+# Run test
+unittest.main ()
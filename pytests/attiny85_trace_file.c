@@ -0,0 +1,17 @@
+#include <avr/io.h>
+
+volatile uint8_t counter;
+
+static void __attribute__ ((noinline)) count () {
+    counter++;
+}
+
+// Main function
+int main () {
+    DDRB = 1 << PB0;
+
+    while (1) {
+        count ();
+        PORTB = counter & 1;
+    }
+}
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+from simavr import *
+from simavrtest import *
+import unittest
+import os
+import shutil
+import tempfile
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class Test (SimavrTest):
+    def setUp (self):
+        SimavrTest.setUp (self)
+        self.directory = tempfile.mkdtemp ()
+        self.addCleanup (shutil.rmtree, self.directory)
+
+    def trace (self, name, cycles = 10000, **kwargs):
+        filename = os.path.join (self.directory, name)
+        avr = self.init_avr ()
+        avr.trace_file_start (filename, chunk_records = 100, **kwargs)
+        avr.run_cycles (cycles)
+        avr.trace_file_stop ()
+        return filename
+
+    def test_records (self):
+        with TraceFile (self.trace ("run.trace", registers = True)) as trace:
+            self.assertEqual (trace.mmcu, "attiny85")
+            records = list (trace)
+            self.assertEqual (len (records), len (trace))
+            self.assertEqual (len (trace.chunks), (len (trace) + 99) // 100)
+
+            # The reset vector first, then one record per instruction
+            self.assertEqual ((records [0].cycle, records [0].pc), (0, 0))
+            cycles = [record.cycle for record in records]
+            self.assertEqual (cycles, sorted (set (cycles)))
+            self.assertTrue (cycles [-1] < 10000)
+            self.assertTrue (any (record.registers for record in records))
+
+            # Instruction running at a cycle
+            (index, position) = trace.seek (5000)
+            record = list (trace.decode (index, position)) [0]
+            self.assertEqual (record, [r for r in records if r.cycle <= 5000] [-1])
+            self.assertEqual (list (trace.read (5000, 3)), records [records.index (record):][:3])
+            self.assertEqual (trace.tail (150), records [-150:])
+
+    def test_compress (self):
+        plain = TraceFile (self.trace ("plain.trace"))
+        compressed = TraceFile (self.trace ("compressed.trace", compress = True))
+        try:
+            self.assertEqual (list (plain), list (compressed))
+            self.assertTrue (all (chunk.compressed for chunk in compressed.chunks))
+            self.assertTrue (os.path.getsize (compressed.filename) < os.path.getsize (plain.filename) / 4)
+        finally:
+            plain.close ()
+            compressed.close ()
+
+    def test_cut_short (self):
+        filename = self.trace ("cut.trace")
+        with TraceFile (filename) as trace:
+            chunks = trace.chunks
+
+        # Only the whole chunks are read
+        with open (filename, "r+b") as f:
+            f.truncate (chunks [3].offset + 10)
+        with TraceFile (filename) as trace:
+            self.assertEqual (trace.chunks, chunks [:3])
+
+    @unittest.skipIf (numpy == None, "NumPy is not available")
+    def test_numpy (self):
+        with TraceFile (self.trace ("numpy.trace")) as trace:
+            records = list (trace)
+
+            chunk = trace.records (1)
+            self.assertEqual (list (trace.cycles (1)), [r.cycle for r in records [100:200]])
+            self.assertEqual (list (chunk ["pc"]), [r.pc for r in records [100:200]])
+            del chunk
+
+            # The reset vector is only run once
+            (cycles, found) = trace.filter_pc (0, 2)
+            self.assertEqual ((list (cycles), list (found ["pc"])), ([0], [0]))
+
+            (cycles, found) = trace.filter_pc (2, 0x10000)
+            self.assertEqual (list (cycles), [r.cycle for r in records [1:]])
+
+# Run test
+unittest.main ()
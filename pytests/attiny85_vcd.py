@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+from simavr import *
+from simavrtest import *
+import unittest
+import tempfile
+import shutil
+import gzip
+import os
+import sys
+
+class Test (SimavrTest):
+    def setUp (self):
+        super (Test, self).setUp ()
+        self.directory = tempfile.mkdtemp ()
+
+    def tearDown (self):
+        shutil.rmtree (self.directory)
+
+    def test_gzip (self):
+        avr = self.init_avr ()
+        filename = os.path.join (self.directory, "trace.vcd.gz")
+
+        vcd = VCD (avr, filename, flush_bytes = 4096)
+        vcd.add_ioport_signal ('B', 0)
+
+        avr.run_cycles (1000)
+        self.assertTrue (vcd.dropped () > 0)
+        dropped = vcd.dropped ()
+
+        vcd.start ()
+        avr.run_cycles (200000)
+        vcd.stop ()
+
+        self.assertEqual (vcd.dropped (), dropped)
+        vcd.close ()
+
+        lines = gzip.open (filename).read ().decode ().splitlines ()
+        self.assertTrue ("$enddefinitions $end" in lines)
+
+        stamps = [int (line[1:]) for line in lines if line.startswith ("#")]
+        self.assertTrue (len (stamps) > 1000)
+        self.assertEqual (stamps, sorted (stamps))
+
+    def test_flush_cycles (self):
+        avr = self.init_avr ()
+        filename = os.path.join (self.directory, "trace.vcd")
+
+        vcd = VCD (avr, filename, flush_cycles = 0)
+        vcd.add_ioport_signal ('B', 0)
+        vcd.start ()
+        avr.run_cycles (20000)
+
+        size = os.path.getsize (filename)
+        vcd.set_flush (cycles = 1000)
+        avr.run_cycles (20000)
+        self.assertTrue (os.path.getsize (filename) > size)
+
+        vcd.close ()
+        self.assertTrue (open (filename).read ().startswith ("$timescale"))
+
+    def test_terminate (self):
+        filename = os.path.join (self.directory, "trace.vcd")
+
+        # The VCD is closed along with the AVR
+        with self.init_avr () as avr:
+            vcd = VCD (avr, filename)
+            vcd.add_ioport_signal ('B', 0)
+            vcd.start ()
+            avr.run_cycles (20000)
+
+        self.assertTrue (open (filename).read ().startswith ("$timescale"))
+        vcd.close ()
+
+# Run test
+unittest.main ()
@@ -0,0 +1,16 @@
+#include <avr/io.h>
+
+// Fixed address, known to the test
+#define COUNTER (*(volatile uint8_t *) 0x100)
+
+// Main function
+int main () {
+    DDRB = 1 << PB1;
+    COUNTER = 0;
+
+    while (1) {
+        uint8_t counter = COUNTER + 1;
+        COUNTER = counter;
+        PORTB = (counter & 1) << PB1;
+    }
+}
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+from simavr import *
+from simavrtest import *
+import unittest
+
+# See attiny85_watch.c
+COUNTER = 0x100
+
+# Data address of PORTB on the attiny85
+PORTB = 0x38
+
+class Test (SimavrTest):
+    def test_hits (self):
+        avr = self.init_avr ()
+        write = avr.watch (COUNTER)
+        read = avr.watch (COUNTER, read = True, write = False)
+        port = avr.watch (PORTB)
+        avr.run_cycles (10000)
+
+        watchpoints = avr.get_watchpoints ()
+        self.assertTrue (watchpoints.hits (write) > 100)
+        # One read and two writes per loop, the run may stop in the middle of one
+        self.assertTrue (abs (watchpoints.hits (read) - watchpoints.hits (port)) <= 1)
+        self.assertTrue (abs (watchpoints.hits (read) - watchpoints.hits (write)) <= 1)
+
+        # Writes of 0 and of the increments, the log keeps the last ones
+        log = watchpoints.log ()
+        self.assertEqual (len (log) + watchpoints.lost (),
+                          watchpoints.hits (write) + watchpoints.hits (read) + watchpoints.hits (port))
+        writes = [hit for hit in log if hit.index == write]
+        self.assertEqual ([hit.value for hit in writes [1:]],
+                          [(hit.value + 1) & 0xff for hit in writes [:-1]])
+        self.assertTrue (all (hit.addr == COUNTER and hit.kind == AVR_WATCH_WRITE for hit in writes))
+        self.assertEqual (log [-1], watchpoints.last ())
+
+        watchpoints.clear_log ()
+        watchpoints.remove (port)
+        hits = watchpoints.hits (port)
+        avr.run_cycles (1000)
+        self.assertEqual (watchpoints.hits (port), hits)
+        self.assertFalse ([hit for hit in watchpoints.log () if hit.index == port])
+
+    def test_stop (self):
+        avr = self.init_avr ()
+        avr.watch (COUNTER, value = 42, stop = True)
+        self.assertEqual (avr.run_cycles (100000), stop_Break)
+        self.assertEqual (avr.sram [COUNTER:COUNTER + 1].tobytes (), b'\x2a')
+        self.assertEqual (avr.get_watchpoints ().last ().value, 42)
+
+    def test_callback (self):
+        avr = self.init_avr ()
+        values = []
+        avr.watch (PORTB, value = 1 << 1, mask = 1 << 1,
+                   callback = lambda hit, arg: arg.append (hit.value), callback_arg = values)
+        avr.run_cycles (1000)
+        self.assertTrue (values)
+        self.assertEqual (set (values), set ([1 << 1]))
+
+    def test_errors (self):
+        avr = self.init_avr ()
+        self.assertRaises (AVRException, lambda: avr.watch (0))
+        self.assertRaises (AVRException, lambda: avr.watch (avr.ramend, 2))
+        self.assertRaises (AVRException, lambda: Watchpoints (avr))
+
+        index = avr.watch (COUNTER)
+        watchpoints = avr.get_watchpoints ()
+        self.assertEqual (watchpoints.hits (index), 0)
+        self.assertRaises (IndexError, lambda: watchpoints.hits (index + 1))
+        self.assertRaises (IndexError, lambda: watchpoints.hits (-1))
+
+# Run test
+unittest.main ()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# Micro-benchmark of python callbacks called from the simulator.
+# Usage: ./bench_callbacks.py [firmware] [mcu]
+
+from simavr import *
+import sys
+import time
+
+def bench_timer (avr, count):
+    """Timer that re-arms itself on every cycle."""
+
+    calls = [0]
+
+    def callback (arg):
+        calls[0] += 1
+        if calls[0] < count:
+            return 1
+
+    avr.add_timer (1, callback)
+
+    start = time.time ()
+    while calls[0] < count:
+        avr.run_cycles (count)
+
+    return calls[0] / (time.time () - start)
+
+def bench_notify (avr, count):
+    """Notification hook of an irq raised from python."""
+
+    calls = [0]
+
+    def callback (value, arg):
+        calls[0] += 1
+
+    irq = IRQ (pool = avr.irq_pool)
+    irq.register_notify (callback)
+
+    start = time.time ()
+    for i in range (count):
+        irq.raise_irq (i & 1)
+
+    return calls[0] / (time.time () - start)
+
+if __name__ == "__main__":
+    filename = len (sys.argv) > 1 and sys.argv[1] or "attiny85_pin_interrupt.hex"
+    mcu = len (sys.argv) > 2 and sys.argv[2] or "attiny85"
+
+    avr = AVR (filename = filename, mcu = mcu, freq = 8000000, quiet = True)
+
+    print ("timer:  %10.0f callbacks/s" % bench_timer (avr, 1000000))
+    print ("notify: %10.0f callbacks/s" % bench_notify (avr, 1000000))
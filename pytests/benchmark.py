@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# Benchmark suite: simulation speed of the firmwares of tests/, overhead of the
+# python bindings and startup time, written as JSON to compare builds.
+# Usage: ./benchmark.py run [-o results.json] [--tests-dir ../tests] [--repeat 3]
+#        ./benchmark.py compare baseline.json results.json [--threshold 10]
+# The compare command exits with 1 if a result regressed beyond the threshold (%).
+
+from simavr import *
+from bench_callbacks import bench_timer, bench_notify
+import argparse
+import glob
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+# Benchmarks are repeated for at least that long (seconds)
+MIN_TIME = 0.2
+
+# Frequency of the firmware of the bindings benchmarks
+BINDINGS_FREQ = 8000000
+
+def load_avr (filename, mcu = None, freq = None):
+    """AVR for the given firmware, run at max speed, silent and not waiting for gdb on crashes."""
+
+    avr = AVR (filename = filename, mcu = mcu, freq = freq, quiet = True, pacing = Pacing.max_speed)
+    avr.gdb_port = 0
+    avr.log = LOG_NONE
+    return avr
+
+def bench_firmware (filename, mcu, freq, cycles):
+    """Simulated MHz, restarting the firmware each time it stops, until MIN_TIME."""
+
+    simulated = 0
+    elapsed = 0
+
+    while elapsed < MIN_TIME:
+        avr = load_avr (filename, mcu, freq)
+        try:
+            start = time.time ()
+            avr.run_cycles (cycles)
+            elapsed += time.time () - start
+            simulated += avr.cycle
+        finally:
+            avr.terminate ()
+
+    return simulated / elapsed / 1e6
+
+def bench_startup (filename, mcu, freq, cached):
+    """Milliseconds to construct and terminate an AVR, parsing the firmware again unless cached."""
+
+    count = 0
+    start = time.time ()
+
+    while time.time () - start < MIN_TIME:
+        if not cached:
+            Firmware._cache.clear ()
+        load_avr (filename, mcu, freq).terminate ()
+        count += 1
+
+    return (time.time () - start) * 1000 / count
+
+def bench_run_cycles (avr, cycles):
+    """run_cycles calls per second, running the given cycles each."""
+
+    count = 0
+    start = time.time ()
+
+    while time.time () - start < MIN_TIME:
+        for i in range (1000):
+            avr.run_cycles (cycles)
+        count += 1000
+
+    return count / (time.time () - start)
+
+def bench_vcd (avr, count):
+    """Value changes written per second to a VCD file, raised from C by an IRQ stimulus."""
+
+    directory = tempfile.mkdtemp ()
+    try:
+        irq = IRQ (pool = avr.irq_pool)
+        stimulus = IRQStimulus (avr, count)
+        index = stimulus.add_irq (irq)
+        stimulus.append ([(i * 10, index, i & 1) for i in range (count)], base = avr.cycle + 10)
+
+        vcd = VCD (avr, os.path.join (directory, "bench.vcd"), flush_period = 10000)
+        vcd.add_signal (irq, 1, "signal")
+        vcd.start ()
+
+        start = time.time ()
+        avr.run_cycles (count * 10 + 20)
+        vcd.close ()
+        elapsed = time.time () - start
+
+        played = stimulus.played ()
+        stimulus.close ()
+        return played / elapsed
+    finally:
+        shutil.rmtree (directory)
+
+def result (value, unit, higher_is_better = True):
+    """One benchmark result."""
+
+    return { "value": value, "unit": unit, "higher_is_better": higher_is_better }
+
+def run (args):
+    """Run the benchmarks, returns the JSON document."""
+
+    firmwares = sorted (os.path.abspath (f) for f in glob.glob (os.path.join (args.tests_dir, "at*.axf")))
+    bindings = os.path.abspath (args.firmware)
+    results = dict ()
+
+    def best (name, function, unit, higher_is_better = True):
+        values = [function () for i in range (args.repeat)]
+        value = max (values) if higher_is_better else min (values)
+        results [name] = result (value, unit, higher_is_better)
+        print ("%-40s %12.3f %s" % (name, value, unit))
+
+    # The firmwares write their traces in the current directory
+    directory = tempfile.mkdtemp ()
+    cwd = os.getcwd ()
+    os.chdir (directory)
+    try:
+        for filename in firmwares:
+            name = os.path.basename (filename).replace (".axf", "")
+            best ("firmware." + name, lambda: bench_firmware (filename, args.mcu, args.freq, args.cycles), "MHz")
+
+        best ("startup.load", lambda: bench_startup (bindings, args.binding_mcu, BINDINGS_FREQ, False), "ms", False)
+        best ("startup.cached", lambda: bench_startup (bindings, args.binding_mcu, BINDINGS_FREQ, True), "ms", False)
+
+        avr = load_avr (bindings, args.binding_mcu, BINDINGS_FREQ)
+        try:
+            best ("bindings.run_cycles", lambda: bench_run_cycles (avr, 100), "calls/s")
+            best ("bindings.timer", lambda: bench_timer (avr, 200000), "callbacks/s")
+            best ("bindings.notify", lambda: bench_notify (avr, 200000), "callbacks/s")
+            best ("vcd.changes", lambda: bench_vcd (avr, 200000), "changes/s")
+        finally:
+            avr.terminate ()
+    finally:
+        os.chdir (cwd)
+        shutil.rmtree (directory)
+
+    return {
+        "version": 1,
+        "time": time.strftime ("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version (),
+        "platform": platform.platform (),
+        "results": results,
+    }
+
+def compare (baseline, current, threshold):
+    """Print the changes of the results, returns the names of the ones that regressed."""
+
+    regressions = []
+
+    for name in sorted (set (baseline ["results"]) | set (current ["results"])):
+        if not name in current ["results"]:
+            print ("%-40s missing" % name)
+            continue
+        if not name in baseline ["results"]:
+            print ("%-40s new" % name)
+            continue
+
+        old = baseline ["results"][name]
+        new = current ["results"][name]
+        change = (new ["value"] - old ["value"]) * 100.0 / old ["value"] if old ["value"] else 0.0
+
+        # Positive when it got worse
+        worse = -change if new ["higher_is_better"] else change
+        regressed = worse > threshold
+        if regressed:
+            regressions.append (name)
+
+        print ("%-40s %12.3f -> %12.3f %-12s %+7.1f%%%s" % (name, old ["value"], new ["value"], new ["unit"],
+                                                          change, "  REGRESSION" if regressed else ""))
+
+    return regressions
+
+def main ():
+    here = os.path.dirname (os.path.abspath (__file__))
+
+    parser = argparse.ArgumentParser (description = "simavr benchmark suite")
+    commands = parser.add_subparsers (dest = "command")
+
+    run_parser = commands.add_parser ("run", help = "run the benchmarks")
+    run_parser.add_argument ("-o", "--output", help = "JSON file to write the results to")
+    run_parser.add_argument ("--tests-dir", default = os.path.join (here, "..", "tests"),
+                             help = "directory of the at*.axf firmwares")
+    run_parser.add_argument ("--mcu", help = "mcu of the firmwares, by default the one in their ELF")
+    run_parser.add_argument ("--freq", type = int, help = "frequency of the firmwares, by default the one in their ELF")
+    run_parser.add_argument ("--cycles", type = int, default = 10000000,
+                             help = "maximum cycles of a firmware run")
+    run_parser.add_argument ("--firmware", default = os.path.join (here, "attiny85_parallel.hex"),
+                             help = "firmware running forever, for the bindings benchmarks")
+    run_parser.add_argument ("--binding-mcu", default = "attiny85", help = "mcu of that firmware")
+    run_parser.add_argument ("--repeat", type = int, default = 3, help = "runs of each benchmark, the best is kept")
+
+    compare_parser = commands.add_parser ("compare", help = "compare results to a baseline")
+    compare_parser.add_argument ("baseline")
+    compare_parser.add_argument ("current")
+    compare_parser.add_argument ("--threshold", type = float, default = 10.0,
+                                 help = "regression threshold in percent")
+
+    args = parser.parse_args ()
+
+    if args.command == "run":
+        document = run (args)
+        if args.output:
+            with open (args.output, "w") as f:
+                json.dump (document, f, indent = 2, sort_keys = True)
+        return 0
+
+    if args.command == "compare":
+        with open (args.baseline) as f:
+            baseline = json.load (f)
+        with open (args.current) as f:
+            current = json.load (f)
+
+        regressions = compare (baseline, current, args.threshold)
+        if regressions:
+            print ("%d regression(s) beyond %.1f%%" % (len (regressions), args.threshold))
+            return 1
+        return 0
+
+    parser.print_help ()
+    return 2
+
+if __name__ == "__main__":
+    sys.exit (main ())
@@ -20,7 +20,10 @@
 #include "avr_twi.h"
 #include "avr_uart.h"
 #include "avr_watchdog.h"
+#include "sim_adc_waveform.h"
 #include "sim_core.h"
+#include "sim_coverage.h"
+#include "sim_cosim.h"
 #include "sim_cycle_timers.h"
 #include "sim_elf.h"
 #include "sim_gdb.h"
@@ -28,8 +31,16 @@
 #include "sim_interrupts.h"
 #include "sim_io.h"
 #include "sim_irq.h"
+#include "sim_irq_recorder.h"
+#include "sim_irq_stimulus.h"
+#include "sim_profile.h"
+#include "sim_snapshot.h"
+#include "sim_stats.h"
 #include "sim_time.h"
+#include "sim_trace_file.h"
+#include "sim_uart_bridge.h"
 #include "sim_vcd_file.h"
+#include "sim_watchpoints.h"
 %}
 
 %include "stdint.i"
@@ -51,15 +62,72 @@
 %include "avr_watchdog.h"
 %include "sim_avr.h"
 %include "sim_avr_types.h"
+/* Takes raw sample pointers, see avr_adc_waveform_queue_py */
+%ignore avr_adc_waveform_queue;
+%include "sim_adc_waveform.h"
 %include "sim_core.h"
+/* Take raw bitmaps, see avr_coverage_count_py and avr_coverage_merge_py */
+%ignore avr_coverage_count;
+%ignore avr_coverage_merge;
+%include "sim_coverage.h"
+%include "sim_cosim.h"
 %include "sim_cycle_timers.h"
 %include "sim_elf.h"
 %include "sim_gdb.h"
 %include "sim_hex.h"
 %include "sim_interrupts.h"
 %include "sim_io.h"
+/* Python never walks the pool while the AVR changes it */
+%ignore avr_irq_pool_lock;
+%ignore avr_irq_pool_unlock;
 %include "sim_irq.h"
+%include "sim_irq_recorder.h"
+%include "sim_irq_stimulus.h"
+%include "sim_profile.h"
+%include "sim_snapshot.h"
+/* Called by the cycle timers, see avr_stats_py for the counters */
+%ignore avr_stats_timer_fire;
+%include "sim_stats.h"
 %include "sim_time.h"
+/* Called by the core */
+%ignore avr_trace_file_record;
+%include "sim_trace_file.h"
+%include "sim_uart_bridge.h"
+/* Called by the core for each access */
+%ignore avr_watchpoints_access;
+%ignore avr_watchpoints_hit;
+%include "sim_watchpoints.h"
+/* Writing or reading the files may take a while, let other threads run */
+%exception avr_trace_file_flush {
+    Py_BEGIN_ALLOW_THREADS
+    $action
+    Py_END_ALLOW_THREADS
+}
+%exception avr_trace_file_stop {
+    Py_BEGIN_ALLOW_THREADS
+    $action
+    Py_END_ALLOW_THREADS
+}
+%exception avr_vcd_init_input {
+    Py_BEGIN_ALLOW_THREADS
+    $action
+    Py_END_ALLOW_THREADS
+}
+%exception avr_vcd_start {
+    Py_BEGIN_ALLOW_THREADS
+    $action
+    Py_END_ALLOW_THREADS
+}
+%exception avr_vcd_stop {
+    Py_BEGIN_ALLOW_THREADS
+    $action
+    Py_END_ALLOW_THREADS
+}
+%exception avr_vcd_close {
+    Py_BEGIN_ALLOW_THREADS
+    $action
+    Py_END_ALLOW_THREADS
+}
 %include "sim_vcd_file.h"
 
 /* - - - Custom stuff - - - */
@@ -67,6 +135,104 @@
 %include "carrays.i"
 %array_class(struct ihex_chunk_t, ihex_chunk_t_array);
 
+/* elf_firmware_t */
+
+%{
+    /* Merge the IHEX chunks of the given segment [start, end) into one image
+       filled with 0xff. Returns the image, or NULL if there are no such chunks. */
+    static uint8_t *__avr_ihex_merge__ (ihex_chunk_p chunks, int count, uint32_t load_base,
+                                        uint32_t start, uint32_t end,
+                                        uint32_t *base, uint32_t *size) {
+        uint32_t low = end, high = start;
+
+        for (int ci = 0; ci < count; ci++) {
+            uint32_t addr = chunks[ci].baseaddr + load_base;
+            if (addr >= start && addr < end) {
+                if (addr < low) low = addr;
+                if (addr + chunks[ci].size > high) high = addr + chunks[ci].size;
+            }
+        }
+
+        if (low >= high)
+            return NULL;
+
+        uint8_t *image = malloc (high - low);
+        memset (image, 0xff, high - low);
+
+        for (int ci = 0; ci < count; ci++) {
+            uint32_t addr = chunks[ci].baseaddr + load_base;
+            if (addr >= start && addr < end)
+                memcpy (image + addr - low, chunks[ci].data, chunks[ci].size);
+        }
+
+        *base = low - start;
+        *size = high - low;
+        return image;
+    }
+%}
+
+%inline %{
+    /* Copy firmware description. Flash and eeprom images are not copied,
+       they are shared by both descriptions. */
+    void elf_firmware_copy_py (elf_firmware_t *dst, const elf_firmware_t *src) {
+        *dst = *src;
+    }
+
+    /* Read an IHEX file into the firmware. Chunks of flash and of eeprom are merged,
+       the images are freed by elf_free_firmware. Returns the number of chunks, or -1. */
+    int elf_firmware_read_ihex_py (elf_firmware_t *firmware, const char *filename, uint32_t load_base) {
+        ihex_chunk_p chunks = NULL;
+        int count = read_ihex_chunks (filename, &chunks);
+        uint32_t eebase = 0;
+
+        if (count <= 0) {
+            free_ihex_chunks (chunks);
+            free (chunks);
+            return -1;
+        }
+
+        memset (firmware, 0, sizeof (*firmware));
+
+        firmware->flash = __avr_ihex_merge__ (chunks, count, load_base,
+                                              AVR_SEGMENT_OFFSET_FLASH, 1 * 1024 * 1024,
+                                              &firmware->flashbase, &firmware->flashsize);
+        firmware->eeprom = __avr_ihex_merge__ (chunks, count, load_base,
+                                               AVR_SEGMENT_OFFSET_EEPROM, AVR_SEGMENT_OFFSET_EEPROM + 0x10000,
+                                               &eebase, &firmware->eesize);
+
+        /* EEPROM is loaded from its start */
+        if (firmware->eeprom && eebase > 0) {
+            firmware->eeprom = realloc (firmware->eeprom, eebase + firmware->eesize);
+            memmove (firmware->eeprom + eebase, firmware->eeprom, firmware->eesize);
+            memset (firmware->eeprom, 0xff, eebase);
+            firmware->eesize += eebase;
+        }
+
+        free_ihex_chunks (chunks);
+        free (chunks);
+        return count;
+    }
+
+    /* List of (address, name) of the symbols read by elf_read_firmware, sorted by address */
+    PyObject *elf_firmware_symbols_py (elf_firmware_t *firmware) {
+        PyObject *list = PyList_New (0);
+
+#if ELF_SYMBOLS
+        for (uint32_t i = 0; list && i < firmware->symbolcount; i++) {
+            PyObject *item = Py_BuildValue ("(kN)", (unsigned long) firmware->symbol[i]->addr,
+                                            SWIG_FromCharPtr (firmware->symbol[i]->symbol));
+            if (item == NULL || PyList_Append (list, item) < 0) {
+                Py_XDECREF (item);
+                Py_DECREF (list);
+                return NULL;
+            }
+            Py_DECREF (item);
+        }
+#endif
+        return list;
+    }
+%}
+
 /* avr_t */
 
 %nodefaultdtor avr_t;
@@ -76,9 +242,129 @@
     }
 
     ~avr_t () {
+        /* Not terminated by python yet */
+        if (self->data)
+            avr_terminate (self);
+
+        free (self);
     }
 }
 
+/* Run loop */
+
+%inline %{
+    /* Reasons for avr_run_until_py to return */
+    enum {
+        stop_Cycle = 0, // requested cycle is reached
+        stop_Done,      // avr software stopped gracefully (cpu_Done)
+        stop_Crashed,   // avr software crashed (cpu_Crashed)
+        stop_Break,     // avr_run_break_py was called from a callback
+    };
+%}
+
+%{
+    /* Nesting level of avr_run_until_py. While it is running, python
+       exceptions raised from callbacks are kept and reraised by the loop.
+       The run state is per thread, so AVRs can be run from several threads. */
+    static __thread int __avr_run_depth__ = 0;
+
+    /* Set when a python exception is pending for the run loop */
+    static __thread int __avr_run_error__ = 0;
+
+    /* Set when a callback asks the run loop to return */
+    static __thread int __avr_run_break__ = 0;
+
+    static void __avr_py_callback_failed__ (void) {
+        if (__avr_run_depth__ > 0) {
+            __avr_run_error__ = 1;
+        } else {
+            PyErr_Print ();
+        }
+    }
+%}
+
+%init %{
+    /* Python before 3.7 creates the GIL on demand, the run loop releases it */
+#if PY_VERSION_HEX < 0x03070000
+    PyEval_InitThreads ();
+#endif
+%}
+
+%inline %{
+    /* Ask avr_run_until_py to return stop_Break after the current instruction.
+       Does nothing if the loop is not running. */
+    void avr_run_break_py () {
+        if (__avr_run_depth__ > 0)
+            __avr_run_break__ = 1;
+    }
+
+    /* Run AVR until the given cycle is reached, the state of the cpu becomes
+       cpu_Done or cpu_Crashed, or a break is requested. Returns one of the stop_*
+       reasons. If a python callback raises an exception, the loop stops and
+       the exception is raised. The GIL is released while the AVR runs, python
+       callbacks take it back, so AVRs can run in parallel threads. */
+    PyObject *avr_run_until_py (avr_t *avr, avr_cycle_count_t end_cycle) {
+        int reason = stop_Cycle;
+        unsigned int count = 0;
+
+        __avr_run_depth__++;
+
+        PyThreadState *state = PyEval_SaveThread ();
+
+        while (avr->cycle < end_cycle) {
+            if (avr->state == cpu_Done) {
+                reason = stop_Done;
+                break;
+            }
+
+            if (avr->state == cpu_Crashed) {
+                reason = stop_Crashed;
+                break;
+            }
+
+            avr_run (avr);
+
+            if (__avr_run_error__ || __avr_run_break__)
+                break;
+
+            /* Let python handle signals (i.e. Ctrl-C) from time to time */
+            if ((++count & 0xffff) == 0) {
+                PyEval_RestoreThread (state);
+                int failed = PyErr_CheckSignals () < 0;
+                state = PyEval_SaveThread ();
+
+                if (failed) {
+                    __avr_run_error__ = 1;
+                    break;
+                }
+            }
+        }
+
+        PyEval_RestoreThread (state);
+
+        /* The loop might be stopped by the last instruction */
+        if (reason == stop_Cycle && !__avr_run_error__) {
+            if (avr->state == cpu_Done) {
+                reason = stop_Done;
+            } else if (avr->state == cpu_Crashed) {
+                reason = stop_Crashed;
+            } else if (__avr_run_break__) {
+                reason = stop_Break;
+            }
+        }
+
+        __avr_run_break__ = 0;
+        __avr_run_depth__--;
+
+        if (__avr_run_error__) {
+            __avr_run_error__ = 0;
+            return NULL;
+        }
+
+        return PyInt_FromLong (reason);
+    }
+%}
+
 /* avr_irq_t */
 
 %nodefaultdtor avr_irq_t;
@@ -95,70 +381,100 @@
     }
 }
 
+%{
+    /* Calls the given python callable with no arguments or with two arguments,
+       using vectorcall when it is available. */
+    static PyObject *__avr_call_noargs__ (PyObject *callable) {
+#if PY_VERSION_HEX >= 0x03090000
+        return PyObject_CallNoArgs (callable);
+#else
+        return PyObject_CallObject (callable, NULL);
+#endif
+    }
+
+    static PyObject *__avr_call_2args__ (PyObject *callable, PyObject *arg1, PyObject *arg2) {
+#if PY_VERSION_HEX >= 0x03090000
+        PyObject *args[2] = { arg1, arg2 };
+        return PyObject_Vectorcall (callable, args, 2, NULL);
+#else
+        return PyObject_CallFunctionObjArgs (callable, arg1, arg2, NULL);
+#endif
+    }
+%}
+
+/* This is a way to pass callback from python. Param is a tuple (irq, callback, callback_arg),
+   callback is called as callback (value, callback_arg). */
 %inline %{
     void __avr_ireq_notify_runner__ (struct avr_irq_t *irq, uint32_t value, void *param) {
-        PyObject *param_casted = (PyObject*) param;
-
-        PyObject *this = PyTuple_GetItem (param_casted, 0);
-        if (this == NULL) {
-            PyErr_Print ();
+        if (__avr_run_error__)
             return;
-        }
 
-        Py_INCREF (this);
-
-        PyObject *cb = PyObject_GetAttrString (this, "_notify_handler");
+        /* The run loop doesn't hold the GIL */
+        PyGILState_STATE gil = PyGILState_Ensure ();
+        PyObject *param_casted = (PyObject*) param;
 
-        PyObject *arglist = Py_BuildValue ("(Ol)", param, (long)value);
+        PyObject *cb = PyTuple_GET_ITEM (param_casted, 1);
+        PyObject *arg = PyTuple_GET_ITEM (param_casted, 2);
+        PyObject *pyvalue = PyInt_FromLong ((long)value);
 
-        PyObject_Repr(param_casted);
-        PyObject *result = PyEval_CallObject (cb, arglist);
+        /* Keep param alive, the callback may unregister itself */
+        Py_INCREF (param_casted);
+        PyObject *result = __avr_call_2args__ (cb, pyvalue, arg);
 
-        Py_DECREF (this);
-        Py_DECREF (arglist);
-        Py_DECREF (cb);
+        Py_DECREF (param_casted);
+        Py_DECREF (pyvalue);
 
         if (result == NULL) {
-            PyErr_Print ();
+            __avr_py_callback_failed__ ();
         } else {
             Py_DECREF (result);
         }
+
+        PyGILState_Release (gil);
     }
 
     void avr_irq_register_notify_py (avr_irq_t *irq, PyObject *param) {
         avr_irq_register_notify (irq, &__avr_ireq_notify_runner__, param);
     }
+
+    void avr_irq_unregister_notify_py (avr_irq_t *irq, PyObject *param) {
+        avr_irq_unregister_notify (irq, &__avr_ireq_notify_runner__, param);
+    }
 %}
 
 /* avr_cycle_timer_t */
 
-/* This is a way to pass callback from python. Don't use unless you know what you are doing! */
+/* This is a way to pass callback from python. Param is a callable (resolved once by the caller)
+   that returns the cycle to run again at, or None/0. Don't use unless you know what you are doing! */
 %inline %{
     avr_cycle_count_t __avr_cycle_timer_runner__ (struct avr_t *avr,
                                                   avr_cycle_count_t when,
                                                   void *param)
     {
-        PyObject *this = (PyObject*) param;
+        if (__avr_run_error__)
+            return 0;
 
-        PyObject *cb = PyObject_GetAttrString (this, "_timer_handler");
-        PyObject *arglist = Py_BuildValue ("()");
-
-        PyObject *result = PyEval_CallObject (cb, arglist);
+        /* The run loop doesn't hold the GIL */
+        PyGILState_STATE gil = PyGILState_Ensure ();
+        PyObject *this = (PyObject*) param;
 
-        Py_DECREF (arglist);
-        Py_DECREF (cb);
+        /* Keep the callable alive, the timer may be cancelled by itself */
+        Py_INCREF (this);
+        PyObject *result = __avr_call_noargs__ (this);
+        Py_DECREF (this);
 
         unsigned long long ret = 0;
         if (result == NULL) {
-            PyErr_Print ();
+            __avr_py_callback_failed__ ();
         } else {
-            if (SWIG_AsVal_unsigned_SS_long_SS_long (result, &ret) != SWIG_OK) {
+            if (result != Py_None && SWIG_AsVal_unsigned_SS_long_SS_long (result, &ret) != SWIG_OK) {
                 ret = 0;
             }
 
             Py_DECREF (result);
         }
 
+        PyGILState_Release (gil);
         return (avr_cycle_count_t) ret;
     }
 
@@ -171,6 +487,605 @@
     {
         avr_cycle_timer_cancel (avr, &__avr_cycle_timer_runner__, param);
     }
+
+    avr_cycle_count_t avr_cycle_timer_status_py (avr_t *avr, PyObject *param)
+    {
+        return avr_cycle_timer_status (avr, &__avr_cycle_timer_runner__, param);
+    }
+%}
+
+/* avr_snapshot_t */
+
+%inline %{
+    /* Saves the state of the avr as bytes. Timers implemented in python are not saved. */
+    PyObject *avr_snapshot_save_py (avr_t *avr) {
+        avr_snapshot_t *snapshot = avr_snapshot_save (avr, &__avr_cycle_timer_runner__);
+        if (snapshot == NULL) {
+            return PyErr_NoMemory ();
+        }
+
+        PyObject *result = PyBytes_FromStringAndSize ((const char*) snapshot, snapshot->size);
+        free (snapshot);
+
+        return result;
+    }
+
+    /* Restores the state saved by avr_snapshot_save_py. Returns 0 or -1 if it doesn't match the avr. */
+    PyObject *avr_snapshot_restore_py (avr_t *avr, PyObject *data) {
+        Py_buffer buffer;
+
+        if (PyObject_GetBuffer (data, &buffer, PyBUF_SIMPLE) < 0) {
+            return NULL;
+        }
+
+        /* Copy it to have it aligned */
+        avr_snapshot_t *snapshot = malloc (buffer.len);
+        if (snapshot == NULL) {
+            PyBuffer_Release (&buffer);
+            return PyErr_NoMemory ();
+        }
+        memcpy (snapshot, buffer.buf, buffer.len);
+
+        int result = -1;
+        if (buffer.len >= sizeof (avr_snapshot_t) && snapshot->size == buffer.len) {
+            result = avr_snapshot_restore (avr, snapshot);
+        }
+
+        free (snapshot);
+        PyBuffer_Release (&buffer);
+
+        return PyInt_FromLong (result);
+    }
+%}
+
+/* avr_irq_recorder_t */
+
+%{
+    /* Exports memory of a python object (ie the AVR) to memoryviews, without copying it.
+       It keeps a reference to that object, so it is not collected while the views are used,
+       and the memory is detached before that object frees it, see avr_exporter_detach_py. */
+    typedef struct {
+        PyObject_HEAD
+        PyObject *owner;
+        void **slot;        /* where the owner keeps the memory, NULL once detached */
+        void *buf;
+        Py_ssize_t len;
+        int readonly;
+        PyObject *weakrefs;
+    } __avr_exporter_t;
+
+    static int __avr_exporter_getbuffer__ (PyObject *self, Py_buffer *buffer, int flags) {
+        static char empty[1];
+        __avr_exporter_t *exporter = (__avr_exporter_t*) self;
+
+        return PyBuffer_FillInfo (buffer, self, exporter->len ? exporter->buf : empty, exporter->len,
+                                  exporter->readonly, flags);
+    }
+
+    static void __avr_exporter_dealloc__ (PyObject *self) {
+        __avr_exporter_t *exporter = (__avr_exporter_t*) self;
+
+        if (exporter->weakrefs != NULL) {
+            PyObject_ClearWeakRefs (self);
+        }
+        if (exporter->slot == NULL) {
+            free (exporter->buf);
+        }
+        Py_XDECREF (exporter->owner);
+        PyObject_Del (self);
+    }
+
+    static PyBufferProcs __avr_exporter_buffer__ = {
+        .bf_getbuffer = __avr_exporter_getbuffer__,
+    };
+
+    static PyTypeObject __avr_exporter_type__ = {
+        PyVarObject_HEAD_INIT (NULL, 0)
+        .tp_name = "csimavr.exporter",
+        .tp_basicsize = sizeof (__avr_exporter_t),
+        .tp_dealloc = __avr_exporter_dealloc__,
+        .tp_as_buffer = &__avr_exporter_buffer__,
+#ifdef Py_TPFLAGS_HAVE_NEWBUFFER
+        .tp_flags = Py_TPFLAGS_DEFAULT | Py_TPFLAGS_HAVE_NEWBUFFER,
+#else
+        .tp_flags = Py_TPFLAGS_DEFAULT,
+#endif
+        .tp_weaklistoffset = offsetof (__avr_exporter_t, weakrefs),
+    };
+
+    /* Returns an exporter of the len bytes of memory that owner keeps in slot */
+    static PyObject *__avr_exporter__ (PyObject *owner, void **slot, Py_ssize_t len, int readonly) {
+        if (PyType_Ready (&__avr_exporter_type__) < 0) {
+            return NULL;
+        }
+
+        __avr_exporter_t *exporter = PyObject_New (__avr_exporter_t, &__avr_exporter_type__);
+        if (exporter == NULL) {
+            return NULL;
+        }
+
+        Py_INCREF (owner);
+        exporter->owner = owner;
+        exporter->slot = slot;
+        exporter->buf = *slot;
+        exporter->len = len;
+        exporter->readonly = readonly;
+        exporter->weakrefs = NULL;
+
+        return (PyObject*) exporter;
+    }
+%}
+
+%inline %{
+    /* Called before the owner frees the memory of the exporter: the exporter keeps it for
+       the views still using it, and the owner gets a copy to free instead */
+    PyObject *avr_exporter_detach_py (PyObject *self) {
+        if (Py_TYPE (self) != &__avr_exporter_type__) {
+            return PyErr_Format (PyExc_TypeError, "exporter expected");
+        }
+
+        __avr_exporter_t *exporter = (__avr_exporter_t*) self;
+        if (exporter->slot != NULL) {
+            void *copy = malloc (exporter->len ? exporter->len : 1);
+            if (copy == NULL) {
+                return PyErr_NoMemory ();
+            }
+
+            memcpy (copy, exporter->buf, exporter->len);
+            *exporter->slot = copy;
+            exporter->slot = NULL;
+        }
+
+        Py_RETURN_NONE;
+    }
+%}
+
+%inline %{
+    /* Read-only exporter of the records buffer, owned by the python recorder */
+    PyObject *avr_irq_recorder_records_py (avr_irq_recorder_t *recorder, PyObject *owner) {
+        return __avr_exporter__ (owner, (void**) &recorder->record, recorder->size * sizeof (avr_irq_record_t), 1);
+    }
+
+    /* Returns (index, count) of the records that can be read in one go in the records
+       buffer. Records stay valid until they are released with avr_irq_recorder_consume. */
+    PyObject *avr_irq_recorder_peek_py (avr_irq_recorder_t *recorder) {
+        avr_irq_record_t *records = NULL;
+        uint32_t count = avr_irq_recorder_peek (recorder, &records);
+
+        return Py_BuildValue ("(II)", count ? (unsigned int) (records - recorder->record) : 0, count);
+    }
+%}
+
+/* avr_adc_waveform_t */
+
+%inline %{
+    /* Queues 16 bits millivolt samples, with optional 64 bits cycle stamps, from any
+       objects with the buffer protocol. Returns the free slots left, or -1 if there were none. */
+    PyObject *avr_adc_waveform_queue_py (avr_adc_waveform_t *waveform, PyObject *samples, int is_signed,
+                                         PyObject *stamps, avr_cycle_count_t span) {
+        Py_buffer sbuf, tbuf;
+
+        if (PyObject_GetBuffer (samples, &sbuf, PyBUF_SIMPLE) < 0) {
+            return NULL;
+        }
+
+        uint32_t count = sbuf.len / sizeof (uint16_t);
+        if (stamps != Py_None) {
+            if (PyObject_GetBuffer (stamps, &tbuf, PyBUF_SIMPLE) < 0) {
+                PyBuffer_Release (&sbuf);
+                return NULL;
+            }
+
+            if (tbuf.len != count * sizeof (avr_cycle_count_t)) {
+                PyBuffer_Release (&sbuf);
+                PyBuffer_Release (&tbuf);
+                return PyErr_Format (PyExc_ValueError, "%u samples but %u stamps",
+                                     count, (uint32_t) (tbuf.len / sizeof (avr_cycle_count_t)));
+            }
+        }
+
+        int result = avr_adc_waveform_queue (waveform, sbuf.buf, is_signed,
+                                             stamps != Py_None ? tbuf.buf : NULL, count, span);
+
+        PyBuffer_Release (&sbuf);
+        if (stamps != Py_None) {
+            PyBuffer_Release (&tbuf);
+        }
+
+        return PyInt_FromLong (result);
+    }
+
+    /* IRQ of the waveform of the given index, ie ADC_WAVEFORM_IRQ_REFILL */
+    avr_irq_t *avr_adc_waveform_get_irq_py (avr_adc_waveform_t *waveform, int index) {
+        return &waveform->irq[index];
+    }
+%}
+
+/* avr_uart_bridge_t */
+
+%inline %{
+    /* Queues the bytes of any object with the buffer protocol for the AVR. Returns the number of bytes
+       that could not be queued. */
+    PyObject *avr_uart_bridge_write_py (avr_uart_bridge_t *bridge, PyObject *data) {
+        Py_buffer buffer;
+
+        if (PyObject_GetBuffer (data, &buffer, PyBUF_SIMPLE) < 0) {
+            return NULL;
+        }
+
+        uint32_t done = avr_uart_bridge_write (bridge, buffer.buf, buffer.len);
+        PyBuffer_Release (&buffer);
+
+        return PyInt_FromLong (buffer.len - done);
+    }
+
+    /* Reads up to size bytes sent by the AVR (all of them if size is negative) */
+    PyObject *avr_uart_bridge_read_py (avr_uart_bridge_t *bridge, int size) {
+        uint32_t count = avr_uart_bridge_get_rx_count (bridge);
+
+        if (size >= 0 && (uint32_t) size < count) {
+            count = size;
+        }
+
+        PyObject *result = PyBytes_FromStringAndSize (NULL, count);
+        if (result == NULL) {
+            return NULL;
+        }
+
+        avr_uart_bridge_read (bridge, (uint8_t*) PyBytes_AS_STRING (result), count);
+
+        return result;
+    }
+%}
+
+/* avr_irq_stimulus_t */
+
+%inline %{
+    /* Appends rows from any object with the buffer protocol, laid out as avr_irq_record_t.
+       Returns 0 or -1 if they are invalid. */
+    PyObject *avr_irq_stimulus_append_py (avr_irq_stimulus_t *stimulus, PyObject *rows, avr_cycle_count_t base) {
+        Py_buffer buffer;
+
+        if (PyObject_GetBuffer (rows, &buffer, PyBUF_SIMPLE) < 0) {
+            return NULL;
+        }
+
+        if (buffer.len % sizeof (avr_irq_record_t)) {
+            PyBuffer_Release (&buffer);
+            return PyErr_Format (PyExc_ValueError, "rows of %u bytes expected", (uint32_t) sizeof (avr_irq_record_t));
+        }
+
+        /* Copy it to have it aligned */
+        avr_irq_record_t *copy = malloc (buffer.len ? buffer.len : 1);
+        if (copy == NULL) {
+            PyBuffer_Release (&buffer);
+            return PyErr_NoMemory ();
+        }
+        memcpy (copy, buffer.buf, buffer.len);
+
+        int result = avr_irq_stimulus_append (stimulus, copy, buffer.len / sizeof (avr_irq_record_t), base);
+
+        free (copy);
+        PyBuffer_Release (&buffer);
+
+        return PyInt_FromLong (result);
+    }
+%}
+
+/* avr_t memory */
+
+%inline %{
+    /* Writable exporter of the data space: registers, I/O and SRAM, owned by the python AVR */
+    PyObject *avr_sram_py (avr_t *avr, PyObject *owner) {
+        return __avr_exporter__ (owner, (void**) &avr->data, avr->ramend + 1, 0);
+    }
+
+    /* Writable exporter of the flash */
+    PyObject *avr_flash_py (avr_t *avr, PyObject *owner) {
+        return __avr_exporter__ (owner, (void**) &avr->flash, avr->flashend + 1, 0);
+    }
+
+    /* Writable exporter of the EEPROM, None if the core has no EEPROM */
+    PyObject *avr_eeprom_py (avr_t *avr, PyObject *owner) {
+        for (avr_io_t *io = avr->io_port; io != NULL; io = io->next) {
+            avr_eeprom_t *eeprom = (avr_eeprom_t*) io;
+
+            if (!strcmp (io->kind, "eeprom") && eeprom->eeprom != NULL) {
+                return __avr_exporter__ (owner, (void**) &eeprom->eeprom, eeprom->size, 0);
+            }
+        }
+
+        Py_RETURN_NONE;
+    }
+
+    /* Writable exporters of the profile counters (native uint64 per flash word),
+       None if the profiler is not enabled */
+    PyObject *avr_profile_cycles_py (avr_t *avr, PyObject *owner) {
+        if (avr->profile.cycles == NULL) {
+            Py_RETURN_NONE;
+        }
+
+        return __avr_exporter__ (owner, (void**) &avr->profile.cycles, (avr->flashend + 2) / 2 * sizeof (uint64_t), 0);
+    }
+
+    PyObject *avr_profile_count_py (avr_t *avr, PyObject *owner) {
+        if (avr->profile.count == NULL) {
+            Py_RETURN_NONE;
+        }
+
+        return __avr_exporter__ (owner, (void**) &avr->profile.count, (avr->flashend + 2) / 2 * sizeof (uint64_t), 0);
+    }
+
+    /* Writable exporter of the coverage bitmap, None if the coverage is not enabled */
+    PyObject *avr_coverage_py (avr_t *avr, PyObject *owner) {
+        if (avr->coverage == NULL) {
+            Py_RETURN_NONE;
+        }
+
+        return __avr_exporter__ (owner, (void**) &avr->coverage, avr_coverage_size (avr), 0);
+    }
+
+    /* Number of bits set in the given bitmap buffer */
+    PyObject *avr_coverage_count_py (PyObject *bitmap) {
+        Py_buffer buffer;
+
+        if (PyObject_GetBuffer (bitmap, &buffer, PyBUF_SIMPLE) < 0) {
+            return NULL;
+        }
+
+        uint32_t count = avr_coverage_count (buffer.buf, buffer.len);
+        PyBuffer_Release (&buffer);
+
+        return PyInt_FromLong (count);
+    }
+
+    /* ORs the src bitmap buffer into the writable dst one, of the same size.
+       Returns 0, or -1 if the sizes differ */
+    PyObject *avr_coverage_merge_py (PyObject *dst, PyObject *src) {
+        Py_buffer dst_buffer, src_buffer;
+
+        if (PyObject_GetBuffer (dst, &dst_buffer, PyBUF_WRITABLE) < 0) {
+            return NULL;
+        }
+
+        if (PyObject_GetBuffer (src, &src_buffer, PyBUF_SIMPLE) < 0) {
+            PyBuffer_Release (&dst_buffer);
+            return NULL;
+        }
+
+        int result = -1;
+        if (dst_buffer.len == src_buffer.len) {
+            avr_coverage_merge (dst_buffer.buf, src_buffer.buf, dst_buffer.len);
+            result = 0;
+        }
+
+        PyBuffer_Release (&src_buffer);
+        PyBuffer_Release (&dst_buffer);
+
+        return PyInt_FromLong (result);
+    }
+%}
+
+/* avr_stats_t */
+
+%{
+    /* Adds the counters to the ones of key in dict, as a tuple */
+    static int __avr_stats_add__ (PyObject *dict, PyObject *key, uint64_t first, uint64_t second) {
+        PyObject *old = PyDict_GetItem (dict, key);
+        unsigned PY_LONG_LONG a = first, b = second;
+
+        if (old != NULL) {
+            a += PyLong_AsUnsignedLongLong (PyTuple_GET_ITEM (old, 0));
+            b += PyLong_AsUnsignedLongLong (PyTuple_GET_ITEM (old, 1));
+        }
+
+        PyObject *value = Py_BuildValue ("(KK)", a, b);
+        int result = value == NULL ? -1 : PyDict_SetItem (dict, key, value);
+        Py_XDECREF (value);
+        return result;
+    }
+
+    /* Counters of an IRQ, copied out of the pool */
+    typedef struct __avr_stats_irq_t {
+        char *name;
+        uint64_t raised, hooked;
+    } __avr_stats_irq_t;
+
+    /* Copies the name (without its flags, ie "8>") and counters of the IRQs that
+       counted something. The thread running the AVR may add or remove IRQs meanwhile,
+       so this is done with the pool locked, and without calling python that might
+       free some. Returns the copies to free with their names, or NULL if out of memory. */
+    static __avr_stats_irq_t *__avr_stats_irqs__ (avr_t *avr, int *count) {
+        avr_irq_pool_lock (&avr->irq_pool);
+
+        __avr_stats_irq_t *irqs = calloc (avr->irq_pool.count + 1, sizeof (__avr_stats_irq_t));
+        *count = 0;
+
+        for (int i = 0; irqs != NULL && i < avr->irq_pool.count; i++) {
+            avr_irq_t *irq = avr->irq_pool.irq [i];
+
+            if (irq == NULL || (!irq->raised && !irq->hooked)) {
+                continue;
+            }
+
+            char unnamed [16];
+            const char *name = irq->name;
+            if (name == NULL) {
+                snprintf (unnamed, sizeof (unnamed), "irq%u", irq->irq);
+                name = unnamed;
+            }
+            while (*name && strchr ("0123456789<>=!", *name)) {
+                name++;
+            }
+
+            __avr_stats_irq_t *copy = &irqs [(*count)++];
+            copy->name = strdup (name);
+            copy->raised = irq->raised;
+            copy->hooked = irq->hooked;
+        }
+
+        avr_irq_pool_unlock (&avr->irq_pool);
+        return irqs;
+    }
+%}
+
+%inline %{
+    /* Snapshot of the counters as a dict: "io" maps the data addresses of the IO registers to
+       (reads, writes, kind of the IO module or None), "irqs" the IRQ names to
+       (raises, hooks) and "timers" is a list of (callback address, kind of the
+       IO module or "python" or None, fires). Only counters that are not 0 are
+       included. None if the counters are not enabled. */
+    PyObject *avr_stats_py (avr_t *avr) {
+        /* Only freed by avr_stats_disable and avr_terminate, called with the GIL held like
+           this function: it is NULL once the AVR is terminated */
+        avr_stats_t *stats = avr->stats;
+
+        if (stats == NULL) {
+            Py_RETURN_NONE;
+        }
+
+        PyObject *io = PyDict_New ();
+        PyObject *irqs = PyDict_New ();
+        PyObject *timers = PyList_New (0);
+        PyObject *result = NULL;
+
+        if (io == NULL || irqs == NULL || timers == NULL) {
+            goto done;
+        }
+
+        /* SRAM below MAX_IOs is accessed like the IO registers, but is not one */
+        for (int i = 0; i < MAX_IOs && AVR_IO_TO_DATA (i) <= avr->ioend; i++) {
+            if (!stats->io_read [i] && !stats->io_write [i]) {
+                continue;
+            }
+
+            void *param = avr->io [i].w.c ? avr->io [i].w.param : avr->io [i].r.param;
+            const char *kind = avr_stats_io_kind (avr, param);
+            PyObject *value = Py_BuildValue ("(KKz)", (unsigned PY_LONG_LONG) stats->io_read [i],
+                                             (unsigned PY_LONG_LONG) stats->io_write [i], kind);
+            PyObject *key = PyInt_FromLong (AVR_IO_TO_DATA (i));
+            int failed = value == NULL || key == NULL || PyDict_SetItem (io, key, value) < 0;
+
+            Py_XDECREF (value);
+            Py_XDECREF (key);
+            if (failed) {
+                goto done;
+            }
+        }
+
+        int count = 0;
+        __avr_stats_irq_t *copies = __avr_stats_irqs__ (avr, &count);
+        int failed = copies == NULL;
+
+        for (int i = 0; i < count; i++) {
+            PyObject *key = failed || copies [i].name == NULL ? NULL : PyString_FromString (copies [i].name);
+            failed = failed || key == NULL ||
+                     __avr_stats_add__ (irqs, key, copies [i].raised, copies [i].hooked) < 0;
+
+            Py_XDECREF (key);
+            free (copies [i].name);
+        }
+        free (copies);
+
+        if (failed) {
+            if (!PyErr_Occurred ()) {
+                PyErr_NoMemory ();
+            }
+            goto done;
+        }
+
+        uint32_t timer_count = __atomic_load_n (&stats->timer_count, __ATOMIC_ACQUIRE);
+        for (uint32_t i = 0; i < timer_count; i++) {
+            avr_stats_timer_t *timer = &stats->timer [i];
+            const char *kind = timer->timer == &__avr_cycle_timer_runner__ ? "python" : timer->kind;
+            PyObject *value = Py_BuildValue ("(KzK)", (unsigned PY_LONG_LONG) (uintptr_t) timer->timer,
+                                             kind, (unsigned PY_LONG_LONG) timer->fires);
+            int failed = value == NULL || PyList_Append (timers, value) < 0;
+
+            Py_XDECREF (value);
+            if (failed) {
+                goto done;
+            }
+        }
+
+        result = Py_BuildValue ("{s:K,s:O,s:O,s:O,s:K}",
+                                "cycle", (unsigned PY_LONG_LONG) avr->cycle,
+                                "io", io, "irqs", irqs, "timers", timers,
+                                "timers_other", (unsigned PY_LONG_LONG) stats->timer_other);
+
+    done:
+        Py_XDECREF (io);
+        Py_XDECREF (irqs);
+        Py_XDECREF (timers);
+        return result;
+    }
+%}
+
+/* avr_watchpoints_t */
+
+%{
+    static PyObject *__avr_watch_hit__ (const avr_watch_hit_t *hit) {
+        return Py_BuildValue ("(KIIIII)", (unsigned PY_LONG_LONG) hit->when, (unsigned int) hit->pc,
+                              (unsigned int) hit->addr, (unsigned int) hit->value,
+                              (unsigned int) hit->kind, (unsigned int) hit->index);
+    }
+%}
+
+%inline %{
+    avr_irq_t *avr_watchpoints_get_irq_py (avr_watchpoints_t *w, int index) {
+        return &w->irq[index];
+    }
+
+    /* Number of hits of the watchpoint of the given index */
+    PyObject *avr_watchpoints_hits_py (avr_watchpoints_t *w, int index) {
+        if (index < 0 || (uint32_t) index >= w->count) {
+            return PyErr_Format (PyExc_IndexError, "no watchpoint %d", index);
+        }
+
+        return PyLong_FromUnsignedLongLong (w->watch[index].hits);
+    }
+
+    /* Last hit, as a (when, pc, addr, value, kind, index) tuple */
+    PyObject *avr_watchpoints_last_py (avr_watchpoints_t *w) {
+        return __avr_watch_hit__ (&w->last);
+    }
+
+    /* Hits of the log as (when, pc, addr, value, kind, index) tuples, the oldest first */
+    PyObject *avr_watchpoints_log_py (avr_watchpoints_t *w) {
+        uint32_t count = avr_watchpoints_get_log_count (w);
+        PyObject *list = PyList_New (count);
+
+        if (list == NULL) {
+            return NULL;
+        }
+
+        for (uint32_t i = 0; i < count; i++) {
+            uint64_t at = w->log_write - count + i;
+            PyObject *hit = __avr_watch_hit__ (&w->log[at & (w->log_size - 1)]);
+
+            if (hit == NULL) {
+                Py_DECREF (list);
+                return NULL;
+            }
+            PyList_SET_ITEM (list, i, hit);
+        }
+
+        return list;
+    }
+%}
+
+/* avr_vcd_t */
+
+%inline %{
+    /* IRQ of the VCD signal of the given index, that the source IRQ is connected to */
+    avr_irq_t *avr_vcd_get_signal_irq_py (avr_vcd_t *vcd, int index) {
+        return &vcd->signal[index].irq;
+    }
+
+    /* VCD signal of the given index */
+    avr_vcd_signal_t *avr_vcd_get_signal_py (avr_vcd_t *vcd, int index) {
+        return &vcd->signal[index];
+    }
 %}
 
 /* Other helpers */
@@ -183,4 +1098,9 @@
     uint32_t avr_ioctl_ioport_getirq (char name) {
         return AVR_IOCTL_IOPORT_GETIRQ (name);
     }
+
+    uint32_t avr_ioctl_uart_getirq (char name) {
+        return AVR_IOCTL_UART_GETIRQ (name);
+    }
 %}
+
@@ -15,9 +15,9 @@ setup (name        = 'simavr',
                                  ['csimavr.i'],
                                  swig_opts = ['-I../sim', '-O', '-w451'],
                                  extra_compile_args = ['-g', '--std=gnu99', '-I../sim', '-I../../include', '-mfpmath=sse', '-msse2', '-O3'],
-                                 extra_link_args = ['-L../' + ldir, '-lsimavr', '-lelf'],
+                                 extra_link_args = ['-L../' + ldir, '-lsimavr', '-lelf', '-lz'],
                                 )
                      ],
-       py_modules  = ["csimavr", "simavr"],
+       py_modules  = ["csimavr", "simavr", "simavr_asyncio", "simavr_coverage"],
      )
 
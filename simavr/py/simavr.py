@@ -1,21 +1,40 @@
 #!/usr/bin/env python
 # Akshaal (C) 2010, GNU GPL. http://akshaal.info
 
+from __future__ import print_function
 from csimavr import *
 import _csimavr
+import bisect
+import collections
+import gzip
+import hashlib
+import json
+import mmap
+import multiprocessing
+import os
+import select
+import struct
+import subprocess
+import sys
+import threading
+import time
 import unittest
+import weakref
+import zlib
 
-# - - - - Global state - - -
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
-# We need to keep timer from being garbage collected while it is scheduled. This is an easiest way to do it.
-active_timers = set ()
-registered_irq_notifiers = set ()
-connected_irqs = set ()
-active_vcds = set ()
+# - - - - Global state - - -
 
 StopOnFirst = "StopOnFirst"
 StopWhenAll = "StopWhenAll"
 
+# Biggest possible cycle, used to run AVR without limit
+RunForever = 2 ** 64 - 1
+
 # - - - - Classes - - - - -
 
 class AVRException(Exception):
@@ -28,25 +47,169 @@ class AVRException(Exception):
         return self.msg
 
 
+class Firmware:
+    """Parsed firmware (ELF or IHEX file). A firmware can be shared by many AVRs,
+       they copy its flash and eeprom when they are created."""
+
+    # Number of firmwares kept by load ()
+    cache_size = 16
+
+    # (absolute filename, load base) -> ((mtime, size), firmware), least recently used first
+    _cache = collections.OrderedDict ()
+
+    def __init__ (self, filename, load_base = AVR_SEGMENT_OFFSET_FLASH, quiet = False):
+        """Parse the given file."""
+
+        self.filename = filename
+        self.load_base = load_base
+        self.__firmware = elf_firmware_t ()
+
+        if filename.lower().endswith (".hex"):
+            chunks_count = elf_firmware_read_ihex_py (self.__firmware, filename, load_base)
+            if chunks_count < 0:
+                raise AVRException ("Unable to load IHEX file: " + filename)
+
+            if not quiet:
+                print ("Loaded", chunks_count, "sections of IHEX")
+
+                flash_info = {'base': self.__firmware.flashbase, 'size': self.__firmware.flashsize}
+                print ("Load HEX flash base=%(base)08x size=%(size)d" % flash_info)
+
+                if self.__firmware.eesize > 0:
+                    print ("Load HEX eeprom size=%d" % self.__firmware.eesize)
+        else:
+            if elf_read_firmware (filename, self.__firmware) < 0:
+                raise AVRException ("Unable to load ELF file: " + filename)
+
+    @staticmethod
+    def load (filename, load_base = AVR_SEGMENT_OFFSET_FLASH, quiet = False):
+        """Get firmware of the given file from the cache. The file is parsed
+           again only if its modification time or size has changed."""
+
+        key = (os.path.abspath (filename), load_base)
+        stat = os.stat (filename)
+        version = (stat.st_mtime, stat.st_size)
+
+        cached = Firmware._cache.pop (key, None)
+        if cached == None or cached [0] != version:
+            cached = (version, Firmware (filename, load_base, quiet))
+
+        Firmware._cache [key] = cached
+        while len (Firmware._cache) > Firmware.cache_size:
+            Firmware._cache.popitem (last = False)
+
+        return cached [1]
+
+    def get_elf_firmware (self):
+        """Parsed firmware description (elf_firmware_t)."""
+
+        return self.__firmware
+
+    def symbols (self):
+        """List of (address, name) of the ELF symbols, sorted by address. Empty for IHEX files."""
+
+        return elf_firmware_symbols_py (self.__firmware)
+
+    def __del__ (self):
+        """Destructor."""
+
+        if elf_free_firmware != None:
+            elf_free_firmware (self.__firmware)
+
+
+class _Exports:
+    """Memory of an object (ie the AVR) exported to memoryviews, without copies. An
+       exporter keeps the object alive while views use it, and keeps the memory when
+       the object frees it meanwhile (the object frees a copy of it instead)."""
+
+    def __init__ (self):
+        # Kind of memory -> its exporter, while views use it
+        self.__exporters = weakref.WeakValueDictionary ()
+
+    def view (self, kind, getter, *args):
+        """Memoryview of the given kind of memory, its exporter is made by getter (*args).
+           None if getter returns None."""
+
+        exporter = self.__exporters.get (kind)
+        if exporter == None:
+            exporter = getter (*args)
+            if exporter == None:
+                return None
+
+            self.__exporters [kind] = exporter
+
+        return memoryview (exporter)
+
+    def detach (self, *kinds):
+        """Detach the views of the given kinds of memory (all of them if none is given),
+           to be called before the object frees it."""
+
+        for kind in kinds or list (self.__exporters.keys ()):
+            exporter = self.__exporters.pop (kind, None)
+            if exporter != None:
+                avr_exporter_detach_py (exporter)
+
+
 class AVR (avr_t):
-    """Main class. Represents an AVR instance."""
+    """Main class. Represents an AVR instance. The GIL is released while it runs, so
+       AVRs run in parallel threads; an AVR must be used by one thread at a time."""
 
     def __init__(self,
-                 filename,
+                 filename = None,
                  mcu = None,
                  freq = None,
                  gdb = False,
                  trace = False,
                  gdb_port = 1234,
                  load_base = AVR_SEGMENT_OFFSET_FLASH,
-                 quiet = False):
-        """Initializer for AVR class."""
+                 quiet = False,
+                 firmware = None,
+                 predecode = False,
+                 pacing = None,
+                 coverage = False,
+                 stats = False):
+        """Initializer for AVR class. The firmware is taken from the given Firmware
+           object, or else loaded from the filename through Firmware.load. With predecode,
+           each instruction is decoded only once, see avr_predecode_enable. The pacing
+           is Pacing.realtime unless given, see set_pacing. With coverage, the executed
+           flash words are recorded, see coverage_enable. With stats, the simulator
+           counts its own work, see stats_enable."""
+
+        # Nothing to terminate until the core is created
+        self.__terminated = True
+
+        if firmware == None:
+            if filename == None:
+                raise AVRException ("filename or firmware must be given")
+
+            firmware = Firmware.load (filename, load_base, quiet)
 
         self.__quiet = quiet
+        self.__firmware = firmware
+
+        # Objects that C code refers to, kept from being garbage collected
+        # until they are not needed anymore or the AVR is terminated
+        self._timers = set ()
+        self._notifiers = dict ()
+        self._connections = set ()
+        self._vcds = set ()
+        self._recorders = weakref.WeakSet ()
+        self._uarts = set ()
+        self._waveforms = set ()
+        self._stimuli = set ()
+        self._links = set ()
+        self._watchpoints = None
+        self._exports = _Exports ()
 
         self._firmware = elf_firmware_t ()
 
-        self._prepare_firmware (filename)
+        # Report of the last run, see RunReport
+        self.last_run = None
+
+        # Set when a coroutine waiting on this AVR is woken up, see simavr_asyncio
+        self._async_wakeup = False
+
+        self._prepare_firmware (firmware)
 
         # Override some firmware options
         if mcu != None:   self._firmware.mmcu = mcu
@@ -65,376 +228,2150 @@ class AVR (avr_t):
         if self.this == None:
             raise AVRException ("AVR " + str(mcu) + " is not known")
 
-        # Initializing
-        self._init ()
+        self.__terminated = False
+
+        # Initializing
+        self._init ()
+
+        if predecode and avr_predecode_enable (self, 1) < 0:
+            raise AVRException ("Predecoding is not supported by this build")
+
+        if pacing != None:
+            self.set_pacing (pacing)
+
+        if coverage:
+            self.coverage_enable ()
+
+        if stats:
+            self.stats_enable ()
+
+        # Loading firmware
+        self._load_firmware ()
+
+        # Take care of bootloader
+        if self._firmware.flashbase > 0:
+            if not self.__quiet: print ("Attempted to load a bootloader at %04x" % self._firmware.flashbase)
+            self.pc = self._firmware.flashbase
+
+        # Setup gdb in case of crash or explicit activation
+        self.gdb_port = gdb_port
+        if gdb:
+            self.gdb_init ()
+
+        # Enable or disable trace
+        self.trace = trace
+
+    def _prepare_firmware (self, firmware):
+        """Prepare firmware description of this AVR. Images are shared with the given firmware."""
+
+        elf_firmware_copy_py (self._firmware, firmware.get_elf_firmware ())
+
+    def get_firmware (self):
+        """Firmware the AVR was created from."""
+
+        return self.__firmware
+
+    @property
+    def sram (self):
+        """Writable memoryview on the data space: registers, I/O and SRAM.
+           No copies are made. The view keeps the AVR alive, and the memory as it
+           was once the AVR is terminated."""
+
+        return self.__memoryview ("sram", avr_sram_py)
+
+    @property
+    def flash (self):
+        """Writable memoryview on the flash. No copies are made, the view keeps the AVR
+           alive (see sram). Call flash_modified after writing to it."""
+
+        return self.__memoryview ("flash", avr_flash_py)
+
+    def flash_modified (self, address = 0, size = None):
+        """Tell the core that the given flash range was modified through the flash view,
+           so that its predecoded instructions are decoded again."""
+
+        if size == None:
+            size = self.flashend + 1 - address
+
+        avr_predecode_invalidate (self, address, size)
+
+    @property
+    def eeprom (self):
+        """Writable memoryview on the EEPROM, None if the core has no EEPROM.
+           No copies are made, the view keeps the AVR alive (see sram)."""
+
+        return self.__memoryview ("eeprom", avr_eeprom_py)
+
+    def profile_enable (self, period = 0):
+        """Count the cycles spent at each flash word: exactly if period is 0, or else
+           by sampling the PC every period cycles. Counters are kept when called again."""
+
+        if avr_profile_enable (self, period) < 0:
+            raise AVRException ("Unable to enable the profiler")
+
+    def profile_disable (self):
+        """Stop profiling and drop the counters (the views on them keep them)."""
+
+        self._exports.detach ("profile_cycles", "profile_counts")
+        avr_profile_disable (self)
+
+    def profile_clear (self):
+        """Reset the profile counters."""
+
+        avr_profile_clear (self)
+
+    @property
+    def profile_cycles (self):
+        """Writable memoryview on the cycles counted per flash word (native uint64),
+           None if the profiler is not enabled. No copies are made, the view keeps the
+           AVR alive (see sram). For NumPy, use
+           numpy.frombuffer (avr.profile_cycles, dtype = numpy.uint64)."""
+
+        return self.__memoryview ("profile_cycles", avr_profile_cycles_py)
+
+    @property
+    def profile_counts (self):
+        """Writable memoryview on the executions (or samples) per flash word (native uint64),
+           None if the profiler is not enabled."""
+
+        return self.__memoryview ("profile_counts", avr_profile_count_py)
+
+    def get_profile (self):
+        """Copy of the profile counters, attributed to the firmware symbols (see Profile)."""
+
+        cycles, counts = self.profile_cycles, self.profile_counts
+        if cycles == None:
+            raise AVRException ("Profiler is not enabled")
+
+        words = len (cycles) // 8
+        return Profile (struct.unpack ("=%dQ" % words, cycles.tobytes ()),
+                        struct.unpack ("=%dQ" % words, counts.tobytes ()),
+                        self.__firmware.symbols (),
+                        self.__firmware.filename,
+                        self.profile.period)
+
+    def coverage_enable (self):
+        """Record the flash words where instructions are executed, one bit per word.
+           It costs far less than the profiler. Bits are kept when called again."""
+
+        if avr_coverage_enable (self) < 0:
+            raise AVRException ("Unable to enable the coverage")
+
+    def coverage_disable (self):
+        """Stop recording the coverage and drop the bitmap (the views on it keep it)."""
+
+        self._exports.detach ("coverage")
+        avr_coverage_disable (self)
+
+    def coverage_clear (self):
+        """Clear the coverage bitmap."""
+
+        avr_coverage_clear (self)
+
+    @property
+    def coverage_bitmap (self):
+        """Writable memoryview on the coverage bitmap, bit (n & 7) of byte n >> 3 for flash
+           word n, None if the coverage is not enabled. No copies are made, the view
+           keeps the AVR alive (see sram)."""
+
+        return self.__memoryview ("coverage", avr_coverage_py)
+
+    def get_coverage (self):
+        """Copy of the coverage bitmap, attributed to the firmware symbols (see Coverage)."""
+
+        bitmap = self.coverage_bitmap
+        if bitmap == None:
+            raise AVRException ("Coverage is not enabled")
+
+        filename = self.__firmware.filename
+        return Coverage (bitmap.tobytes (), self.__firmware.symbols (), filename,
+                         Coverage.firmware_digest (filename), self._firmware.flashsize)
+
+    def stats_enable (self):
+        """Count the IO register accesses, IRQ raises and hooks and cycle timer fires,
+           to find out where the time of a slow simulation goes. Counters are kept
+           when called again."""
+
+        if avr_stats_enable (self) < 0:
+            raise AVRException ("Unable to enable the stats")
+
+    def stats_disable (self):
+        """Stop counting and drop the counters."""
+
+        avr_stats_disable (self)
+
+    def stats_clear (self):
+        """Clear the counters."""
+
+        avr_stats_clear (self)
+
+    def stats (self):
+        """Snapshot of the counters, None if they are not enabled (see stats_enable). A dict of:
+           "cycle": the cycle of the snapshot,
+           "io": {data address: (reads, writes, module)} for the IO registers,
+           "irqs": {name: (raises, hooks)},
+           "timers": [(callback address, module, fires)], "timers_other" the fires of the
+           callbacks past the AVR_STATS_TIMERS first ones,
+           "modules": {module: {"reads": n, "writes": n, "timer_fires": n}}, the sums of the
+           above by IO module kind ("timer", "port", "uart"...; "python" for the python timers).
+           Only counters that are not 0 are included. It is cheap enough to be polled from
+           another thread while the AVR runs."""
+
+        if self.__terminated:
+            return None
+
+        stats = avr_stats_py (self)
+        if stats == None:
+            return None
+
+        modules = dict ()
+        def module (kind):
+            return modules.setdefault (kind, { "reads": 0, "writes": 0, "timer_fires": 0 })
+
+        for (reads, writes, kind) in stats ["io"].values ():
+            module (kind) ["reads"] += reads
+            module (kind) ["writes"] += writes
+
+        for (callback, kind, fires) in stats ["timers"]:
+            module (kind) ["timer_fires"] += fires
+
+        stats ["modules"] = modules
+        return stats
+
+    def trace_file_start (self, filename, registers = False, compress = False, chunk_records = 65536):
+        """Write a binary trace of the executed instructions to the given file, read it
+           with TraceFile. With registers, the registers changed by each instruction are
+           recorded too; with compress, chunks are compressed with zlib. Records are
+           written a chunk of chunk_records at a time, see trace_file_flush."""
+
+        flags = ((AVR_TRACE_FILE_REGISTERS if registers else 0) |
+                 (AVR_TRACE_FILE_COMPRESS if compress else 0))
+
+        if avr_trace_file_start (self, filename, flags, chunk_records) < 0:
+            raise AVRException ("Unable to start tracing into " + filename)
+
+    def trace_file_flush (self):
+        """Write the records of the current chunk, ie before reading a trace still written."""
+
+        if avr_trace_file_flush (self) < 0:
+            raise AVRException ("Unable to write the trace")
+
+    def trace_file_stop (self):
+        """Flush and close the trace file. Done when the AVR is terminated too."""
+
+        avr_trace_file_stop (self)
+
+    def get_watchpoints (self, log_size = 1024):
+        """Watchpoints of the AVR (see Watchpoints), created on first use with a log of
+           the given number of hits."""
+
+        if self._watchpoints == None:
+            Watchpoints (self, log_size)
+        return self._watchpoints
+
+    def watch (self, start, size = 1, **kwargs):
+        """Watch size bytes of the data space from start, see Watchpoints.add. Returns the index."""
+
+        return self.get_watchpoints ().add (start, size, **kwargs)
+
+    def __memoryview (self, kind, getter):
+        if self.__terminated:
+            raise AVRException ("AVR is terminated")
+
+        return self._exports.view (kind, getter, self, self)
+
+    def _init (self):
+        """Initialize AVR."""
+
+        avr_init (self)
+
+    def _load_firmware (self):
+        """Load prepared firmware into the AVR."""
+
+        avr_load_firmware (self, self._firmware)
+
+    def gdb_init (self):
+        """Initialize GDB. This sets AVR into Stopped state."""
+
+        self.state = cpu_Stopped
+        avr_gdb_init (self)
+
+    def terminate (self):
+        """Terminate AVR: cancel timers, unregister notifies, disconnect irqs, close
+           VCDs, recorders, stimuli, board links, UARTs, waveforms and watchpoints and free the memory of the simulator. The AVR must not
+           be used anymore after that."""
+
+        if self.__terminated:
+            return
+
+        self.__terminated = True
+
+        for timer in list (self._timers):
+            timer.cancel ()
+
+        for param in self._notifiers.values ():
+            avr_irq_unregister_notify_py (param [0], param)
+        self._notifiers.clear ()
+
+        for (source, destination) in self._connections:
+            avr_unconnect_irq (source, destination)
+        self._connections.clear ()
+
+        for recorder in list (self._recorders):
+            recorder.close ()
+
+        for uart in list (self._uarts):
+            uart.close ()
+
+        for waveform in list (self._waveforms):
+            waveform.close ()
+
+        for stimulus in list (self._stimuli):
+            stimulus.close ()
+
+        if self._watchpoints != None:
+            self._watchpoints.close ()
+
+        for link in self._links:
+            avr_cosim_link_close (link)
+        self._links.clear ()
+
+        for vcd in list (self._vcds):
+            vcd.close ()
+        self._vcds.clear ()
+
+        self._exports.detach ()
+        avr_terminate (self)
+
+    def __enter__ (self):
+        """Use as a context manager, the AVR is terminated at exit."""
+
+        return self
+
+    def __exit__ (self, exc_type, exc_value, traceback):
+        """Terminate."""
+
+        self.terminate ()
+        return False
+
+    def __del__ (self):
+        """Destructor. Terminates the AVR if it was not, closing what refers to its IRQ
+           pool while it is still there (the C structures of waveforms, watchpoints...
+           may be freed before the AVR otherwise)."""
+
+        if avr_terminate != None:
+            self.terminate ()
+
+    def get_pacing (self):
+        """How the AVR is paced against the wall clock while it sleeps, see set_pacing."""
+
+        return Pacing (self.pacing.mode, self.pacing.scale)
+
+    def set_pacing (self, pacing):
+        """Set the pacing: Pacing.realtime, Pacing.scaled (x) or Pacing.max_speed,
+           also given by name as a string ('realtime' or 'max_speed')."""
+
+        if isinstance (pacing, str):
+            pacing = getattr (Pacing, pacing, None)
+
+        if not isinstance (pacing, Pacing) or avr_set_pacing (self, pacing.mode, pacing.scale) < 0:
+            raise AVRException ("Invalid pacing: " + repr (pacing))
+
+    def __run_until (self, end_cycle):
+        """Run through avr_run_until_py, keeping a RunReport in last_run."""
+
+        cycle, slept = self.cycle, self.pacing.sleep_ns
+        start = _host_time ()
+
+        try:
+            return avr_run_until_py (self, end_cycle)
+        finally:
+            self.last_run = RunReport (self.cycle - cycle,
+                                       self.cycles_to_usec (self.cycle - cycle) / 1e6,
+                                       _host_time () - start,
+                                       (self.pacing.sleep_ns - slept) / 1e9)
+
+    def run (self):
+        """Run AVR until it stops (cpu_Done) or crashes (cpu_Crashed). Returns the stop reason."""
+
+        return self.__run_until (RunForever)
+
+    def run_one (self):
+        """Run one instruction."""
+
+        avr_run_one (self)
+
+    def run_cycles (self, cycles = 1):
+        """Run cycles. Returns the stop reason (stop_Cycle, stop_Done, stop_Crashed or stop_Break)."""
+
+        return self.__run_until (self.cycle + cycles)
+
+    def run_us (self, us):
+        """Run given number of useconds. Returns the stop reason."""
+
+        return self.run_cycles (self.usec_to_cycles (us))
+
+    def break_run (self):
+        """Called from callbacks to make the current run return stop_Break after the current instruction."""
+
+        avr_run_break_py ()
+
+    def reset (self):
+        """Resets the AVR, and the IO modules."""
+
+        avr_reset (self)
+
+    def info (self, *args):
+        """Write formatted information (printf like)."""
+
+        avr_info (self, *args)
+
+    def sadly_crashed (self, signal):
+        """Called when the core has detected a crash somehow.
+           This might activate gdb server.
+        """
+
+        avr_sadly_crashed (self, signal)
+
+    def usec_to_cycles (self, usecs):
+        """Converts a number of usec to a number of machine cycles, at current speed."""
+
+        return avr_usec_to_cycles (self, usecs)
+
+    def cycles_to_usec (self, cycles):
+        """Converts back a number of cycles to usecs (for usleep)."""
+
+        return avr_cycles_to_usec (self, cycles)
+
+    def hz_to_cycles (self, hz):
+        """Converts a number of hz to a number of cycles."""
+
+        return avr_hz_to_cycles (self, hz)
+
+    def add_timer (self, in_cycles, callback, callback_arg = None):
+        """Create a new timer. The given callback will be invoked with the given callback argument in the given cycles."""
+
+        return Timer (self, in_cycles, callback, callback_arg)
+
+    def add_timer_us (self, in_us, callback, callback_arg = None):
+        """Create a new timer. The given callback will be invoked with the given callback argument in the given us."""
+
+        return Timer (self, self.usec_to_cycles (in_us), callback, callback_arg)
+
+    def snapshot (self):
+        """Save the state of the AVR: registers, memories, cycle, interrupts, IO modules and timers."""
+
+        timers = list ()
+        for timer in self._timers:
+            in_cycles = timer.get_remaining_cycles ()
+            if in_cycles != None:
+                timers.append ((timer, self.cycle + in_cycles))
+
+        return Snapshot (avr_snapshot_save_py (self), timers, self)
+
+    def restore (self, snapshot):
+        """Restore a state saved by snapshot (). The snapshot may also come from
+           another AVR of the same kind, running the same firmware."""
+
+        if len (snapshot.timers) > 0 and snapshot.get_avr () is not self:
+            raise AVRException ("Snapshot has python timers of another AVR")
+
+        if avr_snapshot_restore_py (self, snapshot.data) < 0:
+            raise AVRException ("Snapshot doesn't match this AVR")
+
+        # Timers are replaced by the ones of the snapshot
+        self._timers.clear ()
+
+        for (timer, cycle) in snapshot.timers:
+            timer.set_cycles (cycle - self.cycle)
+
+    def firmware_hash (self):
+        """Hash of the firmware file, mcu and frequency. Identifies snapshots of this firmware."""
+
+        digest = hashlib.sha1 ()
+        f = open (self.__firmware.filename, "rb")
+        try:
+            digest.update (f.read ())
+        finally:
+            f.close ()
+        digest.update (str ((self.mmcu, self.frequency)).encode ())
+
+        return digest.hexdigest ()
+
+    def checkpoint (self, directory, name, prepare):
+        """Restore the snapshot of the given name from the directory, or call prepare (avr)
+           and save a snapshot after it. Snapshots are keyed by the firmware hash and
+           the build of simavr, so a new firmware or simavr doesn't use old snapshots."""
+
+        filename = os.path.join (directory, "%s-%s-%016x.snapshot" % (self.firmware_hash (), name,
+                                                                       avr_snapshot_build (self)))
+
+        if os.path.exists (filename):
+            self.restore (Snapshot.load (filename))
+        else:
+            prepare (self)
+
+            if not os.path.isdir (directory):
+                os.makedirs (directory)
+
+            self.snapshot ().save (filename)
+
+    def get_io_irq (self, ctl, index, name = None):
+        """Get the specific irq for a module."""
+
+        irq = IRQ (pool = None, avr = self, _free = False, _instance = avr_io_getirq (self, ctl, index))
+        if name == None:
+            irq.set_name ("ctl" + str(ctl) + "-" + str(index))
+        else:
+            irq.set_name (name)
+
+        return irq
+
+    def get_ioport_irq (self, letter, index, name = None):
+        """Get IRQ of the given ioport (by letter like A, B, C...)."""
+
+        irq = self.get_io_irq (avr_ioctl_ioport_getirq (letter.upper()), index)
+        if name == None:
+            irq.set_name ("ioport_" + letter + str(index))
+        else:
+            irq.set_name (name)
+
+        return irq
+
+    def get_iomem_irq (self, register, index, name = None):
+        """Get IRQ of for the given io memory register."""
+
+        irq = IRQ (pool = None, avr = self, _free = False, _instance = avr_iomem_getirq (self, register, index))
+        if name == None:
+            irq.set_name ("iomem_0x" + hex(register) + "_" + str(index))
+        else:
+            irq.set_name (name)
+
+        return irq
+
+class Snapshot:
+    """State of an AVR saved by AVR.snapshot (). The state of the simulator is kept
+       as bytes, timers implemented in python are kept as (timer, cycle) pairs."""
+
+    def __init__ (self, data, timers = (), avr = None):
+        """Construct."""
+
+        self.data = data
+        self.timers = list (timers)
+        self.__avr = avr and weakref.ref (avr)
+
+    def get_avr (self):
+        """AVR the snapshot was taken from, if it is still alive."""
+
+        return self.__avr and self.__avr ()
+
+    def to_bytes (self):
+        """Compressed bytes of the snapshot. Valid for the same build of simavr only."""
+
+        if len (self.timers) > 0:
+            raise AVRException ("Snapshot with python timers can't be serialized")
+
+        return zlib.compress (self.data)
+
+    @staticmethod
+    def from_bytes (data):
+        """Snapshot from bytes returned by to_bytes ()."""
+
+        return Snapshot (zlib.decompress (data))
+
+    def save (self, filename):
+        """Save to the given file."""
+
+        f = open (filename, "wb")
+        try:
+            f.write (self.to_bytes ())
+        finally:
+            f.close ()
+
+    @staticmethod
+    def load (filename):
+        """Load from the given file."""
+
+        f = open (filename, "rb")
+        try:
+            return Snapshot.from_bytes (f.read ())
+        finally:
+            f.close ()
+
+
+class _CodeSymbols:
+    """Attributes flash byte addresses to the closest code symbol at or below them."""
+
+    def __init__ (self, symbols, size):
+        """Construct from (address, name) symbols, those at or above size are ignored."""
+
+        # One name per code address
+        names = dict ()
+        for address, name in symbols:
+            if address < size:
+                names.setdefault (address, name)
+
+        self.__addresses = sorted (names)
+        self.__names = [names [address] for address in self.__addresses]
+
+    def function_at (self, address):
+        """Name of the symbol the given flash byte address belongs to, '??' if none."""
+
+        index = bisect.bisect_right (self.__addresses, address) - 1
+        return self.__names [index] if index >= 0 else "??"
+
+
+class Profile:
+    """Cycles and executions (or samples) per flash word, see AVR.get_profile.
+       Words are attributed to the closest code symbol at or below them."""
+
+    def __init__ (self, cycles, counts, symbols = (), filename = None, period = 0):
+        """Construct."""
+
+        self.cycles = cycles
+        self.counts = counts
+        self.filename = filename
+        self.period = period
+        self.__symbols = _CodeSymbols (symbols, 2 * len (cycles))
+
+    def function_at (self, address):
+        """Name of the symbol the given flash byte address belongs to, '??' if none."""
+
+        return self.__symbols.function_at (address)
+
+    def words (self):
+        """List of (address, function, cycles, count) of the flash words that were hit."""
+
+        return [(2 * word, self.function_at (2 * word), self.cycles [word], self.counts [word])
+                for word in range (len (self.counts)) if self.counts [word]]
+
+    def functions (self):
+        """List of (function, cycles, count) totals, most cycles first."""
+
+        totals = collections.OrderedDict ()
+        for address, name, cycles, count in self.words ():
+            total = totals.setdefault (name, [0, 0])
+            total [0] += cycles
+            total [1] += count
+
+        return sorted (((name, total [0], total [1]) for name, total in totals.items ()),
+                       key = lambda item: -item [1])
+
+    def total_cycles (self):
+        """Cycles counted over the whole flash."""
+
+        return sum (self.cycles)
+
+    def write_callgrind (self, filename):
+        """Write a callgrind file (for kcachegrind & co), costs are per instruction address."""
+
+        f = open (filename, "w")
+        try:
+            f.write ("# callgrind format\nversion: 1\ncreator: simavr\n")
+            f.write ("positions: instr\nevents: Cycles Executions\n")
+            if self.filename != None:
+                f.write ("ob=%s\n" % self.filename)
+
+            function = None
+            for address, name, cycles, count in self.words ():
+                if name != function:
+                    f.write ("fn=%s\n" % name)
+                    function = name
+                f.write ("0x%x %d %d\n" % (address, cycles, count))
+
+            f.write ("totals: %d %d\n" % (self.total_cycles (), sum (self.counts)))
+        finally:
+            f.close ()
+
+    def write_pprof (self, filename):
+        """Write a gzipped pprof profile.proto file, with one location per instruction address."""
+
+        strings = [""]
+        indexes = {"": 0}
+        def string (value):
+            if value not in indexes:
+                indexes [value] = len (strings)
+                strings.append (value)
+            return indexes [value]
+
+        def value_type (type, unit):
+            return _pb_message ((1, string (type)), (2, string (unit)))
+
+        words = self.words ()
+        functions = dict ()
+        profile = bytearray ()
+
+        profile += _pb_field (1, value_type ("executions" if not self.period else "samples", "count"))
+        profile += _pb_field (1, value_type ("cycles", "count"))
+
+        for location, (address, name, cycles, count) in enumerate (words, 1):
+            profile += _pb_field (2, _pb_message ((1, _pb_packed ([location])),
+                                                  (2, _pb_packed ([count, cycles]))))
+
+        profile += _pb_field (3, _pb_message ((1, 1), (3, 2 * len (self.cycles)),
+                                              (5, string (self.filename or "")), (7, 1)))
+
+        for location, (address, name, cycles, count) in enumerate (words, 1):
+            function = functions.setdefault (name, len (functions) + 1)
+            profile += _pb_field (4, _pb_message ((1, location), (2, 1), (3, address),
+                                                  (4, _pb_message ((1, function),))))
+
+        for name, function in sorted (functions.items (), key = lambda item: item [1]):
+            profile += _pb_field (5, _pb_message ((1, function), (2, string (name)), (3, string (name)),
+                                                  (4, string (self.filename or ""))))
+
+        period_type = value_type ("cycles", "count")
+        for value in strings:
+            profile += _pb_field (6, value.encode ("utf-8"))
+        profile += _pb_field (11, period_type)
+        profile += _pb_field (12, self.period or 1)
+
+        f = gzip.open (filename, "wb")
+        try:
+            f.write (bytes (profile))
+        finally:
+            f.close ()
+
+# Minimal protobuf encoding for Profile.write_pprof
+def _pb_varint (value):
+    result = bytearray ()
+    while value > 0x7f:
+        result.append ((value & 0x7f) | 0x80)
+        value >>= 7
+    result.append (value)
+    return result
+
+def _pb_field (number, value):
+    """Varint field for integers, length delimited field otherwise."""
+
+    if isinstance (value, (bytes, bytearray)):
+        return _pb_varint (number << 3 | 2) + _pb_varint (len (value)) + value
+    return _pb_varint (number << 3) + _pb_varint (value)
+
+def _pb_message (*fields):
+    result = bytearray ()
+    for number, value in fields:
+        result += _pb_field (number, value)
+    return result
+
+def _pb_packed (values):
+    result = bytearray ()
+    for value in values:
+        result += _pb_varint (value)
+    return result
+
+class Coverage:
+    """Flash words where instructions were executed, one bit per word (bit n & 7 of
+       byte n >> 3 for word n), see AVR.get_coverage. Coverages of runs of the same
+       firmware can be merged, also from files with the simavr_coverage tool."""
+
+    MAGIC = b"simavr-coverage 1\n"
+
+    def __init__ (self, bitmap, symbols = (), filename = None, digest = None, code_size = None):
+        """Construct from the bitmap, the firmware symbols, file name and digest (see
+           firmware_digest), and the size of its code in bytes (all the flash by default)."""
+
+        self.bitmap = bytearray (bitmap)
+        self.filename = filename
+        self.digest = digest
+        self.code_size = code_size or 16 * len (self.bitmap)
+        self.__symbols = _CodeSymbols (symbols, 16 * len (self.bitmap))
+
+    @staticmethod
+    def firmware_digest (filename):
+        """Digest of the firmware file, coverages of different firmwares can't be merged."""
+
+        f = open (filename, "rb")
+        try:
+            return hashlib.sha1 (f.read ()).hexdigest ()
+        finally:
+            f.close ()
+
+    def __len__ (self):
+        """Number of flash words."""
+
+        return 8 * len (self.bitmap)
+
+    def executed (self, address):
+        """Whether an instruction at the given flash byte address was executed."""
+
+        word = address >> 1
+        return bool (self.bitmap [word >> 3] & (1 << (word & 7)))
+
+    def count (self):
+        """Number of words executed."""
+
+        return avr_coverage_count_py (self.bitmap)
+
+    def addresses (self):
+        """Flash byte addresses of the executed words."""
+
+        result = []
+        for index, byte in enumerate (self.bitmap):
+            if byte:
+                result.extend (16 * index + 2 * bit for bit in range (8) if byte & (1 << bit))
+
+        return result
+
+    def function_at (self, address):
+        """Name of the symbol the given flash byte address belongs to, '??' if none."""
+
+        return self.__symbols.function_at (address)
+
+    def functions (self):
+        """List of (function, executed words), in address order."""
+
+        totals = collections.OrderedDict ()
+        for address in self.addresses ():
+            name = self.function_at (address)
+            totals [name] = totals.get (name, 0) + 1
+
+        return list (totals.items ())
+
+    def lines (self, addr2line = "avr-addr2line"):
+        """Dict of (source file, line) to whether code of that line was executed, from the
+           DWARF line table of the firmware, read with the given addr2line tool."""
+
+        addresses = range (0, min (self.code_size, 16 * len (self.bitmap)), 2)
+        process = subprocess.Popen ([addr2line, "-e", self.filename], stdin = subprocess.PIPE,
+                                    stdout = subprocess.PIPE, universal_newlines = True)
+        output = process.communicate ("".join ("0x%x\n" % address for address in addresses)) [0]
+        if process.returncode != 0:
+            raise AVRException (addr2line + " failed on " + str (self.filename))
+
+        result = dict ()
+        for address, location in zip (addresses, output.splitlines ()):
+            source, _, line = location.split (" ") [0].rpartition (":")
+            if source in ("", "??") or not line.isdigit () or line == "0":
+                continue
+
+            key = (source, int (line))
+            result [key] = result.get (key, False) or self.executed (address)
+
+        return result
+
+    def merge (self, other):
+        """Add the words executed in the other coverage of the same firmware. Returns self."""
+
+        if self.digest != None and other.digest != None and self.digest != other.digest:
+            raise AVRException ("Coverages of different firmwares can't be merged")
+
+        if avr_coverage_merge_py (self.bitmap, other.bitmap) < 0:
+            raise AVRException ("Coverages of different flash sizes can't be merged")
+
+        self.digest = self.digest or other.digest
+        self.filename = self.filename or other.filename
+        return self
+
+    def save (self, filename):
+        """Write to the given file, see load."""
+
+        header = { "firmware": self.filename, "digest": self.digest, "code_size": self.code_size }
+
+        f = open (filename, "wb")
+        try:
+            f.write (self.MAGIC)
+            f.write ((json.dumps (header) + "\n").encode ())
+            f.write (self.bitmap)
+        finally:
+            f.close ()
+
+    @staticmethod
+    def load (filename):
+        """Read a coverage written by save. The symbols are read from its firmware, if
+           it is still there."""
+
+        f = open (filename, "rb")
+        try:
+            if f.readline () != Coverage.MAGIC:
+                raise AVRException (filename + " is not a coverage file")
+
+            header = json.loads (f.readline ().decode ())
+            bitmap = f.read ()
+        finally:
+            f.close ()
+
+        symbols = ()
+        firmware = header.get ("firmware")
+        if firmware != None and os.path.exists (firmware):
+            symbols = Firmware.load (firmware, quiet = True).symbols ()
+
+        return Coverage (bitmap, symbols, firmware, header.get ("digest"), header.get ("code_size"))
+
+
+TraceRecord = collections.namedtuple ("TraceRecord", "cycle pc sreg registers")
+
+TraceChunk = collections.namedtuple ("TraceChunk", "offset count size compressed first_cycle last_cycle "
+                                                   "min_pc max_pc first_record")
+
+class TraceFile:
+    """Reader of the binary traces of AVR.trace_file_start. The file is mmapped and indexed
+       by its chunks, which are read one at a time: as NumPy structured arrays (see DTYPE),
+       views of the file itself unless compressed, or as TraceRecord (cycle, pc, sreg,
+       registers) tuples without NumPy, registers being the ((register, value), ...)
+       changed by the instruction. A trace cut short is read up to its last whole chunk."""
+
+    HEADER_FORMAT = "<8sIIII32s8x"
+    HEADER_SIZE = struct.calcsize (HEADER_FORMAT)
+    CHUNK_FORMAT = "<IIIIQQII"
+    CHUNK_SIZE = struct.calcsize (CHUNK_FORMAT)
+    RECORD_FORMAT = "<IIBB3s3s"
+    RECORD_SIZE = struct.calcsize (RECORD_FORMAT)
+
+    # Layout of the records, for numpy.dtype
+    DTYPE = [("delta", "<u4"), ("pc", "<u4"), ("sreg", "u1"), ("count", "u1"),
+             ("reg", "u1", (3,)), ("value", "u1", (3,))]
+
+    def __init__ (self, filename):
+        """Open and index the given trace file."""
+
+        self.filename = filename
+        self.__file = open (filename, "rb")
+        self.__map = None
+
+        try:
+            size = os.fstat (self.__file.fileno ()).st_size
+            if size < self.HEADER_SIZE:
+                raise AVRException (filename + " is not a trace file")
+
+            self.__map = mmap.mmap (self.__file.fileno (), 0, access = mmap.ACCESS_READ)
+            (magic, version, record_size, self.flags, self.frequency, mmcu) = \
+                struct.unpack_from (self.HEADER_FORMAT, self.__map, 0)
+            if magic != AVR_TRACE_FILE_MAGIC.encode () or version != 1 or record_size != self.RECORD_SIZE:
+                raise AVRException (filename + " is not a trace file")
+
+            self.mmcu = mmcu.rstrip (b"\0").decode ()
+            self.chunks = self.__index (size)
+        except:
+            self.close ()
+            raise
+
+        self.__first_cycles = [chunk.first_cycle for chunk in self.chunks]
+
+    def __index (self, size):
+        chunks = []
+        offset = self.HEADER_SIZE
+        records = 0
+
+        while offset + self.CHUNK_SIZE <= size:
+            (magic, count, data_size, flags, first_cycle, last_cycle, min_pc, max_pc) = \
+                struct.unpack_from (self.CHUNK_FORMAT, self.__map, offset)
+            if magic != AVR_TRACE_CHUNK_MAGIC or offset + self.CHUNK_SIZE + data_size > size:
+                break
+
+            chunks.append (TraceChunk (offset + self.CHUNK_SIZE, count, data_size,
+                                       bool (flags & AVR_TRACE_FILE_COMPRESS),
+                                       first_cycle, last_cycle, min_pc, max_pc, records))
+            offset += self.CHUNK_SIZE + data_size
+            records += count
+
+        return chunks
+
+    def __len__ (self):
+        """Number of records."""
+
+        return self.chunks [-1].first_record + self.chunks [-1].count if self.chunks else 0
+
+    def data (self, index):
+        """Records of the chunk of the given index, as a bytes like object."""
+
+        chunk = self.chunks [index]
+        data = self.__map [chunk.offset : chunk.offset + chunk.size]
+        return zlib.decompress (data) if chunk.compressed else data
+
+    def records (self, index):
+        """Records of the chunk of the given index as a NumPy structured array, a read-only
+           view of the file unless the chunk is compressed."""
+
+        import numpy
+
+        chunk = self.chunks [index]
+        if chunk.compressed:
+            return numpy.frombuffer (self.data (index), dtype = numpy.dtype (self.DTYPE))
+
+        return numpy.frombuffer (self.__map, dtype = numpy.dtype (self.DTYPE),
+                                 count = chunk.count, offset = chunk.offset)
+
+    def cycles (self, index, records = None):
+        """Cycles the instructions of the chunk of the given index started at, as a NumPy array."""
+
+        import numpy
+
+        if records is None:
+            records = self.records (index)
+
+        return numpy.uint64 (self.chunks [index].first_cycle) + numpy.cumsum (records ["delta"], dtype = numpy.uint64)
+
+    def filter_pc (self, start, end):
+        """Instructions at flash byte addresses from start to end (excluded), as NumPy arrays
+           (cycles, records). Chunks out of that range are not read."""
+
+        import numpy
+
+        cycles = [numpy.zeros (0, dtype = numpy.uint64)]
+        records = [numpy.zeros (0, dtype = numpy.dtype (self.DTYPE))]
+
+        for index, chunk in enumerate (self.chunks):
+            if chunk.max_pc < start or chunk.min_pc >= end:
+                continue
+
+            chunk_records = self.records (index)
+            mask = (chunk_records ["pc"] >= start) & (chunk_records ["pc"] < end)
+            cycles.append (self.cycles (index, chunk_records) [mask])
+            records.append (chunk_records [mask])
+
+        return numpy.concatenate (cycles), numpy.concatenate (records)
+
+    def decode (self, index, first = 0):
+        """Records of the chunk of the given index from the first one, as TraceRecord tuples."""
+
+        data = self.data (index)
+        cycle = self.chunks [index].first_cycle
+
+        for offset in range (0, len (data), self.RECORD_SIZE):
+            (delta, pc, sreg, count, regs, values) = struct.unpack_from (self.RECORD_FORMAT, data, offset)
+            cycle += delta
+            if offset >= first * self.RECORD_SIZE:
+                registers = tuple (zip (bytearray (regs), bytearray (values))) [:count]
+                yield TraceRecord (cycle, pc, sreg, registers)
+
+    def seek (self, cycle):
+        """(chunk index, record index in the chunk) of the last instruction started at or
+           before the given cycle, None if the trace starts after it."""
+
+        index = bisect.bisect_right (self.__first_cycles, cycle) - 1
+        if index < 0:
+            return None
+
+        position = 0
+        for position, record in enumerate (self.decode (index)):
+            if record.cycle > cycle:
+                return (index, position - 1)
+
+        return (index, position)
+
+    def read (self, cycle = None, count = None):
+        """Iterate TraceRecord tuples from the instruction running at the given cycle (from
+           the start by default), for count records (to the end by default)."""
+
+        position = self.seek (cycle) if cycle != None else None
+        index, first = position or (0, 0)
+
+        for index in range (index, len (self.chunks)):
+            for record in self.decode (index, first):
+                if count != None:
+                    if count <= 0:
+                        return
+                    count -= 1
+                yield record
+            first = 0
+
+    def __iter__ (self):
+        """Iterate all the records as TraceRecord tuples."""
+
+        return self.read ()
+
+    def tail (self, count):
+        """Last count records as TraceRecord tuples, ie what led to a crash."""
+
+        records = []
+        for index in range (len (self.chunks) - 1, -1, -1):
+            if len (records) >= count:
+                break
+            records = list (self.decode (index)) + records
+
+        return list (records) [-count:] if count else []
+
+    def close (self):
+        """Close the file. NumPy views of the chunks must be released first."""
+
+        if self.__map != None:
+            self.__map.close ()
+            self.__map = None
+        self.__file.close ()
+
+    def __enter__ (self):
+        return self
+
+    def __exit__ (self, exc_type, exc_value, traceback):
+        self.close ()
+
+
+class Pacing:
+    """How a sleeping AVR is paced against the wall clock, see avr_set_pacing.
+       Use Pacing.realtime, Pacing.max_speed or Pacing.scaled (x)."""
+
+    def __init__ (self, mode, scale = 1.0):
+        """Construct."""
+
+        self.mode = mode
+        self.scale = scale
+
+    @staticmethod
+    def scaled (scale):
+        """Simulated time runs scale times faster than the wall clock."""
+
+        return Pacing (pacing_Scaled, float (scale))
+
+    def __eq__ (self, other):
+        return isinstance (other, Pacing) and (self.mode, self.scale) == (other.mode, other.scale)
+
+    def __ne__ (self, other):
+        return not self == other
+
+    def __repr__ (self):
+        if self.mode == pacing_Scaled:
+            return "Pacing.scaled (%g)" % self.scale
+        if self.mode == pacing_MaxSpeed:
+            return "Pacing.max_speed"
+        if self.mode == pacing_Realtime:
+            return "Pacing.realtime"
+        return "Pacing (%r, %r)" % (self.mode, self.scale)
+
+Pacing.realtime = Pacing (pacing_Realtime)
+Pacing.max_speed = Pacing (pacing_MaxSpeed)
+
+# Wall clock used to time runs
+_host_time = getattr (time, "monotonic", time.time)
+
+class RunReport:
+    """Simulated versus host time of a run, kept in AVR.last_run. Times are in seconds."""
+
+    def __init__ (self, cycles, simulated, host, slept):
+        """Construct."""
+
+        self.cycles = cycles
+        self.simulated = simulated
+        self.host = host
+        self.slept = slept
+
+    def speed (self):
+        """How many times faster than real time the simulation ran."""
+
+        return self.simulated / self.host if self.host > 0 else float ("inf")
+
+    def __repr__ (self):
+        return "<RunReport %d cycles, %.6fs simulated in %.6fs (%.6fs asleep), x%.2f>" % (
+            self.cycles, self.simulated, self.host, self.slept, self.speed ())
+
+class Timer:
+    """Timer that can be triggered by AVR's cycles."""
+
+    def __init__ (self, avr, in_cycles, callback, callback_arg = None):
+        """Create a new timer. The given callback will be invoked with the given callback argument in the given cycles."""
+
+        self.__avr = avr
+        self.__handler = self.__make_handler (avr, callback, callback_arg)
+
+        self.set_cycles (in_cycles)
+
+    def __make_handler (self, avr, callback, callback_arg):
+        """Make a handler that is called by C code directly. It is created once and also
+           identifies the timer in C. It keeps only a weak reference to the timer, so
+           the timer can still be garbage collected."""
+
+        timer = weakref.ref (self)
+
+        def handler ():
+            in_cycles = callback (callback_arg)
+
+            if in_cycles == None or in_cycles == 0:
+                avr._timers.discard (timer ())
+                return 0
+
+            return in_cycles + avr.cycle
+
+        return handler
+
+    def get_avr (self):
+        """AVR of the timer."""
+
+        return self.__avr
+
+    def get_remaining_cycles (self):
+        """Number of cycles before the timer is triggered, None if it is not scheduled."""
+
+        status = avr_cycle_timer_status_py (self.__avr, self.__handler)
+        if status == 0:
+            return None
+
+        return status - 1
+
+    def set_cycles (self, in_cycles):
+        """Changes in what number cycles timer will be triggered."""
+
+        avr_cycle_timer_register_py (self.__avr, in_cycles, self.__handler)
+        self.__avr._timers.add (self)
+
+    def cancel (self):
+        """Cancel timer."""
+
+        # Because it is called from __del__, it well can be that module is already unloaded
+        if avr_cycle_timer_cancel_py != None:
+            avr_cycle_timer_cancel_py (self.__avr, self.__handler)
+
+        self.__avr._timers.discard (self)
+
+    def __del__ (self):
+        """Destructor."""
+
+        self.cancel ()
+
+
+class IRQ (avr_irq_t):
+    """IRQ"""
+
+    def __init__ (self, pool, base = 0, count = 1, avr = None, _free = True, _instance = None):
+        """Constructor. Notifies and connections of the IRQ are kept by the given avr
+           until it is terminated. Without avr they are kept by the IRQ object itself."""
+
+        # This object can be created from scratch or it can be create from
+        # existing instance of avr_irq_t
+        if _instance == None:
+            super (IRQ, self).__init__ (pool, base, count)
+        else:
+            _csimavr.avr_irq_t_swiginit (self, _instance)
+
+        self.__avr = avr
+        self.__count = count
+        self.__free = _free
+        self.__name = "UnnamedIRQ"
+        self.__notifiers = dict ()
+        self.__connections = set ()
+
+    def set_name (self, name):
+        """Set human readable name for IRQ"""
+
+        self.__name = name
+
+    def __repr__ (self):
+        """Representation."""
+
+        return "<IRQ " + self.__name + ">"
+
+    def __del__ (self):
+        """Destructor."""
+
+        if self.__free and avr_free_irq != None:
+            avr_free_irq (self, self.__count)
+
+    def __len__ (self):
+        """Length."""
+
+        return self.__count
+
+    def __getitem__ (self, key):
+        """Support for indexed access."""
+
+        if key in range (0, self.__count):
+            return IRQ (pool = None, avr = self.__avr, _free = False, _instance = self._get_by_index (key))
+        else:
+            raise IndexError ()
+
+    def raise_irq (self, value):
+        """Raise an IRQ. I.e. call their 'hooks', and raise any chained IRQs, and set the new 'value'."""
+
+        if value == True:
+            value = 1
+        elif value == False:
+            value = 0
+
+        avr_raise_irq (self, value)
+
+    def connect_source (self, source):
+        """Let this IRQ be a destination for the given source IRQ."""
+
+        source.connect_destination (self)
+
+    def get_avr (self):
+        """AVR that keeps notifies and connections of the IRQ, if any."""
+
+        return self.__avr
+
+    def connect_destination (self, destination):
+        """Let this IRQ be a source for the given destination IRQ."""
+
+        avr_connect_irq (self, destination)
+
+        # Prevent both from being GCed while connected
+        avr = self.__avr or destination.get_avr ()
+        if avr != None:
+            avr._connections.add ((self, destination))
+        else:
+            self.__connections.add ((self, destination))
+
+    def __get_notifiers (self):
+        """Registered params of notifies, the AVR keeps them if the IRQ has one."""
+
+        if self.__avr != None:
+            return self.__avr._notifiers
+
+        return self.__notifiers
+
+    def __address (self):
+        """Address of the C irq. Pointers of irqs allocated by IRQ itself are not hashable."""
+
+        this = self.this
+        return int (getattr (this, "this", this))
+
+    def register_notify (self, callback, callback_arg = None):
+        """Register a notification hook for the irq."""
+
+        # Prevent from being GCed. The irq is identified by its C pointer,
+        # so the param doesn't keep this object alive.
+        key = (self.__address (), callback, callback_arg)
+        notifiers = self.__get_notifiers ()
+
+        if not (key in notifiers):
+            param = (self.this, callback, callback_arg)
+            notifiers [key] = param
+            avr_irq_register_notify_py (self, param)
+
+    def unregister_notify (self, callback, callback_arg = None):
+        """Unregister a notification hook registered by register_notify."""
+
+        # The very param object passed to C is needed
+        param = self.__get_notifiers ().pop ((self.__address (), callback, callback_arg), None)
+
+        if param != None:
+            avr_irq_unregister_notify_py (self, param)
+
+
+class PinButton:
+    """Button connected to a pin"""
+
+    def __init__ (self, avr, pullup = True):
+        """Construct."""
+
+        self.__avr = avr
+        self.__irq = IRQ (pool = avr.irq_pool, avr = avr)
+        self.__on = not pullup
+        self.__off = pullup
+        self.__timer = None
+
+    def connect_ioport (self, portname, index):
+        """Connect to named io port of the given AVR. Pin of port is selected by index."""
+
+        self.__avr.get_ioport_irq (portname, index).connect_source (self.__irq)
+
+    def set_on (self, timeout_us = None):
+        """Set button to On state"""
+
+        self.__set_value (self.__on, timeout_us)
+
+    def set_off (self, timeout_us = None):
+        """Set button to On state"""
+
+        self.__set_value (self.__off, timeout_us)
+
+    def __set_value (self, value, timeout_us):
+        self.__disable_timer ()
+        self.__irq.raise_irq (value)
+
+        if timeout_us != None:
+            def handler (param):
+                self.__set_value (not value, None)
+
+            self.__timer = self.__avr.add_timer_us (timeout_us, handler)
+
+    def __disable_timer (self):
+        if self.__timer != None:
+            self.__timer.cancel ()
+            self.__timer = None
+
+class VCD:
+    def __init__ (self, avr, filename, flush_period=100000, flush_cycles = None, flush_bytes = 0, compression = None):
+        """Construct new VCD file writer. Values are buffered and written into the file
+           every flush_period us (or flush_cycles cycles) and whenever flush_bytes bytes
+           are buffered, see set_flush. The file is gzip-compressed with the given level
+           (0-9), by default if the filename ends with .gz."""
+
+        self.__avr = avr
+        self.__vcd = avr_vcd_t ()
+        self.__sources = list ()
+        avr_vcd_init (avr, filename, self.__vcd, flush_period)
+
+        if flush_cycles != None or flush_bytes:
+            self.set_flush (flush_cycles, flush_bytes)
+
+        if compression == None:
+            compression = 6 if filename.endswith (".gz") else 0
+
+        if avr_vcd_set_compression (self.__vcd, compression) < 0:
+            raise AVRException ("Invalid VCD compression level: " + str (compression))
+
+        avr._vcds.add (self) # Don't let to GC us
+
+    def set_flush (self, cycles = None, bytes = None):
+        """Write buffered values into the file every given cycles (0 for never) and whenever
+           the given bytes are buffered (0 for no limit). None keeps the current setting."""
+
+        if cycles == None: cycles = self.__vcd.period
+        if bytes == None:  bytes = self.__vcd.flush_size
+
+        avr_vcd_set_flush (self.__vcd, cycles, bytes)
+
+    def dropped (self):
+        """Number of values that could not be logged, because the VCD was not started
+           or memory was exhausted."""
+
+        return self.__vcd.dropped
+
+    def start (self):
+        """Start writing to file."""
+
+        avr_vcd_start (self.__vcd)
+
+    def stop (self):
+        """Stop writing to file."""
+
+        avr_vcd_stop (self.__vcd)
+
+    def add_signal (self, irq, bit_size, name):
+        """Add signal to watch."""
+
+        if avr_vcd_add_signal (self.__vcd, irq, bit_size, name) < 0:
+            raise AVRException ("Unable to add more VCD signals")
+
+        self.__sources.append (irq)
+
+    def add_ioport_signal (self, name, index, bit_size = 1):
+        """Add signal for ioport pin."""
+
+        self.add_signal (self.__avr.get_ioport_irq (name, index), bit_size, name + "-" + str(index))
+
+    def close (self):
+        """Stop writing, disconnect signals and close the file."""
+
+        if self.__vcd == None:
+            return
+
+        for (index, source) in enumerate (self.__sources):
+            avr_unconnect_irq (source, avr_vcd_get_signal_irq_py (self.__vcd, index))
+        self.__sources = list ()
+
+        avr_vcd_close (self.__vcd)
+        self.__vcd = None
+
+        self.__avr._vcds.discard (self)
+
+
+class IRQRecorder:
+    """Records changes of IRQs into a preallocated C buffer. Changes are
+       recorded without calling python and can be drained in batches."""
+
+    # One record: cycle, index of the irq in the recorder, value
+    RECORD_FORMAT = "=QII"
+    RECORD_SIZE = struct.calcsize (RECORD_FORMAT)
+
+    def __init__ (self, avr, size = 65536):
+        """Construct new recorder able to keep the given number of records."""
+
+        self.__avr = avr
+        self.__irqs = list ()
+        self.__recorder = avr_irq_recorder_t ()
+        self.__exports = _Exports ()
+
+        if avr_irq_recorder_init (avr, self.__recorder, size) < 0:
+            raise AVRException ("Unable to allocate IRQ recorder of size " + str(size))
+
+        avr._recorders.add (self) # Closed when the AVR is terminated
+
+    def add_irq (self, irq, name = None):
+        """Start recording changes of the given irq. Returns index of the irq used in records."""
+
+        if name == None:
+            name = "irq" + str(len (self.__irqs))
+
+        index = avr_irq_recorder_add_signal (self.__recorder, irq, name)
+        if index < 0:
+            raise AVRException ("Unable to record more IRQs")
+
+        self.__irqs.append (irq)
+        return index
+
+    def add_ioport_irq (self, letter, index):
+        """Start recording changes of the given ioport pin."""
+
+        return self.add_irq (self.__avr.get_ioport_irq (letter, index), letter + str(index))
+
+    def get_irq (self, index):
+        """Get irq by its index in records."""
+
+        return self.__irqs [index]
+
+    def __len__ (self):
+        """Number of records waiting to be drained."""
+
+        return avr_irq_recorder_get_count (self.__recorder)
+
+    def overflow (self):
+        """Number of records lost because the buffer was full."""
+
+        return self.__recorder.overflow
+
+    def views (self):
+        """Drain records as read-only memoryviews, no copies are made.
+           A view is valid until the next one is requested: it keeps the
+           recorder alive, but its records are then overwritten by new ones."""
+
+        while True:
+            (index, count) = avr_irq_recorder_peek_py (self.__recorder)
+            if count == 0:
+                return
+
+            view = self.__exports.view ("records", avr_irq_recorder_records_py, self.__recorder, self)
+            yield view [index * self.RECORD_SIZE:(index + count) * self.RECORD_SIZE]
+
+            avr_irq_recorder_consume (self.__recorder, count)
+
+    def drain (self):
+        """Drain records as (cycle, irq index, value) tuples."""
+
+        for view in self.views ():
+            for offset in range (0, len (view), self.RECORD_SIZE):
+                yield struct.unpack_from (self.RECORD_FORMAT, view, offset)
+
+    def close (self):
+        """Stop recording and free the buffer."""
+
+        if self.__recorder != None:
+            self.__exports.detach ()
+            avr_irq_recorder_close (self.__recorder)
+            self.__recorder = None
+
+    def __del__ (self):
+        """Destructor."""
+
+        if avr_irq_recorder_close != None:
+            self.close ()
+
+
+class IRQStimulus:
+    """Raises IRQs at given cycles from rows of (cycle, irq index, value), played
+       from C without a python callback per row. Rows use the IRQRecorder record
+       layout, so recordings can be played back as they are."""
+
+    ROW_FORMAT = IRQRecorder.RECORD_FORMAT
+    ROW_SIZE = IRQRecorder.RECORD_SIZE
+
+    def __init__ (self, avr, size = 1024):
+        """Construct new stimulus with room for the given number of rows to start with."""
+
+        self.__avr = avr
+        self.__irqs = list ()
+        self.__stimulus = avr_irq_stimulus_t ()
+
+        if avr_irq_stimulus_init (avr, self.__stimulus, size) < 0:
+            raise AVRException ("Unable to allocate IRQ stimulus of size " + str(size))
+
+        avr._stimuli.add (self) # Don't let to GC us
+
+    def add_irq (self, irq, name = None):
+        """Drive the given irq. Returns index of the irq used in rows."""
+
+        if name == None:
+            name = "irq" + str(len (self.__irqs))
+
+        index = avr_irq_stimulus_add_signal (self.__stimulus, irq, name)
+        if index < 0:
+            raise AVRException ("Unable to drive more IRQs")
+
+        self.__irqs.append (irq)
+        return index
+
+    def add_ioport_irq (self, letter, index):
+        """Drive the given ioport pin."""
+
+        return self.add_irq (self.__avr.get_ioport_irq (letter, index), letter + str(index))
+
+    def append (self, rows, base = 0):
+        """Append rows, in cycle order, to be played at their cycle plus base (ie avr.cycle
+           for rows relative to now). Rows are (cycle, irq index, value) tuples, or any
+           buffer with the same layout, like a NumPy array with the
+           [("cycle", "u8"), ("index", "u4"), ("value", "u4")] dtype or IRQRecorder views.
+           Rows can be appended while the AVR is running, ie from callbacks."""
+
+        try:
+            memoryview (rows)
+        except TypeError:
+            rows = b"".join (struct.pack (self.ROW_FORMAT, *row) for row in rows)
+
+        if avr_irq_stimulus_append_py (self.__stimulus, rows, base) < 0:
+            raise AVRException ("Rows are out of order or use an unknown irq index")
+
+    def __len__ (self):
+        """Number of rows waiting to be played."""
+
+        return avr_irq_stimulus_get_count (self.__stimulus)
+
+    def played (self):
+        """Number of rows played so far."""
+
+        return self.__stimulus.played
+
+    def clear (self):
+        """Drop the rows waiting to be played."""
+
+        avr_irq_stimulus_clear (self.__stimulus)
+
+    def close (self):
+        """Drop the rows, disconnect the irqs and free the buffer."""
+
+        if self.__stimulus != None:
+            avr_irq_stimulus_close (self.__stimulus)
+            self.__stimulus = None
+            self.__avr._stimuli.discard (self)
+
+
+class VCDInput:
+    """Replays a VCD file, ie from the sigrok signal analyzer, from C. Signals are
+       connected to the IRQs they are named after: <four-character ioctl>[_<IRQ index>],
+       ie iogB_3 for pin 3 of port B. The AVR stops (cpu_Done) at the end of the file."""
+
+    def __init__ (self, avr, filename):
+        """Read the header of the file and schedule its first values."""
+
+        self.__avr = avr
+        self.__vcd = avr_vcd_t ()
+
+        if avr_vcd_init_input (avr, filename, self.__vcd) < 0:
+            avr_vcd_close (self.__vcd)
+            raise AVRException ("Unable to read VCD input " + filename)
+
+        avr._vcds.add (self) # Don't let to GC us
+
+    def signals (self):
+        """Names of the signals of the file."""
+
+        return [avr_vcd_get_signal_py (self.__vcd, i).name for i in range (self.__vcd.signal_count)]
+
+    def close (self):
+        """Stop the replay and close the file."""
+
+        if self.__vcd != None:
+            avr_vcd_close (self.__vcd)
+            self.__vcd = None
+            self.__avr._vcds.discard (self)
+
+
+class UART:
+    """Byte stream connected to a UART of the AVR. Bytes sent by the AVR are kept in a
+       C buffer until they are read, bytes written are fed to the UART as fast as it
+       accepts them. The stream can also be relayed to a pty or a socket instead."""
+
+    def __init__ (self, avr, name = '0', size = 65536):
+        """Connect to the UART with the given name, with buffers of the given size to
+           start with (they grow when needed)."""
+
+        self.__avr = avr
+        self.__bridge = avr_uart_bridge_t ()
+        self.__socket = None
+        self.__pending = bytearray ()
+
+        if avr_uart_bridge_init (avr, self.__bridge, name, size) < 0:
+            raise AVRException ("Unable to connect to UART" + name)
+
+        avr._uarts.add (self) # Don't let to GC us
+
+    def write (self, data):
+        """Queue bytes (or any buffer) to be received by the AVR."""
+
+        # Counted in bytes, len () of a buffer counts its items
+        left = avr_uart_bridge_write_py (self.__bridge, data)
+        if left > 0:
+            raise AVRException ("Unable to queue " + str(left) + " bytes")
+
+    def read (self, size = -1):
+        """Read up to size bytes sent by the AVR so far, all of them if size is negative."""
+
+        if size < 0:
+            size = len (self)
+
+        result = bytes (self.__pending [:size])
+        del self.__pending [:size]
+
+        if len (result) < size:
+            result += avr_uart_bridge_read_py (self.__bridge, size - len (result))
+
+        return result
+
+    def readuntil (self, separator = b"\n", timeout_us = None, quantum_us = 1000):
+        """Run the AVR until it sent the separator, and read the bytes up to it (included).
+           Returns None if timeout_us simulated microseconds passed or the AVR stopped first,
+           the bytes received so far are kept for the next read."""
+
+        end_cycle = None if timeout_us == None else self.__avr.cycle + self.__avr.usec_to_cycles (timeout_us)
+        quantum = max (1, self.__avr.usec_to_cycles (quantum_us))
+        start = 0
+
+        while True:
+            self.__pending += avr_uart_bridge_read_py (self.__bridge, -1)
+
+            index = self.__pending.find (separator, start)
+            if index >= 0:
+                return self.read (index + len (separator))
+
+            start = max (0, len (self.__pending) - len (separator) + 1)
+
+            cycles = quantum
+            if end_cycle != None:
+                if self.__avr.cycle >= end_cycle:
+                    return None
+                cycles = min (cycles, end_cycle - self.__avr.cycle)
+
+            if self.__avr.run_cycles (cycles) not in (stop_Cycle, stop_Break):
+                self.__pending += avr_uart_bridge_read_py (self.__bridge, -1)
+                index = self.__pending.find (separator, start)
+                return None if index < 0 else self.read (index + len (separator))
+
+    def __len__ (self):
+        """Number of bytes sent by the AVR waiting to be read."""
+
+        return len (self.__pending) + avr_uart_bridge_get_rx_count (self.__bridge)
+
+    def pending (self):
+        """Number of written bytes the AVR did not receive yet."""
+
+        return avr_uart_bridge_get_tx_count (self.__bridge)
+
+    def dropped (self):
+        """Number of bytes lost because the buffers could not grow."""
+
+        return self.__bridge.dropped
+
+    def attach_fd (self, fd, owned = False, poll_us = 1000):
+        """Relay the stream to the given file descriptor, polled every poll_us simulated
+           microseconds. The fd is closed with the UART if owned."""
+
+        self.__detach ()
+
+        if avr_uart_bridge_set_fd (self.__bridge, fd, owned, max (1, self.__avr.usec_to_cycles (poll_us))) < 0:
+            raise AVRException ("Unable to attach fd " + str(fd))
+
+    def open_pty (self, poll_us = 1000):
+        """Relay the stream to a new pty. Returns the name of its slave side, ie /dev/pts/3."""
 
-        # Loading firmware
-        self._load_firmware ()
+        self.__detach ()
 
-        # Take care of bootloader
-        if self._firmware.flashbase > 0:
-            if not self.__quiet: print "Attempted to load a bootloader at %04x" % self._firmware.flashbase
-            self.pc = self._firmware.flashbase
+        if avr_uart_bridge_open_pty (self.__bridge) < 0:
+            raise AVRException ("Unable to open a pty")
 
-        # Setup gdb in case of crash or explicit activation
-        self.gdb_port = gdb_port
-        if gdb:
-            self.gdb_init ()
+        self.__bridge.poll_period = max (1, self.__avr.usec_to_cycles (poll_us))
 
-        # Enable or disable trace
-        self.trace = trace
+        return self.__bridge.pty_name
 
-    def _prepare_firmware (self, filename):
-        """Prepare firmware from filename."""
+    def connect_unix (self, path, poll_us = 1000):
+        """Relay the stream to the unix socket at the given path."""
 
-        if filename.lower().endswith (".hex"):
-            self.__chunks = ihex_chunk_t_array (4)
-            chunks_count = read_ihex_chunks (filename, self.__chunks, 4)
-            if chunks_count < 0:
-                raise AVRException ("Unable to load IHEX file: " + filename)
+        import socket
 
-            if not self.__quiet: print "Loaded", chunks_count, "sections of IHEX"
+        sock = socket.socket (socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect (path)
+            self.attach_fd (sock.fileno (), False, poll_us)
+        except:
+            sock.close ()
+            raise
 
-            for ci in range (chunks_count):
-                chunk = self.__chunks [ci]
+        self.__socket = sock
 
-                if chunk.baseaddr < 1 * 1024 * 1024:
-                    self._firmware.flash = chunk.data
-                    self._firmware.flashsize = chunk.size
-                    self._firmware.flashbase = chunk.baseaddr
+    def __detach (self):
+        """Stop relaying to the attached fd, if any."""
 
-                    flash_info = {'base': self._firmware.flashbase, 'size': self._firmware.flashsize}
-                    if not self.__quiet: print "Load HEX flash base=%(base)08x size=%(size)d" % flash_info
-                elif (chunk.baseaddr >= AVR_SEGMENT_OFFSET_EEPROM or
-                            chunk.baseaddr + loadBase >= AVR_SEGMENT_OFFSET_EEPROM):
-                    self._firmware.eeprom = chunk.data;
-                    self._firmware.eesize = chunk.size;
+        avr_uart_bridge_set_fd (self.__bridge, -1, 0, 0)
 
-                    eeprom_info = {'base': self._firmware.eeprom, 'size': self._firmware.eesize}
-                    if not self.__quiet: print "Load HEX eeprom base=%(base)08x size=%(size)d" % eeprom_info
-        else:
-            elf_read_firmware (filename, self._firmware)
+        if self.__socket != None:
+            self.__socket.close ()
+            self.__socket = None
 
-    def _init (self):
-        """Initialize AVR."""
+    def close (self):
+        """Disconnect from the UART, the AVR doesn't receive the pending bytes."""
 
-        avr_init (self)
+        if self.__bridge != None:
+            self.__detach ()
+            avr_uart_bridge_close (self.__bridge)
+            self.__bridge = None
+            self.__avr._uarts.discard (self)
 
-    def _load_firmware (self):
-        """Load prepared firmware into the AVR."""
 
-        avr_load_firmware (self, self._firmware)
+class ADCWaveform:
+    """Plays millivolt samples into an ADC channel, from C. The channel is updated
+       when the ADC starts a conversion (and at each sample if timed), by interpolating
+       the samples or holding the last one. Two buffers can be queued, on_refill tells
+       when one is done so the next one can be queued."""
 
-    def gdb_init (self):
-        """Initialize GDB. This sets AVR into Stopped state."""
+    def __init__ (self, avr, channel, rate = 0, interpolate = False, timed = False, loop = False):
+        """Connect to the given ADC channel (ADC_IRQ_ADC0...). The samples of buffers
+           queued without stamps are rate Hz apart. With loop, the last buffer is played
+           again until another one is queued, otherwise its last sample is held."""
 
-        self.state = cpu_Stopped
-        avr_gdb_init (self)
+        self.__avr = avr
+        self.__waveform = avr_adc_waveform_t ()
+        self.__refills = list ()
 
-    def terminate (self):
-        """Terminate AVR."""
+        flags = ((ADC_WAVEFORM_INTERPOLATE if interpolate else 0) |
+                 (ADC_WAVEFORM_TIMED if timed else 0) |
+                 (ADC_WAVEFORM_LOOP if loop else 0))
 
-        avr_terminate (self)
+        if avr_adc_waveform_init (avr, self.__waveform, channel, rate, flags) < 0:
+            raise AVRException ("Unable to connect to ADC channel " + str(channel))
 
-    def run (self):
-        """Run AVR."""
+        self.__refill_irq = IRQ (pool = None, avr = avr, _free = False,
+                                 _instance = avr_adc_waveform_get_irq_py (self.__waveform, ADC_WAVEFORM_IRQ_REFILL))
 
-        while True:
-            self.run_cycles ()
+        avr._waveforms.add (self) # Don't let to GC us
 
-    def run_one (self):
-        """Run one instruction."""
+    # Prefixes of buffer formats in the native byte order
+    __native = ("", "@", "=", "<" if sys.byteorder == "little" else ">")
 
-        avr_run_one (self)
+    @staticmethod
+    def __buffer (values, itemsize, codes):
+        """Values as an object with the buffer protocol, and whether they are signed.
+           Buffers of integers of the given codes and size in the native byte order are
+           passed as they are, anything else is converted to codes [0] items."""
 
-    def run_cycles (self, cycles = 1):
-        """Run cycles."""
+        try:
+            view = memoryview (values)
+            (order, code) = (view.format [:-1], view.format [-1:])
+            if view.itemsize == itemsize and code in codes and order in ADCWaveform.__native:
+                return values, code.islower ()
+        except TypeError:
+            pass
 
-        end_cycle = self.cycle + cycles
+        values = [int (v) for v in values]
+        return struct.pack ("=" + str(len (values)) + codes [0], *values), codes [0].islower ()
 
-        while self.cycle < end_cycle:
-            avr_run (self)
+    def queue (self, samples, stamps = None, span = 0):
+        """Queue 16 bits millivolt samples (ie a NumPy int16 or uint16 array, or any
+           sequence), with optional cycle stamps relative to the start of the buffer.
+           The buffer lasts span cycles, by default until one sample period (or cycle,
+           with stamps) after the last sample. Returns the free slots left."""
 
-    def run_us (self, us):
-        """Run given number of useconds"""
+        samples, is_signed = self.__buffer (samples, 2, "hH")
+        if stamps is not None:
+            # NumPy int64 arrays are "l" on LP64 platforms
+            stamps = self.__buffer (stamps, 8, "QqLl") [0]
 
-        self.run_cycles (self.usec_to_cycles (us))
+        free = avr_adc_waveform_queue_py (self.__waveform, samples, is_signed, stamps, span)
+        if free < 0:
+            raise AVRException ("Unable to queue the samples, the queue is full or they are empty")
 
-    def reset (self):
-        """Resets the AVR, and the IO modules."""
+        return free
 
-        avr_reset (self)
+    def on_refill (self, callback, callback_arg = None):
+        """Call callback (free slots, callback_arg) each time a buffer is done."""
 
-    def info (self, *args):
-        """Write formatted information (printf like)."""
+        self.__refills.append ((callback, callback_arg))
+        self.__refill_irq.register_notify (callback, callback_arg)
 
-        avr_info (self, *args)
+    def clear (self):
+        """Drop the queued buffers, the channel keeps its current value."""
 
-    def sadly_crashed (self, signal):
-        """Called when the core has detected a crash somehow.
-           This might activate gdb server.
-        """
+        avr_adc_waveform_clear (self.__waveform)
 
-        avr_sadly_crashed (self, signal)
+    def value (self):
+        """Millivolts of the waveform at the current cycle."""
 
-    def usec_to_cycles (self, usecs):
-        """Converts a number of usec to a number of machine cycles, at current speed."""
+        return avr_adc_waveform_get_value (self.__waveform)
 
-        return avr_usec_to_cycles (self, usecs)
+    def buffers (self):
+        """Number of buffers played so far (loops included)."""
 
-    def cycles_to_usec (self, cycles):
-        """Converts back a number of cycles to usecs (for usleep)."""
+        return self.__waveform.buffers
 
-        return avr_cycles_to_usec (self, cycles)
+    def underruns (self):
+        """Number of times the queue ran dry."""
 
-    def hz_to_cycles (self, hz):
-        """Converts a number of hz to a number of cycles."""
+        return self.__waveform.underruns
 
-        return avr_hz_to_cycles (self, hz)
+    def close (self):
+        """Disconnect from the ADC, the channel keeps its current value."""
 
-    def add_timer (self, in_cycles, callback, callback_arg = None):
-        """Create a new timer. The given callback will be invoked with the given callback argument in the given cycles."""
+        if self.__waveform != None:
+            for (callback, callback_arg) in self.__refills:
+                self.__refill_irq.unregister_notify (callback, callback_arg)
 
-        return Timer (self, in_cycles, callback, callback_arg)
+            avr_adc_waveform_close (self.__waveform)
+            self.__waveform = None
+            self.__avr._waveforms.discard (self)
 
-    def add_timer_us (self, in_us, callback, callback_arg = None):
-        """Create a new timer. The given callback will be invoked with the given callback argument in the given us."""
 
-        return Timer (self, self.usec_to_cycles (in_us), callback, callback_arg)
+WatchHit = collections.namedtuple ("WatchHit", "when pc addr value kind index")
 
-    def get_io_irq (self, ctl, index, name = None):
-        """Get the specific irq for a module."""
+class Watchpoints:
+    """Read and write watchpoints on ranges of the data space (I/O registers and SRAM),
+       checked by the core with a per address index: unwatched accesses cost one byte
+       lookup. Hits are counted and logged in C, python is only called for watchpoints
+       with a callback or stop. Hits are WatchHit (when, pc, addr, value, kind, index)
+       tuples, kind being AVR_WATCH_READ or AVR_WATCH_WRITE."""
 
-        irq = IRQ (pool = None, _free = False, _instance = avr_io_getirq (self, ctl, index))
-        if name == None:
-            irq.set_name ("ctl" + str(ctl) + "-" + str(index))
-        else:
-            irq.set_name (name)
+    def __init__ (self, avr, log_size = 1024):
+        """Attach to the AVR, which can have one set of watchpoints (see AVR.get_watchpoints).
+           The log keeps the last log_size hits, rounded up to a power of two."""
 
-        return irq
+        self.__avr = avr
+        self.__watchpoints = avr_watchpoints_t ()
+        self.__breaks = dict ()
 
-    def get_ioport_irq (self, letter, index, name = None):
-        """Get IRQ of the given ioport (by letter like A, B, C...)."""
+        if avr_watchpoints_init (avr, self.__watchpoints, log_size) < 0:
+            raise AVRException ("Unable to attach watchpoints")
 
-        irq = self.get_io_irq (avr_ioctl_ioport_getirq (letter.upper()), index)
-        if name == None:
-            irq.set_name ("ioport_" + letter + str(index))
-        else:
-            irq.set_name (name)
+        self.__break_irq = IRQ (pool = None, avr = avr, _free = False,
+                                _instance = avr_watchpoints_get_irq_py (self.__watchpoints, WATCH_IRQ_BREAK))
+        self.__break_irq.register_notify (self.__on_break)
 
-        return irq
+        avr._watchpoints = self # Don't let to GC us
 
-    def get_iomem_irq (self, register, index, name = None):
-        """Get IRQ of for the given io memory register."""
+    def add (self, start, size = 1, read = False, write = True, value = None, mask = 0xff,
+             callback = None, callback_arg = None, stop = False):
+        """Watch reads and/or writes of size bytes from the start data address (32 and up,
+           the general purpose registers are not watched). With value, only accesses where
+           (byte & mask) == value count. On a hit, callback (hit, callback_arg) is called
+           and, with stop, the current run returns stop_Break after the instruction.
+           Returns the index of the watchpoint."""
 
-        irq = IRQ (pool = None, _free = False, _instance = avr_iomem_getirq (self, register, index))
-        if name == None:
-            irq.set_name ("iomem_0x" + hex(register) + "_" + str(index))
-        else:
-            irq.set_name (name)
+        kind = ((AVR_WATCH_READ if read else 0) | (AVR_WATCH_WRITE if write else 0) |
+                (AVR_WATCH_MATCH if value != None else 0) |
+                (AVR_WATCH_BREAK if callback != None or stop else 0))
 
-        return irq
+        index = avr_watchpoints_add (self.__watchpoints, start, size, kind,
+                                     (value or 0) & mask, mask)
+        if index < 0:
+            raise AVRException ("Unable to watch %d bytes at 0x%x" % (size, start))
 
-class Timer:
-    """Timer that can be triggered by AVR's cycles."""
+        if kind & AVR_WATCH_BREAK:
+            self.__breaks [index] = (callback, callback_arg, stop)
 
-    def __init__ (self, avr, in_cycles, callback, callback_arg = None):
-        """Create a new timer. The given callback will be invoked with the given callback argument in the given cycles."""
+        return index
 
-        self.__callback = callback
-        self.__callback_arg = callback_arg
-        self.__avr = avr
+    def remove (self, index):
+        """Stop watching, the index is not reused."""
 
-        self.set_cycles (in_cycles)
+        avr_watchpoints_remove (self.__watchpoints, index)
+        self.__breaks.pop (index, None)
 
-    def set_cycles (self, in_cycles):
-        """Changes in what number cycles timer will be triggered."""
+    def hits (self, index):
+        """Number of hits of the watchpoint."""
 
-        avr_cycle_timer_register_py (self.__avr, in_cycles, self)
-        active_timers.add (self)
+        return avr_watchpoints_hits_py (self.__watchpoints, index)
 
-    def cancel (self):
-        """Cancel timer."""
+    def last (self):
+        """Last hit, of any watchpoint."""
 
-        avr_cycle_timer_cancel_py (self.__avr, self)
+        return WatchHit (*avr_watchpoints_last_py (self.__watchpoints))
 
-        # Because it is called from __del__, it well can be that globar var is unavailable
-        if active_timers != None:
-            active_timers.discard (self)
+    def log (self):
+        """Hits kept in the log, the oldest first."""
 
-    def _timer_handler (self):
-        """This method is called by C code."""
+        return [WatchHit (*hit) for hit in avr_watchpoints_log_py (self.__watchpoints)]
 
-        in_cycles = self.__callback (self.__callback_arg)
+    def lost (self):
+        """Number of hits dropped from the log since it was cleared."""
 
-        if in_cycles == None or in_cycles == 0:
-            active_timers.discard (self)
-            in_cycles = 0
-        else:
-            in_cycles += self.__avr.cycle
+        logged = self.__watchpoints.log_write
+        return logged - avr_watchpoints_get_log_count (self.__watchpoints)
 
-        return in_cycles
+    def clear_log (self):
+        """Drop the hits of the log, the counts of hits are kept."""
 
-    def __del__ (self):
-        """Destructor."""
+        avr_watchpoints_clear_log (self.__watchpoints)
 
-        self.cancel ()
+    def __on_break (self, index, arg):
+        (callback, callback_arg, stop) = self.__breaks [index]
 
+        if callback != None:
+            callback (self.last (), callback_arg)
 
-class IRQ (avr_irq_t):
-    """IRQ"""
+        if stop:
+            self.__avr.break_run ()
 
-    def __init__ (self, pool, base = 0, count = 1, _free = True, _instance = None):
-        """Constructor."""
+    def close (self):
+        """Remove the watchpoints from the AVR."""
 
-        # This object can be created from scratch or it can be create from
-        # existing instance of avr_irq_t
-        if _instance == None:
-            super (IRQ, self).__init__ (pool, base, count)
-        else:
-            _csimavr.avr_irq_t_swiginit (self, _instance)
+        if self.__watchpoints != None:
+            self.__break_irq.unregister_notify (self.__on_break)
+            avr_watchpoints_close (self.__watchpoints)
+            self.__watchpoints = None
+            self.__avr._watchpoints = None
 
-        self.__count = count
-        self.__free = _free
-        self.__name = "UnnamedIRQ"
 
-    def set_name (self, name):
-        """Set human readable name for IRQ"""
+class Board:
+    """AVRs, possibly at different frequencies, run together on a common timebase a
+       quantum at a time. IRQs of different AVRs are linked with a latency: their
+       changes are exchanged at the end of each quantum, so they arrive on time with a
+       latency of at least the quantum, and at most a quantum late otherwise.
+       With threads, each AVR runs its quantum in a thread of its own, where its
+       callbacks are called too."""
 
-        self.__name = name
+    def __init__ (self, quantum_us = 10, threads = False):
+        """Construct an empty board."""
 
-    def __repr__ (self):
-        """Representation."""
+        self.__quantum_ns = int (quantum_us * 1000)
+        if self.__quantum_ns <= 0:
+            raise AVRException ("The quantum must be positive")
 
-        return "<IRQ " + self.__name + ">"
+        self.__time_ns = 0
+        self.__avrs = list ()   # (avr, cycle at time 0)
+        self.__links = list ()
+        self.__threads = threads
+        self.__workers = None
+        self.__results = None
 
-    def __del__ (self):
-        """Destructor."""
+        # AVRs that are done or crashed, to their stop reason. They are not run anymore.
+        self.stopped = dict ()
 
-        if self.__free and avr_free_irq != None:
-            avr_free_irq (self, self.__count)
+    def add (self, avr):
+        """Add an AVR, its current cycle being the current time of the board. Returns it."""
 
-    def __len__ (self):
-        """Length."""
+        if self.__workers != None:
+            raise AVRException ("AVRs can't be added once the board ran with threads")
 
-        return self.__count
+        self.__avrs.append ((avr, avr.cycle - self.__time_ns * avr.frequency // 1000000000))
+        return avr
 
-    def __getitem__ (self, key):
-        """Support for indexed access."""
+    def __origin (self, avr):
+        """Cycle of the AVR at time 0."""
 
-        if key in range (0, self.__count):
-            return IRQ (pool = None, _free = False, _instance = _get_by_index (key))
-        else:
-            raise IndexError ()
+        for (a, origin) in self.__avrs:
+            if a is avr:
+                return origin
 
-    def raise_irq (self, value):
-        """Raise an IRQ. I.e. call their 'hooks', and raise any chained IRQs, and set the new 'value'."""
+        raise AVRException ("The AVR of the IRQ is not on the board")
 
-        if value == True:
-            value = 1
-        elif value == False:
-            value = 0
+    def connect (self, source, destination, latency_us = None):
+        """Link source IRQ of an AVR to the destination IRQ of another one (or the same),
+           with the given latency, the quantum by default. Both IRQs must come from their
+           AVR (ie get_ioport_irq), to know which one they belong to. Returns the link."""
 
-        avr_raise_irq (self, value)
+        if latency_us == None:
+            latency_us = self.__quantum_ns / 1000.0
+        if latency_us < 0:
+            raise AVRException ("The latency can't be negative")
 
-    def connect_source (self, source):
-        """Let this IRQ be a destination for the given source IRQ."""
+        source_avr = source.get_avr ()
+        destination_avr = destination.get_avr ()
+        if source_avr == None or destination_avr == None:
+            raise AVRException ("The IRQs must know their AVR")
 
-        source.connect_destination (self)
+        link = avr_cosim_link_t ()
+        if avr_cosim_link_init (link, source_avr, source, self.__origin (source_avr),
+                                destination_avr, destination, self.__origin (destination_avr),
+                                int (latency_us * 1000)) < 0:
+            raise AVRException ("Unable to link " + repr (source) + " to " + repr (destination))
 
-    def connect_destination (self, destination):
-        """Let this IRQ be a source for the given destination IRQ."""
+        # Closed by the first AVR to be terminated
+        source_avr._links.add (link)
+        destination_avr._links.add (link)
+        self.__links.append (link)
+        return link
 
-        avr_connect_irq (self, destination)
-        connected_irqs.add ((self, destination))
+    def connect_uarts (self, avr_a, avr_b, name_a = '0', name_b = '0', latency_us = None):
+        """Cross link the given UARTs of two AVRs, TX of one to RX of the other."""
 
-    def register_notify (self, callback, callback_arg = None):
-        """Register a notification hook for the irq."""
+        self.connect (avr_a.get_io_irq (avr_ioctl_uart_getirq (name_a), UART_IRQ_OUTPUT),
+                      avr_b.get_io_irq (avr_ioctl_uart_getirq (name_b), UART_IRQ_INPUT), latency_us)
+        self.connect (avr_b.get_io_irq (avr_ioctl_uart_getirq (name_b), UART_IRQ_OUTPUT),
+                      avr_a.get_io_irq (avr_ioctl_uart_getirq (name_a), UART_IRQ_INPUT), latency_us)
 
-        # Prevent from being GCed
-        param = (self, callback, callback_arg)
+    def time_us (self):
+        """Current time of the board."""
 
-        if not (param in registered_irq_notifiers):
-            registered_irq_notifiers.add (param)
-            avr_irq_register_notify_py (self, param)
+        return self.__time_ns / 1000.0
 
-    def _notify_handler (self, param, value):
-        """Called on notification from C code. Used to dispatch to python method."""
+    def late (self):
+        """Number of IRQ changes that arrived late, as their latency was below the quantum."""
 
-        (_, callback, callback_arg) = param
-        callback (value, callback_arg)
+        return sum (link.late for link in self.__links)
 
+    def run_us (self, us):
+        """Run the AVRs for the given microseconds of board time. Stops at the end of a
+           quantum if an AVR called break_run. Returns a dict of the AVRs that stopped
+           early to their reason (stop_Done, stop_Crashed or stop_Break), empty if all of
+           them ran the whole time."""
 
-class PinButton:
-    """Button connected to a pin"""
+        end_ns = self.__time_ns + int (us * 1000)
+        stopped = dict ()
 
-    def __init__ (self, avr, pullup = True):
-        """Construct."""
+        while self.__time_ns < end_ns and len (self.stopped) < len (self.__avrs):
+            self.__time_ns = min (end_ns, self.__time_ns + self.__quantum_ns)
 
-        self.__avr = avr
-        self.__irq = IRQ (pool = avr.irq_pool)
-        self.__on = not pullup
-        self.__off = pullup
-        self.__timer = None
+            targets = [(avr, origin + self.__time_ns * avr.frequency // 1000000000)
+                       for (avr, origin) in self.__avrs if not avr in self.stopped]
 
-    def connect_ioport (self, portname, index):
-        """Connect to named io port of the given AVR. Pin of port is selected by index."""
+            for (avr, reason) in self.__run_quantum (targets):
+                if reason != stop_Cycle:
+                    stopped [avr] = reason
+                if reason in (stop_Done, stop_Crashed):
+                    self.stopped [avr] = reason
 
-        self.__avr.get_ioport_irq (portname, index).connect_source (self.__irq)
+            for link in self.__links:
+                avr_cosim_link_sync (link)
 
-    def set_on (self, timeout_us = None):
-        """Set button to On state"""
+            if stop_Break in stopped.values ():
+                return stopped
 
-        self.__set_value (self.__on, timeout_us)
+        # Nothing is left to run once all the AVRs stopped
+        self.__time_ns = max (self.__time_ns, end_ns)
+        return stopped
 
-    def set_off (self, timeout_us = None):
-        """Set button to On state"""
+    def __run_quantum (self, targets):
+        """Run each AVR to its target cycle, returns (avr, stop reason) pairs."""
 
-        self.__set_value (self.__off, timeout_us)
+        if not self.__threads:
+            return [(avr, avr.run_cycles (max (0, cycle - avr.cycle))) for (avr, cycle) in targets]
 
-    def __set_value (self, value, timeout_us):
-        self.__disable_timer ()
-        self.__irq.raise_irq (value)
+        if self.__workers == None:
+            self.__start_workers ()
 
-        if timeout_us != None:
-            def handler (param):
-                self.__set_value (not value, None)
+        for (avr, cycle) in targets:
+            self.__workers [avr].put (cycle)
 
-            self.__timer = self.__avr.add_timer_us (timeout_us, handler)
+        results = [self.__results.get () for target in targets]
 
-    def __disable_timer (self):
-        if self.__timer != None:
-            self.__timer.cancel ()
-            self.__timer = None
+        for (avr, reason, error) in results:
+            if error != None:
+                raise error
 
-class VCD:
-    def __init__ (self, avr, filename, flush_period=100000):
-        """Construct new VCD file writer."""
+        return [(avr, reason) for (avr, reason, error) in results]
 
-        self.__avr = avr
-        self.__vcd = avr_vcd_t ()
-        avr_vcd_init (avr, filename, self.__vcd, flush_period)
+    def __start_workers (self):
+        """Start a thread per AVR, that runs it to the cycles put in its queue."""
 
-    def start (self):
-        """Start writing to file."""
+        self.__results = queue.Queue ()
+        self.__workers = dict ()
 
-        avr_vcd_start (self.__vcd)
+        for (avr, origin) in self.__avrs:
+            requests = queue.Queue ()
+            thread = threading.Thread (target = self.__work, args = (avr, requests))
+            thread.daemon = True
+            thread.start ()
+            self.__workers [avr] = requests
 
-    def stop (self):
-        """Stop writing to file."""
+    def __work (self, avr, requests):
+        """Body of the thread of an AVR."""
 
-        avr_vcd_stop (self.__vcd)
+        while True:
+            cycle = requests.get ()
+            if cycle == None:
+                return
 
-    def add_signal (self, irq, bit_size, name):
-        """Add signal to watch."""
+            try:
+                self.__results.put ((avr, avr.run_cycles (max (0, cycle - avr.cycle)), None))
+            except Exception as e:
+                self.__results.put ((avr, None, e))
 
-        avr_vcd_add_signal (self.__vcd, irq, bit_size, name)
-        active_vcds.add (self) # Don't let to GC us
+    def close (self):
+        """Stop the threads and close the links. The AVRs are left as they are."""
 
-    def add_ioport_signal (self, name, index, bit_size = 1):
-        """Add signal for ioport pin."""
+        if self.__workers != None:
+            for requests in self.__workers.values ():
+                requests.put (None)
+            self.__workers = None
 
-        self.add_signal (self.__avr.get_ioport_irq (name, index), bit_size, name + "-" + str(index))
+        for link in self.__links:
+            avr_cosim_link_close (link)
+        self.__links = list ()
 
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
@@ -451,31 +2388,29 @@ class AVRTestCase (unittest.TestCase):
     def setUp (self):
         """Clear state."""
 
-        self.__registered_irqs = list ()
-        self.__display_irqs = list ()
-        self.__ignore_irqs = list ()
+        self.__registered_irqs = set ()
+        self.__display_irqs = set ()
+        self.__ignore_irqs = set ()
         self.__irq_handler = None
-        self.__events = list ()
+        self.__events = collections.deque ()
 
     def register_irqs (self, *irqs):
         """Reqister possible irqs that will controlled in tests."""
 
         for irq in irqs:
             irq.register_notify (self.__on_irq, irq)
-            self.__registered_irqs.append (irq)
+            self.__registered_irqs.add (irq)
 
     def display_irqs (self, *irqs):
         """Reqister possible irqs that will controlled in tests."""
 
-        for irq in irqs:
-            self.__display_irqs.append (irq)
+        self.__display_irqs.update (irqs)
 
     def ignore_irqs (self, *irqs):
         """Ignore the given irqs. That means that they only will be displayed
            (if this is requested). But ignore irqs do not affect expectances."""
 
-        for irq in irqs:
-            self.__ignore_irqs.append (irq)
+        self.__ignore_irqs.update (irqs)
 
     def __on_irq (self, value, irq):
         """Called when irq occurs."""
@@ -496,70 +2431,89 @@ class AVRTestCase (unittest.TestCase):
     def expect_irqs_for_cycles (self, cycles, *irq_pairs):
         """Expect the following irq to happen for the given us."""
 
-        # Setup
-        expectings = list (irq_pairs)
+        # Setup: expected (irq, value) pairs are counted, so the same pair may be expected many times
+        expectings = dict ()
+        expected_count = 0
         problems = list()
         stop_on_first = False
         stop_when_all = False
 
-        if StopOnFirst in expectings:
-            expectings.remove (StopOnFirst)
-            stop_on_first = True
+        for pair in irq_pairs:
+            if pair == StopOnFirst:
+                stop_on_first = True
+            elif pair == StopWhenAll:
+                stop_when_all = True
+            else:
+                expectings [pair] = expectings.get (pair, 0) + 1
+                expected_count += 1
 
-        if StopWhenAll in expectings:
-            expectings.remove (StopWhenAll)
-            stop_when_all = True
+        avr = self.__avr
+        running = [True]
 
         def irq_handler (value, irq):
             if not (irq in self.__registered_irqs):
                 return
 
             if not (irq in self.__ignore_irqs):
-                pair = (irq, value)
-                self.__events.append ((self.__avr.cycle, pair))
+                self.__events.append ((avr.cycle, (irq, value)))
+
+                # Let the events be checked as soon as possible
+                if running [0]:
+                    avr.break_run ()
 
             if irq in self.__display_irqs:
-                self.__avr.info (str(irq) + " changed to " + str(value) + "\n")
+                avr.info (str(irq) + " changed to " + str(value) + "\n")
 
         self.__irq_handler = irq_handler
 
         # Run
-        end_cycle = self.__avr.cycle + cycles
+        end_cycle = avr.cycle + cycles
 
-        while self.__avr.cycle < end_cycle:
-            # Run
-            self.__avr.run_cycles ()
+        try:
+            while avr.cycle < end_cycle:
+                # Run until the next event or the end
+                reason = avr.run_cycles (end_cycle - avr.cycle)
 
-            # Handle events that occured during cycle
-            stop = False
-            for event in list(self.__events):
-                (cycle, pair) = event
+                # Handle events that occured
+                stop = False
+                while len (self.__events) > 0:
+                    (cycle, pair) = self.__events [0]
 
-                if cycle > end_cycle:
-                    break
-                self.__events.remove (event)
+                    if cycle > end_cycle:
+                        break
+                    self.__events.popleft ()
 
-                if pair in expectings:
-                    expectings.remove (pair)
+                    if expectings.get (pair, 0) > 0:
+                        expectings [pair] -= 1
+                        expected_count -= 1
 
-                    if stop_on_first:
-                        stop = True
+                        if stop_on_first:
+                            stop = True
 
-                    if stop_when_all and len(expectings) == 0:
-                        stop = True
-                else:
-                    (irq, value) = pair
-                    problems.append ("Unexpected " + str(irq) + " with value " + str(value))
+                        if stop_when_all and expected_count == 0:
+                            stop = True
+                    else:
+                        (irq, value) = pair
+                        problems.append ("Unexpected " + str(irq) + " with value " + str(value))
 
-            # Check current state
-            self.failIf (len (problems) > 0, problems)
+                # Check current state
+                self.failIf (len (problems) > 0, problems)
 
-            if stop:
-                return
+                if stop:
+                    return
+
+                # Nothing is going to happen anymore
+                if reason == stop_Done or reason == stop_Crashed:
+                    break
+        finally:
+            running [0] = False
 
         # Check if everything that we expected has occured
-        for (irq, value) in expectings:
-            problems.append ("Expected but not occured: " + str(irq) + " with value " + str(value))
+        for pair in irq_pairs:
+            if expectings.get (pair, 0) > 0:
+                expectings [pair] -= 1
+                (irq, value) = pair
+                problems.append ("Expected but not occured: " + str(irq) + " with value " + str(value))
 
         self.failIf (len (problems) > 0, problems)
 
@@ -608,3 +2562,290 @@ class AVRTestCase (unittest.TestCase):
         self.register_irq (irq, name, display, display_only)
         return irq
 
+
+
+# # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
+# Parallel testing
+
+# Tests of the current ParallelTestRunner.run, inherited by forked workers
+_parallel_tests = list ()
+
+class RemoteTestError (Exception):
+    """Failure or error of a test that was run by a worker process."""
+
+    def __init__ (self, text):
+        self.text = text
+
+    def __str__ (self):
+        return self.text
+
+
+class _RecordingTestResult (unittest.TestResult):
+    """Records outcomes of tests run by a worker as (test index, outcome, text), and
+       passes them to report once each test is done. Errors of class and module fixtures
+       are recorded with their description instead of index, and reported at once.
+       Every test started gets an outcome, an error if none was reported."""
+
+    def __init__ (self, indexes, report):
+        """Construct. Indexes maps id of the tests to their indexes."""
+
+        unittest.TestResult.__init__ (self)
+
+        self.__indexes = indexes
+        self.__report = report
+        self.__current = None
+        self.__reported = False
+        self.__outcomes = list ()
+
+    def __record (self, test, outcome, text = None):
+        key = self.__indexes.get (id (test))
+        if key == None:
+            key = str (test)
+
+        self.__outcomes.append ((key, outcome, text))
+        self.__reported = True
+
+        if self.__current == None:
+            self.__flush ()
+
+    def __flush (self):
+        self.__report (self.__outcomes)
+        self.__outcomes = list ()
+
+    def startTest (self, test):
+        unittest.TestResult.startTest (self, test)
+        self.__current = test
+        self.__reported = False
+
+    def stopTest (self, test):
+        if not self.__reported:
+            self.__record (test, "error", "No outcome was reported for " + str (test))
+
+        self.__current = None
+        self.__flush ()
+        unittest.TestResult.stopTest (self, test)
+
+    def addSubTest (self, test, subtest, err):
+        # Failed subtests are reported instead of the success of their test
+        if err != None:
+            outcome = "failure" if issubclass (err [0], test.failureException) else "error"
+            self.__record (test, outcome, str (subtest) + "\n" + self._exc_info_to_string (err, test))
+
+    def addSuccess (self, test):
+        self.__record (test, "success")
+
+    def addError (self, test, err):
+        self.__record (test, "error", self._exc_info_to_string (err, test))
+
+    def addFailure (self, test, err):
+        self.__record (test, "failure", self._exc_info_to_string (err, test))
+
+    def addSkip (self, test, reason):
+        self.__record (test, "skip", reason)
+
+    def addExpectedFailure (self, test, err):
+        self.__record (test, "expectedFailure", self._exc_info_to_string (err, test))
+
+    def addUnexpectedSuccess (self, test):
+        self.__record (test, "unexpectedSuccess")
+
+
+class _ParallelTextTestResult (unittest.TextTestResult):
+    """Text result that shows tracebacks of workers as they were formatted by the workers."""
+
+    def _exc_info_to_string (self, err, test):
+        if isinstance (err [1], RemoteTestError):
+            return err [1].text
+
+        return unittest.TextTestResult._exc_info_to_string (self, err, test)
+
+
+def _iterate_tests (test):
+    """Iterate over test cases of the given suite."""
+
+    if isinstance (test, unittest.TestSuite):
+        for subtest in test:
+            for case in _iterate_tests (subtest):
+                yield case
+    else:
+        yield test
+
+def _run_parallel_tests (indexes, connection):
+    """Worker process running the given tests. Sends the outcomes of each test to the
+       connection once it is done, then None once all of them are."""
+
+    tests = [_parallel_tests [index] for index in indexes]
+    result = _RecordingTestResult (dict ((id (test), index) for (test, index) in zip (tests, indexes)),
+                                   connection.send)
+
+    # The suite takes care of setUpClass/setUpModule
+    unittest.TestSuite (tests) (result)
+
+    connection.send (None)
+    connection.close ()
+
+
+class ParallelTestRunner (unittest.TextTestRunner):
+    """Test runner that distributes test classes (or test methods) across forked worker
+       processes, one per class (or method) and up to processes at a time. Each worker
+       builds its own AVRs, so the process-global state of this module is never shared.
+       Firmwares given to the constructor are parsed once before forking and shared by
+       the workers. When a worker dies (ie crashes in the simulator), the test it was
+       running is reported as an error and the tests it had left are given to another
+       worker.
+
+       Usage: unittest.main (testRunner = ParallelTestRunner (firmwares = ["fw.axf"]))"""
+
+    resultclass = _ParallelTextTestResult
+
+    def __init__ (self, processes = None, firmwares = (), split = "class", **kwargs):
+        """Construct. Processes defaults to the number of cpus, split is "class" or "method"."""
+
+        unittest.TextTestRunner.__init__ (self, **kwargs)
+
+        if not (split in ("class", "method")):
+            raise AVRException ("Unknown split: " + str(split))
+
+        self.processes = processes
+        self.firmwares = list (firmwares)
+        self.split = split
+
+    def run (self, test):
+        """Run the given test or suite. Returns the result."""
+
+        # Parsed firmwares stay in the cache, forked workers find them there
+        Firmware.cache_size = max (Firmware.cache_size, len (self.firmwares))
+        for filename in self.firmwares:
+            Firmware.load (filename, quiet = True)
+
+        return unittest.TextTestRunner.run (self, lambda result: self.__run_parallel (test, result))
+
+    def __groups (self, tests):
+        """Split tests in groups, each group is run by one worker."""
+
+        groups = collections.OrderedDict ()
+        for (index, test) in enumerate (tests):
+            if self.split == "class":
+                key = test.__class__
+            else:
+                key = index
+
+            groups.setdefault (key, list ()).append (index)
+
+        return list (groups.values ())
+
+    def __run_parallel (self, test, result):
+        """Run tests in workers and replay their outcomes into the result."""
+
+        global _parallel_tests
+        _parallel_tests = list (_iterate_tests (test))
+
+        # Workers must be forked to inherit the tests and the parsed firmwares
+        if hasattr (multiprocessing, "get_context"):
+            context = multiprocessing.get_context ("fork")
+        else:
+            context = multiprocessing
+
+        processes = self.processes or multiprocessing.cpu_count ()
+        waiting = collections.deque (self.__groups (_parallel_tests))
+        running = dict () # connection -> (indexes, process)
+        done = set ()
+
+        try:
+            while (waiting or running) and not result.shouldStop:
+                while waiting and len (running) < processes:
+                    indexes = waiting.popleft ()
+                    (connection, child) = context.Pipe (False)
+                    process = context.Process (target = _run_parallel_tests, args = (indexes, child))
+                    process.daemon = True
+                    process.start ()
+                    # The connection gets EOF once the worker is gone
+                    child.close ()
+                    running [connection] = (indexes, process)
+
+                for connection in select.select (list (running), [], []) [0]:
+                    (indexes, process) = running [connection]
+
+                    try:
+                        outcomes = connection.recv ()
+                    except EOFError:
+                        # Died: tests run in order, the first one left was running
+                        left = [index for index in indexes if not (index in done)]
+                        outcomes = None
+
+                        if left:
+                            process.join ()
+                            self.__lost (left [0], process.exitcode, result)
+                            done.add (left [0])
+
+                            if left [1:]:
+                                waiting.appendleft (left [1:])
+
+                    if outcomes == None:
+                        del running [connection]
+                        connection.close ()
+                        process.join ()
+                    else:
+                        self.__replay (outcomes, result)
+                        done.update (key for (key, outcome, text) in outcomes if isinstance (key, int))
+        finally:
+            for (connection, (indexes, process)) in running.items ():
+                process.terminate ()
+                process.join ()
+                connection.close ()
+            _parallel_tests = list ()
+
+    def __lost (self, index, exitcode, result):
+        """Report the test a worker was running when it died as an error."""
+
+        err = (RemoteTestError, RemoteTestError ("Worker process died (exit code %s) running the test" % exitcode), None)
+
+        test = _parallel_tests [index]
+        result.startTest (test)
+        result.addError (test, err)
+        result.stopTest (test)
+
+    def __replay (self, outcomes, result):
+        """Report outcomes recorded by a worker."""
+
+        current = None
+
+        for (key, outcome, text) in outcomes:
+            if isinstance (key, int):
+                test = _parallel_tests [key]
+
+                if not (test is current):
+                    if current != None:
+                        result.stopTest (current)
+
+                    result.startTest (test)
+                    current = test
+            else:
+                test = unittest.suite._ErrorHolder (key)
+
+            err = (RemoteTestError, RemoteTestError (text), None)
+
+            if outcome == "success":
+                result.addSuccess (test)
+            elif outcome == "error":
+                result.addError (test, err)
+            elif outcome == "failure":
+                result.addFailure (test, err)
+            elif outcome == "skip":
+                result.addSkip (test, text)
+            elif outcome == "expectedFailure":
+                result.addExpectedFailure (test, err)
+            elif outcome == "unexpectedSuccess":
+                result.addUnexpectedSuccess (test)
+
+        if current != None:
+            result.stopTest (current)
+
+# - - - - asyncio - - - - -
+
+if sys.version_info >= (3, 5):
+    import simavr_asyncio
+
+    AVR.run_async = simavr_asyncio.run_async
+    AVR.wait_irq = simavr_asyncio.wait_irq
+    AVR.sleep_sim_us = simavr_asyncio.sleep_sim_us
@@ -0,0 +1,90 @@
+# Akshaal (C) 2010, GNU GPL. http://akshaal.info
+
+"""asyncio support for AVR (Python 3.5+). Imported by simavr, that makes the
+   coroutines below available as AVR.run_async, AVR.wait_irq and AVR.sleep_sim_us."""
+
+import asyncio
+
+from csimavr import *
+
+async def run_async (self, quantum_cycles = 10000, cycles = None):
+    """Run the AVR quantum_cycles at a time, yielding to the event loop between slices,
+       until it stops (cpu_Done) or crashes (cpu_Crashed), or for the given cycles if any.
+       Returns the stop reason, like run_cycles. Realtime and scaled pacing are done by
+       sleeping in the event loop, the AVR itself runs at max speed."""
+
+    loop = asyncio.get_event_loop ()
+    pacing = self.get_pacing ()
+    end_cycle = None if cycles == None else self.cycle + cycles
+    start_cycle, start_time = self.cycle, loop.time ()
+
+    if pacing.mode != pacing_MaxSpeed:
+        self.set_pacing ("max_speed")
+
+    try:
+        while True:
+            slice_cycles = quantum_cycles
+            if end_cycle != None:
+                slice_cycles = min (slice_cycles, end_cycle - self.cycle)
+
+            reason = self.run_cycles (slice_cycles)
+
+            # A waiter was woken up, let it run before going on
+            if reason == stop_Break and self._async_wakeup:
+                reason = stop_Cycle
+            self._async_wakeup = False
+
+            if reason != stop_Cycle or (end_cycle != None and self.cycle >= end_cycle):
+                return reason
+
+            delay = 0
+            if pacing.mode != pacing_MaxSpeed:
+                simulated = self.cycles_to_usec (self.cycle - start_cycle) / 1e6 / pacing.scale
+                delay = max (0, start_time + simulated - loop.time ())
+
+            await asyncio.sleep (delay)
+    finally:
+        if pacing.mode != pacing_MaxSpeed:
+            self.set_pacing (pacing)
+
+def _wake (self, future, value):
+    """Resolve the future of a waiter, making the running slice return early."""
+
+    if not future.done ():
+        future.set_result (value)
+        self._async_wakeup = True
+        self.break_run ()
+
+async def wait_irq (self, irq, value = None, timeout_us = None):
+    """Wait until the IRQ is raised (with the given value, if not None) while the AVR
+       is run by run_async. Returns the value, or None if timeout_us simulated
+       microseconds passed first."""
+
+    future = asyncio.get_event_loop ().create_future ()
+    timer = None
+
+    def notify (irq_value, arg):
+        if value == None or irq_value == value:
+            _wake (self, future, irq_value)
+
+    irq.register_notify (notify)
+    try:
+        if timeout_us != None:
+            timer = self.add_timer_us (timeout_us, lambda arg: _wake (self, future, None))
+
+        return await future
+    finally:
+        irq.unregister_notify (notify)
+        if timer != None:
+            timer.cancel ()
+
+async def sleep_sim_us (self, us):
+    """Wait until the given simulated microseconds passed, while the AVR is run by run_async."""
+
+    future = asyncio.get_event_loop ().create_future ()
+    timer = self.add_timer_us (us, lambda arg: _wake (self, future, None))
+
+    try:
+        await future
+    finally:
+        timer.cancel ()
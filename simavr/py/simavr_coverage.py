@@ -0,0 +1,64 @@
+# Akshaal (C) 2010, GNU GPL. http://akshaal.info
+
+"""Merges and reports coverage files written by Coverage.save, ie by parallel test runs.
+
+   python -m simavr_coverage merge -o all.coverage run1.coverage run2.coverage ...
+   python -m simavr_coverage report [--lines] [--addr2line avr-addr2line] all.coverage"""
+
+from __future__ import print_function
+from simavr import *
+import argparse
+import sys
+
+def merge (filenames):
+    """Coverage of the union of the given files."""
+
+    result = Coverage.load (filenames [0])
+    for filename in filenames [1:]:
+        result.merge (Coverage.load (filename))
+
+    return result
+
+def report (coverage, lines = False, addr2line = "avr-addr2line"):
+    """Print the executed words per function, and the lines never executed if asked."""
+
+    print ("%s: %d words executed" % (coverage.filename, coverage.count ()))
+    for name, words in coverage.functions ():
+        print ("  %-40s %6d" % (name, words))
+
+    if lines:
+        executed = coverage.lines (addr2line)
+        missed = sorted (key for key, value in executed.items () if not value)
+
+        print ("%d of %d lines executed" % (len (executed) - len (missed), len (executed)))
+        for source, line in missed:
+            print ("  not executed: %s:%d" % (source, line))
+
+def main (argv = None):
+    parser = argparse.ArgumentParser (description = "simavr coverage files")
+    commands = parser.add_subparsers (dest = "command")
+
+    merge_parser = commands.add_parser ("merge", help = "merge coverage files")
+    merge_parser.add_argument ("-o", "--output", required = True, help = "merged coverage file")
+    merge_parser.add_argument ("files", nargs = "+")
+
+    report_parser = commands.add_parser ("report", help = "report executed functions and lines")
+    report_parser.add_argument ("--lines", action = "store_true", help = "list the lines never executed")
+    report_parser.add_argument ("--addr2line", default = "avr-addr2line", help = "addr2line tool of the toolchain")
+    report_parser.add_argument ("files", nargs = "+", help = "coverage files, merged first")
+
+    args = parser.parse_args (argv)
+
+    if args.command == "merge":
+        merge (args.files).save (args.output)
+        return 0
+
+    if args.command == "report":
+        report (merge (args.files), args.lines, args.addr2line)
+        return 0
+
+    parser.print_help ()
+    return 2
+
+if __name__ == "__main__":
+    sys.exit (main ())
@@ -219,10 +219,16 @@ static const char * irq_names[ACOMP_IRQ_COUNT] = {
 	[ACOMP_IRQ_OUT] = ">out"
 };
 
+static const avr_cycle_timer_t timers[] = {
+	avr_acomp_sync_state,
+	NULL,
+};
+
 static avr_io_t _io = {
 	.kind = "ac",
 	.reset = avr_acomp_reset,
 	.irq_names = irq_names,
+	.timers = timers,
 };
 
 void
@@ -330,10 +330,16 @@ static const char * irq_names[ADC_IRQ_COUNT] = {
 	[ADC_IRQ_OUT_TRIGGER] = ">trigger_out",
 };
 
+static const avr_cycle_timer_t timers[] = {
+	avr_adc_int_raise,
+	NULL,
+};
+
 static	avr_io_t	_io = {
 	.kind = "adc",
 	.reset = avr_adc_reset,
 	.irq_names = irq_names,
+	.timers = timers,
 };
 
 void avr_adc_init(avr_t * avr, avr_adc_t * p)
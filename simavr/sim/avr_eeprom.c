@@ -99,6 +99,7 @@ static int avr_eeprom_ioctl(struct avr_io_t * port, uint32_t ctl, void * io_para
 			memcpy(p->eeprom + desc->offset, desc->ee, desc->size);
 			AVR_LOG(port->avr, LOG_TRACE, "EEPROM: %s: AVR_IOCTL_EEPROM_SET Loaded %d at offset %d\n",
 					__FUNCTION__, desc->size, desc->offset);
+			res = 0;
 		}	break;
 		case AVR_IOCTL_EEPROM_GET: {
 			avr_eeprom_desc_t * desc = (avr_eeprom_desc_t*)io_param;
@@ -111,6 +112,7 @@ static int avr_eeprom_ioctl(struct avr_io_t * port, uint32_t ctl, void * io_para
 				memcpy(desc->ee, p->eeprom + desc->offset, desc->size);
 			else	// allow to get access to the read data, for gdb support
 				desc->ee = p->eeprom + desc->offset;
+			res = 0;
 		}	break;
 	}
 	
@@ -125,10 +127,17 @@ static void avr_eeprom_dealloc(struct avr_io_t * port)
 	p->eeprom = NULL;
 }
 
+static const avr_cycle_timer_t timers[] = {
+	avr_eempe_clear,
+	avr_eei_raise,
+	NULL,
+};
+
 static	avr_io_t	_io = {
 	.kind = "eeprom",
 	.ioctl = avr_eeprom_ioctl,
 	.dealloc = avr_eeprom_dealloc,
+	.timers = timers,
 };
 
 void avr_eeprom_init(avr_t * avr, avr_eeprom_t * p)
@@ -23,6 +23,7 @@
 #include <stdlib.h>
 #include <string.h>
 #include "avr_flash.h"
+#include "sim_core.h"
 
 static avr_cycle_count_t avr_progen_clear(struct avr_t * avr, avr_cycle_count_t when, void * param)
 {
@@ -75,6 +76,7 @@ static int avr_flash_ioctl(struct avr_io_t * port, uint32_t ctl, void * io_param
 			AVR_LOG(avr, LOG_TRACE, "FLASH: Erasing page %04x (%d)\n", (z / p->spm_pagesize), p->spm_pagesize);
 			for (int i = 0; i < p->spm_pagesize; i++)
 				avr->flash[z++] = 0xff;
+			avr_predecode_invalidate(avr, z - p->spm_pagesize, p->spm_pagesize);
 		} else if (avr_regbit_get(avr, p->pgwrt)) {
 			z &= ~(p->spm_pagesize - 1);
 			AVR_LOG(avr, LOG_TRACE, "FLASH: Writing page %04x (%d)\n", (z / p->spm_pagesize), p->spm_pagesize);
@@ -82,6 +84,7 @@ static int avr_flash_ioctl(struct avr_io_t * port, uint32_t ctl, void * io_param
 				avr->flash[z++] = p->tmppage[i];
 				avr->flash[z++] = p->tmppage[i] >> 8;
 			}
+			avr_predecode_invalidate(avr, z - p->spm_pagesize, p->spm_pagesize);
 			avr_flash_clear_temppage(p);
 		} else if (avr_regbit_get(avr, p->blbset)) {
 			AVR_LOG(avr, LOG_TRACE, "FLASH: Setting lock bits (ignored)\n");
@@ -120,11 +123,17 @@ avr_flash_dealloc(struct avr_io_t * port)
 		free(p->tmppage_used);
 }
 
+static const avr_cycle_timer_t timers[] = {
+	avr_progen_clear,
+	NULL,
+};
+
 static	avr_io_t	_io = {
 	.kind = "flash",
 	.ioctl = avr_flash_ioctl,
 	.reset = avr_flash_reset,
 	.dealloc = avr_flash_dealloc,
+	.timers = timers,
 };
 
 void avr_flash_init(avr_t * avr, avr_flash_t * p)
@@ -90,10 +90,16 @@ static const char * irq_names[SPI_IRQ_COUNT] = {
 	[SPI_IRQ_OUTPUT] = "8<out",
 };
 
+static const avr_cycle_timer_t timers[] = {
+	avr_spi_raise,
+	NULL,
+};
+
 static	avr_io_t	_io = {
 	.kind = "spi",
 	.reset = avr_spi_reset,
 	.irq_names = irq_names,
+	.timers = timers,
 };
 
 void avr_spi_init(avr_t * avr, avr_spi_t * p)
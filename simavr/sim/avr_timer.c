@@ -857,11 +857,20 @@ static const char * irq_names[TIMER_IRQ_COUNT] = {
 	[TIMER_IRQ_OUT_COMP + 2] = ">compc",
 };
 
+static const avr_cycle_timer_t timers[] = {
+	avr_timer_tov,
+	avr_timer_compa,
+	avr_timer_compb,
+	avr_timer_compc,
+	NULL,
+};
+
 static	avr_io_t	_io = {
 	.kind = "timer",
 	.irq_names = irq_names,
 	.reset = avr_timer_reset,
 	.ioctl = avr_timer_ioctl,
+	.timers = timers,
 };
 
 void
@@ -469,10 +469,16 @@ static const char * irq_names[TWI_IRQ_COUNT] = {
 	[TWI_IRQ_STATUS] = "8>status",
 };
 
+static const avr_cycle_timer_t timers[] = {
+	avr_twi_set_state_timer,
+	NULL,
+};
+
 static	avr_io_t	_io = {
 	.kind = "twi",
 	.reset = avr_twi_reset,
 	.irq_names = irq_names,
+	.timers = timers,
 };
 
 void avr_twi_init(avr_t * avr, avr_twi_t * p)
@@ -282,7 +282,7 @@ avr_uart_udr_write(
 	if (p->flags & AVR_UART_FLAG_STDIO) {
 		const int maxsize = 256;
 		if (!p->stdio_out)
-			p->stdio_out = malloc(maxsize);
+			p->stdio_out = malloc(maxsize + 1);
 		p->stdio_out[p->stdio_len++] = v < ' ' ? '.' : v;
 		p->stdio_out[p->stdio_len] = 0;
 		if (v == '\n' || p->stdio_len == maxsize) {
@@ -507,11 +507,18 @@ static const char * irq_names[UART_IRQ_COUNT] = {
 	[UART_IRQ_OUT_XOFF] = ">xoff",
 };
 
+static const avr_cycle_timer_t timers[] = {
+	avr_uart_txc_raise,
+	avr_uart_rxc_raise,
+	NULL,
+};
+
 static	avr_io_t	_io = {
 	.kind = "uart",
 	.reset = avr_uart_reset,
 	.ioctl = avr_uart_ioctl,
 	.irq_names = irq_names,
+	.timers = timers,
 };
 
 void
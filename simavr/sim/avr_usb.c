@@ -726,12 +726,18 @@ avr_usb_dealloc(
 	free(p->state);
 }
 
+static const avr_cycle_timer_t timers[] = {
+	sof_generator,
+	NULL,
+};
+
 static	avr_io_t	_io = {
 	.kind = "usb",
 	.reset = avr_usb_reset,
 	.irq_names = irq_names,
 	.ioctl = avr_usb_ioctl,
 	.dealloc = avr_usb_dealloc,
+	.timers = timers,
 };
 
 static void
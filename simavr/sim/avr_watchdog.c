@@ -211,10 +211,17 @@ static void avr_watchdog_reset(avr_io_t * port)
 	avr_irq_register_notify(p->watchdog.irq, avr_watchdog_irq_notify, p);
 }
 
+static const avr_cycle_timer_t timers[] = {
+	avr_watchdog_timer,
+	avr_wdce_clear,
+	NULL,
+};
+
 static	avr_io_t	_io = {
 	.kind = "watchdog",
 	.reset = avr_watchdog_reset,
 	.ioctl = avr_watchdog_ioctl,
+	.timers = timers,
 };
 
 void avr_watchdog_init(avr_t * avr, avr_watchdog_t * p)
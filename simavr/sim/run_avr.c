@@ -44,6 +44,7 @@ display_usage(
 			"       [--help|-h]         Display this usage message and exit\n"
 			"       [--trace, -t]       Run full scale decoder trace\n"
 			"       [-ti <vector>]      Add traces for IRQ vector <vector>\n"
+			"       [--predecode]       Decode each instruction only once\n"
 			"       [--gdb|-g [<port>]] Listen for gdb connection on <port> (default 1234)\n"
 			"       [-ff <.hex file>]   Load next .hex file as flash\n"
 			"       [-ee <.hex file>]   Load next .hex file as eeprom\n"
@@ -88,6 +89,7 @@ main(
 	elf_firmware_t f = {{0}};
 	uint32_t f_cpu = 0;
 	int trace = 0;
+	int predecode = 0;
 	int gdb = 0;
 	int log = 1;
 	int port = 1234;
@@ -192,6 +194,8 @@ main(
 				exit(1);
 			}
 			snprintf(f.tracename, sizeof(f.tracename), "%s", argv[++pi]);
+		} else if (!strcmp(argv[pi], "--predecode")) {
+			predecode++;
 		} else if (!strcmp(argv[pi], "-ti")) {
 			if (pi < argc-1)
 				trace_vectors[trace_vectors_count++] = atoi(argv[++pi]);
@@ -258,6 +262,8 @@ main(
 	avr_init(avr);
 	avr->log = (log > LOG_TRACE ? LOG_TRACE : log);
 	avr->trace = trace;
+	if (predecode && avr_predecode_enable(avr, 1))
+		fprintf(stderr, "%s: Warning: predecoding is not supported\n", argv[0]);
 	avr_load_firmware(avr, &f);
 	if (f.flashbase) {
 		printf("Attempted to load a bootloader at %04x\n", f.flashbase);
@@ -0,0 +1,325 @@
+/*
+	sim_adc_waveform.c
+
+	Plays sampled waveforms into an ADC channel, without a callback per
+	sample.
+
+ 	This file is part of simavr.
+
+	simavr is free software: you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation, either version 3 of the License, or
+	(at your option) any later version.
+
+	simavr is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+
+	You should have received a copy of the GNU General Public License
+	along with simavr.  If not, see <http://www.gnu.org/licenses/>.
+ */
+
+#include <stdio.h>
+#include <string.h>
+#include <stdlib.h>
+#include "sim_adc_waveform.h"
+#include "sim_avr.h"
+#include "sim_io.h"
+#include "sim_cycle_timers.h"
+#include "avr_adc.h"
+
+static inline avr_cycle_count_t
+_avr_adc_waveform_stamp(
+		avr_adc_waveform_t * w,
+		avr_adc_waveform_buffer_t * b,
+		uint32_t i )
+{
+	return b->stamps ? b->stamps[i] :
+			(avr_cycle_count_t)(i * w->cycles_per_sample);
+}
+
+static void
+_avr_adc_waveform_free(
+		avr_adc_waveform_buffer_t * b )
+{
+	free(b->samples);
+	free(b->stamps);
+	memset(b, 0, sizeof(*b));
+}
+
+/*
+ * Moves to the buffer and sample playing at cycle 'now'
+ */
+static void
+_avr_adc_waveform_advance(
+		avr_adc_waveform_t * w,
+		avr_cycle_count_t now )
+{
+	while (w->playing && now - w->start >= w->slot[0].span) {
+		w->start += w->slot[0].span;
+		w->index = 0;
+		w->buffers++;
+		if (w->queued > 1) {
+			_avr_adc_waveform_free(&w->slot[0]);
+			memmove(&w->slot[0], &w->slot[1],
+					(ADC_WAVEFORM_SLOTS - 1) * sizeof(w->slot[0]));
+			memset(&w->slot[ADC_WAVEFORM_SLOTS - 1], 0, sizeof(w->slot[0]));
+			w->queued--;
+		} else if (w->flags & ADC_WAVEFORM_LOOP) {
+			continue;
+		} else {
+			// hold the last sample until something is queued
+			w->playing = 0;
+			w->queued = 0;
+			w->index = w->slot[0].count - 1;
+			w->underruns++;
+		}
+		avr_raise_irq(w->irq + ADC_WAVEFORM_IRQ_REFILL,
+				ADC_WAVEFORM_SLOTS - w->queued);
+	}
+	if (!w->playing)
+		return;
+
+	avr_adc_waveform_buffer_t * b = &w->slot[0];
+	avr_cycle_count_t rel = now - w->start;
+	if (b->stamps) {
+		// time only goes forward, the index is a cursor
+		if (rel < b->stamps[w->index])
+			w->index = 0;
+		while (w->index + 1 < b->count && b->stamps[w->index + 1] <= rel)
+			w->index++;
+	} else {
+		uint64_t i = rel / w->cycles_per_sample;
+		w->index = i < b->count ? i : b->count - 1;
+	}
+}
+
+static uint16_t
+_avr_adc_waveform_value(
+		avr_adc_waveform_t * w,
+		avr_cycle_count_t now )
+{
+	avr_adc_waveform_buffer_t * b = &w->slot[0];
+
+	if (!b->count)
+		return w->value;
+
+	uint32_t i = w->index;
+	uint16_t v0 = b->samples[i];
+	if (!w->playing || !(w->flags & ADC_WAVEFORM_INTERPOLATE))
+		return v0;
+
+	avr_cycle_count_t rel = now - w->start;
+	avr_cycle_count_t t0 = _avr_adc_waveform_stamp(w, b, i);
+	avr_cycle_count_t t1;
+	uint16_t v1;
+	if (i + 1 < b->count) {
+		t1 = _avr_adc_waveform_stamp(w, b, i + 1);
+		v1 = b->samples[i + 1];
+	} else {
+		// towards the first sample of what is played next
+		t1 = b->span;
+		v1 = w->queued > 1 ? w->slot[1].samples[0] :
+				w->flags & ADC_WAVEFORM_LOOP ? b->samples[0] : v0;
+	}
+	if (rel <= t0 || t1 <= t0)
+		return v0;
+	return v0 + (int32_t)((v1 - v0) * (double)(rel - t0) / (t1 - t0));
+}
+
+static void
+_avr_adc_waveform_update(
+		avr_adc_waveform_t * w,
+		avr_cycle_count_t now )
+{
+	_avr_adc_waveform_advance(w, now);
+	w->value = _avr_adc_waveform_value(w, now);
+	avr_raise_irq(w->irq + ADC_WAVEFORM_IRQ_VALUE, w->value);
+}
+
+static avr_cycle_count_t
+_avr_adc_waveform_tick(
+		struct avr_t * avr,
+		avr_cycle_count_t when,
+		void * param)
+{
+	avr_adc_waveform_t * w = (avr_adc_waveform_t *)param;
+	// the timer may fire after 'when', and a buffer queued by a REFILL hook
+	// starts at the current cycle: both have to be played at the same time
+	avr_cycle_count_t now = avr->cycle;
+
+	// a buffer queued by a REFILL hook is picked up below
+	w->ticking = 1;
+	_avr_adc_waveform_update(w, now);
+	w->ticking = 0;
+	if (!w->playing)
+		return 0;
+
+	// next sample, or end of the buffer
+	avr_adc_waveform_buffer_t * b = &w->slot[0];
+	avr_cycle_count_t next = w->start + (w->index + 1 < b->count ?
+			_avr_adc_waveform_stamp(w, b, w->index + 1) : b->span);
+	return next > now ? next : now + 1;
+}
+
+static void
+_avr_adc_waveform_trigger_hook(
+		struct avr_irq_t * irq,
+		uint32_t value,
+		void * param)
+{
+	avr_adc_waveform_t * w = (avr_adc_waveform_t *)param;
+
+	_avr_adc_waveform_update(w, w->avr->cycle);
+}
+
+static const char * irq_names[ADC_WAVEFORM_IRQ_COUNT] = {
+	[ADC_WAVEFORM_IRQ_TRIGGER] = "<waveform.trigger",
+	[ADC_WAVEFORM_IRQ_VALUE] = "16>waveform.value",
+	[ADC_WAVEFORM_IRQ_REFILL] = "8>waveform.refill",
+};
+
+int
+avr_adc_waveform_init(
+		struct avr_t * avr,
+		avr_adc_waveform_t * waveform,
+		int channel,
+		uint32_t rate,
+		uint32_t flags )
+{
+	memset(waveform, 0, sizeof(avr_adc_waveform_t));
+	waveform->avr = avr;
+	waveform->channel = channel;
+	waveform->flags = flags;
+	if (rate)
+		waveform->cycles_per_sample = (double)avr->frequency / rate;
+
+	if (channel < ADC_IRQ_ADC0 || channel > ADC_IRQ_TEMP) {
+		AVR_LOG(avr, LOG_ERROR, "%s: invalid ADC channel %d\n",
+				__FUNCTION__, channel);
+		return -1;
+	}
+	waveform->adc = avr_io_getirq(avr, AVR_IOCTL_ADC_GETIRQ, 0);
+	if (!waveform->adc) {
+		AVR_LOG(avr, LOG_ERROR, "%s: no ADC\n", __FUNCTION__);
+		return -1;
+	}
+	avr_init_irq(&avr->irq_pool, waveform->irq, 0, ADC_WAVEFORM_IRQ_COUNT, irq_names);
+	avr_irq_register_notify(waveform->irq + ADC_WAVEFORM_IRQ_TRIGGER,
+			_avr_adc_waveform_trigger_hook, waveform);
+	avr_connect_irq(waveform->adc + ADC_IRQ_OUT_TRIGGER,
+			waveform->irq + ADC_WAVEFORM_IRQ_TRIGGER);
+	avr_connect_irq(waveform->irq + ADC_WAVEFORM_IRQ_VALUE,
+			waveform->adc + channel);
+	return 0;
+}
+
+void
+avr_adc_waveform_close(
+		avr_adc_waveform_t * waveform )
+{
+	if (!waveform->adc)
+		return;
+	avr_adc_waveform_clear(waveform);
+
+	/* dispose of any link and hooks */
+	avr_unconnect_irq(waveform->adc + ADC_IRQ_OUT_TRIGGER,
+			waveform->irq + ADC_WAVEFORM_IRQ_TRIGGER);
+	avr_unconnect_irq(waveform->irq + ADC_WAVEFORM_IRQ_VALUE,
+			waveform->adc + waveform->channel);
+	avr_free_irq(waveform->irq, ADC_WAVEFORM_IRQ_COUNT);
+	waveform->adc = NULL;
+}
+
+int
+avr_adc_waveform_queue(
+		avr_adc_waveform_t * waveform,
+		const void * samples,
+		int is_signed,
+		const avr_cycle_count_t * stamps,
+		uint32_t count,
+		avr_cycle_count_t span )
+{
+	avr_t * avr = waveform->avr;
+
+	if (!waveform->adc || !count)
+		return -1;
+	if (!stamps && !waveform->cycles_per_sample) {
+		AVR_LOG(avr, LOG_ERROR, "%s: no sample rate nor stamps\n", __FUNCTION__);
+		return -1;
+	}
+	// catch up, the buffer playing might be over already
+	_avr_adc_waveform_advance(waveform, avr->cycle);
+	if (waveform->queued == ADC_WAVEFORM_SLOTS)
+		return -1;
+
+	avr_adc_waveform_buffer_t b = { .count = count, .span = span };
+	b.samples = malloc(count * sizeof(uint16_t));
+	if (stamps)
+		b.stamps = malloc(count * sizeof(avr_cycle_count_t));
+	if (!b.samples || (stamps && !b.stamps)) {
+		AVR_LOG(avr, LOG_ERROR, "%s: unable to allocate %u samples\n",
+				__FUNCTION__, count);
+		_avr_adc_waveform_free(&b);
+		return -1;
+	}
+	if (is_signed) {
+		const int16_t * s = samples;
+		for (uint32_t i = 0; i < count; i++)
+			b.samples[i] = s[i] < 0 ? 0 : s[i];
+	} else
+		memcpy(b.samples, samples, count * sizeof(uint16_t));
+	if (stamps)
+		memcpy(b.stamps, stamps, count * sizeof(avr_cycle_count_t));
+	if (!b.span) {
+		if (stamps)
+			b.span = stamps[count - 1] + 1;
+		else
+			b.span = count * waveform->cycles_per_sample + 0.999999;
+	}
+	if (!b.span)
+		b.span = 1;
+
+	if (waveform->queued) {
+		waveform->slot[waveform->queued++] = b;
+		return ADC_WAVEFORM_SLOTS - waveform->queued;
+	}
+	// nothing playing, start now
+	_avr_adc_waveform_free(&waveform->slot[0]);
+	waveform->slot[0] = b;
+	waveform->queued = 1;
+	waveform->playing = 1;
+	waveform->start = avr->cycle;
+	waveform->index = 0;
+	_avr_adc_waveform_update(waveform, avr->cycle);
+	if ((waveform->flags & ADC_WAVEFORM_TIMED) && !waveform->ticking) {
+		avr_adc_waveform_buffer_t * p = &waveform->slot[0];
+		avr_cycle_count_t next = p->count > 1 ?
+				_avr_adc_waveform_stamp(waveform, p, 1) : p->span;
+		avr_cycle_timer_register(avr, next ? next : 1,
+				_avr_adc_waveform_tick, waveform);
+	}
+	return ADC_WAVEFORM_SLOTS - waveform->queued;
+}
+
+void
+avr_adc_waveform_clear(
+		avr_adc_waveform_t * waveform )
+{
+	if (waveform->adc)
+		avr_cycle_timer_cancel(waveform->avr, _avr_adc_waveform_tick, waveform);
+	for (int i = 0; i < ADC_WAVEFORM_SLOTS; i++)
+		_avr_adc_waveform_free(&waveform->slot[i]);
+	waveform->queued = 0;
+	waveform->playing = 0;
+	waveform->index = 0;
+}
+
+uint16_t
+avr_adc_waveform_get_value(
+		avr_adc_waveform_t * waveform )
+{
+	_avr_adc_waveform_advance(waveform, waveform->avr->cycle);
+	return _avr_adc_waveform_value(waveform, waveform->avr->cycle);
+}
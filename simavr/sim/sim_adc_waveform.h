@@ -0,0 +1,132 @@
+/*
+	sim_adc_waveform.h
+
+	Plays sampled waveforms into an ADC channel, without a callback per
+	sample.
+
+ 	This file is part of simavr.
+
+	simavr is free software: you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation, either version 3 of the License, or
+	(at your option) any later version.
+
+	simavr is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+
+	You should have received a copy of the GNU General Public License
+	along with simavr.  If not, see <http://www.gnu.org/licenses/>.
+ */
+
+#ifndef __SIM_ADC_WAVEFORM_H__
+#define __SIM_ADC_WAVEFORM_H__
+
+#include "sim_irq.h"
+#include "sim_avr_types.h"
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+/*
+ * A waveform is a queue of buffers of millivolt samples, played one after
+ * the other. Samples are either evenly spaced (at 'rate' Hz) or each have
+ * a cycle stamp, relative to the start of their buffer.
+ *
+ * The value of the channel is updated when the ADC starts a conversion
+ * (see ADC_IRQ_OUT_TRIGGER), so even high rates cost nothing until the
+ * firmware samples them. With ADC_WAVEFORM_TIMED, it is also updated at
+ * each sample, for the other users of the ADC IRQs.
+ *
+ * Two buffers can be queued: when the first one is done, the second one
+ * starts and ADC_WAVEFORM_IRQ_REFILL is raised, so the next one can be
+ * queued. Without a next buffer, the last one is played again if
+ * ADC_WAVEFORM_LOOP is set, or its last sample is held.
+ */
+enum {
+	ADC_WAVEFORM_IRQ_TRIGGER = 0,	// conversion started by the ADC
+	ADC_WAVEFORM_IRQ_VALUE,			// millivolts sent to the channel
+	ADC_WAVEFORM_IRQ_REFILL,		// a buffer is done, value is the free slots
+	ADC_WAVEFORM_IRQ_COUNT
+};
+
+enum {
+	ADC_WAVEFORM_INTERPOLATE	= (1 << 0),	// linear, otherwise the last sample is held
+	ADC_WAVEFORM_TIMED			= (1 << 1),	// update the channel at each sample
+	ADC_WAVEFORM_LOOP			= (1 << 2),	// play the last buffer again
+};
+
+#define ADC_WAVEFORM_SLOTS	2
+
+typedef struct avr_adc_waveform_buffer_t {
+	uint16_t *				samples;	// millivolts
+	avr_cycle_count_t *		stamps;		// optional, from the start of the buffer
+	uint32_t				count;
+	avr_cycle_count_t		span;		// cycles the buffer lasts
+} avr_adc_waveform_buffer_t;
+
+typedef struct avr_adc_waveform_t {
+	struct avr_t *	avr;
+	avr_irq_t		irq[ADC_WAVEFORM_IRQ_COUNT];
+	avr_irq_t *		adc;		// IRQs of the ADC we are connected to
+	int				channel;
+	uint32_t		flags;
+	double			cycles_per_sample;	// for buffers without stamps
+
+	avr_adc_waveform_buffer_t	slot[ADC_WAVEFORM_SLOTS];
+	uint32_t		queued;		// buffers in 'slot', the first one is playing
+	int				playing;	// otherwise the last sample is held
+	avr_cycle_count_t	start;	// cycle the playing buffer started at
+	uint32_t		index;		// sample played last
+	uint16_t		value;		// value sent to the channel last
+	int				ticking;	// in the ADC_WAVEFORM_TIMED timer
+
+	uint64_t		buffers;	// buffers played so far
+	uint64_t		underruns;	// times the queue ran dry
+} avr_adc_waveform_t;
+
+// connects a waveform to the ADC channel (ADC_IRQ_ADC0...). Samples of
+// buffers without stamps are 'rate' Hz apart. Returns 0 or -1
+int
+avr_adc_waveform_init(
+		struct avr_t * avr,
+		avr_adc_waveform_t * waveform,
+		int channel,
+		uint32_t rate,
+		uint32_t flags );
+// disconnects the waveform and frees its buffers
+void
+avr_adc_waveform_close(
+		avr_adc_waveform_t * waveform );
+
+/*
+ * Queues a copy of 'count' samples, with 'stamps' cycles (or NULL). If
+ * 'is_signed', the samples are int16_t, negative ones are clipped to 0.
+ * 'span' is the number of cycles the buffer lasts, 0 to make it end
+ * one sample period (or cycle, with stamps) after the last sample.
+ * Returns the number of free slots left, or -1 if there were none.
+ */
+int
+avr_adc_waveform_queue(
+		avr_adc_waveform_t * waveform,
+		const void * samples,
+		int is_signed,
+		const avr_cycle_count_t * stamps,
+		uint32_t count,
+		avr_cycle_count_t span );
+// drops the queued buffers, the channel keeps its current value
+void
+avr_adc_waveform_clear(
+		avr_adc_waveform_t * waveform );
+// millivolts of the waveform at the current cycle
+uint16_t
+avr_adc_waveform_get_value(
+		avr_adc_waveform_t * waveform );
+
+#ifdef __cplusplus
+};
+#endif
+
+#endif /* __SIM_ADC_WAVEFORM_H__ */
@@ -32,6 +32,10 @@
 #include "sim_gdb.h"
 #include "avr_uart.h"
 #include "sim_vcd_file.h"
+#include "sim_profile.h"
+#include "sim_coverage.h"
+#include "sim_stats.h"
+#include "sim_trace_file.h"
 #include "avr/avr_mcu_section.h"
 
 #define AVR_KIND_DECL
@@ -121,6 +125,8 @@ avr_init(
 	// set default (non gdb) fast callbacks
 	avr->run = avr_callback_run_raw;
 	avr->sleep = avr_callback_sleep_raw;
+	avr->pacing.mode = pacing_Realtime;
+	avr->pacing.scale = 1.0;
 	// number of address bytes to push/pull on/off the stack
 	avr->address_size = avr->eind ? 3 : 2;
 	avr->log = 1;
@@ -144,7 +150,34 @@ avr_terminate(
 		avr->vcd = NULL;
 	}
 	avr_deallocate_ios(avr);
+	for (int i = 0; i < avr->interrupts.vector_count; i++)
+		avr_free_irq(avr->interrupts.vector[i]->irq, AVR_INT_IRQ_COUNT);
+	avr_free_irq(avr->interrupts.irq, AVR_INT_IRQ_COUNT);
+	avr->interrupts.vector_count = 0;
+
+	// IRQs still alive (ie owned by the caller) are detached from the pool,
+	// so avr_free_irq() doesn't look for them in it once the avr is freed
+	for (int i = 0; i < avr->irq_pool.count; i++)
+		if (avr->irq_pool.irq[i])
+			avr->irq_pool.irq[i]->pool = NULL;
+	if (avr->irq_pool.irq) free(avr->irq_pool.irq);
+	avr->irq_pool.irq = NULL;
+	avr->irq_pool.count = 0;
+	avr_cycle_timer_dealloc(avr);
+#ifdef CONFIG_SIMAVR_TRACE
+	if (avr->trace_data) {
+		if (avr->trace_data->codeline) free(avr->trace_data->codeline);
+		free(avr->trace_data);
+		avr->trace_data = NULL;
+	}
+#endif
 
+	if (avr->decode) free(avr->decode);
+	avr->decode = NULL;
+	avr_profile_disable(avr);
+	avr_coverage_disable(avr);
+	avr_stats_disable(avr);
+	avr_trace_file_stop(avr);
 	if (avr->flash) free(avr->flash);
 	if (avr->data) free(avr->data);
 	if (avr->io_console_buffer.buf) {
@@ -171,6 +204,7 @@ avr_reset(
 		avr->sreg[i] = 0;
 	avr_interrupt_reset(avr);
 	avr_cycle_timer_reset(avr);
+	avr_profile_reset(avr);
 	if (avr->reset)
 		avr->reset(avr);
 	avr_io_t * port = avr->io_port;
@@ -251,6 +285,7 @@ avr_loadcode(
 		abort();
 	}
 	memcpy(avr->flash + address, code, size);
+	avr_predecode_invalidate(avr, address, size);
 }
 
 /**
@@ -278,6 +313,8 @@ avr_callback_sleep_gdb(
 		avr_cycle_count_t howLong)
 {
 	uint32_t usec = avr_pending_sleep_usec(avr, howLong);
+	if (avr->pacing.mode == pacing_MaxSpeed)
+		usec = 0;
 	while (avr_gdb_processor(avr, usec))
 		;
 }
@@ -345,16 +382,45 @@ avr_callback_sleep_raw(
 		avr_t *avr,
 		avr_cycle_count_t how_long)
 {
+	if (avr->pacing.mode == pacing_MaxSpeed)
+		return;
 	/* figure out how long we should wait to match the sleep deadline */
-	uint64_t deadline_ns = avr_cycles_to_nsec(avr, avr->cycle + how_long);
+	uint64_t deadline_ns = avr_cycles_to_nsec(avr,
+			avr->cycle + how_long - avr->pacing.cycle_base);
+	if (avr->pacing.mode == pacing_Scaled)
+		deadline_ns /= avr->pacing.scale;
 	uint64_t runtime_ns = avr_get_time_stamp(avr);
 	if (runtime_ns >= deadline_ns)
 		return;
 	uint64_t sleep_us = (deadline_ns - runtime_ns) / 1000;
 	usleep(sleep_us);
+	avr->pacing.sleep_ns += sleep_us * 1000;
+	avr->pacing.sleep_count++;
 	return;
 }
 
+int
+avr_set_pacing(
+		avr_t * avr,
+		int mode,
+		double scale)
+{
+	if (mode != pacing_Scaled)
+		scale = 1.0;
+	if ((mode != pacing_Realtime && mode != pacing_Scaled && mode != pacing_MaxSpeed) ||
+			!(scale > 0)) {
+		AVR_LOG(avr, LOG_ERROR, "CORE: %s: invalid pacing %d (scale %g)\n",
+				__func__, mode, scale);
+		return -1;
+	}
+	avr->pacing.mode = mode;
+	avr->pacing.scale = scale;
+	// restart the wall clock synchronisation from here
+	avr->pacing.cycle_base = avr->cycle;
+	avr->time_base = 0;
+	return 0;
+}
+
 void
 avr_callback_run_raw(
 		avr_t * avr)
@@ -413,6 +479,7 @@ avr_core_allocate(
 {
 	uint8_t * b = malloc(coreLen);
 	memcpy(b, core, coreLen);
+	((avr_t *)b)->core_size = coreLen;
 	return (avr_t *)b;
 }
 
@@ -112,6 +112,16 @@ enum {
 	cpu_Crashed,    // avr software crashed (watchdog fired)
 };
 
+/*
+ * Pacing modes, ie how avr_callback_sleep_raw() keeps the simulated time
+ * in step with the wall clock when the core sleeps.
+ */
+enum {
+	pacing_Realtime = 0,	// sleep until the wall clock catches up (default)
+	pacing_Scaled,			// same, with simulated time running 'scale' times faster
+	pacing_MaxSpeed,		// never sleep, jump straight to the next cycle timer
+};
+
 // this is only ever used if CONFIG_SIMAVR_TRACE is defined
 struct avr_trace_data_t {
 	struct avr_symbol_t ** codeline;
@@ -180,6 +190,10 @@ typedef struct avr_t {
 	// filled by the ELF data, this allow tracking of invalid jumps
 	uint32_t			codeend;
 
+	// size of the block allocated by avr_core_allocate(): this avr_t
+	// followed by the IO modules of the core
+	uint32_t			core_size;
+
 	int					state;		// stopped, running, sleeping
 	uint32_t			frequency;	// frequency we are running at
 	// mostly used by the ADC for now
@@ -203,6 +217,14 @@ typedef struct avr_t {
 	uint32_t 			sleep_usec;
 	uint64_t			time_base;	// for avr_get_time_stamp()
 
+	struct {
+		int					mode;		// pacing_Realtime etc
+		double				scale;		// for pacing_Scaled, 2.0 runs twice as fast
+		avr_cycle_count_t	cycle_base;	// cycle at which the pacing was set
+		uint64_t			sleep_ns;	// total time slept on the host
+		uint32_t			sleep_count;
+	} pacing;
+
 	// called at init time
 	void (*init)(struct avr_t * avr);
 	// called at reset time
@@ -305,6 +327,22 @@ typedef struct avr_t {
 
 	// flash memory (initialized to 0xff, and code loaded into it)
 	uint8_t *		flash;
+	// predecoded instructions, one entry per flash word, see avr_predecode_enable()
+	void **			decode;
+	// cycles and executions per flash word, see avr_profile_enable()
+	struct {
+		uint64_t *		cycles;
+		uint64_t *		count;
+		uint32_t		period;		// 0 for exact, else sampling period in cycles
+	} profile;
+	// one bit per flash word, set when an instruction starts there, see avr_coverage_enable()
+	uint8_t *		coverage;
+	// data space watchpoints checked on each access, see avr_watchpoints_init()
+	struct avr_watchpoints_t * watchpoints;
+	// counters of the IO accesses and cycle timers, see avr_stats_enable()
+	struct avr_stats_t * stats;
+	// binary trace of the executed instructions, see avr_trace_file_start()
+	struct avr_trace_file_t * trace_file;
 	// this is the general purpose registers, IO registers, and SRAM
 	uint8_t *		data;
 
@@ -466,6 +504,18 @@ void avr_callback_run_gdb(avr_t * avr);
 void avr_callback_sleep_raw(avr_t * avr, avr_cycle_count_t howLong);
 void avr_callback_run_raw(avr_t * avr);
 
+/*
+ * Selects how sleeping cores are paced against the wall clock, one of
+ * pacing_Realtime, pacing_Scaled (with 'scale' > 0) or pacing_MaxSpeed.
+ * Wall clock synchronisation restarts from the current cycle.
+ * Returns 0, or -1 if the mode or scale is invalid.
+ */
+int
+avr_set_pacing(
+		avr_t * avr,
+		int mode,
+		double scale);
+
 /**
  * Accumulates sleep requests (and returns a sleep time of 0) until
  * a minimum count of requested sleep microseconds are reached
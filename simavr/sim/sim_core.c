@@ -28,6 +28,9 @@
 #include "sim_gdb.h"
 #include "avr_flash.h"
 #include "avr_watchdog.h"
+#include "sim_watchpoints.h"
+#include "sim_stats.h"
+#include "sim_trace_file.h"
 
 // SREG bit names
 const char * _sreg_bit_name = "cznvshti";
@@ -192,6 +195,8 @@ static inline void _avr_set_r(avr_t * avr, uint16_t r, uint8_t v)
 	}
 	if (r > 31) {
 		avr_io_addr_t io = AVR_DATA_TO_IO(r);
+		if (unlikely(avr->stats))
+			avr->stats->io_write[io]++;
 		if (avr->io[io].w.c)
 			avr->io[io].w.c(avr, r, v, avr->io[io].w.param);
 		else
@@ -247,6 +252,8 @@ static inline void _avr_set_ram(avr_t * avr, uint16_t addr, uint8_t v)
 		_avr_set_r(avr, addr, v);
 	else
 		avr_core_watch_write(avr, addr, v);
+	if (unlikely(avr->watchpoints))
+		avr_watchpoints_access(avr->watchpoints, addr, v, AVR_WATCH_WRITE);
 }
 
 /*
@@ -264,6 +271,8 @@ static inline uint8_t _avr_get_ram(avr_t * avr, uint16_t addr)
 	} else if (addr > 31 && addr < 31 + MAX_IOs) {
 		avr_io_addr_t io = AVR_DATA_TO_IO(addr);
 
+		if (unlikely(avr->stats))
+			avr->stats->io_read[io]++;
 		if (avr->io[io].r.c)
 			avr->data[addr] = avr->io[io].r.c(avr, addr, avr->io[io].r.param);
 
@@ -274,7 +283,10 @@ static inline uint8_t _avr_get_ram(avr_t * avr, uint16_t addr)
 				avr_raise_irq(avr->io[io].irq + i, (v >> i) & 1);
 		}
 	}
-	return avr_core_watch_read(avr, addr);
+	uint8_t v = avr_core_watch_read(avr, addr);
+	if (unlikely(avr->watchpoints))
+		avr_watchpoints_access(avr->watchpoints, addr, v, AVR_WATCH_READ);
+	return v;
 }
 
 /*
@@ -599,6 +611,59 @@ static inline int _avr_is_instruction_32_bits(avr_t * avr, avr_flashaddr_t pc)
 			o == 0x940f; // CALL Long Call to sub
 }
 
+/*
+ * Predecoded instructions use the "labels as values" extension of GCC and clang.
+ * Each leaf of the decoder starts with DECODED(), that remembers the leaf as the
+ * entry point of the flash word being executed. avr_run_one() then jumps to it
+ * directly, without going through the switches again.
+ * The first leaf reached is the entry point, as RETI falls through RET.
+ */
+#ifdef __GNUC__
+#define AVR_PREDECODE 1
+#define _DECODED_LABEL(_line) _avr_decoded_##_line
+#define _DECODED(_line) \
+	if (avr->decode && !avr->decode[avr->pc >> 1]) \
+		avr->decode[avr->pc >> 1] = &&_DECODED_LABEL(_line); \
+	_DECODED_LABEL(_line):
+#define DECODED() _DECODED(__LINE__)
+#else
+#define AVR_PREDECODE 0
+#define DECODED()
+#endif
+
+int
+avr_predecode_enable(
+		avr_t * avr,
+		int enable)
+{
+	if (!AVR_PREDECODE)
+		return -1;
+	if (!enable) {
+		if (avr->decode)
+			free(avr->decode);
+		avr->decode = NULL;
+	} else if (!avr->decode) {
+		avr->decode = calloc((avr->flashend + 2) / 2, sizeof(void *));
+		if (!avr->decode)
+			return -1;
+	}
+	return 0;
+}
+
+void
+avr_predecode_invalidate(
+		avr_t * avr,
+		avr_flashaddr_t addr,
+		uint32_t size)
+{
+	if (!avr->decode || !size || addr > avr->flashend)
+		return;
+	if (addr + size > avr->flashend + 1)
+		size = avr->flashend + 1 - addr;
+	avr_flashaddr_t first = addr >> 1, last = (addr + size + 1) >> 1;
+	memset(avr->decode + first, 0, (last - first) * sizeof(void *));
+}
+
 /*
  * Main opcode decoder
  *
@@ -644,15 +709,22 @@ run_one_again:
 	avr_flashaddr_t	new_pc = avr->pc + 2;	// future "default" pc
 	int 			cycle = 1;
 
+#if AVR_PREDECODE
+	if (avr->decode && avr->decode[avr->pc >> 1])
+		goto *avr->decode[avr->pc >> 1];
+#endif
+
 	switch (opcode & 0xf000) {
 		case 0x0000: {
 			switch (opcode) {
 				case 0x0000: {	// NOP
+					DECODED();
 					STATE("nop\n");
 				}	break;
 				default: {
 					switch (opcode & 0xfc00) {
 						case 0x0400: {	// CPC -- Compare with carry -- 0000 01rd dddd rrrr
+							DECODED();
 							get_vd5_vr5(opcode);
 							uint8_t res = vd - vr - avr->sreg[S_C];
 							STATE("cpc %s[%02x], %s[%02x] = %02x\n", avr_regname(d), vd, avr_regname(r), vr, res);
@@ -660,6 +732,7 @@ run_one_again:
 							SREG();
 						}	break;
 						case 0x0c00: {	// ADD -- Add without carry -- 0000 11rd dddd rrrr
+							DECODED();
 							get_vd5_vr5(opcode);
 							uint8_t res = vd + vr;
 							if (r == d) {
@@ -672,6 +745,7 @@ run_one_again:
 							SREG();
 						}	break;
 						case 0x0800: {	// SBC -- Subtract with carry -- 0000 10rd dddd rrrr
+							DECODED();
 							get_vd5_vr5(opcode);
 							uint8_t res = vd - vr - avr->sreg[S_C];
 							STATE("sbc %s[%02x], %s[%02x] = %02x\n", avr_regname(d), avr->data[d], avr_regname(r), avr->data[r], res);
@@ -682,6 +756,7 @@ run_one_again:
 						default:
 							switch (opcode & 0xff00) {
 								case 0x0100: {	// MOVW -- Copy Register Word -- 0000 0001 dddd rrrr
+									DECODED();
 									uint8_t d = ((opcode >> 4) & 0xf) << 1;
 									uint8_t r = ((opcode) & 0xf) << 1;
 									STATE("movw %s:%s, %s:%s[%02x%02x]\n", avr_regname(d), avr_regname(d+1), avr_regname(r), avr_regname(r+1), avr->data[r+1], avr->data[r]);
@@ -689,6 +764,7 @@ run_one_again:
 									_avr_set_r16le(avr, d, vr);
 								}	break;
 								case 0x0200: {	// MULS -- Multiply Signed -- 0000 0010 dddd rrrr
+									DECODED();
 									int8_t r = 16 + (opcode & 0xf);
 									int8_t d = 16 + ((opcode >> 4) & 0xf);
 									int16_t res = ((int8_t)avr->data[r]) * ((int8_t)avr->data[d]);
@@ -700,6 +776,7 @@ run_one_again:
 									SREG();
 								}	break;
 								case 0x0300: {	// MUL -- Multiply -- 0000 0011 fddd frrr
+									DECODED();
 									int8_t r = 16 + (opcode & 0x7);
 									int8_t d = 16 + ((opcode >> 4) & 0x7);
 									int16_t res = 0;
@@ -747,6 +824,7 @@ run_one_again:
 		case 0x1000: {
 			switch (opcode & 0xfc00) {
 				case 0x1800: {	// SUB -- Subtract without carry -- 0001 10rd dddd rrrr
+					DECODED();
 					get_vd5_vr5(opcode);
 					uint8_t res = vd - vr;
 					STATE("sub %s[%02x], %s[%02x] = %02x\n", avr_regname(d), vd, avr_regname(r), vr, res);
@@ -755,6 +833,7 @@ run_one_again:
 					SREG();
 				}	break;
 				case 0x1000: {	// CPSE -- Compare, skip if equal -- 0001 00rd dddd rrrr
+					DECODED();
 					get_vd5_vr5(opcode);
 					uint16_t res = vd == vr;
 					STATE("cpse %s[%02x], %s[%02x]\t; Will%s skip\n", avr_regname(d), avr->data[d], avr_regname(r), avr->data[r], res ? "":" not");
@@ -767,6 +846,7 @@ run_one_again:
 					}
 				}	break;
 				case 0x1400: {	// CP -- Compare -- 0001 01rd dddd rrrr
+					DECODED();
 					get_vd5_vr5(opcode);
 					uint8_t res = vd - vr;
 					STATE("cp %s[%02x], %s[%02x] = %02x\n", avr_regname(d), vd, avr_regname(r), vr, res);
@@ -774,6 +854,7 @@ run_one_again:
 					SREG();
 				}	break;
 				case 0x1c00: {	// ADD -- Add with carry -- 0001 11rd dddd rrrr
+					DECODED();
 					get_vd5_vr5(opcode);
 					uint8_t res = vd + vr + avr->sreg[S_C];
 					if (r == d) {
@@ -792,6 +873,7 @@ run_one_again:
 		case 0x2000: {
 			switch (opcode & 0xfc00) {
 				case 0x2000: {	// AND -- Logical AND -- 0010 00rd dddd rrrr
+					DECODED();
 					get_vd5_vr5(opcode);
 					uint8_t res = vd & vr;
 					if (r == d) {
@@ -804,6 +886,7 @@ run_one_again:
 					SREG();
 				}	break;
 				case 0x2400: {	// EOR -- Logical Exclusive OR -- 0010 01rd dddd rrrr
+					DECODED();
 					get_vd5_vr5(opcode);
 					uint8_t res = vd ^ vr;
 					if (r==d) {
@@ -816,6 +899,7 @@ run_one_again:
 					SREG();
 				}	break;
 				case 0x2800: {	// OR -- Logical OR -- 0010 10rd dddd rrrr
+					DECODED();
 					get_vd5_vr5(opcode);
 					uint8_t res = vd | vr;
 					STATE("or %s[%02x], %s[%02x] = %02x\n", avr_regname(d), vd, avr_regname(r), vr, res);
@@ -824,6 +908,7 @@ run_one_again:
 					SREG();
 				}	break;
 				case 0x2c00: {	// MOV -- 0010 11rd dddd rrrr
+					DECODED();
 					get_d5_vr5(opcode);
 					uint8_t res = vr;
 					STATE("mov %s, %s[%02x] = %02x\n", avr_regname(d), avr_regname(r), vr, res);
@@ -834,6 +919,7 @@ run_one_again:
 		}	break;
 
 		case 0x3000: {	// CPI -- Compare Immediate -- 0011 kkkk hhhh kkkk
+			DECODED();
 			get_vh4_k8(opcode);
 			uint8_t res = vh - k;
 			STATE("cpi %s[%02x], 0x%02x\n", avr_regname(h), vh, k);
@@ -842,6 +928,7 @@ run_one_again:
 		}	break;
 
 		case 0x4000: {	// SBCI -- Subtract Immediate With Carry -- 0100 kkkk hhhh kkkk
+			DECODED();
 			get_vh4_k8(opcode);
 			uint8_t res = vh - k - avr->sreg[S_C];
 			STATE("sbci %s[%02x], 0x%02x = %02x\n", avr_regname(h), vh, k, res);
@@ -851,6 +938,7 @@ run_one_again:
 		}	break;
 
 		case 0x5000: {	// SUBI -- Subtract Immediate -- 0101 kkkk hhhh kkkk
+			DECODED();
 			get_vh4_k8(opcode);
 			uint8_t res = vh - k;
 			STATE("subi %s[%02x], 0x%02x = %02x\n", avr_regname(h), vh, k, res);
@@ -860,6 +948,7 @@ run_one_again:
 		}	break;
 
 		case 0x6000: {	// ORI aka SBR -- Logical OR with Immediate -- 0110 kkkk hhhh kkkk
+			DECODED();
 			get_vh4_k8(opcode);
 			uint8_t res = vh | k;
 			STATE("ori %s[%02x], 0x%02x\n", avr_regname(h), vh, k);
@@ -869,6 +958,7 @@ run_one_again:
 		}	break;
 
 		case 0x7000: {	// ANDI	-- Logical AND with Immediate -- 0111 kkkk hhhh kkkk
+			DECODED();
 			get_vh4_k8(opcode);
 			uint8_t res = vh & k;
 			STATE("andi %s[%02x], 0x%02x\n", avr_regname(h), vh, k);
@@ -890,6 +980,7 @@ run_one_again:
 			switch (opcode & 0xd008) {
 				case 0xa000:
 				case 0x8000: {	// LD (LDD) -- Load Indirect using Z -- 10q0 qqsd dddd yqqq
+					DECODED();
 					uint16_t v = avr->data[R_ZL] | (avr->data[R_ZH] << 8);
 					get_d5_q6(opcode);
 					if (opcode & 0x0200) {
@@ -903,6 +994,7 @@ run_one_again:
 				}	break;
 				case 0xa008:
 				case 0x8008: {	// LD (LDD) -- Load Indirect using Y -- 10q0 qqsd dddd yqqq
+					DECODED();
 					uint16_t v = avr->data[R_YL] | (avr->data[R_YH] << 8);
 					get_d5_q6(opcode);
 					if (opcode & 0x0200) {
@@ -921,12 +1013,14 @@ run_one_again:
 		case 0x9000: {
 			/* this is an annoying special case, but at least these lines handle all the SREG set/clear opcodes */
 			if ((opcode & 0xff0f) == 0x9408) {
+				DECODED();
 				get_sreg_bit(opcode);
 				STATE("%s%c\n", opcode & 0x0080 ? "cl" : "se", _sreg_bit_name[b]);
 				avr_sreg_set(avr, b, (opcode & 0x0080) == 0);
 				SREG();
 			} else switch (opcode) {
 				case 0x9588: { // SLEEP -- 1001 0101 1000 1000
+					DECODED();
 					STATE("sleep\n");
 					/* Don't sleep if there are interrupts about to be serviced.
 					 * Without this check, it was possible to incorrectly enter a state
@@ -936,6 +1030,7 @@ run_one_again:
 						avr->state = cpu_Sleeping;
 				}	break;
 				case 0x9598: { // BREAK -- 1001 0101 1001 1000
+					DECODED();
 					STATE("break\n");
 					if (avr->gdb) {
 						// if gdb is on, we break here as in here
@@ -947,10 +1042,12 @@ run_one_again:
 					}
 				}	break;
 				case 0x95a8: { // WDR -- Watchdog Reset -- 1001 0101 1010 1000
+					DECODED();
 					STATE("wdr\n");
 					avr_ioctl(avr, AVR_IOCTL_WATCHDOG_RESET, 0);
 				}	break;
 				case 0x95e8: { // SPM -- Store Program Memory -- 1001 0101 1110 1000
+					DECODED();
 					STATE("spm\n");
 					avr_ioctl(avr, AVR_IOCTL_FLASH_SPM, 0);
 				}	break;
@@ -958,6 +1055,7 @@ run_one_again:
 				case 0x9419:   // EIJMP -- Indirect jump -- 1001 0100 0001 1001   bit 4 is "indirect"
 				case 0x9509:   // ICALL -- Indirect Call to Subroutine -- 1001 0101 0000 1001
 				case 0x9519: { // EICALL -- Indirect Call to Subroutine -- 1001 0101 0001 1001   bit 8 is "push pc"
+					DECODED();
 					int e = opcode & 0x10;
 					int p = opcode & 0x100;
 					if (e && !avr->eind)
@@ -973,10 +1071,12 @@ run_one_again:
 					TRACE_JUMP();
 				}	break;
 				case 0x9518: 	// RETI -- Return from Interrupt -- 1001 0101 0001 1000
+					DECODED();
 					avr_sreg_set(avr, S_I, 1);
 					avr_interrupt_reti(avr);
 					FALLTHROUGH
 				case 0x9508: {	// RET -- Return -- 1001 0101 0000 1000
+					DECODED();
 					new_pc = _avr_pop_addr(avr);
 					cycle += 1 + avr->address_size;
 					STATE("ret%s\n", opcode & 0x10 ? "i" : "");
@@ -984,12 +1084,14 @@ run_one_again:
 					STACK_FRAME_POP();
 				}	break;
 				case 0x95c8: {	// LPM -- Load Program Memory R0 <- (Z) -- 1001 0101 1100 1000
+					DECODED();
 					uint16_t z = avr->data[R_ZL] | (avr->data[R_ZH] << 8);
 					STATE("lpm %s, (Z[%04x])\n", avr_regname(0), z);
 					cycle += 2; // 3 cycles
 					_avr_set_r(avr, 0, avr->flash[z]);
 				}	break;
 				case 0x95d8: {	// ELPM -- Load Program Memory R0 <- (Z) -- 1001 0101 1101 1000
+					DECODED();
 					if (!avr->rampz)
 						_avr_invalid_opcode(avr);
 					uint32_t z = avr->data[R_ZL] | (avr->data[R_ZH] << 8) | (avr->data[avr->rampz] << 16);
@@ -1000,6 +1102,7 @@ run_one_again:
 				default:  {
 					switch (opcode & 0xfe0f) {
 						case 0x9000: {	// LDS -- Load Direct from Data Space, 32 bits -- 1001 0000 0000 0000
+							DECODED();
 							get_d5(opcode);
 							uint16_t x = _avr_flash_read16le(avr, new_pc);
 							new_pc += 2;
@@ -1009,6 +1112,7 @@ run_one_again:
 						}	break;
 						case 0x9005:
 						case 0x9004: {	// LPM -- Load Program Memory -- 1001 000d dddd 01oo
+							DECODED();
 							get_d5(opcode);
 							uint16_t z = avr->data[R_ZL] | (avr->data[R_ZH] << 8);
 							int op = opcode & 1;
@@ -1022,6 +1126,7 @@ run_one_again:
 						}	break;
 						case 0x9006:
 						case 0x9007: {	// ELPM -- Extended Load Program Memory -- 1001 000d dddd 01oo
+							DECODED();
 							if (!avr->rampz)
 								_avr_invalid_opcode(avr);
 							uint32_t z = avr->data[R_ZL] | (avr->data[R_ZH] << 8) | (avr->data[avr->rampz] << 16);
@@ -1047,6 +1152,7 @@ run_one_again:
 						case 0x900c:
 						case 0x900d:
 						case 0x900e: {	// LD -- Load Indirect from Data using X -- 1001 000d dddd 11oo
+							DECODED();
 							int op = opcode & 3;
 							get_d5(opcode);
 							uint16_t x = (avr->data[R_XH] << 8) | avr->data[R_XL];
@@ -1061,6 +1167,7 @@ run_one_again:
 						case 0x920c:
 						case 0x920d:
 						case 0x920e: {	// ST -- Store Indirect Data Space X -- 1001 001d dddd 11oo
+							DECODED();
 							int op = opcode & 3;
 							get_vd5(opcode);
 							uint16_t x = (avr->data[R_XH] << 8) | avr->data[R_XL];
@@ -1073,6 +1180,7 @@ run_one_again:
 						}	break;
 						case 0x9009:
 						case 0x900a: {	// LD -- Load Indirect from Data using Y -- 1001 000d dddd 10oo
+							DECODED();
 							int op = opcode & 3;
 							get_d5(opcode);
 							uint16_t y = (avr->data[R_YH] << 8) | avr->data[R_YL];
@@ -1086,6 +1194,7 @@ run_one_again:
 						}	break;
 						case 0x9209:
 						case 0x920a: {	// ST -- Store Indirect Data Space Y -- 1001 001d dddd 10oo
+							DECODED();
 							int op = opcode & 3;
 							get_vd5(opcode);
 							uint16_t y = (avr->data[R_YH] << 8) | avr->data[R_YL];
@@ -1097,6 +1206,7 @@ run_one_again:
 							_avr_set_r16le_hl(avr, R_YL, y);
 						}	break;
 						case 0x9200: {	// STS -- Store Direct to Data Space, 32 bits -- 1001 0010 0000 0000
+							DECODED();
 							get_vd5(opcode);
 							uint16_t x = _avr_flash_read16le(avr, new_pc);
 							new_pc += 2;
@@ -1106,6 +1216,7 @@ run_one_again:
 						}	break;
 						case 0x9001:
 						case 0x9002: {	// LD -- Load Indirect from Data using Z -- 1001 000d dddd 00oo
+							DECODED();
 							int op = opcode & 3;
 							get_d5(opcode);
 							uint16_t z = (avr->data[R_ZH] << 8) | avr->data[R_ZL];
@@ -1119,6 +1230,7 @@ run_one_again:
 						}	break;
 						case 0x9201:
 						case 0x9202: {	// ST -- Store Indirect Data Space Z -- 1001 001d dddd 00oo
+							DECODED();
 							int op = opcode & 3;
 							get_vd5(opcode);
 							uint16_t z = (avr->data[R_ZH] << 8) | avr->data[R_ZL];
@@ -1130,6 +1242,7 @@ run_one_again:
 							_avr_set_r16le_hl(avr, R_ZL, z);
 						}	break;
 						case 0x900f: {	// POP -- 1001 000d dddd 1111
+							DECODED();
 							get_d5(opcode);
 							_avr_set_r(avr, d, _avr_pop8(avr));
 							T(uint16_t sp = _avr_sp_get(avr);)
@@ -1137,6 +1250,7 @@ run_one_again:
 							cycle++;
 						}	break;
 						case 0x920f: {	// PUSH -- 1001 001d dddd 1111
+							DECODED();
 							get_vd5(opcode);
 							_avr_push8(avr, vd);
 							T(uint16_t sp = _avr_sp_get(avr);)
@@ -1144,6 +1258,7 @@ run_one_again:
 							cycle++;
 						}	break;
 						case 0x9400: {	// COM -- One's Complement -- 1001 010d dddd 0000
+							DECODED();
 							get_vd5(opcode);
 							uint8_t res = 0xff - vd;
 							STATE("com %s[%02x] = %02x\n", avr_regname(d), vd, res);
@@ -1153,6 +1268,7 @@ run_one_again:
 							SREG();
 						}	break;
 						case 0x9401: {	// NEG -- Two's Complement -- 1001 010d dddd 0001
+							DECODED();
 							get_vd5(opcode);
 							uint8_t res = 0x00 - vd;
 							STATE("neg %s[%02x] = %02x\n", avr_regname(d), vd, res);
@@ -1164,12 +1280,14 @@ run_one_again:
 							SREG();
 						}	break;
 						case 0x9402: {	// SWAP -- Swap Nibbles -- 1001 010d dddd 0010
+							DECODED();
 							get_vd5(opcode);
 							uint8_t res = (vd >> 4) | (vd << 4) ;
 							STATE("swap %s[%02x] = %02x\n", avr_regname(d), vd, res);
 							_avr_set_r(avr, d, res);
 						}	break;
 						case 0x9403: {	// INC -- Increment -- 1001 010d dddd 0011
+							DECODED();
 							get_vd5(opcode);
 							uint8_t res = vd + 1;
 							STATE("inc %s[%02x] = %02x\n", avr_regname(d), vd, res);
@@ -1179,6 +1297,7 @@ run_one_again:
 							SREG();
 						}	break;
 						case 0x9405: {	// ASR -- Arithmetic Shift Right -- 1001 010d dddd 0101
+							DECODED();
 							get_vd5(opcode);
 							uint8_t res = (vd >> 1) | (vd & 0x80);
 							STATE("asr %s[%02x]\n", avr_regname(d), vd);
@@ -1187,6 +1306,7 @@ run_one_again:
 							SREG();
 						}	break;
 						case 0x9406: {	// LSR -- Logical Shift Right -- 1001 010d dddd 0110
+							DECODED();
 							get_vd5(opcode);
 							uint8_t res = vd >> 1;
 							STATE("lsr %s[%02x]\n", avr_regname(d), vd);
@@ -1196,6 +1316,7 @@ run_one_again:
 							SREG();
 						}	break;
 						case 0x9407: {	// ROR -- Rotate Right -- 1001 010d dddd 0111
+							DECODED();
 							get_vd5(opcode);
 							uint8_t res = (avr->sreg[S_C] ? 0x80 : 0) | vd >> 1;
 							STATE("ror %s[%02x]\n", avr_regname(d), vd);
@@ -1204,6 +1325,7 @@ run_one_again:
 							SREG();
 						}	break;
 						case 0x940a: {	// DEC -- Decrement -- 1001 010d dddd 1010
+							DECODED();
 							get_vd5(opcode);
 							uint8_t res = vd - 1;
 							STATE("dec %s[%02x] = %02x\n", avr_regname(d), vd, res);
@@ -1214,6 +1336,7 @@ run_one_again:
 						}	break;
 						case 0x940c:
 						case 0x940d: {	// JMP -- Long Call to sub, 32 bits -- 1001 010a aaaa 110a
+							DECODED();
 							avr_flashaddr_t a = ((opcode & 0x01f0) >> 3) | (opcode & 1);
 							uint16_t x = _avr_flash_read16le(avr, new_pc);
 							a = (a << 16) | x;
@@ -1224,6 +1347,7 @@ run_one_again:
 						}	break;
 						case 0x940e:
 						case 0x940f: {	// CALL -- Long Call to sub, 32 bits -- 1001 010a aaaa 111a
+							DECODED();
 							avr_flashaddr_t a = ((opcode & 0x01f0) >> 3) | (opcode & 1);
 							uint16_t x = _avr_flash_read16le(avr, new_pc);
 							a = (a << 16) | x;
@@ -1238,6 +1362,7 @@ run_one_again:
 						default: {
 							switch (opcode & 0xff00) {
 								case 0x9600: {	// ADIW -- Add Immediate to Word -- 1001 0110 KKpp KKKK
+									DECODED();
 									get_vp2_k6(opcode);
 									uint16_t res = vp + k;
 									STATE("adiw %s:%s[%04x], 0x%02x\n", avr_regname(p), avr_regname(p + 1), vp, k);
@@ -1249,6 +1374,7 @@ run_one_again:
 									cycle++;
 								}	break;
 								case 0x9700: {	// SBIW -- Subtract Immediate from Word -- 1001 0111 KKpp KKKK
+									DECODED();
 									get_vp2_k6(opcode);
 									uint16_t res = vp - k;
 									STATE("sbiw %s:%s[%04x], 0x%02x\n", avr_regname(p), avr_regname(p + 1), vp, k);
@@ -1260,6 +1386,7 @@ run_one_again:
 									cycle++;
 								}	break;
 								case 0x9800: {	// CBI -- Clear Bit in I/O Register -- 1001 1000 AAAA Abbb
+									DECODED();
 									get_io5_b3mask(opcode);
 									uint8_t res = _avr_get_ram(avr, io) & ~mask;
 									STATE("cbi %s[%04x], 0x%02x = %02x\n", avr_regname(io), avr->data[io], mask, res);
@@ -1267,6 +1394,7 @@ run_one_again:
 									cycle++;
 								}	break;
 								case 0x9900: {	// SBIC -- Skip if Bit in I/O Register is Cleared -- 1001 1001 AAAA Abbb
+									DECODED();
 									get_io5_b3mask(opcode);
 									uint8_t res = _avr_get_ram(avr, io) & mask;
 									STATE("sbic %s[%04x], 0x%02x\t; Will%s branch\n", avr_regname(io), avr->data[io], mask, !res?"":" not");
@@ -1279,6 +1407,7 @@ run_one_again:
 									}
 								}	break;
 								case 0x9a00: {	// SBI -- Set Bit in I/O Register -- 1001 1010 AAAA Abbb
+									DECODED();
 									get_io5_b3mask(opcode);
 									uint8_t res = _avr_get_ram(avr, io) | mask;
 									STATE("sbi %s[%04x], 0x%02x = %02x\n", avr_regname(io), avr->data[io], mask, res);
@@ -1286,6 +1415,7 @@ run_one_again:
 									cycle++;
 								}	break;
 								case 0x9b00: {	// SBIS -- Skip if Bit in I/O Register is Set -- 1001 1011 AAAA Abbb
+									DECODED();
 									get_io5_b3mask(opcode);
 									uint8_t res = _avr_get_ram(avr, io) & mask;
 									STATE("sbis %s[%04x], 0x%02x\t; Will%s branch\n", avr_regname(io), avr->data[io], mask, res?"":" not");
@@ -1300,6 +1430,7 @@ run_one_again:
 								default:
 									switch (opcode & 0xfc00) {
 										case 0x9c00: {	// MUL -- Multiply Unsigned -- 1001 11rd dddd rrrr
+											DECODED();
 											get_vd5_vr5(opcode);
 											uint16_t res = vd * vr;
 											STATE("mul %s[%02x], %s[%02x] = %04x\n", avr_regname(d), vd, avr_regname(r), vr, res);
@@ -1321,11 +1452,13 @@ run_one_again:
 		case 0xb000: {
 			switch (opcode & 0xf800) {
 				case 0xb800: {	// OUT A,Rr -- 1011 1AAd dddd AAAA
+					DECODED();
 					get_d5_a6(opcode);
 					STATE("out %s, %s[%02x]\n", avr_regname(A), avr_regname(d), avr->data[d]);
 					_avr_set_ram(avr, A, avr->data[d]);
 				}	break;
 				case 0xb000: {	// IN Rd,A -- 1011 0AAd dddd AAAA
+					DECODED();
 					get_d5_a6(opcode);
 					STATE("in %s, %s[%02x]\n", avr_regname(d), avr_regname(A), avr->data[A]);
 					_avr_set_r(avr, d, _avr_get_ram(avr, A));
@@ -1335,6 +1468,7 @@ run_one_again:
 		}	break;
 
 		case 0xc000: {	// RJMP -- 1100 kkkk kkkk kkkk
+			DECODED();
 			get_o12(opcode);
 			STATE("rjmp .%d [%04x]\n", o >> 1, new_pc + o);
 			new_pc = (new_pc + o) % (avr->flashend+1);
@@ -1343,6 +1477,7 @@ run_one_again:
 		}	break;
 
 		case 0xd000: {	// RCALL -- 1101 kkkk kkkk kkkk
+			DECODED();
 			get_o12(opcode);
 			STATE("rcall .%d [%04x]\n", o >> 1, new_pc + o);
 			cycle += _avr_push_addr(avr, new_pc);
@@ -1355,6 +1490,7 @@ run_one_again:
 		}	break;
 
 		case 0xe000: {	// LDI Rd, K aka SER (LDI r, 0xff) -- 1110 kkkk dddd kkkk
+			DECODED();
 			get_h4_k8(opcode);
 			STATE("ldi %s, 0x%02x\n", avr_regname(h), k);
 			_avr_set_r(avr, h, k);
@@ -1363,6 +1499,7 @@ run_one_again:
 		case 0xf000: {
 			switch (opcode & 0xfe00) {
 				case 0xf100: {	/* simavr special opcodes */
+					DECODED();
 					if (opcode == 0xf1f1) { // AVR_OVERFLOW_OPCODE
 						printf("FLASH overflow, soft reset\n");
 						new_pc = 0;
@@ -1373,6 +1510,7 @@ run_one_again:
 				case 0xf200:
 				case 0xf400:
 				case 0xf600: {	// BRXC/BRXS -- All the SREG branches -- 1111 0Boo oooo osss
+					DECODED();
 					int16_t o = ((int16_t)(opcode << 6)) >> 9; // offset
 					uint8_t s = opcode & 7;
 					int set = (opcode & 0x0400) == 0;		// this bit means BRXC otherwise BRXS
@@ -1393,6 +1531,7 @@ run_one_again:
 				}	break;
 				case 0xf800:
 				case 0xf900: {	// BLD -- Bit Store from T into a Bit in Register -- 1111 100d dddd 0bbb
+					DECODED();
 					get_vd5_s3_mask(opcode);
 					uint8_t v = (vd & ~mask) | (avr->sreg[S_T] ? mask : 0);
 					STATE("bld %s[%02x], 0x%02x = %02x\n", avr_regname(d), vd, mask, v);
@@ -1400,6 +1539,7 @@ run_one_again:
 				}	break;
 				case 0xfa00:
 				case 0xfb00:{	// BST -- Bit Store into T from bit in Register -- 1111 101d dddd 0bbb
+					DECODED();
 					get_vd5_s3(opcode)
 					STATE("bst %s[%02x], 0x%02x\n", avr_regname(d), vd, 1 << s);
 					avr->sreg[S_T] = (vd >> s) & 1;
@@ -1407,6 +1547,7 @@ run_one_again:
 				}	break;
 				case 0xfc00:
 				case 0xfe00: {	// SBRS/SBRC -- Skip if Bit in Register is Set/Clear -- 1111 11sd dddd 0bbb
+					DECODED();
 					get_vd5_s3_mask(opcode)
 					int set = (opcode & 0x0200) != 0;
 					int branch = ((vd & mask) && set) || (!(vd & mask) && !set);
@@ -1428,6 +1569,15 @@ run_one_again:
 	}
 	avr->cycle += cycle;
 
+	if (unlikely(avr->profile.count) && !avr->profile.period) {
+		avr->profile.cycles[avr->pc >> 1] += cycle;
+		avr->profile.count[avr->pc >> 1]++;
+	}
+	if (unlikely(avr->coverage))
+		avr->coverage[avr->pc >> 4] |= 1 << ((avr->pc >> 1) & 7);
+	if (unlikely(avr->trace_file))
+		avr_trace_file_record(avr, avr->pc, cycle);
+
 	if ((avr->state == cpu_Running) &&
 		(avr->run_cycle_count > cycle) &&
 		(avr->interrupt_state == 0))
@@ -41,6 +41,18 @@ extern "C" {
  */
 avr_flashaddr_t avr_run_one(avr_t * avr);
 
+/*
+ * Predecoded instructions. When enabled, the decoder remembers where each
+ * flash word it executed was decoded to, and jumps straight there the next
+ * time the word is executed. Returns -1 if the compiler doesn't support it.
+ */
+int avr_predecode_enable(avr_t * avr, int enable);
+/*
+ * Forgets the predecoded instructions of a flash range. Must be called
+ * whenever flash is modified, this is done by avr_loadcode() and SPM.
+ */
+void avr_predecode_invalidate(avr_t * avr, avr_flashaddr_t addr, uint32_t size);
+
 /*
  * These are for internal access to the stack (for interrupts)
  */
@@ -0,0 +1,136 @@
+/*
+	sim_cosim.c
+
+	Links IRQs of different AVRs, for boards with several MCUs that are
+	run a time quantum at a time.
+
+ 	This file is part of simavr.
+
+	simavr is free software: you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation, either version 3 of the License, or
+	(at your option) any later version.
+
+	simavr is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+
+	You should have received a copy of the GNU General Public License
+	along with simavr.  If not, see <http://www.gnu.org/licenses/>.
+ */
+
+#include <stdio.h>
+#include <string.h>
+#include <stdlib.h>
+#include "sim_cosim.h"
+#include "sim_avr.h"
+
+/*
+ * Called in the thread running the source AVR, the pending changes are
+ * only read at synchronization points, when that thread is waiting.
+ */
+static void
+_avr_cosim_link_hook(
+		struct avr_irq_t * irq,
+		uint32_t value,
+		void * param)
+{
+	avr_cosim_link_t * link = (avr_cosim_link_t *)param;
+
+	if (link->pending_count == link->pending_size) {
+		uint32_t size = link->pending_size ? link->pending_size * 2 : 64;
+		avr_irq_record_t * pending = realloc(link->pending,
+				size * sizeof(avr_irq_record_t));
+		if (!pending) {
+			link->dropped++;
+			return;
+		}
+		link->pending = pending;
+		link->pending_size = size;
+	}
+	avr_irq_record_t * r = &link->pending[link->pending_count++];
+	r->when = link->source_avr->cycle;
+	r->index = 0;
+	r->value = value;
+}
+
+int
+avr_cosim_link_init(
+		avr_cosim_link_t * link,
+		struct avr_t * source_avr,
+		avr_irq_t * source,
+		avr_cycle_count_t source_origin,
+		struct avr_t * destination_avr,
+		avr_irq_t * destination,
+		avr_cycle_count_t destination_origin,
+		uint64_t latency_ns )
+{
+	memset(link, 0, sizeof(avr_cosim_link_t));
+	link->source_avr = source_avr;
+	link->destination_avr = destination_avr;
+	link->source_origin = source_origin;
+	link->destination_origin = destination_origin;
+
+	if (!source_avr->frequency || !destination_avr->frequency) {
+		AVR_LOG(source_avr, LOG_ERROR, "%s: the AVRs need a frequency\n",
+				__FUNCTION__);
+		return -1;
+	}
+	link->ratio = (double)destination_avr->frequency / source_avr->frequency;
+	link->latency = latency_ns * (double)destination_avr->frequency / 1e9;
+
+	if (avr_irq_stimulus_init(destination_avr, &link->stimulus, 64) ||
+			avr_irq_stimulus_add_signal(&link->stimulus, destination,
+					destination->name ? destination->name : "link") < 0) {
+		avr_irq_stimulus_close(&link->stimulus);
+		return -1;
+	}
+
+	const char * names[1] = { ">cosim.link" };
+	avr_init_irq(&source_avr->irq_pool, &link->irq, 0, 1, names);
+	avr_irq_register_notify(&link->irq, _avr_cosim_link_hook, link);
+	link->source = source;
+	avr_connect_irq(source, &link->irq);
+	return 0;
+}
+
+void
+avr_cosim_link_close(
+		avr_cosim_link_t * link )
+{
+	if (!link->source)
+		return;
+	avr_unconnect_irq(link->source, &link->irq);
+	avr_free_irq(&link->irq, 1);
+	link->source = NULL;
+
+	avr_irq_stimulus_close(&link->stimulus);
+	free(link->pending);
+	link->pending = NULL;
+	link->pending_count = link->pending_size = 0;
+}
+
+int
+avr_cosim_link_sync(
+		avr_cosim_link_t * link )
+{
+	if (!link->source)
+		return -1;
+
+	avr_cycle_count_t now = link->destination_avr->cycle;
+	for (uint32_t i = 0; i < link->pending_count; i++) {
+		avr_irq_record_t * r = &link->pending[i];
+		// round up, a change can't arrive before it happened
+		double when = (r->when - link->source_origin) * link->ratio + link->latency;
+		r->when = link->destination_origin + (avr_cycle_count_t)when +
+				(when > (avr_cycle_count_t)when);
+		if (r->when < now)
+			link->late++;
+	}
+	int count = link->pending_count;
+	if (avr_irq_stimulus_append(&link->stimulus, link->pending, count, 0))
+		return -1;
+	link->pending_count = 0;
+	return count;
+}
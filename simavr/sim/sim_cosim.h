@@ -0,0 +1,93 @@
+/*
+	sim_cosim.h
+
+	Links IRQs of different AVRs, for boards with several MCUs that are
+	run a time quantum at a time.
+
+ 	This file is part of simavr.
+
+	simavr is free software: you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation, either version 3 of the License, or
+	(at your option) any later version.
+
+	simavr is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+
+	You should have received a copy of the GNU General Public License
+	along with simavr.  If not, see <http://www.gnu.org/licenses/>.
+ */
+
+#ifndef __SIM_COSIM_H__
+#define __SIM_COSIM_H__
+
+#include "sim_irq.h"
+#include "sim_avr_types.h"
+#include "sim_irq_stimulus.h"
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+/*
+ * AVRs of a board are run one after the other (or in parallel threads)
+ * up to the same point in time, a quantum at a time. An IRQ of one AVR
+ * can't be connected to an IRQ of another one directly, as they are not
+ * at the same time when it is raised.
+ *
+ * Instead, a link records the changes of its source IRQ with their cycle.
+ * At each synchronization point, avr_cosim_link_sync() converts them to
+ * cycles of the destination AVR, adding a latency, and queues them in a
+ * stimulus that raises the destination IRQ at that cycle. With a latency
+ * of at least the quantum, changes always arrive in time; otherwise the
+ * ones that are late are raised as soon as possible and counted.
+ *
+ * The 'origin' of each AVR is its cycle at time 0 of the board.
+ */
+typedef struct avr_cosim_link_t {
+	struct avr_t *	source_avr;
+	struct avr_t *	destination_avr;
+	avr_irq_t *		source;
+	avr_irq_t		irq;		// connected to 'source', records its changes
+	avr_irq_stimulus_t	stimulus;	// raises the destination IRQ
+
+	avr_cycle_count_t	source_origin;
+	avr_cycle_count_t	destination_origin;
+	double			ratio;		// destination cycles per source cycle
+	double			latency;	// in destination cycles
+
+	avr_irq_record_t * pending;	// changes since the last sync
+	uint32_t		pending_count;
+	uint32_t		pending_size;
+	uint64_t		late;		// changes that arrived after their cycle
+	uint64_t		dropped;	// changes lost, as the buffer could not grow
+} avr_cosim_link_t;
+
+// links 'source' of 'source_avr' to 'destination' of 'destination_avr',
+// with a latency in nanoseconds. Returns 0 or -1
+int
+avr_cosim_link_init(
+		avr_cosim_link_t * link,
+		struct avr_t * source_avr,
+		avr_irq_t * source,
+		avr_cycle_count_t source_origin,
+		struct avr_t * destination_avr,
+		avr_irq_t * destination,
+		avr_cycle_count_t destination_origin,
+		uint64_t latency_ns );
+// disconnects the link, the pending changes are dropped
+void
+avr_cosim_link_close(
+		avr_cosim_link_t * link );
+// queues the pending changes on the destination, returns how many or -1
+int
+avr_cosim_link_sync(
+		avr_cosim_link_t * link );
+
+#ifdef __cplusplus
+};
+#endif
+
+#endif /* __SIM_COSIM_H__ */
@@ -0,0 +1,85 @@
+/*
+	sim_coverage.c
+
+	Bitmap of the flash words executed by the firmware.
+
+ 	This file is part of simavr.
+
+	simavr is free software: you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation, either version 3 of the License, or
+	(at your option) any later version.
+
+	simavr is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+
+	You should have received a copy of the GNU General Public License
+	along with simavr.  If not, see <http://www.gnu.org/licenses/>.
+ */
+
+#include <stdlib.h>
+#include <string.h>
+#include "sim_coverage.h"
+
+int
+avr_coverage_enable(
+		avr_t * avr)
+{
+	if (avr->coverage)
+		return 0;
+	avr->coverage = calloc(avr_coverage_size(avr), 1);
+	if (!avr->coverage) {
+		AVR_LOG(avr, LOG_ERROR, "COVERAGE: %s: unable to allocate the bitmap\n",
+				__func__);
+		return -1;
+	}
+	return 0;
+}
+
+void
+avr_coverage_disable(
+		avr_t * avr)
+{
+	if (avr->coverage)
+		free(avr->coverage);
+	avr->coverage = NULL;
+}
+
+void
+avr_coverage_clear(
+		avr_t * avr)
+{
+	if (avr->coverage)
+		memset(avr->coverage, 0, avr_coverage_size(avr));
+}
+
+uint32_t
+avr_coverage_count(
+		const uint8_t * bitmap,
+		uint32_t size)
+{
+	uint32_t count = 0;
+	uint32_t i = 0;
+
+	for (; i + sizeof(uint64_t) <= size; i += sizeof(uint64_t)) {
+		uint64_t word;
+		memcpy(&word, bitmap + i, sizeof(word));
+		count += __builtin_popcountll(word);
+	}
+	for (; i < size; i++)
+		count += __builtin_popcount(bitmap[i]);
+	return count;
+}
+
+void
+avr_coverage_merge(
+		uint8_t * dst,
+		const uint8_t * src,
+		uint32_t size)
+{
+	// simple enough for the compiler to vectorize
+	for (uint32_t i = 0; i < size; i++)
+		dst[i] |= src[i];
+}
@@ -0,0 +1,82 @@
+/*
+	sim_coverage.h
+
+	Bitmap of the flash words executed by the firmware.
+
+ 	This file is part of simavr.
+
+	simavr is free software: you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation, either version 3 of the License, or
+	(at your option) any later version.
+
+	simavr is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+
+	You should have received a copy of the GNU General Public License
+	along with simavr.  If not, see <http://www.gnu.org/licenses/>.
+ */
+
+#ifndef __SIM_COVERAGE_H__
+#define __SIM_COVERAGE_H__
+
+#include "sim_avr.h"
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+/*
+ * The coverage is a bitmap found in avr->coverage, with one bit per flash
+ * word (least significant bit first): the core sets the bit of the word
+ * each instruction starts at. Unlike the profiler, it costs a single OR
+ * per instruction, so it can stay on for long runs.
+ *
+ * Bitmaps of several runs of the same firmware can be merged with
+ * avr_coverage_merge().
+ */
+
+// size in bytes of the coverage bitmap of the given AVR
+static inline uint32_t
+avr_coverage_size(
+		avr_t * avr)
+{
+	return ((avr->flashend + 2) / 2 + 7) / 8;
+}
+
+// enables the coverage, bits are kept if it already is.
+// Returns 0, or -1 if the bitmap could not be allocated
+int
+avr_coverage_enable(
+		avr_t * avr);
+
+// stops the coverage and frees the bitmap
+void
+avr_coverage_disable(
+		avr_t * avr);
+
+// clears the bitmap
+void
+avr_coverage_clear(
+		avr_t * avr);
+
+// number of bits set in the 'size' bytes of 'bitmap'
+uint32_t
+avr_coverage_count(
+		const uint8_t * bitmap,
+		uint32_t size);
+
+// ORs the 'size' bytes of 'src' into 'dst'
+void
+avr_coverage_merge(
+		uint8_t * dst,
+		const uint8_t * src,
+		uint32_t size);
+
+#ifdef __cplusplus
+};
+#endif
+
+#endif /* __SIM_COVERAGE_H__ */
@@ -25,44 +25,211 @@
 #include "sim_avr.h"
 #include "sim_time.h"
 #include "sim_cycle_timers.h"
+#include "sim_stats.h"
 
-#define QUEUE(__q, __e) { \
-		(__e)->next = (__q); \
-		(__q) = __e; \
+#define DEFAULT_SLEEP_CYCLES 1000
+
+// initial number of slots, doubles when full
+#define CYCLE_TIMER_SLOTS 64
+
+static inline uint32_t
+avr_cycle_timer_hash(
+		avr_cycle_timer_pool_t * pool,
+		avr_cycle_timer_t timer,
+		void * param)
+{
+	uint64_t h = ((uintptr_t)timer ^ ((uintptr_t)param * 0x9e3779b97f4a7c15ull)) * 0xff51afd7ed558ccdull;
+	return (h >> 32) & (pool->index_size - 1);
+}
+
+// bucket of the index holding the heap position 'pos' of that timer
+static uint32_t
+avr_cycle_timer_index_find(
+		avr_cycle_timer_pool_t * pool,
+		avr_cycle_timer_slot_p t,
+		uint32_t pos)
+{
+	uint32_t b = avr_cycle_timer_hash(pool, t->timer, t->param);
+	while (pool->index[b] != pos + 1)
+		b = (b + 1) & (pool->index_size - 1);
+	return b;
+}
+
+static void
+avr_cycle_timer_index_add(
+		avr_cycle_timer_pool_t * pool,
+		avr_cycle_timer_slot_p t,
+		uint32_t pos)
+{
+	uint32_t b = avr_cycle_timer_hash(pool, t->timer, t->param);
+	while (pool->index[b])
+		b = (b + 1) & (pool->index_size - 1);
+	pool->index[b] = pos + 1;
+}
+
+// linear probing removal, later entries are moved back into the hole
+static void
+avr_cycle_timer_index_remove(
+		avr_cycle_timer_pool_t * pool,
+		uint32_t b)
+{
+	uint32_t mask = pool->index_size - 1;
+	uint32_t hole = b;
+
+	pool->index[hole] = 0;
+	for (b = (b + 1) & mask; pool->index[b]; b = (b + 1) & mask) {
+		avr_cycle_timer_slot_p t = &pool->timer[pool->index[b] - 1];
+		uint32_t home = avr_cycle_timer_hash(pool, t->timer, t->param);
+		// move it if its home is not between the hole and where it is
+		if (((b - home) & mask) >= ((b - hole) & mask)) {
+			pool->index[hole] = pool->index[b];
+			pool->index[b] = 0;
+			hole = b;
+		}
+	}
+}
+
+static void
+avr_cycle_timer_index_rebuild(
+		avr_cycle_timer_pool_t * pool)
+{
+	memset(pool->index, 0, pool->index_size * sizeof(pool->index[0]));
+	for (uint32_t i = 0; i < pool->count; i++)
+		avr_cycle_timer_index_add(pool, &pool->timer[i], i);
+}
+
+// heap position of that timer, or -1
+static int
+avr_cycle_timer_lookup(
+		avr_cycle_timer_pool_t * pool,
+		avr_cycle_timer_t timer,
+		void * param)
+{
+	if (!pool->count)
+		return -1;
+	for (uint32_t b = avr_cycle_timer_hash(pool, timer, param); pool->index[b];
+			b = (b + 1) & (pool->index_size - 1)) {
+		avr_cycle_timer_slot_p t = &pool->timer[pool->index[b] - 1];
+		if (t->timer == timer && t->param == param)
+			return pool->index[b] - 1;
 	}
-#define DETACH(__q, __l, __e) { \
-		if (__l) \
-			(__l)->next = (__e)->next; \
-		else \
-			(__q) = (__e)->next; \
+	return -1;
+}
+
+static inline int
+avr_cycle_timer_before(
+		avr_cycle_timer_slot_p a,
+		avr_cycle_timer_slot_p b)
+{
+	return a->when < b->when || (a->when == b->when && a->order < b->order);
+}
+
+// moves the timer at heap position 'from' to 'to', updating the index
+static inline void
+avr_cycle_timer_move(
+		avr_cycle_timer_pool_t * pool,
+		uint32_t from,
+		uint32_t to)
+{
+	pool->index[avr_cycle_timer_index_find(pool, &pool->timer[from], from)] = to + 1;
+	pool->timer[to] = pool->timer[from];
+}
+
+/*
+ * Puts the timer 't' at its place in the heap, starting from the hole at
+ * 'pos', and returns that place. The index entry of 't' is not updated.
+ */
+static uint32_t
+avr_cycle_timer_sift(
+		avr_cycle_timer_pool_t * pool,
+		uint32_t pos,
+		avr_cycle_timer_slot_p t)
+{
+	while (pos > 0) {
+		uint32_t parent = (pos - 1) / 2;
+		if (!avr_cycle_timer_before(t, &pool->timer[parent]))
+			break;
+		avr_cycle_timer_move(pool, parent, pos);
+		pos = parent;
 	}
-#define INSERT(__q, __l, __e) { \
-		if (__l) { \
-			(__e)->next = (__l)->next; \
-			(__l)->next = (__e); \
-		} else { \
-			(__e)->next = (__q); \
-			(__q) = (__e); \
-		} \
+	for (;;) {
+		uint32_t child = 2 * pos + 1;
+		if (child >= pool->count)
+			break;
+		if (child + 1 < pool->count &&
+				avr_cycle_timer_before(&pool->timer[child + 1], &pool->timer[child]))
+			child++;
+		if (!avr_cycle_timer_before(&pool->timer[child], t))
+			break;
+		avr_cycle_timer_move(pool, child, pos);
+		pos = child;
 	}
+	pool->timer[pos] = *t;
+	return pos;
+}
 
-#define DEFAULT_SLEEP_CYCLES 1000
+static int
+avr_cycle_timer_grow(
+		avr_t * avr)
+{
+	avr_cycle_timer_pool_t * pool = &avr->cycle_timers;
+	uint32_t size = pool->size ? pool->size * 2 : CYCLE_TIMER_SLOTS;
+	avr_cycle_timer_slot_p timer = realloc(pool->timer, size * sizeof(*timer));
+	uint32_t * index = timer ? malloc(2 * size * sizeof(*index)) : NULL;
+
+	if (!index) {
+		if (timer)
+			pool->timer = timer;
+		AVR_LOG(avr, LOG_ERROR, "CYCLE: %s: ran out of memory for %d timers!\n", __func__, size);
+		return -1;
+	}
+	free(pool->index);
+	pool->timer = timer;
+	pool->size = size;
+	pool->index = index;
+	pool->index_size = 2 * size;
+	avr_cycle_timer_index_rebuild(pool);
+	return 0;
+}
+
+// removes the timer at heap position 'pos'
+static void
+avr_cycle_timer_remove(
+		avr_cycle_timer_pool_t * pool,
+		uint32_t pos)
+{
+	avr_cycle_timer_index_remove(pool,
+			avr_cycle_timer_index_find(pool, &pool->timer[pos], pos));
+	if (pos == --pool->count)
+		return;
+	avr_cycle_timer_slot_t last = pool->timer[pool->count];
+	uint32_t b = avr_cycle_timer_index_find(pool, &last, pool->count);
+	pool->index[b] = avr_cycle_timer_sift(pool, pos, &last) + 1;
+}
 
 void
 avr_cycle_timer_reset(
 		struct avr_t * avr)
 {
 	avr_cycle_timer_pool_t * pool = &avr->cycle_timers;
-	memset(pool, 0, sizeof(*pool));
-	// queue all slots into the free queue
-	for (int i = 0; i < MAX_CYCLE_TIMERS; i++) {
-		avr_cycle_timer_slot_p t = &pool->timer_slots[i];
-		QUEUE(pool->timer_free, t);
-	}
+	pool->count = 0;
+	pool->order = 0;
+	if (pool->index)
+		memset(pool->index, 0, pool->index_size * sizeof(pool->index[0]));
 	avr->run_cycle_count = 1;
 	avr->run_cycle_limit = 1;
 }
 
+void
+avr_cycle_timer_dealloc(
+		struct avr_t * avr)
+{
+	avr_cycle_timer_pool_t * pool = &avr->cycle_timers;
+	free(pool->timer);
+	free(pool->index);
+	memset(pool, 0, sizeof(*pool));
+}
+
 static avr_cycle_count_t
 avr_cycle_timer_return_sleep_run_cycles_limited(
 	avr_t *avr,
@@ -85,9 +252,9 @@ avr_cycle_timer_reset_sleep_run_cycles_limited(
 	avr_cycle_timer_pool_t * pool = &avr->cycle_timers;
 	avr_cycle_count_t sleep_cycle_count = DEFAULT_SLEEP_CYCLES;
 
-	if(pool->timer) {
-		if(pool->timer->when > avr->cycle) {
-			sleep_cycle_count = pool->timer->when - avr->cycle;
+	if(pool->count) {
+		if(pool->timer[0].when > avr->cycle) {
+			sleep_cycle_count = pool->timer[0].when - avr->cycle;
 		} else {
 			sleep_cycle_count = 0;
 		}
@@ -106,30 +273,17 @@ avr_cycle_timer_insert(
 {
 	avr_cycle_timer_pool_t * pool = &avr->cycle_timers;
 
-	when += avr->cycle;
-
-	avr_cycle_timer_slot_p t = pool->timer_free;
-
-	if (!t) {
-		AVR_LOG(avr, LOG_ERROR, "CYCLE: %s: ran out of timers (%d)!\n", __func__, MAX_CYCLE_TIMERS);
+	if (pool->count == pool->size && avr_cycle_timer_grow(avr))
 		return;
-	}
-	// detach head
-	pool->timer_free = t->next;
-	t->next = NULL;
-	t->timer = timer;
-	t->param = param;
-	t->when = when;
-
-	// find its place in the list
-	avr_cycle_timer_slot_p loop = pool->timer, last = NULL;
-	while (loop) {
-		if (loop->when > when)
-			break;
-		last = loop;
-		loop = loop->next;
-	}
-	INSERT(pool->timer, last, t);
+
+	avr_cycle_timer_slot_t t = {
+		.when = when + avr->cycle,
+		.timer = timer,
+		.param = param,
+		.order = pool->order++,
+	};
+	uint32_t pos = pool->count++;
+	avr_cycle_timer_index_add(pool, &t, avr_cycle_timer_sift(pool, pos, &t));
 }
 
 void
@@ -142,12 +296,10 @@ avr_cycle_timer_register(
 	avr_cycle_timer_pool_t * pool = &avr->cycle_timers;
 
 	// remove it if it was already scheduled
-	avr_cycle_timer_cancel(avr, timer, param);
+	int pos = avr_cycle_timer_lookup(pool, timer, param);
+	if (pos >= 0)
+		avr_cycle_timer_remove(pool, pos);
 
-	if (!pool->timer_free) {
-		AVR_LOG(avr, LOG_ERROR, "CYCLE: %s: pool is full (%d)!\n", __func__, MAX_CYCLE_TIMERS);
-		return;
-	}
 	avr_cycle_timer_insert(avr, when, timer, param);
 	avr_cycle_timer_reset_sleep_run_cycles_limited(avr);
 }
@@ -170,17 +322,9 @@ avr_cycle_timer_cancel(
 {
 	avr_cycle_timer_pool_t * pool = &avr->cycle_timers;
 
-	// find its place in the list
-	avr_cycle_timer_slot_p t = pool->timer, last = NULL;
-	while (t) {
-		if (t->timer == timer && t->param == param) {
-			DETACH(pool->timer, last, t);
-			QUEUE(pool->timer_free, t);
-			break;
-		}
-		last = t;
-		t = t->next;
-	}
+	int pos = avr_cycle_timer_lookup(pool, timer, param);
+	if (pos >= 0)
+		avr_cycle_timer_remove(pool, pos);
 	avr_cycle_timer_reset_sleep_run_cycles_limited(avr);
 }
 
@@ -196,17 +340,40 @@ avr_cycle_timer_status(
 {
 	avr_cycle_timer_pool_t * pool = &avr->cycle_timers;
 
-	// find its place in the list
-	avr_cycle_timer_slot_p t = pool->timer;
-	while (t) {
-		if (t->timer == timer && t->param == param) {
-			return 1 + (t->when - avr->cycle);
-		}
-		t = t->next;
-	}
+	int pos = avr_cycle_timer_lookup(pool, timer, param);
+	if (pos >= 0)
+		return 1 + (pool->timer[pos].when - avr->cycle);
 	return 0;
 }
 
+static int
+avr_cycle_timer_compare(
+		const void * a,
+		const void * b)
+{
+	return avr_cycle_timer_before((avr_cycle_timer_slot_p)a, (avr_cycle_timer_slot_p)b) ? -1 : 1;
+}
+
+void
+avr_cycle_timer_foreach(
+		avr_t * avr,
+		void (*callback)(struct avr_t * avr, avr_cycle_timer_slot_p slot, void * param),
+		void * param)
+{
+	avr_cycle_timer_pool_t * pool = &avr->cycle_timers;
+
+	if (!pool->count)
+		return;
+	avr_cycle_timer_slot_p sorted = malloc(pool->count * sizeof(*sorted));
+	memcpy(sorted, pool->timer, pool->count * sizeof(*sorted));
+	qsort(sorted, pool->count, sizeof(*sorted), avr_cycle_timer_compare);
+
+	uint32_t count = pool->count;
+	for (uint32_t i = 0; i < count; i++)
+		callback(avr, &sorted[i], param);
+	free(sorted);
+}
+
 /*
  * run through all the timers, call the ones that needs it,
  * clear the ones that wants it, and calculate the next
@@ -218,29 +385,27 @@ avr_cycle_timer_process(
 {
 	avr_cycle_timer_pool_t * pool = &avr->cycle_timers;
 
-	if (pool->timer) do {
-		avr_cycle_timer_slot_p t = pool->timer;
-		avr_cycle_count_t when = t->when;
+	while (pool->count) {
+		avr_cycle_timer_slot_t t = pool->timer[0];
+		avr_cycle_count_t when = t.when;
 
 		if (when > avr->cycle)
 			return avr_cycle_timer_return_sleep_run_cycles_limited(avr, when - avr->cycle);
 
 		// detach from active timers
-		pool->timer = t->next;
-		t->next = NULL;
+		avr_cycle_timer_remove(pool, 0);
 		do {
-			avr_cycle_count_t w = t->timer(avr, when, t->param);
+			if (unlikely(avr->stats))
+				avr_stats_timer_fire(avr, t.timer, t.param);
+			avr_cycle_count_t w = t.timer(avr, when, t.param);
 			// make sure the return value is either zero, or greater
 			// than the last one to prevent infinite loop here
 			when = w > when ? w : 0;
 		} while (when && when <= avr->cycle);
-		
+
 		if (when) // reschedule then
-			avr_cycle_timer_insert(avr, when - avr->cycle, t->timer, t->param);
-		
-		// requeue this one into the free ones
-		QUEUE(pool->timer_free, t);
-	} while (pool->timer);
+			avr_cycle_timer_insert(avr, when - avr->cycle, t.timer, t.param);
+	}
 
 	// original behavior was to return 1000 cycles when no timers were present...
 	// run_cycles are bound to at least one cycle but no more than requested limit...
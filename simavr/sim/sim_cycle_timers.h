@@ -24,9 +24,10 @@
  * these timers are one shots, then get cleared if the timer function returns zero,
  * they get reset if the callback function returns a new cycle number
  *
- * the implementation maintains a list of 'pending' timers, sorted by when they
- * should run, it allows very quick comparison with the next timer to run, and
- * quick removal of then from the pile once dispatched.
+ * the implementation maintains a binary heap of 'pending' timers, ordered by when
+ * they should run, it allows very quick comparison with the next timer to run, and
+ * registering/removing timers in O(log n). Timers are found by their callback and
+ * parameter through a hash index, and the pool grows as needed.
  */
 #ifndef __SIM_CYCLE_TIMERS_H___
 #define __SIM_CYCLE_TIMERS_H___
@@ -37,8 +38,6 @@
 extern "C" {
 #endif
 
-#define MAX_CYCLE_TIMERS	64
-
 typedef avr_cycle_count_t (*avr_cycle_timer_t)(
 		struct avr_t * avr,
 		avr_cycle_count_t when,
@@ -55,22 +54,24 @@ typedef avr_cycle_count_t (*avr_cycle_timer_t)(
  * repeteadly until it 'caches up'.
  */
 typedef struct avr_cycle_timer_slot_t {
-	struct avr_cycle_timer_slot_t *next;
 	avr_cycle_count_t	when;
 	avr_cycle_timer_t	timer;
 	void * param;
+	uint64_t			order;	// registration order, for timers due on the same cycle
 } avr_cycle_timer_slot_t, *avr_cycle_timer_slot_p;
 
 /*
- * Timer pool contains a pool of timer slots available, they all
- * start queued into the 'free' qeueue, are migrated to the
- * 'active' queue when needed and are re-queued to the free one
- * when done
+ * Timer pool contains the pending timers as a binary heap, the first
+ * one is the next to run. The index is an open addressing hash table
+ * of the heap positions (+1, 0 is free) hashed by timer and param
  */
 typedef struct avr_cycle_timer_pool_t {
-	avr_cycle_timer_slot_t timer_slots[MAX_CYCLE_TIMERS];
-	avr_cycle_timer_slot_p timer_free;
 	avr_cycle_timer_slot_p timer;
+	uint32_t	count;			// pending timers
+	uint32_t	size;			// allocated slots
+	uint32_t *	index;
+	uint32_t	index_size;		// power of two, at least twice the slots
+	uint64_t	order;
 } avr_cycle_timer_pool_t, *avr_cycle_timer_pool_p;
 
 
@@ -104,6 +105,16 @@ avr_cycle_timer_status(
 		avr_cycle_timer_t timer,
 		void * param);
 
+/*
+ * Call 'callback' for each pending timer, in the order they will run.
+ * Timers must not be registered or cancelled by the callback
+ */
+void
+avr_cycle_timer_foreach(
+		struct avr_t * avr,
+		void (*callback)(struct avr_t * avr, avr_cycle_timer_slot_p slot, void * param),
+		void * param);
+
 //
 // Private, called from the core
 //
@@ -113,6 +124,9 @@ avr_cycle_timer_process(
 void
 avr_cycle_timer_reset(
 		struct avr_t * avr);
+void
+avr_cycle_timer_dealloc(
+		struct avr_t * avr);
 
 #ifdef __cplusplus
 };
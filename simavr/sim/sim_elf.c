@@ -446,3 +446,22 @@ elf_read_firmware(
 	return 0;
 }
 
+void
+elf_free_firmware(
+	elf_firmware_t * firmware)
+{
+	if (firmware->flash) free(firmware->flash);
+	if (firmware->eeprom) free(firmware->eeprom);
+	if (firmware->fuse) free(firmware->fuse);
+	if (firmware->lockbits) free(firmware->lockbits);
+	firmware->flash = firmware->eeprom = NULL;
+	firmware->fuse = firmware->lockbits = NULL;
+	firmware->flashsize = firmware->eesize = firmware->fusesize = 0;
+#if ELF_SYMBOLS
+	for (int i = 0; i < firmware->symbolcount; i++)
+		free(firmware->symbol[i]);
+	if (firmware->symbol) free(firmware->symbol);
+	firmware->symbol = NULL;
+	firmware->symbolcount = 0;
+#endif
+}
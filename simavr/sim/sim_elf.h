@@ -86,6 +86,13 @@ int
 elf_read_firmware(
 	const char * file,
 	elf_firmware_t * firmware);
+/*
+ * Frees the images and symbols allocated by elf_read_firmware(). The avrs
+ * the firmware was loaded into must not use its symbols anymore.
+ */
+void
+elf_free_firmware(
+	elf_firmware_t * firmware);
 
 void
 avr_load_firmware(
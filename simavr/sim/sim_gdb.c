@@ -409,6 +409,7 @@ gdb_handle_command(
 			}
 			if (addr < 0xffff) {
 				read_hex_string(start + 1, avr->flash + addr, strlen(start+1));
+				avr_predecode_invalidate(avr, addr, len);
 				gdb_send_reply(g, "OK");
 			} else if (addr >= 0x800000 && (addr - 0x800000) <= avr->ramend) {
 				read_hex_string(start + 1, avr->data + addr - 0x800000, strlen(start+1));
@@ -56,6 +56,9 @@ typedef struct avr_io_t {
 
 	// optional, a function to free up allocated system resources
 	void (*dealloc)(struct avr_io_t *io);
+	// optional, the cycle timer callbacks of the module, NULL terminated.
+	// A snapshot restores the timers of the module by their index in there
+	const avr_cycle_timer_t * timers;
 } avr_io_t;
 
 /*
@@ -34,12 +34,29 @@ typedef struct avr_irq_hook_t {
 	void * param;				// "notify" parameter
 } avr_irq_hook_t;
 
+void
+avr_irq_pool_lock(
+		avr_irq_pool_t * pool)
+{
+	while (__atomic_test_and_set(&pool->lock, __ATOMIC_ACQUIRE))
+		;
+}
+
+void
+avr_irq_pool_unlock(
+		avr_irq_pool_t * pool)
+{
+	__atomic_clear(&pool->lock, __ATOMIC_RELEASE);
+}
+
 static void
 _avr_irq_pool_add(
 		avr_irq_pool_t * pool,
 		avr_irq_t * irq)
 {
 	int insert = 0;
+
+	avr_irq_pool_lock(pool);
 	/* lookup a slot */
 	for (; insert < pool->count && pool->irq[insert]; insert++)
 		;
@@ -52,6 +69,7 @@ _avr_irq_pool_add(
 	}
 	pool->irq[insert] = irq;
 	irq->pool = pool;
+	avr_irq_pool_unlock(pool);
 }
 
 static void
@@ -59,11 +77,13 @@ _avr_irq_pool_remove(
 		avr_irq_pool_t * pool,
 		avr_irq_t * irq)
 {
+	avr_irq_pool_lock(pool);
 	for (int i = 0; i < pool->count; i++)
 		if (pool->irq[i] == irq) {
 			pool->irq[i] = 0;
-			return;
+			break;
 		}
+	avr_irq_pool_unlock(pool);
 }
 
 void
@@ -79,13 +99,14 @@ avr_init_irq(
 	for (int i = 0; i < count; i++) {
 		irq[i].irq = base + i;
 		irq[i].flags = IRQ_FLAG_INIT;
-		if (pool)
-			_avr_irq_pool_add(pool, &irq[i]);
 		if (names && names[i])
 			irq[i].name = strdup(names[i]);
 		else {
 			printf("WARNING %s() with NULL name for irq %d.\n", __func__, irq[i].irq);
 		}
+		// named first, for the readers of the pool
+		if (pool)
+			_avr_irq_pool_add(pool, &irq[i]);
 	}
 }
 
@@ -196,6 +217,9 @@ avr_raise_irq_float(
 {
 	if (!irq)
 		return ;
+	int stats = irq->pool && irq->pool->stats;
+	if (stats)
+		irq->raised++;
 	uint32_t output = (irq->flags & IRQ_FLAG_NOT) ? !value : value;
 	// if value is the same but it's the first time, raise it anyway
 	if (irq->value == output &&
@@ -210,6 +234,8 @@ avr_raise_irq_float(
 			// prevents reentrance / endless calling loops
 		if (hook->busy == 0) {
 			hook->busy++;
+			if (stats)
+				irq->hooked++;
 			if (hook->notify)
 				hook->notify(irq, output,  hook->param);
 			if (hook->chain)
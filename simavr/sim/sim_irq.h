@@ -66,6 +66,8 @@ enum {
 typedef struct avr_irq_pool_t {
 	int count;						//!< number of irqs living in the pool
 	struct avr_irq_t ** irq;		//!< irqs belonging in this pool
+	int stats;						//!< count raises and hooks of the irqs, see avr_stats_enable()
+	char lock;						//!< taken while irqs are added or removed, see avr_irq_pool_lock()
 } avr_irq_pool_t;
 
 /*!
@@ -78,6 +80,8 @@ typedef struct avr_irq_t {
 	uint32_t			value;		//!< current value
 	uint8_t				flags;		//!< IRQ_* flags
 	struct avr_irq_hook_t * hook;	//!< list of hooks to be notified
+	uint64_t			raised;		//!< raises, counted when the pool has 'stats'
+	uint64_t			hooked;		//!< hooks called, counted when the pool has 'stats'
 } avr_irq_t;
 
 //! allocates 'count' IRQs, initializes their "irq" starting from 'base' and increment
@@ -100,6 +104,18 @@ avr_init_irq(
 		uint32_t base,
 		uint32_t count,
 		const char ** names /* optional */);
+/*!
+ * The pool is changed by the thread running the AVR, ie when IRQs are
+ * allocated by a callback. Another thread walking it (ie to read the stats)
+ * holds this lock, which is only taken around these changes.
+ */
+void
+avr_irq_pool_lock(
+		avr_irq_pool_t * pool);
+void
+avr_irq_pool_unlock(
+		avr_irq_pool_t * pool);
+
 //! Returns the current IRQ flags
 uint8_t
 avr_irq_get_flags(
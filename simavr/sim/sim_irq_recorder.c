@@ -0,0 +1,149 @@
+/*
+	sim_irq_recorder.c
+
+	Records IRQ value changes into a preallocated ring buffer, so they
+	can be processed in batches instead of one callback per change.
+
+ 	This file is part of simavr.
+
+	simavr is free software: you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation, either version 3 of the License, or
+	(at your option) any later version.
+
+	simavr is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+
+	You should have received a copy of the GNU General Public License
+	along with simavr.  If not, see <http://www.gnu.org/licenses/>.
+ */
+
+#include <stdio.h>
+#include <string.h>
+#include <stdlib.h>
+#include "sim_irq_recorder.h"
+#include "sim_avr.h"
+
+int
+avr_irq_recorder_init(
+		struct avr_t * avr,
+		avr_irq_recorder_t * recorder,
+		uint32_t size )
+{
+	memset(recorder, 0, sizeof(avr_irq_recorder_t));
+	recorder->avr = avr;
+
+	recorder->size = 1;
+	while (recorder->size < size && recorder->size < 0x80000000)
+		recorder->size <<= 1;
+
+	recorder->record = malloc(recorder->size * sizeof(avr_irq_record_t));
+	if (!recorder->record) {
+		AVR_LOG(avr, LOG_ERROR,
+				"%s: unable to allocate %u records\n",
+				__FUNCTION__, recorder->size);
+		recorder->size = 0;
+		return -1;
+	}
+	return 0;
+}
+
+void
+avr_irq_recorder_close(
+		avr_irq_recorder_t * recorder )
+{
+	/* dispose of any link and hooks */
+	for (int i = 0; i < recorder->signal_count; i++) {
+		avr_unconnect_irq(recorder->source[i], &recorder->signal[i]);
+		avr_free_irq(&recorder->signal[i], 1);
+	}
+	recorder->signal_count = 0;
+
+	if (recorder->record)
+		free(recorder->record);
+	recorder->record = NULL;
+	recorder->size = 0;
+	recorder->read = recorder->write = 0;
+}
+
+static void
+_avr_irq_recorder_notify(
+		struct avr_irq_t * irq,
+		uint32_t value,
+		void * param)
+{
+	avr_irq_recorder_t * recorder = (avr_irq_recorder_t *)param;
+
+	if (recorder->write - recorder->read >= recorder->size) {
+		recorder->overflow++;
+		return;
+	}
+	avr_irq_record_t * r =
+			&recorder->record[recorder->write & (recorder->size - 1)];
+	r->when = recorder->avr->cycle;
+	r->index = irq->irq;
+	r->value = value;
+	recorder->write++;
+}
+
+int
+avr_irq_recorder_add_signal(
+		avr_irq_recorder_t * recorder,
+		avr_irq_t * signal_irq,
+		const char * name )
+{
+	if (recorder->signal_count == AVR_IRQ_RECORDER_MAX_SIGNALS) {
+		AVR_LOG(recorder->avr, LOG_ERROR,
+			" %s: unable add signal '%s'\n",
+			__FUNCTION__, name);
+		return -1;
+	}
+	int index = recorder->signal_count++;
+	avr_irq_t * s = &recorder->signal[index];
+
+	/* manufacture a nice IRQ name */
+	int l = strlen(name);
+	char iname[10 + l + 1];
+	sprintf(iname, ">rec.%s", name);
+
+	const char * names[1] = { iname };
+	avr_init_irq(&recorder->avr->irq_pool, s, index, 1, names);
+	avr_irq_register_notify(s, _avr_irq_recorder_notify, recorder);
+
+	recorder->source[index] = signal_irq;
+	avr_connect_irq(signal_irq, s);
+	return index;
+}
+
+uint32_t
+avr_irq_recorder_get_count(
+		avr_irq_recorder_t * recorder )
+{
+	return recorder->write - recorder->read;
+}
+
+uint32_t
+avr_irq_recorder_peek(
+		avr_irq_recorder_t * recorder,
+		avr_irq_record_t ** records )
+{
+	uint32_t count = recorder->write - recorder->read;
+	uint32_t start = recorder->read & (recorder->size - 1);
+
+	if (count > recorder->size - start)
+		count = recorder->size - start;
+	*records = count ? &recorder->record[start] : NULL;
+	return count;
+}
+
+void
+avr_irq_recorder_consume(
+		avr_irq_recorder_t * recorder,
+		uint32_t count )
+{
+	uint32_t available = recorder->write - recorder->read;
+
+	recorder->read += count > available ? available : count;
+}
@@ -0,0 +1,109 @@
+/*
+	sim_irq_recorder.h
+
+	Records IRQ value changes into a preallocated ring buffer, so they
+	can be processed in batches instead of one callback per change.
+
+ 	This file is part of simavr.
+
+	simavr is free software: you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation, either version 3 of the License, or
+	(at your option) any later version.
+
+	simavr is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+
+	You should have received a copy of the GNU General Public License
+	along with simavr.  If not, see <http://www.gnu.org/licenses/>.
+ */
+
+#ifndef __SIM_IRQ_RECORDER_H__
+#define __SIM_IRQ_RECORDER_H__
+
+#include "sim_irq.h"
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+/*
+ * IRQ recorder module for simavr.
+ *
+ * Like the VCD module, the recorder connects one of its own IRQs to each
+ * "source" IRQ, but instead of formatting the changes it appends a
+ * fixed size record (cycle, signal index, value) to a ring buffer that
+ * is allocated once at init time. Nothing is allocated and no callback
+ * is made per change.
+ *
+ * The reader gets direct access to the records with avr_irq_recorder_peek()
+ * and releases them with avr_irq_recorder_consume(). When the buffer is
+ * full, new records are dropped and counted in 'overflow'.
+ */
+
+#define AVR_IRQ_RECORDER_MAX_SIGNALS 64
+
+typedef struct avr_irq_record_t {
+	uint64_t		when;		// cycle of the change
+	uint32_t		index;		// index of the signal in the recorder
+	uint32_t		value;		// new value of the signal
+} avr_irq_record_t, *avr_irq_record_p;
+
+typedef struct avr_irq_recorder_t {
+	struct avr_t *	avr;	// AVR we read the cycle from
+
+	int 			signal_count;
+	avr_irq_t		signal[AVR_IRQ_RECORDER_MAX_SIGNALS];
+	avr_irq_t *		source[AVR_IRQ_RECORDER_MAX_SIGNALS];	// IRQs we are connected to
+
+	avr_irq_record_t * record;	// ring buffer
+	uint32_t		size;		// number of records, power of two
+	uint32_t		read;		// free running read/write positions
+	uint32_t		write;
+	uint64_t		overflow;	// number of dropped records
+} avr_irq_recorder_t;
+
+// initializes a recorder able to hold 'size' records (rounded up to a power of two)
+int
+avr_irq_recorder_init(
+		struct avr_t * avr,
+		avr_irq_recorder_t * recorder,
+		uint32_t size );
+// disconnects the signals and frees the buffer
+void
+avr_irq_recorder_close(
+		avr_irq_recorder_t * recorder );
+
+// Starts recording the changes of the given IRQ, returns its signal index or -1
+int
+avr_irq_recorder_add_signal(
+		avr_irq_recorder_t * recorder,
+		avr_irq_t * signal_irq,
+		const char * name );
+
+// Returns the number of records waiting to be read
+uint32_t
+avr_irq_recorder_get_count(
+		avr_irq_recorder_t * recorder );
+/*
+ * Returns the number of records that can be read in one go from 'records'.
+ * The records stay valid until they are consumed; call again after
+ * avr_irq_recorder_consume() to get the ones that wrapped around.
+ */
+uint32_t
+avr_irq_recorder_peek(
+		avr_irq_recorder_t * recorder,
+		avr_irq_record_t ** records );
+// Releases 'count' records returned by avr_irq_recorder_peek()
+void
+avr_irq_recorder_consume(
+		avr_irq_recorder_t * recorder,
+		uint32_t count );
+
+#ifdef __cplusplus
+};
+#endif
+
+#endif /* __SIM_IRQ_RECORDER_H__ */
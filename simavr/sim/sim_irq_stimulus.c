@@ -0,0 +1,208 @@
+/*
+	sim_irq_stimulus.c
+
+	Raises IRQs at given cycles from a table of rows, so scripted inputs
+	don't need a timer per edge.
+
+ 	This file is part of simavr.
+
+	simavr is free software: you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation, either version 3 of the License, or
+	(at your option) any later version.
+
+	simavr is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+
+	You should have received a copy of the GNU General Public License
+	along with simavr.  If not, see <http://www.gnu.org/licenses/>.
+ */
+
+#include <stdio.h>
+#include <string.h>
+#include <stdlib.h>
+#include "sim_irq_stimulus.h"
+#include "sim_avr.h"
+#include "sim_cycle_timers.h"
+
+int
+avr_irq_stimulus_init(
+		struct avr_t * avr,
+		avr_irq_stimulus_t * stimulus,
+		uint32_t size )
+{
+	memset(stimulus, 0, sizeof(avr_irq_stimulus_t));
+	stimulus->avr = avr;
+
+	stimulus->size = 1;
+	while (stimulus->size < size && stimulus->size < 0x80000000)
+		stimulus->size <<= 1;
+
+	stimulus->row = malloc(stimulus->size * sizeof(avr_irq_record_t));
+	if (!stimulus->row) {
+		AVR_LOG(avr, LOG_ERROR,
+				"%s: unable to allocate %u rows\n",
+				__FUNCTION__, stimulus->size);
+		stimulus->size = 0;
+		return -1;
+	}
+	return 0;
+}
+
+static avr_cycle_count_t
+_avr_irq_stimulus_timer(
+		struct avr_t * avr,
+		avr_cycle_count_t when,
+		void * param)
+{
+	avr_irq_stimulus_t * stimulus = (avr_irq_stimulus_t *)param;
+	avr_cycle_count_t next = 0;
+
+	// rows appended by the hooks are picked up here, not by a new timer
+	stimulus->playing = 1;
+	while (stimulus->read != stimulus->write) {
+		avr_irq_record_t r = stimulus->row[stimulus->read & (stimulus->size - 1)];
+		if (r.when > when) {
+			next = r.when;
+			break;
+		}
+		stimulus->read++;
+		stimulus->played++;
+		avr_raise_irq(&stimulus->signal[r.index], r.value);
+	}
+	stimulus->playing = 0;
+	return next;
+}
+
+void
+avr_irq_stimulus_close(
+		avr_irq_stimulus_t * stimulus )
+{
+	avr_irq_stimulus_clear(stimulus);
+
+	/* dispose of any link and hooks */
+	for (int i = 0; i < stimulus->signal_count; i++) {
+		avr_unconnect_irq(&stimulus->signal[i], stimulus->destination[i]);
+		avr_free_irq(&stimulus->signal[i], 1);
+	}
+	stimulus->signal_count = 0;
+
+	if (stimulus->row)
+		free(stimulus->row);
+	stimulus->row = NULL;
+	stimulus->size = 0;
+}
+
+int
+avr_irq_stimulus_add_signal(
+		avr_irq_stimulus_t * stimulus,
+		avr_irq_t * signal_irq,
+		const char * name )
+{
+	if (stimulus->signal_count == AVR_IRQ_STIMULUS_MAX_SIGNALS) {
+		AVR_LOG(stimulus->avr, LOG_ERROR,
+			" %s: unable add signal '%s'\n",
+			__FUNCTION__, name);
+		return -1;
+	}
+	int index = stimulus->signal_count++;
+	avr_irq_t * s = &stimulus->signal[index];
+
+	/* manufacture a nice IRQ name */
+	int l = strlen(name);
+	char iname[10 + l + 1];
+	sprintf(iname, "<stim.%s", name);
+
+	const char * names[1] = { iname };
+	avr_init_irq(&stimulus->avr->irq_pool, s, index, 1, names);
+
+	stimulus->destination[index] = signal_irq;
+	avr_connect_irq(s, signal_irq);
+	return index;
+}
+
+int
+avr_irq_stimulus_append(
+		avr_irq_stimulus_t * stimulus,
+		const avr_irq_record_t * rows,
+		uint32_t count,
+		avr_cycle_count_t base )
+{
+	if (!count)
+		return 0;
+	if (!stimulus->row)
+		return -1;
+
+	int empty = stimulus->read == stimulus->write;
+	avr_cycle_count_t last = empty ? 0 :
+			stimulus->row[(stimulus->write - 1) & (stimulus->size - 1)].when;
+	for (uint32_t i = 0; i < count; i++) {
+		avr_cycle_count_t when = rows[i].when + base;
+		if (rows[i].index >= (uint32_t)stimulus->signal_count ||
+				(when < last && (i || !empty))) {
+			AVR_LOG(stimulus->avr, LOG_ERROR,
+					"%s: row %u has an unknown signal or is out of order\n",
+					__FUNCTION__, i);
+			return -1;
+		}
+		last = when;
+	}
+
+	uint32_t used = stimulus->write - stimulus->read;
+	if (stimulus->size - used < count) {
+		uint32_t size = stimulus->size;
+		while (size - used < count) {
+			if (size >= 0x80000000)
+				return -1;
+			size <<= 1;
+		}
+		avr_irq_record_t * row = malloc(size * sizeof(avr_irq_record_t));
+		if (!row) {
+			AVR_LOG(stimulus->avr, LOG_ERROR,
+					"%s: unable to allocate %u rows\n",
+					__FUNCTION__, size);
+			return -1;
+		}
+		for (uint32_t i = 0; i < used; i++)
+			row[i] = stimulus->row[(stimulus->read + i) & (stimulus->size - 1)];
+		free(stimulus->row);
+		stimulus->row = row;
+		stimulus->size = size;
+		stimulus->read = 0;
+		stimulus->write = used;
+	}
+	for (uint32_t i = 0; i < count; i++) {
+		avr_irq_record_t * r =
+				&stimulus->row[(stimulus->write + i) & (stimulus->size - 1)];
+		*r = rows[i];
+		r->when += base;
+	}
+	stimulus->write += count;
+
+	// the timer is only pending when there are rows, start it for the first one
+	if (empty && !stimulus->playing) {
+		avr_t * avr = stimulus->avr;
+		avr_cycle_count_t when = rows[0].when + base;
+		avr_cycle_timer_register(avr, when > avr->cycle ? when - avr->cycle : 0,
+				_avr_irq_stimulus_timer, stimulus);
+	}
+	return 0;
+}
+
+uint32_t
+avr_irq_stimulus_get_count(
+		avr_irq_stimulus_t * stimulus )
+{
+	return stimulus->write - stimulus->read;
+}
+
+void
+avr_irq_stimulus_clear(
+		avr_irq_stimulus_t * stimulus )
+{
+	if (stimulus->avr)
+		avr_cycle_timer_cancel(stimulus->avr, _avr_irq_stimulus_timer, stimulus);
+	stimulus->read = stimulus->write = 0;
+}
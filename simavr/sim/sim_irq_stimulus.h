@@ -0,0 +1,108 @@
+/*
+	sim_irq_stimulus.h
+
+	Raises IRQs at given cycles from a table of rows, so scripted inputs
+	don't need a timer per edge.
+
+ 	This file is part of simavr.
+
+	simavr is free software: you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation, either version 3 of the License, or
+	(at your option) any later version.
+
+	simavr is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+
+	You should have received a copy of the GNU General Public License
+	along with simavr.  If not, see <http://www.gnu.org/licenses/>.
+ */
+
+#ifndef __SIM_IRQ_STIMULUS_H__
+#define __SIM_IRQ_STIMULUS_H__
+
+#include "sim_irq.h"
+#include "sim_avr_types.h"
+#include "sim_irq_recorder.h"
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+/*
+ * IRQ stimulus module for simavr.
+ *
+ * This is the reverse of the IRQ recorder: one of its own IRQs is
+ * connected to each "destination" IRQ, and rows of (cycle, signal index,
+ * value) are played from a queue by a single cycle timer, that fires at
+ * the cycle of the next row (like any timer, once the instruction running
+ * at that cycle is done). Rows use the recorder record layout, so a
+ * recording can be played back as is.
+ *
+ * Rows must be appended in cycle order, and can be appended while the AVR
+ * runs; rows for cycles already past are played on the next timer run.
+ * The queue grows as needed.
+ */
+
+#define AVR_IRQ_STIMULUS_MAX_SIGNALS 64
+
+typedef struct avr_irq_stimulus_t {
+	struct avr_t *	avr;	// AVR we attach the timer to
+
+	int 			signal_count;
+	avr_irq_t		signal[AVR_IRQ_STIMULUS_MAX_SIGNALS];
+	avr_irq_t *		destination[AVR_IRQ_STIMULUS_MAX_SIGNALS];	// IRQs we are connected to
+
+	avr_irq_record_t * row;		// ring buffer
+	uint32_t		size;		// number of rows, power of two
+	uint32_t		read;		// free running read/write positions
+	uint32_t		write;
+	uint64_t		played;		// number of rows played so far
+	int				playing;	// in the timer
+} avr_irq_stimulus_t;
+
+// initializes a stimulus with room for 'size' rows to start with
+int
+avr_irq_stimulus_init(
+		struct avr_t * avr,
+		avr_irq_stimulus_t * stimulus,
+		uint32_t size );
+// disconnects the signals, drops the rows and frees the buffer
+void
+avr_irq_stimulus_close(
+		avr_irq_stimulus_t * stimulus );
+
+// Connects a new signal to the given IRQ, returns its signal index or -1
+int
+avr_irq_stimulus_add_signal(
+		avr_irq_stimulus_t * stimulus,
+		avr_irq_t * signal_irq,
+		const char * name );
+
+/*
+ * Appends 'count' rows, their cycles offset by 'base'. Returns 0, or -1
+ * if a row has an unknown signal, is not in cycle order or the queue
+ * can't grow; none of the rows are appended then.
+ */
+int
+avr_irq_stimulus_append(
+		avr_irq_stimulus_t * stimulus,
+		const avr_irq_record_t * rows,
+		uint32_t count,
+		avr_cycle_count_t base );
+// Returns the number of rows waiting to be played
+uint32_t
+avr_irq_stimulus_get_count(
+		avr_irq_stimulus_t * stimulus );
+// Drops the rows waiting to be played
+void
+avr_irq_stimulus_clear(
+		avr_irq_stimulus_t * stimulus );
+
+#ifdef __cplusplus
+};
+#endif
+
+#endif /* __SIM_IRQ_STIMULUS_H__ */
@@ -0,0 +1,104 @@
+/*
+	sim_profile.c
+
+	Counts the cycles spent at each word of the flash, to find out where
+	the firmware spends its time.
+
+ 	This file is part of simavr.
+
+	simavr is free software: you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation, either version 3 of the License, or
+	(at your option) any later version.
+
+	simavr is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+
+	You should have received a copy of the GNU General Public License
+	along with simavr.  If not, see <http://www.gnu.org/licenses/>.
+ */
+
+#include <stdlib.h>
+#include <string.h>
+#include "sim_profile.h"
+#include "sim_cycle_timers.h"
+
+static inline uint32_t
+_avr_profile_size(
+		avr_t * avr)
+{
+	return (avr->flashend + 2) / 2;
+}
+
+static avr_cycle_count_t
+_avr_profile_sample(
+		avr_t * avr,
+		avr_cycle_count_t when,
+		void * param)
+{
+	// might be restored from a snapshot after the profiler was disabled
+	if (!avr->profile.count || !avr->profile.period)
+		return 0;
+	uint32_t word = avr->pc >> 1;
+	if (word < _avr_profile_size(avr)) {
+		avr->profile.cycles[word] += avr->profile.period;
+		avr->profile.count[word]++;
+	}
+	return when + avr->profile.period;
+}
+
+int
+avr_profile_enable(
+		avr_t * avr,
+		uint32_t period)
+{
+	if (!avr->profile.count) {
+		avr->profile.cycles = calloc(_avr_profile_size(avr), sizeof(uint64_t));
+		avr->profile.count = calloc(_avr_profile_size(avr), sizeof(uint64_t));
+		if (!avr->profile.cycles || !avr->profile.count) {
+			AVR_LOG(avr, LOG_ERROR, "PROFILE: %s: unable to allocate the counters\n",
+					__func__);
+			avr_profile_disable(avr);
+			return -1;
+		}
+	}
+	avr->profile.period = period;
+	if (period)
+		avr_cycle_timer_register(avr, period, _avr_profile_sample, NULL);
+	else
+		avr_cycle_timer_cancel(avr, _avr_profile_sample, NULL);
+	return 0;
+}
+
+void
+avr_profile_disable(
+		avr_t * avr)
+{
+	avr_cycle_timer_cancel(avr, _avr_profile_sample, NULL);
+	if (avr->profile.cycles)
+		free(avr->profile.cycles);
+	if (avr->profile.count)
+		free(avr->profile.count);
+	avr->profile.cycles = avr->profile.count = NULL;
+	avr->profile.period = 0;
+}
+
+void
+avr_profile_clear(
+		avr_t * avr)
+{
+	if (!avr->profile.count)
+		return;
+	memset(avr->profile.cycles, 0, _avr_profile_size(avr) * sizeof(uint64_t));
+	memset(avr->profile.count, 0, _avr_profile_size(avr) * sizeof(uint64_t));
+}
+
+void
+avr_profile_reset(
+		avr_t * avr)
+{
+	if (avr->profile.count && avr->profile.period)
+		avr_cycle_timer_register(avr, avr->profile.period, _avr_profile_sample, NULL);
+}
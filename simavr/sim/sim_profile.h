@@ -0,0 +1,70 @@
+/*
+	sim_profile.h
+
+	Counts the cycles spent at each word of the flash, to find out where
+	the firmware spends its time.
+
+ 	This file is part of simavr.
+
+	simavr is free software: you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation, either version 3 of the License, or
+	(at your option) any later version.
+
+	simavr is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+
+	You should have received a copy of the GNU General Public License
+	along with simavr.  If not, see <http://www.gnu.org/licenses/>.
+ */
+
+#ifndef __SIM_PROFILE_H__
+#define __SIM_PROFILE_H__
+
+#include "sim_avr.h"
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+/*
+ * The profile is made of two arrays with one entry per flash word, found
+ * in avr->profile: 'cycles' and 'count'.
+ *
+ * With a period of zero, the profile is exact: the core adds the cycles
+ * taken by every instruction to the word it starts at, and counts its
+ * executions.
+ * Otherwise the profile is sampled by a cycle timer every 'period' cycles,
+ * which adds 'period' cycles and one hit to the word at the current PC.
+ * This is cheaper for long runs, and counts the cycles spent sleeping.
+ */
+
+// enables (or changes the period of) the profiler, counters are kept.
+// Returns 0, or -1 if the counters could not be allocated
+int
+avr_profile_enable(
+		avr_t * avr,
+		uint32_t period);
+
+// stops profiling and frees the counters
+void
+avr_profile_disable(
+		avr_t * avr);
+
+// clears the counters
+void
+avr_profile_clear(
+		avr_t * avr);
+
+// re-arms the sampling timer, the cycle timers being cleared by avr_reset()
+void
+avr_profile_reset(
+		avr_t * avr);
+
+#ifdef __cplusplus
+};
+#endif
+
+#endif /* __SIM_PROFILE_H__ */
@@ -0,0 +1,612 @@
+/*
+	sim_snapshot.c
+
+	Saves the state of a running AVR, and restores it later into the same
+	instance or into a new instance of the same core.
+
+ 	This file is part of simavr.
+
+	simavr is free software: you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation, either version 3 of the License, or
+	(at your option) any later version.
+
+	simavr is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+
+	You should have received a copy of the GNU General Public License
+	along with simavr.  If not, see <http://www.gnu.org/licenses/>.
+ */
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include "sim_snapshot.h"
+#include "sim_core.h"
+#include "sim_cycle_timers.h"
+#include "sim_interrupts.h"
+#include "sim_io.h"
+#include "avr_eeprom.h"
+
+DEFINE_FIFO(avr_int_vector_p, avr_int_pending);
+
+/*
+ * Pointer masks tell which words of the IO modules hold a pointer, and
+ * what it points to. They are found by comparing two fresh instances of
+ * the core, and kept per core.
+ */
+enum {
+	AVR_SNAPSHOT_WORD_DATA = 0,		// copied as is
+	AVR_SNAPSHOT_WORD_STATIC,		// same in all instances, data or pointer to simavr
+	AVR_SNAPSHOT_WORD_CORE,			// pointer into the core block
+	AVR_SNAPSHOT_WORD_IRQ,			// pointer to an IRQ of the pool
+	AVR_SNAPSHOT_WORD_INSTANCE,		// pointer allocated by the instance
+};
+
+typedef struct avr_snapshot_mask_t {
+	struct avr_snapshot_mask_t * next;
+	const char *	mmcu;
+	uint32_t		count;		// in words
+	uint8_t			kind[0];	// AVR_SNAPSHOT_WORD_*
+} avr_snapshot_mask_t;
+
+static avr_snapshot_mask_t * _avr_snapshot_masks = NULL;
+
+// FNV-1a
+static uint64_t
+_avr_snapshot_hash(
+		uint64_t hash,
+		const void * data,
+		uint32_t size)
+{
+	const uint8_t * b = data;
+	for (uint32_t i = 0; i < size; i++)
+		hash = (hash ^ b[i]) * 0x100000001b3ull;
+	return hash;
+}
+
+// hashes where some code is, relative to this file, as its address moves
+static uint64_t
+_avr_snapshot_hash_code(
+		uint64_t hash,
+		uintptr_t code)
+{
+	int64_t offset = code ? (int64_t)(code - (uintptr_t)avr_snapshot_save) : 0;
+	return _avr_snapshot_hash(hash, &offset, sizeof(offset));
+}
+
+/*
+ * The layout of the code of simavr changes with its build: the offsets of
+ * the functions of the core and of its IO modules are hashed, with the
+ * time of the build.
+ */
+uint64_t
+avr_snapshot_build(
+		avr_t * avr )
+{
+	const char * built = __DATE__ " " __TIME__;
+	uint32_t sizes[] = { AVR_SNAPSHOT_VERSION, sizeof(avr_t), avr->core_size };
+	uint64_t hash = 0xcbf29ce484222325ull;
+
+	hash = _avr_snapshot_hash(hash, built, strlen(built));
+	hash = _avr_snapshot_hash(hash, sizes, sizeof(sizes));
+	hash = _avr_snapshot_hash_code(hash, (uintptr_t)avr->init);
+	hash = _avr_snapshot_hash_code(hash, (uintptr_t)avr->reset);
+	hash = _avr_snapshot_hash_code(hash, (uintptr_t)avr_run_one);
+	hash = _avr_snapshot_hash_code(hash, (uintptr_t)avr_cycle_timer_register);
+	hash = _avr_snapshot_hash_code(hash, (uintptr_t)avr_raise_interrupt);
+	hash = _avr_snapshot_hash_code(hash, (uintptr_t)avr_raise_irq);
+	for (avr_io_t * io = avr->io_port; io; io = io->next) {
+		hash = _avr_snapshot_hash_code(hash, (uintptr_t)io->reset);
+		hash = _avr_snapshot_hash_code(hash, (uintptr_t)io->ioctl);
+		hash = _avr_snapshot_hash_code(hash, (uintptr_t)io->dealloc);
+		for (int i = 0; io->timers && io->timers[i]; i++)
+			hash = _avr_snapshot_hash_code(hash, (uintptr_t)io->timers[i]);
+	}
+	return hash;
+}
+
+static inline uint8_t *
+_avr_snapshot_io(
+		avr_t * avr)
+{
+	return (uint8_t *)avr + sizeof(avr_t);
+}
+
+static inline uint32_t
+_avr_snapshot_io_size(
+		avr_t * avr)
+{
+	return avr->core_size > sizeof(avr_t) ? avr->core_size - sizeof(avr_t) : 0;
+}
+
+static uint8_t *
+_avr_snapshot_get_eeprom(
+		avr_t * avr,
+		uint32_t * size)
+{
+	avr_eeprom_desc_t desc = { .ee = NULL, .offset = 0, .size = 0 };
+
+	*size = 0;
+	if (!avr->e2end || avr_ioctl(avr, AVR_IOCTL_EEPROM_GET, &desc) < 0 || !desc.ee)
+		return NULL;
+	*size = avr->e2end + 1;
+	return desc.ee;
+}
+
+static const avr_snapshot_mask_t *
+_avr_snapshot_get_mask(
+		avr_t * avr)
+{
+	uint32_t count = _avr_snapshot_io_size(avr) / sizeof(uintptr_t);
+
+	for (avr_snapshot_mask_t * m = _avr_snapshot_masks; m; m = m->next)
+		if (!strcmp(m->mmcu, avr->mmcu) && m->count == count)
+			return m;
+
+	avr_t * fresh[2];
+	for (int i = 0; i < 2; i++) {
+		fresh[i] = avr_make_mcu_by_name(avr->mmcu);
+		if (!fresh[i] || fresh[i]->core_size != avr->core_size) {
+			AVR_LOG(avr, LOG_ERROR, "SNAPSHOT: %s: unable to make a '%s'\n",
+					__func__, avr->mmcu);
+			if (i && fresh[0]) {
+				avr_terminate(fresh[0]);
+				free(fresh[0]);
+			}
+			if (fresh[i])
+				free(fresh[i]);
+			return NULL;
+		}
+		avr_init(fresh[i]);
+	}
+	avr_snapshot_mask_t * m = calloc(1, sizeof(avr_snapshot_mask_t) + count);
+	m->mmcu = avr->mmcu;
+	m->count = count;
+
+	uintptr_t * w0 = (uintptr_t *)_avr_snapshot_io(fresh[0]);
+	uintptr_t * w1 = (uintptr_t *)_avr_snapshot_io(fresh[1]);
+	for (uint32_t i = 0; i < count; i++) {
+		uintptr_t o0 = w0[i] - (uintptr_t)fresh[0], o1 = w1[i] - (uintptr_t)fresh[1];
+
+		if (w0[i] && o0 < avr->core_size && o0 == o1) {
+			m->kind[i] = AVR_SNAPSHOT_WORD_CORE;
+			continue;
+		}
+		for (int j = 0; w0[i] && j < fresh[0]->irq_pool.count &&
+				j < fresh[1]->irq_pool.count; j++)
+			if (w0[i] == (uintptr_t)fresh[0]->irq_pool.irq[j] &&
+					w1[i] == (uintptr_t)fresh[1]->irq_pool.irq[j]) {
+				m->kind[i] = AVR_SNAPSHOT_WORD_IRQ;
+				break;
+			}
+		if (m->kind[i])
+			continue;
+		if (w0[i] != w1[i])
+			m->kind[i] = AVR_SNAPSHOT_WORD_INSTANCE;
+		else if (w0[i])
+			m->kind[i] = AVR_SNAPSHOT_WORD_STATIC;
+	}
+
+	for (int i = 0; i < 2; i++) {
+		avr_terminate(fresh[i]);
+		free(fresh[i]);
+	}
+	m->next = _avr_snapshot_masks;
+	_avr_snapshot_masks = m;
+	return m;
+}
+
+static void
+_avr_snapshot_put(
+		uint8_t ** dst,
+		const void * src,
+		uint32_t size)
+{
+	if (size)
+		memcpy(*dst, src, size);
+	*dst += size;
+}
+
+static const uint8_t *
+_avr_snapshot_get(
+		const uint8_t ** src,
+		uint32_t size)
+{
+	const uint8_t * res = *src;
+	*src += size;
+	return res;
+}
+
+typedef struct _avr_snapshot_timers_t {
+	avr_cycle_timer_t	external;
+	uint32_t			count;
+	uint8_t *			dst;
+} _avr_snapshot_timers_t;
+
+// index of the IO module with that timer callback, and of the callback there
+static int32_t
+_avr_snapshot_find_timer(
+		avr_t * avr,
+		avr_cycle_timer_t timer,
+		uint32_t * index)
+{
+	int32_t io_index = 0;
+	for (avr_io_t * io = avr->io_port; io; io = io->next, io_index++)
+		for (uint32_t i = 0; io->timers && io->timers[i]; i++)
+			if (io->timers[i] == timer) {
+				*index = i;
+				return io_index;
+			}
+	return -1;
+}
+
+static avr_cycle_timer_t
+_avr_snapshot_get_timer(
+		avr_t * avr,
+		int32_t io_index,
+		uint32_t index)
+{
+	avr_io_t * io = avr->io_port;
+	for (int32_t i = 0; io && i < io_index; i++)
+		io = io->next;
+	if (io_index < 0 || !io || !io->timers)
+		return NULL;
+	for (uint32_t i = 0; io->timers[i]; i++)
+		if (i == index)
+			return io->timers[i];
+	return NULL;
+}
+
+static void
+_avr_snapshot_count_timer(
+		avr_t * avr,
+		avr_cycle_timer_slot_p t,
+		void * param)
+{
+	_avr_snapshot_timers_t * timers = param;
+	if (t->timer != timers->external)
+		timers->count++;
+}
+
+static void
+_avr_snapshot_put_timer(
+		avr_t * avr,
+		avr_cycle_timer_slot_p t,
+		void * param)
+{
+	_avr_snapshot_timers_t * timers = param;
+	if (t->timer == timers->external)
+		return;
+	avr_snapshot_timer_t st = {
+		.when = t->when,
+		.io = -1,
+		.timer = (uintptr_t)t->timer,
+		.param = (uintptr_t)t->param,
+	};
+	st.io = _avr_snapshot_find_timer(avr, t->timer, &st.index);
+	_avr_snapshot_put(&timers->dst, &st, sizeof(st));
+}
+
+avr_snapshot_t *
+avr_snapshot_save(
+		avr_t * avr,
+		avr_cycle_timer_t external )
+{
+	avr_int_table_p table = &avr->interrupts;
+	uint32_t eeprom_size;
+	uint8_t * eeprom = _avr_snapshot_get_eeprom(avr, &eeprom_size);
+
+	_avr_snapshot_timers_t timers = { .external = external };
+	avr_cycle_timer_foreach(avr, _avr_snapshot_count_timer, &timers);
+	uint32_t timer_count = timers.count;
+
+	uint32_t pending_count = avr_int_pending_get_read_size(&table->pending);
+	uint32_t size = sizeof(avr_snapshot_t) +
+			timer_count * sizeof(avr_snapshot_timer_t) +
+			avr->irq_pool.count * (sizeof(uint64_t) + sizeof(uint32_t) + 1) +
+			pending_count + table->running_ptr +
+			(avr->ramend + 1) + (avr->flashend + 1) + eeprom_size +
+			_avr_snapshot_io_size(avr);
+
+	avr_snapshot_t * s = calloc(1, size);
+	if (!s) {
+		AVR_LOG(avr, LOG_ERROR, "SNAPSHOT: %s: unable to allocate %u bytes\n",
+				__func__, size);
+		return NULL;
+	}
+	s->magic = AVR_SNAPSHOT_MAGIC;
+	s->version = AVR_SNAPSHOT_VERSION;
+	s->size = size;
+	strncpy(s->mmcu, avr->mmcu, sizeof(s->mmcu) - 1);
+	s->build = avr_snapshot_build(avr);
+	s->avr = (uintptr_t)avr;
+	s->reference = (uintptr_t)avr_snapshot_save;
+	s->core_size = avr->core_size;
+
+	s->state = avr->state;
+	s->cycle = avr->cycle;
+	s->run_cycle_count = avr->run_cycle_count;
+	s->run_cycle_limit = avr->run_cycle_limit;
+	s->sleep_usec = avr->sleep_usec;
+	s->pc = avr->pc;
+	s->reset_pc = avr->reset_pc;
+	s->interrupt_state = avr->interrupt_state;
+	memcpy(s->sreg, avr->sreg, sizeof(s->sreg));
+
+	s->timer_count = timer_count;
+	s->irq_count = avr->irq_pool.count;
+	s->pending_count = pending_count;
+	s->running_count = table->running_ptr;
+	s->data_size = avr->ramend + 1;
+	s->flash_size = avr->flashend + 1;
+	s->eeprom_size = eeprom_size;
+	s->io_size = _avr_snapshot_io_size(avr);
+
+	uint8_t * dst = s->payload;
+
+	timers.dst = dst;
+	avr_cycle_timer_foreach(avr, _avr_snapshot_put_timer, &timers);
+	dst = timers.dst;
+	for (int i = 0; i < avr->irq_pool.count; i++) {
+		uint64_t addr = (uintptr_t)avr->irq_pool.irq[i];
+		_avr_snapshot_put(&dst, &addr, sizeof(addr));
+	}
+	for (int i = 0; i < avr->irq_pool.count; i++) {
+		avr_irq_t * irq = avr->irq_pool.irq[i];
+		uint32_t value = irq ? irq->value : 0;
+		_avr_snapshot_put(&dst, &value, sizeof(value));
+	}
+	for (int i = 0; i < avr->irq_pool.count; i++) {
+		avr_irq_t * irq = avr->irq_pool.irq[i];
+		uint8_t flags = irq ? irq->flags : 0;
+		_avr_snapshot_put(&dst, &flags, sizeof(flags));
+	}
+	for (int i = 0; i < pending_count; i++) {
+		avr_int_vector_t * vector = avr_int_pending_read_at(&table->pending, i);
+		uint8_t index = 0;
+		while (index < table->vector_count && table->vector[index] != vector)
+			index++;
+		_avr_snapshot_put(&dst, &index, sizeof(index));
+	}
+	for (int i = 0; i < table->running_ptr; i++) {
+		uint8_t index = 0;
+		while (index < table->vector_count && table->vector[index] != table->running[i])
+			index++;
+		_avr_snapshot_put(&dst, &index, sizeof(index));
+	}
+	_avr_snapshot_put(&dst, avr->data, s->data_size);
+	_avr_snapshot_put(&dst, avr->flash, s->flash_size);
+	_avr_snapshot_put(&dst, eeprom, s->eeprom_size);
+	_avr_snapshot_put(&dst, _avr_snapshot_io(avr), s->io_size);
+
+	return s;
+}
+
+/*
+ * Relocation of addresses of the saved avr into the restored one.
+ */
+typedef struct avr_snapshot_reloc_t {
+	avr_t *				avr;
+	const avr_snapshot_t * s;
+	const uint8_t *		irqs;	// addresses of the saved IRQ pool
+} avr_snapshot_reloc_t;
+
+static int
+_avr_snapshot_relocate(
+		avr_snapshot_reloc_t * r,
+		uint64_t addr,
+		uintptr_t * res)
+{
+	if (!addr)
+		return 0;
+	if (addr >= r->s->avr && addr < r->s->avr + r->s->core_size) {
+		*res = (uintptr_t)r->avr + (uintptr_t)(addr - r->s->avr);
+		return 1;
+	}
+	for (int i = 0; i < r->s->irq_count && i < r->avr->irq_pool.count; i++) {
+		uint64_t irq;
+		memcpy(&irq, r->irqs + i * sizeof(irq), sizeof(irq));
+		if (irq == addr && r->avr->irq_pool.irq[i]) {
+			*res = (uintptr_t)r->avr->irq_pool.irq[i];
+			return 1;
+		}
+	}
+	return 0;
+}
+
+static void
+_avr_snapshot_restore_io(
+		avr_t * avr,
+		avr_snapshot_reloc_t * r,
+		const uint8_t * io,
+		const avr_snapshot_mask_t * mask,
+		uint64_t slide)
+{
+	uint8_t * dst = _avr_snapshot_io(avr);
+	uint32_t count = r->s->io_size / sizeof(uintptr_t);
+
+	// the hooks and names of the IRQs are not part of the state
+	typedef struct {
+		avr_irq_t * irq;
+		avr_irq_pool_t * pool;
+		const char * name;
+		struct avr_irq_hook_t * hook;
+	} irq_link_t;
+	irq_link_t * links = calloc(avr->irq_pool.count + 1, sizeof(irq_link_t));
+	int link_count = 0;
+	for (int i = 0; i < avr->irq_pool.count; i++) {
+		avr_irq_t * irq = avr->irq_pool.irq[i];
+		if (irq && (uint8_t *)irq >= dst && (uint8_t *)irq < dst + r->s->io_size) {
+			irq_link_t l = { irq, irq->pool, irq->name, irq->hook };
+			links[link_count++] = l;
+		}
+	}
+
+	for (uint32_t i = 0; i < count; i++) {
+		uintptr_t saved, current, res;
+		memcpy(&saved, io + i * sizeof(uintptr_t), sizeof(saved));
+		memcpy(&current, dst + i * sizeof(uintptr_t), sizeof(current));
+
+		switch (mask ? mask->kind[i] : AVR_SNAPSHOT_WORD_DATA) {
+			case AVR_SNAPSHOT_WORD_CORE:
+			case AVR_SNAPSHOT_WORD_IRQ:
+				if (_avr_snapshot_relocate(r, saved, &res))
+					saved = res;
+				else if (saved)
+					saved = current;	// not in the saved avr anymore
+				break;
+			case AVR_SNAPSHOT_WORD_INSTANCE:
+				saved = current;	// allocated by this instance
+				break;
+			case AVR_SNAPSHOT_WORD_STATIC:
+				if (slide && saved + slide == current)
+					saved = current;	// pointer to simavr, moved with it
+				break;
+		}
+		memcpy(dst + i * sizeof(uintptr_t), &saved, sizeof(saved));
+	}
+	memcpy(dst + count * sizeof(uintptr_t), io + count * sizeof(uintptr_t),
+			r->s->io_size - count * sizeof(uintptr_t));
+
+	for (int i = 0; i < link_count; i++) {
+		links[i].irq->pool = links[i].pool;
+		links[i].irq->name = links[i].name;
+		links[i].irq->hook = links[i].hook;
+	}
+	free(links);
+}
+
+int
+avr_snapshot_restore(
+		avr_t * avr,
+		const avr_snapshot_t * s )
+{
+	avr_int_table_p table = &avr->interrupts;
+	uint32_t eeprom_size;
+	uint8_t * eeprom = _avr_snapshot_get_eeprom(avr, &eeprom_size);
+
+	if (s->magic != AVR_SNAPSHOT_MAGIC || s->version != AVR_SNAPSHOT_VERSION ||
+			strncmp(s->mmcu, avr->mmcu, sizeof(s->mmcu)) ||
+			s->build != avr_snapshot_build(avr) ||
+			s->core_size != avr->core_size ||
+			s->data_size != avr->ramend + 1 ||
+			s->flash_size != avr->flashend + 1 ||
+			s->eeprom_size != eeprom_size ||
+			s->io_size != _avr_snapshot_io_size(avr)) {
+		AVR_LOG(avr, LOG_ERROR, "SNAPSHOT: %s: snapshot of '%.32s' does not match '%s'\n",
+				__func__, s->mmcu, avr->mmcu);
+		return -1;
+	}
+	const avr_snapshot_mask_t * mask = NULL;
+	if (s->io_size) {
+		mask = _avr_snapshot_get_mask(avr);
+		if (!mask)
+			return -1;
+	}
+
+	// how much simavr moved since the snapshot was saved, if it did
+	uint64_t slide = (uintptr_t)avr_snapshot_save - s->reference;
+
+	const uint8_t * src = s->payload;
+	const uint8_t * timers = _avr_snapshot_get(&src, s->timer_count * sizeof(avr_snapshot_timer_t));
+	const uint8_t * irqs = _avr_snapshot_get(&src, s->irq_count * sizeof(uint64_t));
+	const uint8_t * values = _avr_snapshot_get(&src, s->irq_count * sizeof(uint32_t));
+	const uint8_t * flags = _avr_snapshot_get(&src, s->irq_count);
+	const uint8_t * pending = _avr_snapshot_get(&src, s->pending_count);
+	const uint8_t * running = _avr_snapshot_get(&src, s->running_count);
+	const uint8_t * data = _avr_snapshot_get(&src, s->data_size);
+	const uint8_t * flash = _avr_snapshot_get(&src, s->flash_size);
+	const uint8_t * ee = _avr_snapshot_get(&src, s->eeprom_size);
+	const uint8_t * io = _avr_snapshot_get(&src, s->io_size);
+
+	avr_snapshot_reloc_t r = { .avr = avr, .s = s, .irqs = irqs };
+
+	/*
+	 * The callbacks of the IO modules are found by their index, their
+	 * parameter is in the core. The other timers are only kept if they
+	 * are still registered, with the parameter relocated if it was.
+	 */
+	avr_cycle_timer_slot_t * restored = calloc(s->timer_count + 1, sizeof(avr_cycle_timer_slot_t));
+	if (!restored)
+		return -1;
+	uint32_t restored_count = 0;
+	for (int i = 0; i < s->timer_count; i++) {
+		avr_snapshot_timer_t t;
+		memcpy(&t, timers + i * sizeof(t), sizeof(t));
+
+		avr_cycle_timer_t timer = NULL;
+		uintptr_t param = 0;
+		int relocated = _avr_snapshot_relocate(&r, t.param, &param);
+		if (t.io >= 0) {
+			if (!t.param || relocated)
+				timer = _avr_snapshot_get_timer(avr, t.io, t.index);
+		} else {
+			if (!relocated)
+				param = t.param;
+			avr_cycle_timer_t registered = (avr_cycle_timer_t)(uintptr_t)(t.timer + slide);
+			if (avr_cycle_timer_status(avr, registered, (void*)param))
+				timer = registered;
+		}
+		if (!timer) {
+			AVR_LOG(avr, LOG_WARNING,
+					"SNAPSHOT: %s: timer %p(%p) can not be restored, dropped\n",
+					__func__, (void*)(uintptr_t)t.timer, (void*)(uintptr_t)t.param);
+			continue;
+		}
+		avr_cycle_timer_slot_t slot = {
+			.when = t.when, .timer = timer, .param = (void*)param };
+		restored[restored_count++] = slot;
+	}
+
+	_avr_snapshot_restore_io(avr, &r, io, mask, slide);
+
+	memcpy(avr->data, data, s->data_size);
+	memcpy(avr->flash, flash, s->flash_size);
+	avr_predecode_invalidate(avr, 0, s->flash_size);
+	if (eeprom_size)
+		memcpy(eeprom, ee, eeprom_size);
+
+	avr->state = s->state;
+	avr->cycle = s->cycle;
+	avr->sleep_usec = s->sleep_usec;
+	// the pacing mode is kept, but the wall clock is synchronised from here
+	avr->pacing.cycle_base = avr->cycle;
+	avr->time_base = 0;
+	avr->pc = s->pc;
+	avr->reset_pc = s->reset_pc;
+	memcpy(avr->sreg, s->sreg, sizeof(avr->sreg));
+
+	for (int i = 0; i < s->irq_count && i < avr->irq_pool.count; i++) {
+		avr_irq_t * irq = avr->irq_pool.irq[i];
+		if (!irq)
+			continue;
+		memcpy(&irq->value, values + i * sizeof(uint32_t), sizeof(uint32_t));
+		irq->flags = (flags[i] & ~IRQ_FLAG_ALLOC) | (irq->flags & IRQ_FLAG_ALLOC);
+	}
+
+	avr_int_pending_reset(&table->pending);
+	for (int i = 0; i < s->pending_count; i++)
+		if (pending[i] < table->vector_count) {
+			table->vector[pending[i]]->pending = 1;
+			avr_int_pending_write(&table->pending, table->vector[pending[i]]);
+		}
+	table->running_ptr = 0;
+	for (int i = 0; i < s->running_count; i++)
+		if (running[i] < table->vector_count)
+			table->running[table->running_ptr++] = table->vector[running[i]];
+	avr->interrupt_state = s->interrupt_state;
+
+	// all the timers are replaced by the saved ones
+	avr_cycle_timer_reset(avr);
+	avr->run_cycle_limit = s->run_cycle_limit;
+	for (int i = 0; i < restored_count; i++)
+		avr_cycle_timer_register(avr,
+				restored[i].when > avr->cycle ? restored[i].when - avr->cycle : 0,
+				restored[i].timer, restored[i].param);
+	free(restored);
+	avr->run_cycle_count = s->run_cycle_count;
+	return 0;
+}
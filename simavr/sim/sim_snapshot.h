@@ -0,0 +1,132 @@
+/*
+	sim_snapshot.h
+
+	Saves the state of a running AVR, and restores it later into the same
+	instance or into a new instance of the same core.
+
+ 	This file is part of simavr.
+
+	simavr is free software: you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation, either version 3 of the License, or
+	(at your option) any later version.
+
+	simavr is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+
+	You should have received a copy of the GNU General Public License
+	along with simavr.  If not, see <http://www.gnu.org/licenses/>.
+ */
+
+#ifndef __SIM_SNAPSHOT_H__
+#define __SIM_SNAPSHOT_H__
+
+#include "sim_avr.h"
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+/*
+ * A snapshot is a single block of memory, it can be copied or written to
+ * a file as is (it is only valid for the same build of simavr on the
+ * same host, see avr_snapshot_build()).
+ *
+ * It contains the core state (registers, SRAM, flash, EEPROM, cycle,
+ * pending and running interrupts), the cycle timers, the values of the
+ * IRQs of the pool and the private state of the IO modules (the part of
+ * the block allocated by avr_core_allocate() that follows avr_t).
+ *
+ * The pointers of the IO modules are relocated when they point into the
+ * core block or to an IRQ of the pool, so a snapshot can be restored into
+ * another instance of the same core with the same firmware. They are found
+ * by comparing fresh instances of the core, the other words are data.
+ *
+ * The timers of the IO modules are saved as the index of their callback in
+ * the module (see avr_io_t), their parameter is relocated. Other timers
+ * (ie of an IRQ stimulus) belong to objects that are not part of the
+ * snapshot: they are only restored if the same timer is still registered
+ * in the avr when restoring, they are dropped otherwise.
+ *
+ * Restoring replaces all the cycle timers by the saved ones. Timers using
+ * the 'external' callback are not saved, the caller is supposed to take
+ * care of them (the python bindings use that for timers implemented in
+ * python).
+ */
+
+#define AVR_SNAPSHOT_MAGIC		0x53525641	// 'AVRS'
+#define AVR_SNAPSHOT_VERSION	2
+
+typedef struct avr_snapshot_timer_t {
+	uint64_t		when;		// absolute cycle
+	int32_t			io;			// IO module with the callback, or -1
+	uint32_t		index;		// of the callback in the timers of the IO module
+	uint64_t		timer;		// address of the callback when saved
+	uint64_t		param;		// address of the parameter when saved
+} avr_snapshot_timer_t;
+
+typedef struct avr_snapshot_t {
+	uint32_t		magic;
+	uint32_t		version;
+	uint32_t		size;		// whole snapshot, in bytes
+	char			mmcu[32];
+
+	uint64_t		build;		// see avr_snapshot_build()
+	uint64_t		avr;		// address of the avr that was saved
+	uint64_t		reference;	// address of a simavr function when saved
+	uint32_t		core_size;
+
+	// core state
+	int32_t			state;
+	uint64_t		cycle;
+	uint64_t		run_cycle_count;
+	uint64_t		run_cycle_limit;
+	uint32_t		sleep_usec;
+	uint32_t		pc;
+	uint32_t		reset_pc;
+	int8_t			interrupt_state;
+	uint8_t			sreg[8];
+
+	// number of items of the sections following, in that order
+	uint32_t		timer_count;	// avr_snapshot_timer_t
+	uint32_t		irq_count;		// IRQ pool: address (uint64_t), value (uint32_t), flags (uint8_t)
+	uint32_t		pending_count;	// pending interrupts, index in the vector table (uint8_t)
+	uint32_t		running_count;	// running interrupts, index in the vector table (uint8_t)
+	uint32_t		data_size;		// avr->data
+	uint32_t		flash_size;		// avr->flash
+	uint32_t		eeprom_size;	// EEPROM content
+	uint32_t		io_size;		// IO modules, the rest of the core block
+
+	uint8_t			payload[0];
+} avr_snapshot_t;
+
+/*
+ * Identifies the build of simavr and of the IO modules of this core. A
+ * snapshot is only restored with the same one, ie it is part of the key
+ * of snapshots kept in files.
+ */
+uint64_t
+avr_snapshot_build(
+		avr_t * avr );
+// Saves the avr state into a newly allocated snapshot, to be free()d by the caller
+avr_snapshot_t *
+avr_snapshot_save(
+		avr_t * avr,
+		avr_cycle_timer_t external );
+/*
+ * Restores a snapshot saved from the same core. Returns zero if all is
+ * well, or -1 if the snapshot does not match this avr (the avr is not
+ * changed in that case).
+ */
+int
+avr_snapshot_restore(
+		avr_t * avr,
+		const avr_snapshot_t * snapshot );
+
+#ifdef __cplusplus
+};
+#endif
+
+#endif /* __SIM_SNAPSHOT_H__ */
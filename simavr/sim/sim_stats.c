@@ -0,0 +1,103 @@
+/*
+	sim_stats.c
+
+	Counters of the IO register accesses, IRQs and cycle timers.
+
+ 	This file is part of simavr.
+
+	simavr is free software: you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation, either version 3 of the License, or
+	(at your option) any later version.
+
+	simavr is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+
+	You should have received a copy of the GNU General Public License
+	along with simavr.  If not, see <http://www.gnu.org/licenses/>.
+ */
+
+#include <stdlib.h>
+#include <string.h>
+#include "sim_io.h"
+#include "sim_stats.h"
+
+int
+avr_stats_enable(
+		avr_t * avr)
+{
+	if (avr->stats)
+		return 0;
+	avr->stats = calloc(1, sizeof(avr_stats_t));
+	if (!avr->stats) {
+		AVR_LOG(avr, LOG_ERROR, "STATS: %s: unable to allocate the counters\n",
+				__func__);
+		return -1;
+	}
+	avr->irq_pool.stats = 1;
+	return 0;
+}
+
+void
+avr_stats_disable(
+		avr_t * avr)
+{
+	avr->irq_pool.stats = 0;
+	if (avr->stats)
+		free(avr->stats);
+	avr->stats = NULL;
+}
+
+void
+avr_stats_clear(
+		avr_t * avr)
+{
+	if (avr->stats)
+		memset(avr->stats, 0, sizeof(avr_stats_t));
+	avr_irq_pool_lock(&avr->irq_pool);
+	for (int i = 0; i < avr->irq_pool.count; i++) {
+		avr_irq_t * irq = avr->irq_pool.irq[i];
+		if (irq)
+			irq->raised = irq->hooked = 0;
+	}
+	avr_irq_pool_unlock(&avr->irq_pool);
+}
+
+const char *
+avr_stats_io_kind(
+		avr_t * avr,
+		void * param)
+{
+	// the modules start with their avr_io_t, pointers are only compared
+	for (avr_io_t * port = avr->io_port; port; port = port->next)
+		if ((void *)port == param)
+			return port->kind;
+	return NULL;
+}
+
+void
+avr_stats_timer_fire(
+		avr_t * avr,
+		avr_cycle_timer_t timer,
+		void * param)
+{
+	avr_stats_t * stats = avr->stats;
+
+	for (uint32_t i = 0; i < stats->timer_count; i++)
+		if (stats->timer[i].timer == timer) {
+			stats->timer[i].fires++;
+			return;
+		}
+	if (stats->timer_count == AVR_STATS_TIMERS) {
+		stats->timer_other++;
+		return;
+	}
+	avr_stats_timer_t * t = &stats->timer[stats->timer_count];
+	t->timer = timer;
+	t->kind = avr_stats_io_kind(avr, param);
+	t->fires = 1;
+	// made visible once filled in, for the readers of other threads
+	__atomic_store_n(&stats->timer_count, stats->timer_count + 1, __ATOMIC_RELEASE);
+}
@@ -0,0 +1,95 @@
+/*
+	sim_stats.h
+
+	Counters of the IO register accesses, IRQs and cycle timers.
+
+ 	This file is part of simavr.
+
+	simavr is free software: you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation, either version 3 of the License, or
+	(at your option) any later version.
+
+	simavr is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+
+	You should have received a copy of the GNU General Public License
+	along with simavr.  If not, see <http://www.gnu.org/licenses/>.
+ */
+
+#ifndef __SIM_STATS_H__
+#define __SIM_STATS_H__
+
+#include "sim_avr.h"
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+/*
+ * Instrumentation of the simulator itself, to find out where the time of
+ * a slow simulation goes. When enabled, avr->stats counts the reads and
+ * writes of the IO registers made by the core, and the fires of the cycle
+ * timers per callback; the IRQs of avr->irq_pool count their raises and
+ * the hooks they called (see avr_irq_t). Disabled, each of these costs a
+ * pointer or flag test.
+ *
+ * The counters are only ever incremented by the thread running the AVR,
+ * they can be read from another one while it runs. That one walks the IRQ
+ * pool with avr_irq_pool_lock() held, as the running thread may change it.
+ */
+
+// distinct timer callbacks counted, the others are added to 'timer_other'
+#define AVR_STATS_TIMERS	32
+
+typedef struct avr_stats_timer_t {
+	avr_cycle_timer_t	timer;
+	const char *		kind;	// kind of the IO module of the first param, or NULL
+	uint64_t			fires;
+} avr_stats_timer_t;
+
+typedef struct avr_stats_t {
+	uint64_t			io_read[MAX_IOs];	// by IO address
+	uint64_t			io_write[MAX_IOs];
+	avr_stats_timer_t	timer[AVR_STATS_TIMERS];
+	uint32_t			timer_count;
+	uint64_t			timer_other;
+} avr_stats_t;
+
+// enables the counters, they are kept if they already are.
+// Returns 0, or -1 if they could not be allocated
+int
+avr_stats_enable(
+		avr_t * avr);
+
+// stops counting and frees the counters
+void
+avr_stats_disable(
+		avr_t * avr);
+
+// clears the counters, IRQ ones included
+void
+avr_stats_clear(
+		avr_t * avr);
+
+// kind of the IO module 'param' points to, if any, ie "timer" for the
+// param of the timer callbacks of avr_timer.c
+const char *
+avr_stats_io_kind(
+		avr_t * avr,
+		void * param);
+
+// called by the cycle timers for each fire
+void
+avr_stats_timer_fire(
+		avr_t * avr,
+		avr_cycle_timer_t timer,
+		void * param);
+
+#ifdef __cplusplus
+};
+#endif
+
+#endif /* __SIM_STATS_H__ */
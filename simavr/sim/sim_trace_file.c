@@ -0,0 +1,182 @@
+/*
+	sim_trace_file.c
+
+	Binary trace of the executed instructions, written in chunks.
+
+ 	This file is part of simavr.
+
+	simavr is free software: you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation, either version 3 of the License, or
+	(at your option) any later version.
+
+	simavr is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+
+	You should have received a copy of the GNU General Public License
+	along with simavr.  If not, see <http://www.gnu.org/licenses/>.
+ */
+
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <zlib.h>
+#include "sim_trace_file.h"
+
+int
+avr_trace_file_start(
+		avr_t * avr,
+		const char * filename,
+		uint32_t flags,
+		uint32_t chunk_records)
+{
+	if (avr->trace_file) {
+		AVR_LOG(avr, LOG_ERROR, "TRACE: %s: already tracing\n", __func__);
+		return -1;
+	}
+	if (!chunk_records)
+		chunk_records = 1;
+
+	avr_trace_file_t * t = calloc(1, sizeof(avr_trace_file_t));
+	if (!t)
+		return -1;
+	t->flags = flags;
+	t->size = chunk_records;
+	t->records = calloc(chunk_records, sizeof(avr_trace_record_t));
+	if (flags & AVR_TRACE_FILE_COMPRESS) {
+		t->compressed_size = compressBound(chunk_records * sizeof(avr_trace_record_t));
+		t->compressed = malloc(t->compressed_size);
+	}
+	t->file = fopen(filename, "wb");
+	if (!t->records || ((flags & AVR_TRACE_FILE_COMPRESS) && !t->compressed) || !t->file) {
+		AVR_LOG(avr, LOG_ERROR, "TRACE: %s: unable to start tracing into %s\n",
+				__func__, filename);
+		goto error;
+	}
+
+	avr_trace_file_header_t header = {
+		.magic = AVR_TRACE_FILE_MAGIC,
+		.version = 1,
+		.record_size = sizeof(avr_trace_record_t),
+		.flags = flags,
+		.frequency = avr->frequency,
+	};
+	strncpy(header.mmcu, avr->mmcu, sizeof(header.mmcu) - 1);
+	if (fwrite(&header, sizeof(header), 1, t->file) != 1) {
+		AVR_LOG(avr, LOG_ERROR, "TRACE: %s: unable to write %s\n",
+				__func__, filename);
+		goto error;
+	}
+	memcpy(t->registers, avr->data, sizeof(t->registers));
+	avr->trace_file = t;
+	return 0;
+error:
+	if (t->file)
+		fclose(t->file);
+	free(t->records);
+	free(t->compressed);
+	free(t);
+	return -1;
+}
+
+int
+avr_trace_file_flush(
+		avr_t * avr)
+{
+	avr_trace_file_t * t = avr->trace_file;
+
+	if (!t || !t->count)
+		return 0;
+
+	const void * data = t->records;
+	t->chunk.magic = AVR_TRACE_CHUNK_MAGIC;
+	t->chunk.count = t->count;
+	t->chunk.size = t->count * sizeof(avr_trace_record_t);
+	t->chunk.flags = 0;
+	if (t->flags & AVR_TRACE_FILE_COMPRESS) {
+		uLongf size = t->compressed_size;
+		if (compress2(t->compressed, &size, data, t->chunk.size, 1) == Z_OK) {
+			data = t->compressed;
+			t->chunk.size = size;
+			t->chunk.flags = AVR_TRACE_FILE_COMPRESS;
+		}
+	}
+	int res = 0;
+	if (fwrite(&t->chunk, sizeof(t->chunk), 1, t->file) != 1 ||
+			fwrite(data, t->chunk.size, 1, t->file) != 1 ||
+			fflush(t->file)) {
+		AVR_LOG(avr, LOG_ERROR, "TRACE: %s: unable to write the trace\n", __func__);
+		res = -1;
+	}
+	t->written += t->count;
+	t->count = 0;
+	return res;
+}
+
+void
+avr_trace_file_stop(
+		avr_t * avr)
+{
+	avr_trace_file_t * t = avr->trace_file;
+
+	if (!t)
+		return;
+	avr_trace_file_flush(avr);
+	avr->trace_file = NULL;
+	fclose(t->file);
+	free(t->records);
+	free(t->compressed);
+	free(t);
+}
+
+void
+avr_trace_file_record(
+		avr_t * avr,
+		avr_flashaddr_t pc,
+		avr_cycle_count_t cycles)
+{
+	avr_trace_file_t * t = avr->trace_file;
+	avr_cycle_count_t start = avr->cycle - cycles;
+
+	// the deltas are 32 bits, start a new chunk past that (ie long sleeps)
+	if (t->count && start - t->chunk.last_cycle > UINT32_MAX)
+		avr_trace_file_flush(avr);
+
+	avr_trace_record_t * r = &t->records[t->count];
+	if (t->count == 0) {
+		t->chunk.first_cycle = start;
+		t->chunk.min_pc = t->chunk.max_pc = pc;
+		r->delta = 0;
+	} else {
+		r->delta = start - t->chunk.last_cycle;
+		if (pc < t->chunk.min_pc)
+			t->chunk.min_pc = pc;
+		if (pc > t->chunk.max_pc)
+			t->chunk.max_pc = pc;
+	}
+	t->chunk.last_cycle = start;
+	r->pc = pc;
+	r->sreg = 0;
+	for (int i = 0; i < 8; i++)
+		if (avr->sreg[i])
+			r->sreg |= (1 << i);
+	r->count = 0;
+	if (t->flags & AVR_TRACE_FILE_REGISTERS) {
+		for (int i = 0; i < 32; i++)
+			if (avr->data[i] != t->registers[i]) {
+				if (r->count < 3) {
+					r->reg[r->count] = i;
+					r->value[r->count] = avr->data[i];
+				}
+				r->count++;
+				t->registers[i] = avr->data[i];
+			}
+	}
+	for (int i = r->count; i < 3; i++)
+		r->reg[i] = r->value[i] = 0;
+
+	if (++t->count == t->size)
+		avr_trace_file_flush(avr);
+}
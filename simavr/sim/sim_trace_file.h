@@ -0,0 +1,130 @@
+/*
+	sim_trace_file.h
+
+	Binary trace of the executed instructions, written in chunks.
+
+ 	This file is part of simavr.
+
+	simavr is free software: you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation, either version 3 of the License, or
+	(at your option) any later version.
+
+	simavr is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+
+	You should have received a copy of the GNU General Public License
+	along with simavr.  If not, see <http://www.gnu.org/licenses/>.
+ */
+
+#ifndef __SIM_TRACE_FILE_H__
+#define __SIM_TRACE_FILE_H__
+
+#include <stdio.h>
+#include "sim_avr.h"
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+/*
+ * The trace file records one fixed size avr_trace_record_t per executed
+ * instruction, far faster than the text trace of CONFIG_SIMAVR_TRACE.
+ * Records are buffered into chunks, each written (optionally compressed
+ * with zlib) as an avr_trace_chunk_t header followed by the records:
+ *
+ *	avr_trace_file_header_t
+ *	avr_trace_chunk_t, records
+ *	avr_trace_chunk_t, records
+ *	...
+ *
+ * All the fields are little endian. A chunk holds the cycle of its first
+ * instruction, the others are deltas from the previous one, so readers can
+ * seek by cycle through the chunk headers. A trace cut short (ie the
+ * process was killed) keeps all the chunks written so far.
+ */
+
+#define AVR_TRACE_FILE_MAGIC	"simavrTR"
+#define AVR_TRACE_CHUNK_MAGIC	0x4b4e4843	// "CHNK"
+
+enum {
+	AVR_TRACE_FILE_REGISTERS	= (1 << 0),	// record the registers changed
+	AVR_TRACE_FILE_COMPRESS		= (1 << 1),	// zlib compress the chunks
+};
+
+typedef struct avr_trace_file_header_t {
+	char		magic[8];		// AVR_TRACE_FILE_MAGIC
+	uint32_t	version;		// 1
+	uint32_t	record_size;	// sizeof(avr_trace_record_t)
+	uint32_t	flags;			// AVR_TRACE_FILE_*
+	uint32_t	frequency;
+	char		mmcu[32];
+	uint32_t	reserved[2];
+} avr_trace_file_header_t;
+
+typedef struct avr_trace_chunk_t {
+	uint32_t	magic;			// AVR_TRACE_CHUNK_MAGIC
+	uint32_t	count;			// records
+	uint32_t	size;			// bytes of records that follow, compressed or not
+	uint32_t	flags;			// AVR_TRACE_FILE_COMPRESS if compressed
+	uint64_t	first_cycle;	// cycle the first instruction started at
+	uint64_t	last_cycle;		// cycle the last instruction started at
+	uint32_t	min_pc;			// range of the PCs of the chunk
+	uint32_t	max_pc;
+} avr_trace_chunk_t;
+
+typedef struct avr_trace_record_t {
+	uint32_t	delta;			// cycles since the previous instruction started
+	uint32_t	pc;				// byte address of the instruction
+	uint8_t		sreg;			// after the instruction
+	uint8_t		count;			// registers changed by the instruction
+	uint8_t		reg[3];			// the first (up to) 3 of them
+	uint8_t		value[3];		// and their new values
+} avr_trace_record_t;
+
+typedef struct avr_trace_file_t {
+	FILE *		file;
+	uint32_t	flags;
+	avr_trace_record_t * records;	// current chunk
+	uint32_t	count;
+	uint32_t	size;			// records per chunk
+	avr_trace_chunk_t chunk;
+	uint8_t *	compressed;		// buffer for the compressed chunks
+	unsigned long compressed_size;
+	uint8_t		registers[32];	// as of the last instruction
+	uint64_t	written;		// records written to the file
+} avr_trace_file_t;
+
+// starts tracing the instructions into 'filename', with chunks of
+// 'chunk_records' records. Returns 0, or -1
+int
+avr_trace_file_start(
+		avr_t * avr,
+		const char * filename,
+		uint32_t flags,
+		uint32_t chunk_records);
+
+// writes the records of the current chunk to the file
+int
+avr_trace_file_flush(
+		avr_t * avr);
+
+// flushes and closes the trace file
+void
+avr_trace_file_stop(
+		avr_t * avr);
+
+// called by the core after each instruction, started 'cycles' ago at 'pc'
+void
+avr_trace_file_record(
+		avr_t * avr,
+		avr_flashaddr_t pc,
+		avr_cycle_count_t cycles);
+
+#ifdef __cplusplus
+};
+#endif
+
+#endif /* __SIM_TRACE_FILE_H__ */
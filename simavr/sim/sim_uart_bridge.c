@@ -0,0 +1,446 @@
+/*
+	sim_uart_bridge.c
+
+	Connects a byte stream to one of the UARTs of the AVR, with buffers on
+	both sides, so that bytes do not have to be handled one by one.
+
+ 	This file is part of simavr.
+
+	simavr is free software: you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation, either version 3 of the License, or
+	(at your option) any later version.
+
+	simavr is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+
+	You should have received a copy of the GNU General Public License
+	along with simavr.  If not, see <http://www.gnu.org/licenses/>.
+ */
+
+#define _GNU_SOURCE	/* for posix_openpt() and cfmakeraw() */
+#include <stdio.h>
+#include <string.h>
+#include <stdlib.h>
+#include <errno.h>
+#include <fcntl.h>
+#include <unistd.h>
+#ifndef __MINGW32__
+#include <termios.h>
+#endif
+#include "sim_uart_bridge.h"
+#include "sim_avr.h"
+#include "sim_io.h"
+#include "sim_cycle_timers.h"
+#include "sim_time.h"
+#include "avr_uart.h"
+
+// bytes read from the file descriptor at once
+#define UART_BRIDGE_CHUNK	256
+
+static int
+_avr_uart_bridge_ring_init(
+		avr_uart_bridge_ring_t * ring,
+		uint32_t size )
+{
+	ring->size = 1;
+	while (ring->size < size && ring->size < 0x80000000)
+		ring->size <<= 1;
+	ring->read = ring->write = 0;
+	ring->buf = malloc(ring->size);
+	if (!ring->buf) {
+		ring->size = 0;
+		return -1;
+	}
+	return 0;
+}
+
+/*
+ * Makes sure 'count' more bytes fit in the ring, doubling its size
+ * as many times as needed. The content is moved to the start of the
+ * new buffer.
+ */
+static int
+_avr_uart_bridge_ring_reserve(
+		avr_uart_bridge_ring_t * ring,
+		uint32_t count )
+{
+	uint32_t used = ring->write - ring->read;
+	if (ring->size - used >= count)
+		return 0;
+
+	uint32_t size = ring->size;
+	while (size - used < count) {
+		if (size >= 0x80000000)
+			return -1;
+		size <<= 1;
+	}
+	uint8_t * buf = malloc(size);
+	if (!buf)
+		return -1;
+	for (uint32_t i = 0; i < used; i++)
+		buf[i] = ring->buf[(ring->read + i) & (ring->size - 1)];
+	free(ring->buf);
+	ring->buf = buf;
+	ring->size = size;
+	ring->read = 0;
+	ring->write = used;
+	return 0;
+}
+
+static uint32_t
+_avr_uart_bridge_ring_put(
+		avr_uart_bridge_ring_t * ring,
+		const uint8_t * data,
+		uint32_t count )
+{
+	if (_avr_uart_bridge_ring_reserve(ring, count))
+		return 0;
+	for (uint32_t i = 0; i < count; i++)
+		ring->buf[(ring->write + i) & (ring->size - 1)] = data[i];
+	ring->write += count;
+	return count;
+}
+
+/*
+ * Returns the number of contiguous bytes that can be read at 'data',
+ * use _avr_uart_bridge_ring_consume() once they are processed.
+ */
+static uint32_t
+_avr_uart_bridge_ring_peek(
+		avr_uart_bridge_ring_t * ring,
+		uint8_t ** data )
+{
+	uint32_t count = ring->write - ring->read;
+	uint32_t start = ring->read & (ring->size - 1);
+
+	if (count > ring->size - start)
+		count = ring->size - start;
+	*data = count ? ring->buf + start : NULL;
+	return count;
+}
+
+static void
+_avr_uart_bridge_ring_consume(
+		avr_uart_bridge_ring_t * ring,
+		uint32_t count )
+{
+	ring->read += count;
+}
+
+/*
+ * Feeds the queued bytes to the UART, until it tells us its fifo is full
+ */
+static void
+_avr_uart_bridge_flush(
+		avr_uart_bridge_t * bridge )
+{
+	while (bridge->xon && bridge->tx.write != bridge->tx.read) {
+		uint8_t b = bridge->tx.buf[bridge->tx.read & (bridge->tx.size - 1)];
+		bridge->tx.read++;
+		bridge->tx_total++;
+		avr_raise_irq(bridge->irq + UART_BRIDGE_IRQ_BYTE_OUT, b);
+	}
+}
+
+static void
+_avr_uart_bridge_byte_in_hook(
+		struct avr_irq_t * irq,
+		uint32_t value,
+		void * param)
+{
+	avr_uart_bridge_t * bridge = (avr_uart_bridge_t *)param;
+	uint8_t b = value;
+
+	bridge->rx_total++;
+	if (!_avr_uart_bridge_ring_put(&bridge->rx, &b, 1))
+		bridge->dropped++;
+}
+
+static void
+_avr_uart_bridge_xon_hook(
+		struct avr_irq_t * irq,
+		uint32_t value,
+		void * param)
+{
+	avr_uart_bridge_t * bridge = (avr_uart_bridge_t *)param;
+
+	bridge->xon = 1;
+	_avr_uart_bridge_flush(bridge);
+}
+
+static void
+_avr_uart_bridge_xoff_hook(
+		struct avr_irq_t * irq,
+		uint32_t value,
+		void * param)
+{
+	avr_uart_bridge_t * bridge = (avr_uart_bridge_t *)param;
+
+	bridge->xon = !value;
+}
+
+static const char * irq_names[UART_BRIDGE_IRQ_COUNT] = {
+	[UART_BRIDGE_IRQ_BYTE_IN] = "8<bridge.in",
+	[UART_BRIDGE_IRQ_BYTE_OUT] = "8>bridge.out",
+	[UART_BRIDGE_IRQ_XON] = "<bridge.xon",
+	[UART_BRIDGE_IRQ_XOFF] = "<bridge.xoff",
+};
+
+int
+avr_uart_bridge_init(
+		struct avr_t * avr,
+		avr_uart_bridge_t * bridge,
+		char name,
+		uint32_t size )
+{
+	memset(bridge, 0, sizeof(avr_uart_bridge_t));
+	bridge->avr = avr;
+	bridge->name = name;
+	bridge->fd = -1;
+
+	bridge->uart = avr_io_getirq(avr, AVR_IOCTL_UART_GETIRQ(name), 0);
+	if (!bridge->uart) {
+		AVR_LOG(avr, LOG_ERROR, "%s: no UART%c\n", __FUNCTION__, name);
+		return -1;
+	}
+	if (_avr_uart_bridge_ring_init(&bridge->rx, size) ||
+			_avr_uart_bridge_ring_init(&bridge->tx, size)) {
+		AVR_LOG(avr, LOG_ERROR,
+				"%s: unable to allocate %u bytes buffers\n",
+				__FUNCTION__, size);
+		free(bridge->rx.buf);
+		free(bridge->tx.buf);
+		bridge->rx.buf = bridge->tx.buf = NULL;
+		bridge->uart = NULL;
+		return -1;
+	}
+
+	avr_init_irq(&avr->irq_pool, bridge->irq, 0, UART_BRIDGE_IRQ_COUNT, irq_names);
+	avr_irq_register_notify(bridge->irq + UART_BRIDGE_IRQ_BYTE_IN,
+			_avr_uart_bridge_byte_in_hook, bridge);
+	avr_irq_register_notify(bridge->irq + UART_BRIDGE_IRQ_XON,
+			_avr_uart_bridge_xon_hook, bridge);
+	avr_irq_register_notify(bridge->irq + UART_BRIDGE_IRQ_XOFF,
+			_avr_uart_bridge_xoff_hook, bridge);
+
+	// the UART might already be receiving
+	bridge->xon = bridge->uart[UART_IRQ_OUT_XON].value &&
+			!bridge->uart[UART_IRQ_OUT_XOFF].value;
+
+	avr_connect_irq(bridge->uart + UART_IRQ_OUTPUT,
+			bridge->irq + UART_BRIDGE_IRQ_BYTE_IN);
+	avr_connect_irq(bridge->irq + UART_BRIDGE_IRQ_BYTE_OUT,
+			bridge->uart + UART_IRQ_INPUT);
+	avr_connect_irq(bridge->uart + UART_IRQ_OUT_XON,
+			bridge->irq + UART_BRIDGE_IRQ_XON);
+	avr_connect_irq(bridge->uart + UART_IRQ_OUT_XOFF,
+			bridge->irq + UART_BRIDGE_IRQ_XOFF);
+	return 0;
+}
+
+void
+avr_uart_bridge_close(
+		avr_uart_bridge_t * bridge )
+{
+	if (!bridge->uart)
+		return;
+	avr_uart_bridge_set_fd(bridge, -1, 0, 0);
+
+	/* dispose of any link and hooks */
+	avr_unconnect_irq(bridge->uart + UART_IRQ_OUTPUT,
+			bridge->irq + UART_BRIDGE_IRQ_BYTE_IN);
+	avr_unconnect_irq(bridge->irq + UART_BRIDGE_IRQ_BYTE_OUT,
+			bridge->uart + UART_IRQ_INPUT);
+	avr_unconnect_irq(bridge->uart + UART_IRQ_OUT_XON,
+			bridge->irq + UART_BRIDGE_IRQ_XON);
+	avr_unconnect_irq(bridge->uart + UART_IRQ_OUT_XOFF,
+			bridge->irq + UART_BRIDGE_IRQ_XOFF);
+	avr_free_irq(bridge->irq, UART_BRIDGE_IRQ_COUNT);
+	bridge->uart = NULL;
+
+	free(bridge->rx.buf);
+	free(bridge->tx.buf);
+	memset(&bridge->rx, 0, sizeof(bridge->rx));
+	memset(&bridge->tx, 0, sizeof(bridge->tx));
+	bridge->xon = 0;
+}
+
+uint32_t
+avr_uart_bridge_write(
+		avr_uart_bridge_t * bridge,
+		const uint8_t * data,
+		uint32_t size )
+{
+	if (!bridge->uart)
+		return 0;
+	uint32_t done = _avr_uart_bridge_ring_put(&bridge->tx, data, size);
+	if (done < size)
+		bridge->dropped += size - done;
+	_avr_uart_bridge_flush(bridge);
+	return done;
+}
+
+uint32_t
+avr_uart_bridge_read(
+		avr_uart_bridge_t * bridge,
+		uint8_t * data,
+		uint32_t size )
+{
+	uint32_t done = 0;
+
+	if (!bridge->uart)
+		return 0;
+	while (done < size) {
+		uint8_t * src;
+		uint32_t count = _avr_uart_bridge_ring_peek(&bridge->rx, &src);
+		if (!count)
+			break;
+		if (count > size - done)
+			count = size - done;
+		memcpy(data + done, src, count);
+		_avr_uart_bridge_ring_consume(&bridge->rx, count);
+		done += count;
+	}
+	return done;
+}
+
+uint32_t
+avr_uart_bridge_get_rx_count(
+		avr_uart_bridge_t * bridge )
+{
+	return bridge->rx.write - bridge->rx.read;
+}
+
+uint32_t
+avr_uart_bridge_get_tx_count(
+		avr_uart_bridge_t * bridge )
+{
+	return bridge->tx.write - bridge->tx.read;
+}
+
+/*
+ * Writes the bytes sent by the AVR to the file descriptor, as much
+ * as it can without blocking.
+ */
+static void
+_avr_uart_bridge_drain(
+		avr_uart_bridge_t * bridge )
+{
+	for (;;) {
+		uint8_t * src;
+		uint32_t count = _avr_uart_bridge_ring_peek(&bridge->rx, &src);
+		if (!count)
+			break;
+		ssize_t r = write(bridge->fd, src, count);
+		if (r <= 0)
+			break;	// nobody is reading, try again later
+		_avr_uart_bridge_ring_consume(&bridge->rx, r);
+	}
+}
+
+/*
+ * Moves the bytes between the rings and the file descriptor
+ */
+static avr_cycle_count_t
+_avr_uart_bridge_poll(
+		struct avr_t * avr,
+		avr_cycle_count_t when,
+		void * param)
+{
+	avr_uart_bridge_t * bridge = (avr_uart_bridge_t *)param;
+
+	if (bridge->fd < 0)
+		return 0;
+
+	_avr_uart_bridge_drain(bridge);
+	// don't queue more than a chunk, the AVR is slower than the other side
+	while (avr_uart_bridge_get_tx_count(bridge) < UART_BRIDGE_CHUNK) {
+		uint8_t buf[UART_BRIDGE_CHUNK];
+		ssize_t r = read(bridge->fd, buf, sizeof(buf));
+		if (r <= 0)
+			break;	// nothing yet, no peer or end of file
+		avr_uart_bridge_write(bridge, buf, r);
+	}
+	_avr_uart_bridge_flush(bridge);
+
+	return when + bridge->poll_period;
+}
+
+int
+avr_uart_bridge_set_fd(
+		avr_uart_bridge_t * bridge,
+		int fd,
+		int owned,
+		avr_cycle_count_t poll_period )
+{
+	if (!bridge->uart)
+		return -1;
+
+	avr_cycle_timer_cancel(bridge->avr, _avr_uart_bridge_poll, bridge);
+	if (bridge->fd >= 0) {
+		// don't lose what the AVR sent since the last poll
+		_avr_uart_bridge_drain(bridge);
+		if (bridge->fd_owned)
+			close(bridge->fd);
+	}
+	bridge->fd = -1;
+	bridge->fd_owned = 0;
+	bridge->pty_name[0] = 0;
+
+	if (fd < 0)
+		return 0;
+#ifndef __MINGW32__
+	int flags = fcntl(fd, F_GETFL);
+	if (flags == -1 || fcntl(fd, F_SETFL, flags | O_NONBLOCK) == -1) {
+		AVR_LOG(bridge->avr, LOG_ERROR,
+				"%s: unable to make fd %d non blocking: %s\n",
+				__FUNCTION__, fd, strerror(errno));
+		return -1;
+	}
+#endif
+	if (!poll_period)
+		poll_period = avr_usec_to_cycles(bridge->avr, 1000);
+	bridge->poll_period = poll_period ? poll_period : 1;
+	bridge->fd = fd;
+	bridge->fd_owned = owned;
+	avr_cycle_timer_register(bridge->avr, bridge->poll_period,
+			_avr_uart_bridge_poll, bridge);
+	return 0;
+}
+
+int
+avr_uart_bridge_open_pty(
+		avr_uart_bridge_t * bridge )
+{
+#ifdef __MINGW32__
+	AVR_LOG(bridge->avr, LOG_ERROR, "%s: not supported\n", __FUNCTION__);
+	return -1;
+#else
+	int fd = posix_openpt(O_RDWR | O_NOCTTY);
+	if (fd < 0 || grantpt(fd) || unlockpt(fd)) {
+		AVR_LOG(bridge->avr, LOG_ERROR, "%s: unable to open a pty: %s\n",
+				__FUNCTION__, strerror(errno));
+		if (fd >= 0)
+			close(fd);
+		return -1;
+	}
+	// the firmware talks binary, don't let the line discipline in the way
+	struct termios t;
+	if (tcgetattr(fd, &t) == 0) {
+		cfmakeraw(&t);
+		tcsetattr(fd, TCSANOW, &t);
+	}
+	char name[sizeof(bridge->pty_name)];
+	snprintf(name, sizeof(name), "%s", ptsname(fd));
+
+	if (avr_uart_bridge_set_fd(bridge, fd, 1, 0)) {
+		close(fd);
+		return -1;
+	}
+	strcpy(bridge->pty_name, name);
+	return 0;
+#endif
+}
@@ -0,0 +1,132 @@
+/*
+	sim_uart_bridge.h
+
+	Connects a byte stream to one of the UARTs of the AVR, with buffers on
+	both sides, so that bytes do not have to be handled one by one.
+
+ 	This file is part of simavr.
+
+	simavr is free software: you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation, either version 3 of the License, or
+	(at your option) any later version.
+
+	simavr is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+
+	You should have received a copy of the GNU General Public License
+	along with simavr.  If not, see <http://www.gnu.org/licenses/>.
+ */
+
+#ifndef __SIM_UART_BRIDGE_H__
+#define __SIM_UART_BRIDGE_H__
+
+#include "sim_irq.h"
+#include "sim_avr_types.h"
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+/*
+ * The bridge connects its IRQs to the UART ones. Bytes sent by the AVR are
+ * appended to the 'rx' ring buffer, bytes written to the bridge are queued
+ * in the 'tx' one and fed to the UART as long as it says it has room for
+ * them (see the XON/XOFF IRQs in avr_uart.h). Both rings grow as needed.
+ *
+ * Optionally, a file descriptor (a pty or a socket) can be attached: it is
+ * polled by a cycle timer, that writes the received bytes to it and reads
+ * the bytes to send from it, without going through the caller.
+ */
+enum {
+	UART_BRIDGE_IRQ_BYTE_IN = 0,	// bytes sent by the AVR
+	UART_BRIDGE_IRQ_BYTE_OUT,		// bytes sent to the AVR
+	UART_BRIDGE_IRQ_XON,
+	UART_BRIDGE_IRQ_XOFF,
+	UART_BRIDGE_IRQ_COUNT
+};
+
+typedef struct avr_uart_bridge_ring_t {
+	uint8_t *		buf;
+	uint32_t		size;		// power of two
+	uint32_t		read;		// free running read/write positions
+	uint32_t		write;
+} avr_uart_bridge_ring_t;
+
+typedef struct avr_uart_bridge_t {
+	struct avr_t *	avr;
+	char			name;		// of the UART, ie '0'
+	avr_irq_t		irq[UART_BRIDGE_IRQ_COUNT];
+	avr_irq_t *		uart;		// IRQs of the UART we are connected to
+
+	avr_uart_bridge_ring_t	rx;	// sent by the AVR, not read yet
+	avr_uart_bridge_ring_t	tx;	// to be sent to the AVR
+	int				xon;		// the UART has room for more bytes
+	uint64_t		rx_total;	// bytes sent by the AVR so far
+	uint64_t		tx_total;	// bytes sent to the AVR so far
+	uint64_t		dropped;	// bytes lost, as the rings could not grow
+
+	int				fd;			// attached pty or socket, or -1
+	int				fd_owned;	// closed by the bridge
+	char			pty_name[64];
+	avr_cycle_count_t	poll_period;	// cycles between two polls of 'fd'
+} avr_uart_bridge_t;
+
+// connects a bridge to the UART 'name', with rings of 'size' bytes to start with.
+// Returns 0, or -1 if there is no such UART or the rings can't be allocated
+int
+avr_uart_bridge_init(
+		struct avr_t * avr,
+		avr_uart_bridge_t * bridge,
+		char name,
+		uint32_t size );
+// disconnects the bridge, closes the file descriptor if it owns it, frees the rings
+void
+avr_uart_bridge_close(
+		avr_uart_bridge_t * bridge );
+
+// queues bytes for the AVR, returns the number of bytes queued
+uint32_t
+avr_uart_bridge_write(
+		avr_uart_bridge_t * bridge,
+		const uint8_t * data,
+		uint32_t size );
+// reads up to 'size' bytes sent by the AVR, returns the number of bytes read
+uint32_t
+avr_uart_bridge_read(
+		avr_uart_bridge_t * bridge,
+		uint8_t * data,
+		uint32_t size );
+// number of bytes sent by the AVR waiting to be read
+uint32_t
+avr_uart_bridge_get_rx_count(
+		avr_uart_bridge_t * bridge );
+// number of bytes waiting to be sent to the AVR
+uint32_t
+avr_uart_bridge_get_tx_count(
+		avr_uart_bridge_t * bridge );
+
+/*
+ * Attaches a file descriptor, made non blocking, that is polled every
+ * 'poll_period' cycles (a millisecond if 0). Bytes sent by the AVR are
+ * written to it instead of being kept for avr_uart_bridge_read(). A fd of
+ * -1 detaches it, after writing what the AVR sent since the last poll.
+ */
+int
+avr_uart_bridge_set_fd(
+		avr_uart_bridge_t * bridge,
+		int fd,
+		int owned,
+		avr_cycle_count_t poll_period );
+// opens a pty and attaches it, its name is in 'pty_name'. Returns 0 or -1
+int
+avr_uart_bridge_open_pty(
+		avr_uart_bridge_t * bridge );
+
+#ifdef __cplusplus
+};
+#endif
+
+#endif /* __SIM_UART_BRIDGE_H__ */
@@ -27,6 +27,9 @@
 #include <stdlib.h>
 #include <inttypes.h>
 #include <ctype.h>
+#include <stdarg.h>
+#include <unistd.h>
+#include <zlib.h>
 #include "sim_vcd_file.h"
 #include "sim_avr.h"
 #include "sim_time.h"
@@ -36,12 +39,21 @@ DEFINE_FIFO(avr_vcd_log_t, avr_vcd_fifo);
 
 #define strdupa(__s) strcpy(alloca(strlen(__s)+1), __s)
 
+// initial size of the output log, it doubles when full
+#define AVR_VCD_LOG_SIZE	256
+
 static void
 _avr_vcd_notify(
 		struct avr_irq_t * irq,
 		uint32_t value,
 		void * param);
 
+static avr_cycle_count_t
+_avr_vcd_timer(
+		struct avr_t * avr,
+		avr_cycle_count_t when,
+		void * param);
+
 int
 avr_vcd_init(
 		struct avr_t * avr,
@@ -57,6 +69,36 @@ avr_vcd_init(
 	return 0;
 }
 
+void
+avr_vcd_set_flush(
+		avr_vcd_t * vcd,
+		avr_cycle_count_t period,
+		uint32_t size)
+{
+	avr_cycle_count_t old_period = vcd->period;
+
+	vcd->period = period;
+	vcd->flush_size = size;
+
+	// reschedule the flush timer if we are already running
+	if (vcd->output && period != old_period) {
+		avr_cycle_timer_cancel(vcd->avr, _avr_vcd_timer, vcd);
+		if (period)
+			avr_cycle_timer_register(vcd->avr, period, _avr_vcd_timer, vcd);
+	}
+}
+
+int
+avr_vcd_set_compression(
+		avr_vcd_t * vcd,
+		int level)
+{
+	if (vcd->output || level < 0 || level > 9)
+		return -1;
+	vcd->compression = level;
+	return 0;
+}
+
 /*
  * Parse a VCD 'timing' line. The lines are assumed to be:
  * #<absolute timestamp>[\n][<value x/0/1><signal alias character>|
@@ -359,6 +401,32 @@ avr_vcd_close(
 		free(vcd->filename);
 		vcd->filename = NULL;
 	}
+	if (vcd->output_log) {
+		free(vcd->output_log);
+		vcd->output_log = NULL;
+	}
+	vcd->output_log_count = vcd->output_log_size = 0;
+}
+
+static void
+_avr_vcd_printf(
+		avr_vcd_t * vcd,
+		const char * format,
+		...)
+{
+	char text[256];
+	va_list args;
+
+	va_start(args, format);
+	int size = vsnprintf(text, sizeof(text), format, args);
+	va_end(args);
+
+	if (size >= (int)sizeof(text))
+		size = sizeof(text) - 1;
+	if (vcd->output_gz)
+		gzwrite(vcd->output_gz, text, size);
+	else
+		fwrite(text, 1, size, vcd->output);
 }
 
 static char *
@@ -412,11 +480,11 @@ avr_vcd_flush_log(
 	uint64_t oldbase = 0;	// make sure it's different
 	char out[48];
 
-	if (avr_vcd_fifo_isempty(&vcd->log) || !vcd->output)
+	if (!vcd->output_log_count || !vcd->output)
 		return;
 
-	while (!avr_vcd_fifo_isempty(&vcd->log)) {
-		avr_vcd_log_t l = avr_vcd_fifo_read(&vcd->log);
+	for (uint32_t li = 0; li < vcd->output_log_count; li++) {
+		avr_vcd_log_t l = vcd->output_log[li];
 		// 10ns base -- 100MHz should be enough
 		uint64_t base = avr_cycles_to_nsec(vcd->avr, l.when - vcd->start) / 10;
 
@@ -434,12 +502,12 @@ avr_vcd_flush_log(
 
 		if (base > oldbase || !seen) {
 			seen = 0;
-			fprintf(vcd->output, "#%" PRIu64  "\n", base);
+			_avr_vcd_printf(vcd, "#%" PRIu64  "\n", base);
 			oldbase = base;
 		}
 		// mark this trace as seen for this timestamp
 		seen |= (1 << l.sigindex);
-		fprintf(vcd->output, "%s\n",
+		_avr_vcd_printf(vcd, "%s\n",
 				l.floating ?
 					_avr_vcd_get_float_signal_text(
 							&vcd->signal[l.sigindex],
@@ -448,6 +516,7 @@ avr_vcd_flush_log(
 							&vcd->signal[l.sigindex],
 							out, l.value));
 	}
+	vcd->output_log_count = 0;
 }
 
 static avr_cycle_count_t
@@ -458,7 +527,7 @@ _avr_vcd_timer(
 {
 	avr_vcd_t * vcd = param;
 	avr_vcd_flush_log(vcd);
-	return when + vcd->period;
+	return vcd->period ? when + vcd->period : 0;
 }
 
 static void
@@ -470,9 +539,10 @@ _avr_vcd_notify(
 	avr_vcd_t * vcd = (avr_vcd_t *)param;
 
 	if (!vcd->output) {
-		AVR_LOG(vcd->avr, LOG_WARNING,
-				"%s: no output\n",
-				__FUNCTION__);
+		if (!vcd->dropped++)
+			AVR_LOG(vcd->avr, LOG_WARNING,
+					"%s: no output, dropping values\n",
+					__FUNCTION__);
 		return;
 	}
 
@@ -483,15 +553,26 @@ _avr_vcd_notify(
 		.value = value,
 		.floating = !!(avr_irq_get_flags(irq) & IRQ_FLAG_FLOATING),
 	};
-	if (avr_vcd_fifo_isfull(&vcd->log)) {
-		AVR_LOG(vcd->avr, LOG_WARNING,
-				"%s FIFO Overload, flushing!\n",
-				__func__);
-		/* Decrease period by a quarter, for next time */
-		vcd->period -= vcd->period >> 2;
-		avr_vcd_flush_log(vcd);
+	if (vcd->output_log_count == vcd->output_log_size) {
+		uint32_t size = vcd->output_log_size ?
+				vcd->output_log_size * 2 : AVR_VCD_LOG_SIZE;
+		avr_vcd_log_p log = realloc(vcd->output_log, size * sizeof(avr_vcd_log_t));
+
+		if (!log) {
+			if (!vcd->dropped++)
+				AVR_LOG(vcd->avr, LOG_ERROR,
+						"%s: out of memory, dropping values\n",
+						__func__);
+			return;
+		}
+		vcd->output_log = log;
+		vcd->output_log_size = size;
 	}
-	avr_vcd_fifo_write(&vcd->log, l);
+	vcd->output_log[vcd->output_log_count++] = l;
+
+	if (vcd->flush_size &&
+			vcd->output_log_count * sizeof(avr_vcd_log_t) >= vcd->flush_size)
+		avr_vcd_flush_log(vcd);
 }
 
 int
@@ -546,32 +627,51 @@ avr_vcd_start(
 	}
 	if (vcd->output)
 		avr_vcd_stop(vcd);
+	vcd->output_log_count = 0;
 	vcd->output = fopen(vcd->filename, "w");
 	if (vcd->output == NULL) {
 		perror(vcd->filename);
 		return -1;
 	}
+	if (vcd->compression) {
+		char mode[4];
+		int fd = dup(fileno(vcd->output));
+
+		sprintf(mode, "wb%d", vcd->compression);
+		vcd->output_gz = fd < 0 ? NULL : gzdopen(fd, mode);
+		if (!vcd->output_gz) {
+			AVR_LOG(vcd->avr, LOG_ERROR,
+					"%s: unable to compress %s\n",
+					__func__, vcd->filename);
+			if (fd >= 0)
+				close(fd);
+			fclose(vcd->output);
+			vcd->output = NULL;
+			return -1;
+		}
+	}
 
-	fprintf(vcd->output, "$timescale 10ns $end\n");	// 10ns base, aka 100MHz
-	fprintf(vcd->output, "$scope module logic $end\n");
+	_avr_vcd_printf(vcd, "$timescale 10ns $end\n");	// 10ns base, aka 100MHz
+	_avr_vcd_printf(vcd, "$scope module logic $end\n");
 
 	for (int i = 0; i < vcd->signal_count; i++) {
-		fprintf(vcd->output, "$var wire %d %c %s $end\n",
+		_avr_vcd_printf(vcd, "$var wire %d %c %s $end\n",
 			vcd->signal[i].size, vcd->signal[i].alias, vcd->signal[i].name);
 	}
 
-	fprintf(vcd->output, "$upscope $end\n");
-	fprintf(vcd->output, "$enddefinitions $end\n");
+	_avr_vcd_printf(vcd, "$upscope $end\n");
+	_avr_vcd_printf(vcd, "$enddefinitions $end\n");
 
-	fprintf(vcd->output, "$dumpvars\n");
+	_avr_vcd_printf(vcd, "$dumpvars\n");
 	for (int i = 0; i < vcd->signal_count; i++) {
 		avr_vcd_signal_t * s = &vcd->signal[i];
 		char out[48];
-		fprintf(vcd->output, "%s\n",
+		_avr_vcd_printf(vcd, "%s\n",
 				_avr_vcd_get_float_signal_text(s, out));
 	}
-	fprintf(vcd->output, "$end\n");
-	avr_cycle_timer_register(vcd->avr, vcd->period, _avr_vcd_timer, vcd);
+	_avr_vcd_printf(vcd, "$end\n");
+	if (vcd->period)
+		avr_cycle_timer_register(vcd->avr, vcd->period, _avr_vcd_timer, vcd);
 	return 0;
 }
 
@@ -590,6 +690,9 @@ avr_vcd_stop(
 	if (vcd->input)
 		fclose(vcd->input);
 	vcd->input = NULL;
+	if (vcd->output_gz)
+		gzclose(vcd->output_gz);
+	vcd->output_gz = NULL;
 	if (vcd->output)
 		fclose(vcd->output);
 	vcd->output = NULL;
@@ -26,6 +26,7 @@
 #define __SIM_VCD_FILE_H__
 
 #include <stdio.h>
+#include "sim_avr_types.h"
 #include "sim_irq.h"
 #include "fifo_declare.h"
 
@@ -87,7 +88,16 @@ typedef struct avr_vcd_t {
 	uint64_t 		period;		// for output cycles
 	uint64_t 		vcd_to_us;	// for input unit mapping
 
-	avr_vcd_fifo_t	log;
+	avr_vcd_fifo_t	log;		// for input
+
+	/* for output, values are buffered until flushed into the file */
+	avr_vcd_log_p	output_log;
+	uint32_t		output_log_count;
+	uint32_t		output_log_size;	// allocated entries, grows as needed
+	uint32_t		flush_size;		// flush when that many bytes are buffered, 0 for no limit
+	uint64_t		dropped;		// values that could not be logged
+	int				compression;	// gzip level, 0 for a plain text file
+	void *			output_gz;		// gzFile when compressing
 } avr_vcd_t;
 
 // initializes a new VCD trace file, and returns zero if all is well
@@ -106,6 +116,21 @@ void
 avr_vcd_close(
 		avr_vcd_t * vcd );
 
+// Sets when the buffered values are written into the file: every 'period'
+// cycles (0 for never) and whenever 'size' bytes are buffered (0 for no limit)
+void
+avr_vcd_set_flush(
+		avr_vcd_t * vcd,
+		avr_cycle_count_t period,
+		uint32_t size );
+
+// Sets the gzip compression level of the file, 0 writes plain text.
+// Must be called before avr_vcd_start()
+int
+avr_vcd_set_compression(
+		avr_vcd_t * vcd,
+		int level );
+
 // Add a trace signal to the vcd file. Must be called before avr_vcd_start()
 int
 avr_vcd_add_signal(
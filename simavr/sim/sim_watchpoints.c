@@ -0,0 +1,219 @@
+/*
+	sim_watchpoints.c
+
+	Address range watchpoints on the data space, evaluated by the core.
+
+ 	This file is part of simavr.
+
+	simavr is free software: you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation, either version 3 of the License, or
+	(at your option) any later version.
+
+	simavr is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+
+	You should have received a copy of the GNU General Public License
+	along with simavr.  If not, see <http://www.gnu.org/licenses/>.
+ */
+
+#include <stdio.h>
+#include <string.h>
+#include <stdlib.h>
+#include "sim_avr.h"
+#include "sim_watchpoints.h"
+
+static const char * irq_names[WATCH_IRQ_COUNT] = {
+	[WATCH_IRQ_BREAK] = "32>watch.break",
+};
+
+static inline uint32_t
+_avr_watchpoints_space(
+		avr_watchpoints_t * w)
+{
+	return w->avr->ramend + 1;
+}
+
+int
+avr_watchpoints_init(
+		struct avr_t * avr,
+		avr_watchpoints_t * w,
+		uint32_t log_size )
+{
+	memset(w, 0, sizeof(avr_watchpoints_t));
+	w->avr = avr;
+	if (avr->watchpoints) {
+		AVR_LOG(avr, LOG_ERROR, "WATCH: %s: the AVR already has watchpoints\n",
+				__FUNCTION__);
+		return -1;
+	}
+	w->log_size = 1;
+	while (w->log_size < log_size)
+		w->log_size <<= 1;
+
+	w->kinds = calloc(_avr_watchpoints_space(w), sizeof(uint8_t));
+	w->first = calloc(_avr_watchpoints_space(w), sizeof(uint32_t));
+	w->log = calloc(w->log_size, sizeof(avr_watch_hit_t));
+	if (!w->kinds || !w->first || !w->log) {
+		AVR_LOG(avr, LOG_ERROR, "WATCH: %s: unable to allocate the index\n",
+				__FUNCTION__);
+		free(w->kinds);
+		free(w->first);
+		free(w->log);
+		w->kinds = NULL;
+		return -1;
+	}
+	avr_init_irq(&avr->irq_pool, w->irq, 0, WATCH_IRQ_COUNT, irq_names);
+	avr->watchpoints = w;
+	return 0;
+}
+
+void
+avr_watchpoints_close(
+		avr_watchpoints_t * w )
+{
+	if (!w->kinds)
+		return;
+	if (w->avr->watchpoints == w)
+		w->avr->watchpoints = NULL;
+	avr_free_irq(w->irq, WATCH_IRQ_COUNT);
+	free(w->kinds);
+	free(w->first);
+	free(w->link);
+	free(w->watch);
+	free(w->log);
+	w->kinds = NULL;
+	w->first = NULL;
+	w->link = NULL;
+	w->watch = NULL;
+	w->log = NULL;
+	w->count = w->size = w->link_count = w->link_size = 0;
+}
+
+/*
+ * Rebuilds the index from scratch, watchpoints are not changed often.
+ * Links of an address are in watchpoint order.
+ */
+static int
+_avr_watchpoints_index(
+		avr_watchpoints_t * w )
+{
+	uint32_t links = 0;
+	for (uint32_t i = 0; i < w->count; i++)
+		links += w->watch[i].size;
+	if (links > w->link_size) {
+		avr_watch_link_t * link = realloc(w->link, links * sizeof(avr_watch_link_t));
+		if (!link)
+			return -1;
+		w->link = link;
+		w->link_size = links;
+	}
+	memset(w->kinds, 0, _avr_watchpoints_space(w) * sizeof(uint8_t));
+	memset(w->first, 0, _avr_watchpoints_space(w) * sizeof(uint32_t));
+	w->link_count = 0;
+
+	for (uint32_t i = w->count; i > 0; i--) {
+		avr_watch_t * watch = &w->watch[i - 1];
+		for (uint32_t a = watch->start; a < watch->start + watch->size; a++) {
+			avr_watch_link_t * l = &w->link[w->link_count++];
+			l->index = i - 1;
+			l->next = w->first[a];
+			w->first[a] = w->link_count;
+			w->kinds[a] |= watch->kind & (AVR_WATCH_READ | AVR_WATCH_WRITE);
+		}
+	}
+	return 0;
+}
+
+int
+avr_watchpoints_add(
+		avr_watchpoints_t * w,
+		uint16_t start,
+		uint16_t size,
+		uint8_t kind,
+		uint8_t match,
+		uint8_t mask )
+{
+	if (!w->kinds || !size || start < 32 || !(kind & (AVR_WATCH_READ | AVR_WATCH_WRITE)) ||
+			start + size > _avr_watchpoints_space(w))
+		return -1;
+	if (w->count == w->size) {
+		uint32_t s = w->size ? w->size * 2 : 16;
+		avr_watch_t * watch = realloc(w->watch, s * sizeof(avr_watch_t));
+		if (!watch)
+			return -1;
+		w->watch = watch;
+		w->size = s;
+	}
+	avr_watch_t * watch = &w->watch[w->count++];
+	memset(watch, 0, sizeof(avr_watch_t));
+	watch->start = start;
+	watch->size = size;
+	watch->kind = kind;
+	watch->match = match;
+	watch->mask = mask;
+	if (_avr_watchpoints_index(w)) {
+		w->count--;
+		return -1;
+	}
+	return w->count - 1;
+}
+
+void
+avr_watchpoints_remove(
+		avr_watchpoints_t * w,
+		uint32_t index )
+{
+	if (!w->kinds || index >= w->count || !w->watch[index].size)
+		return;
+	w->watch[index].size = 0;
+	// can't fail, there are fewer links than before
+	_avr_watchpoints_index(w);
+}
+
+uint32_t
+avr_watchpoints_get_log_count(
+		avr_watchpoints_t * w )
+{
+	return w->log_write < w->log_size ? w->log_write : w->log_size;
+}
+
+void
+avr_watchpoints_clear_log(
+		avr_watchpoints_t * w )
+{
+	w->log_write = 0;
+}
+
+void
+avr_watchpoints_hit(
+		avr_watchpoints_t * w,
+		uint16_t addr,
+		uint8_t value,
+		uint8_t kind )
+{
+	for (uint32_t l = w->first[addr]; l; l = w->link[l - 1].next) {
+		uint32_t index = w->link[l - 1].index;
+		avr_watch_t * watch = &w->watch[index];
+
+		if (!(watch->kind & kind))
+			continue;
+		if ((watch->kind & AVR_WATCH_MATCH) && (value & watch->mask) != watch->match)
+			continue;
+		watch->hits++;
+
+		avr_watch_hit_t * hit = &w->log[w->log_write++ & (w->log_size - 1)];
+		hit->when = w->avr->cycle;
+		hit->pc = w->avr->pc;
+		hit->addr = addr;
+		hit->value = value;
+		hit->kind = kind;
+		hit->index = index;
+		w->last = *hit;
+
+		if (watch->kind & AVR_WATCH_BREAK)
+			avr_raise_irq(w->irq + WATCH_IRQ_BREAK, index);
+	}
+}
@@ -0,0 +1,157 @@
+/*
+	sim_watchpoints.h
+
+	Address range watchpoints on the data space, evaluated by the core.
+
+ 	This file is part of simavr.
+
+	simavr is free software: you can redistribute it and/or modify
+	it under the terms of the GNU General Public License as published by
+	the Free Software Foundation, either version 3 of the License, or
+	(at your option) any later version.
+
+	simavr is distributed in the hope that it will be useful,
+	but WITHOUT ANY WARRANTY; without even the implied warranty of
+	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+	GNU General Public License for more details.
+
+	You should have received a copy of the GNU General Public License
+	along with simavr.  If not, see <http://www.gnu.org/licenses/>.
+ */
+
+#ifndef __SIM_WATCHPOINTS_H__
+#define __SIM_WATCHPOINTS_H__
+
+#include "sim_avr.h"
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+/*
+ * Watchpoints on ranges of the data space: I/O registers and SRAM, as
+ * accessed by the instructions (OUT/STS/ST/SBI/PUSH... and IN/LDS/LD/POP...).
+ * The general purpose registers are not watched, nor are the changes made
+ * by the peripherals themselves.
+ *
+ * The core checks one byte per access in 'kinds', indexed by address, so
+ * the cost doesn't depend on the number of watchpoints. Only accesses to
+ * a watched address walk the (few) watchpoints covering it: their 'hits'
+ * are counted and the access is added to a ring log keeping the latest
+ * ones. WATCH_IRQ_BREAK is raised with the index of the watchpoint when
+ * one with AVR_WATCH_BREAK hits, 'last' being the access.
+ */
+enum {
+	AVR_WATCH_READ	= (1 << 0),
+	AVR_WATCH_WRITE	= (1 << 1),
+	AVR_WATCH_MATCH	= (1 << 2),	// only when (value & mask) == match
+	AVR_WATCH_BREAK	= (1 << 3),	// raise WATCH_IRQ_BREAK
+};
+
+enum {
+	WATCH_IRQ_BREAK = 0,
+	WATCH_IRQ_COUNT
+};
+
+typedef struct avr_watch_t {
+	uint16_t		start;
+	uint16_t		size;		// 0 once removed
+	uint8_t			kind;		// AVR_WATCH_*
+	uint8_t			match;
+	uint8_t			mask;
+	uint64_t		hits;
+} avr_watch_t;
+
+typedef struct avr_watch_hit_t {
+	avr_cycle_count_t	when;
+	uint32_t		pc;
+	uint16_t		addr;
+	uint8_t			value;
+	uint8_t			kind;		// AVR_WATCH_READ or AVR_WATCH_WRITE
+	uint32_t		index;		// of the watchpoint
+} avr_watch_hit_t;
+
+typedef struct avr_watch_link_t {
+	uint32_t		index;		// of the watchpoint
+	uint32_t		next;		// in 'link', plus one, 0 for the end
+} avr_watch_link_t;
+
+typedef struct avr_watchpoints_t {
+	struct avr_t *	avr;
+	avr_irq_t		irq[WATCH_IRQ_COUNT];
+
+	avr_watch_t *	watch;		// by index
+	uint32_t		count;
+	uint32_t		size;
+
+	// index, one entry per data address
+	uint8_t *		kinds;		// AVR_WATCH_READ/WRITE of the watchpoints
+	uint32_t *		first;		// first link plus one, 0 for none
+	avr_watch_link_t *	link;
+	uint32_t		link_count;
+	uint32_t		link_size;
+
+	avr_watch_hit_t *	log;	// ring buffer of the latest hits
+	uint32_t		log_size;	// power of two
+	uint64_t		log_write;	// free running
+	avr_watch_hit_t	last;		// last hit
+} avr_watchpoints_t;
+
+// attaches the watchpoints to the AVR (one set per AVR), with a log of
+// at least 'log_size' hits. Returns 0, or -1
+int
+avr_watchpoints_init(
+		struct avr_t * avr,
+		avr_watchpoints_t * w,
+		uint32_t log_size );
+void
+avr_watchpoints_close(
+		avr_watchpoints_t * w );
+
+// adds a watchpoint on 'size' bytes from 'start', returns its index or -1
+int
+avr_watchpoints_add(
+		avr_watchpoints_t * w,
+		uint16_t start,
+		uint16_t size,
+		uint8_t kind,
+		uint8_t match,
+		uint8_t mask );
+// removes a watchpoint, its index is not reused
+void
+avr_watchpoints_remove(
+		avr_watchpoints_t * w,
+		uint32_t index );
+// number of hits in the log
+uint32_t
+avr_watchpoints_get_log_count(
+		avr_watchpoints_t * w );
+void
+avr_watchpoints_clear_log(
+		avr_watchpoints_t * w );
+
+// called by the core for a watched access
+void
+avr_watchpoints_hit(
+		avr_watchpoints_t * w,
+		uint16_t addr,
+		uint8_t value,
+		uint8_t kind );
+
+// called by the core for each access to the data space
+static inline void
+avr_watchpoints_access(
+		avr_watchpoints_t * w,
+		uint16_t addr,
+		uint8_t value,
+		uint8_t kind )
+{
+	if (addr <= w->avr->ramend && (w->kinds[addr] & kind))
+		avr_watchpoints_hit(w, addr, value, kind);
+}
+
+#ifdef __cplusplus
+};
+#endif
+
+#endif /* __SIM_WATCHPOINTS_H__ */
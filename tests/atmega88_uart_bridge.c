@@ -0,0 +1,47 @@
+/*
+	atmega88_uart_bridge.c
+
+	Echoes the bytes received on the uart, upper cased, until it gets a \n.
+	Used to test the buffered uart bridge, that sends whole lines at once
+	and relies on the XON/XOFF irqs to not overrun the reception fifo.
+ */
+
+#include <avr/io.h>
+#include <avr/sleep.h>
+#include <avr/interrupt.h>
+
+#include "avr_mcu_section.h"
+AVR_MCU(F_CPU, "atmega88");
+
+int main()
+{
+	UCSR0C |= (3 << UCSZ00); // 8 bits
+#define BAUD 38400
+#include <util/setbaud.h>
+	UBRR0H = UBRRH_VALUE;
+	UBRR0L = UBRRL_VALUE;
+#if USE_2X
+	UCSR0A |= (1 << U2X0);
+#else
+	UCSR0A &= ~(1 << U2X0);
+#endif
+
+	// enable receiver & transmitter, no interrupts: the bytes pile up
+	// in the fifo while we are sending
+	UCSR0B |= (1 << RXEN0) | (1 << TXEN0);
+
+	uint8_t b;
+	do {
+		loop_until_bit_is_set(UCSR0A, RXC0);
+		b = UDR0;
+		if (b >= 'a' && b <= 'z')
+			b -= 'a' - 'A';
+		loop_until_bit_is_set(UCSR0A, UDRE0);
+		UDR0 = b;
+	} while (b != '\n');
+	loop_until_bit_is_set(UCSR0A, TXC0);
+
+	// this quits the simulator, since interupts are off
+	cli();
+	sleep_cpu();
+}
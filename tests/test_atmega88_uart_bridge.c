@@ -0,0 +1,77 @@
+#include <stdio.h>
+#include <string.h>
+#include <unistd.h>
+#include <sys/socket.h>
+#include "tests.h"
+#include "sim_avr.h"
+#include "sim_time.h"
+#include "sim_uart_bridge.h"
+
+#define LINE_SIZE	300
+
+static void
+make_line(
+		char * line,
+		char * expected)
+{
+	for (int i = 0; i < LINE_SIZE - 1; i++) {
+		line[i] = 'a' + i % 26;
+		expected[i] = 'A' + i % 26;
+	}
+	line[LINE_SIZE - 1] = expected[LINE_SIZE - 1] = '\n';
+}
+
+int main(int argc, char **argv) {
+	tests_init(argc, argv);
+
+	char line[LINE_SIZE], expected[LINE_SIZE], got[LINE_SIZE + 1];
+	make_line(line, expected);
+
+	// the whole line is written at once, the AVR gets it as fast as it can take it
+	avr_t * avr = tests_init_avr("atmega88_uart_bridge.axf");
+	avr_uart_bridge_t bridge;
+	if (avr_uart_bridge_init(avr, &bridge, '0', 16))
+		fail("Unable to connect the bridge");
+	if (avr_uart_bridge_write(&bridge, (uint8_t*)line, LINE_SIZE) != LINE_SIZE)
+		fail("Unable to queue the line");
+	if (tests_run_test(avr, 1000000) != LJR_SPECIAL_DEINIT)
+		fail("Simulation did not finish, %u bytes not sent",
+				avr_uart_bridge_get_tx_count(&bridge));
+	if (avr_uart_bridge_get_tx_count(&bridge) || bridge.tx_total != LINE_SIZE)
+		fail("%u bytes not sent", avr_uart_bridge_get_tx_count(&bridge));
+	uint32_t count = avr_uart_bridge_read(&bridge, (uint8_t*)got, sizeof(got));
+	if (count != LINE_SIZE || memcmp(got, expected, LINE_SIZE))
+		fail("Echo differs: got %u bytes \"%.*s\"", count, (int)count, got);
+	if (bridge.dropped)
+		fail("%d bytes dropped", (int)bridge.dropped);
+	avr_uart_bridge_close(&bridge);
+
+	// same thing, through a socket
+	int sv[2];
+	if (socketpair(AF_UNIX, SOCK_STREAM, 0, sv))
+		fail("Unable to create a socket pair");
+	if (write(sv[0], line, LINE_SIZE) != LINE_SIZE)
+		fail("Unable to write the line");
+	avr = tests_init_avr("atmega88_uart_bridge.axf");
+	// nobody reads the socket while the AVR runs, poll it seldom to not
+	// fill it with tiny writes
+	if (avr_uart_bridge_init(avr, &bridge, '0', 16) ||
+			avr_uart_bridge_set_fd(&bridge, sv[1], 1,
+					avr_usec_to_cycles(avr, 20000)))
+		fail("Unable to connect the bridge");
+	if (tests_run_test(avr, 1000000) != LJR_SPECIAL_DEINIT)
+		fail("Simulation did not finish through the socket");
+	// closing writes what was not polled yet, and closes the socket
+	avr_uart_bridge_close(&bridge);
+	count = 0;
+	ssize_t r;
+	while ((r = read(sv[0], got + count, sizeof(got) - count)) > 0)
+		count += r;
+	if (count != LINE_SIZE || memcmp(got, expected, LINE_SIZE))
+		fail("Echo through the socket differs: got %u bytes \"%.*s\"",
+				count, (int)count, got);
+	close(sv[0]);
+
+	tests_success();
+	return 0;
+}
@@ -0,0 +1,112 @@
+#include <stdio.h>
+#include <stdlib.h>
+#include <time.h>
+#include "tests.h"
+#include "sim_avr.h"
+#include "sim_cycle_timers.h"
+
+#define TIMER_COUNT	10000
+
+static avr_cycle_count_t registered[TIMER_COUNT];
+static int sequence[TIMER_COUNT];
+static int sequence_count;
+static int fired[TIMER_COUNT];
+static int fired_count;
+static avr_cycle_count_t last_when;
+static int last_sequence = -1;
+
+static avr_cycle_count_t
+stress_timer(
+		struct avr_t * avr,
+		avr_cycle_count_t when,
+		void * param)
+{
+	uintptr_t i = (uintptr_t)param;
+
+	if (fired[i])
+		fail("timer %d fired twice", (int)i);
+	if (when != registered[i])
+		fail("timer %d fired for cycle %" PRI_avr_cycle_count
+				" instead of %" PRI_avr_cycle_count, (int)i, when, registered[i]);
+	// timers due on the same cycle fire in the order they were registered
+	if (when < last_when || (when == last_when && sequence[i] < last_sequence))
+		fail("timer %d fired out of order", (int)i);
+	last_when = when;
+	last_sequence = sequence[i];
+	fired[i] = 1;
+	fired_count++;
+	return 0;
+}
+
+static double
+now(void)
+{
+	struct timespec ts;
+	clock_gettime(CLOCK_MONOTONIC, &ts);
+	return ts.tv_sec + ts.tv_nsec / 1e9;
+}
+
+int main(int argc, char **argv) {
+	tests_init(argc, argv);
+
+	avr_t * avr = avr_make_mcu_by_name("atmega88");
+	if (!avr)
+		fail("Creating core failed");
+	avr_init(avr);
+
+	double start = now();
+	srand(1);
+	// few distinct cycles, so a lot of timers are due at the same time
+	for (int i = 0; i < TIMER_COUNT; i++) {
+		avr_cycle_count_t when = 1 + rand() % 1000;
+		registered[i] = avr->cycle + when;
+		sequence[i] = sequence_count++;
+		avr_cycle_timer_register(avr, when, stress_timer, (void*)(uintptr_t)i);
+	}
+	double inserted = now();
+
+	int expected = 0;
+	for (int i = 0; i < TIMER_COUNT; i++) {
+		avr_cycle_count_t left = avr_cycle_timer_status(avr, stress_timer, (void*)(uintptr_t)i);
+		if (left != registered[i] - avr->cycle + 1)
+			fail("timer %d has %" PRI_avr_cycle_count " cycles left", (int)i, left);
+		if (i % 3 == 0) {
+			avr_cycle_timer_cancel(avr, stress_timer, (void*)(uintptr_t)i);
+			if (avr_cycle_timer_status(avr, stress_timer, (void*)(uintptr_t)i))
+				fail("timer %d was not cancelled", (int)i);
+			fired[i] = -1;
+		} else
+			expected++;
+	}
+	// registering again replaces the timer and moves it to the back
+	for (int i = 1; i < TIMER_COUNT; i += 99) {
+		if (fired[i])
+			continue;
+		registered[i] = avr->cycle + 500;
+		sequence[i] = sequence_count++;
+		avr_cycle_timer_register(avr, 500, stress_timer, (void*)(uintptr_t)i);
+	}
+	if (avr->cycle_timers.count != expected)
+		fail("%d timers pending instead of %d", avr->cycle_timers.count, expected);
+	double cancelled = now();
+
+	while (avr->cycle_timers.count) {
+		avr->cycle++;
+		avr_cycle_timer_process(avr);
+	}
+	double processed = now();
+
+	if (fired_count != expected)
+		fail("%d timers fired instead of %d", fired_count, expected);
+	for (int i = 0; i < TIMER_COUNT; i++)
+		if (!fired[i])
+			fail("timer %d never fired", i);
+
+	printf("%d timers: register %.2fms, status/cancel %.2fms, process %.2fms\n",
+			TIMER_COUNT, (inserted - start) * 1000,
+			(cancelled - inserted) * 1000, (processed - cancelled) * 1000);
+
+	avr_terminate(avr);
+	tests_success();
+	return 0;
+}
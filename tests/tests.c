@@ -110,6 +110,9 @@ avr_t *tests_init_avr(const char *elfname) {
 	if (!avr)
 		fail("Creating AVR failed.");
 	avr_init(avr);
+	// run the tests with predecoded instructions, to check them
+	if (getenv("SIMAVR_PREDECODE"))
+		avr_predecode_enable(avr, 1);
 	avr_load_firmware(avr, &fw);
 	return avr;
 }